@@ -15,6 +15,7 @@ benchmark (arXiv:2407.02883) or a local repository.
 Usage:
     uv run bench/coir_eval.py --dataset CoIR-Retrieval/cosqa
     uv run bench/coir_eval.py --repo ~/github/rtk-ai/rtk
+    uv run bench/coir_eval.py --dataset CoIR-Retrieval/cosqa --trace
 
 Metrics: nDCG@10, Recall@1/5/10, MRR@10.
 """
@@ -26,6 +27,7 @@ import random
 import shutil
 import subprocess
 import sys
+import tempfile
 from collections import defaultdict
 from pathlib import Path
 
@@ -94,24 +96,72 @@ def evaluate_metrics(qrels, results, k=10):
     }
 
 
-def run_og_search(og_bin, query, target_dir, k=10):
-    """Run og search and return parsed JSON results."""
-    cmd = [og_bin, query, str(target_dir), "--json", "-n", str(k)]
-    r = subprocess.run(cmd, capture_output=True, text=True, check=False)
-    if r.returncode == 1:
-        return []
-    if r.returncode != 0:
-        raise RuntimeError(f"og search failed for query {query!r}: {r.stderr.strip()}")
-    if not r.stdout.strip():
-        return []
-
-    # og output format: list of { file, block, score, ... }. For CoIR datasets,
-    # the file stem is the corpus ID because corpus files are named <doc_id>.py.
-    data = json.loads(r.stdout)
-    return [
-        {"id": os.path.basename(item["file"]).split(".")[0], "score": item["score"]}
-        for item in data
-    ]
+def run_og_batch_search(og_bin, queries, target_dir, k=10, trace=False):
+    """Run all queries through one `og --batch` process.
+
+    `queries` is a list of (qid, text). Returns qid -> parsed results. Loading
+    the model and index once instead of per query is what makes full CoIR
+    runs practical. With `trace`, og's per-query stage timings are printed
+    after the run.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".jsonl", delete=False, encoding="utf-8"
+    ) as f:
+        for qid, text in queries:
+            f.write(json.dumps({"id": qid, "query": text}) + "\n")
+        batch_path = f.name
+
+    all_results = {}
+    # stderr goes to a file, not a pipe, so a long traced run can't block og
+    stderr = tempfile.TemporaryFile("w+", encoding="utf-8") if trace else None
+    env = {**os.environ, "OG_TRACE": "json"} if trace else None
+    try:
+        cmd = [og_bin, "--batch", batch_path, str(target_dir), "-n", str(k), "--quiet"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, env=env, text=True)
+        for line in tqdm(proc.stdout, total=len(queries), desc="Querying"):
+            record = json.loads(line)
+            if "error" in record:
+                raise RuntimeError(
+                    f"og search failed for query {record.get('query')!r}: {record['error']}"
+                )
+            # og output format: list of { file, block, score, ... }. For CoIR datasets,
+            # the file stem is the corpus ID because corpus files are named <doc_id>.py.
+            all_results[record["id"]] = [
+                {
+                    "id": os.path.basename(item["file"]).split(".")[0],
+                    "score": item["score"],
+                }
+                for item in record.get("results", [])
+            ]
+        if proc.wait() != 0:
+            raise RuntimeError(f"og --batch exited with {proc.returncode}")
+        if stderr is not None:
+            from og_trace import batch_report
+
+            stderr.seek(0)
+            print(batch_report(stderr.read()))
+    finally:
+        os.unlink(batch_path)
+        if stderr is not None:
+            stderr.close()
+    return all_results
+
+
+def run_server_search(socket_path, queries, target_dir, k=10):
+    """Run queries against a running `og serve`; returns (results, latency summary)."""
+    from og_client import OgClient, latency_summary
+
+    all_results = {}
+    with OgClient(socket_path or None) as client:
+        for qid, text in tqdm(queries, desc="Querying (server)"):
+            all_results[qid] = [
+                {
+                    "id": os.path.basename(item["file"]).split(".")[0],
+                    "score": item["score"],
+                }
+                for item in client.search(text, target_dir, k)
+            ]
+        return all_results, latency_summary(client.latencies_ms)
 
 
 def build_index(og_bin, target_dir, force=True):
@@ -134,6 +184,8 @@ def eval_coir(
     limit_queries=None,
     limit_corpus=None,
     force_build=True,
+    server=None,
+    trace=False,
 ):
     """Evaluate og on a CoIR dataset."""
     print(f"Loading CoIR dataset: {dataset_name}...")
@@ -195,19 +247,26 @@ def eval_coir(
     build_index(og_bin, corpus_dir, force=force_build)
 
     print(f"Evaluating {len(relevant_queries)} queries...")
-    all_results = {}
-    for q in tqdm(relevant_queries, desc="Querying"):
+    query_pairs = [(q["_id"], q["text"]) for q in relevant_queries]
+    latency = None
+    if server is not None:
+        all_results, latency = run_server_search(server, query_pairs, corpus_dir, k)
+    else:
+        all_results = run_og_batch_search(og_bin, query_pairs, corpus_dir, k, trace)
+
+    # Debug first query
+    if relevant_queries:
+        q = relevant_queries[0]
         qid = q["_id"]
-        res = run_og_search(og_bin, q["text"], corpus_dir, k)
-        all_results[qid] = res
-
-        # Debug first query
-        if qid == relevant_queries[0]["_id"]:
-            print(f"\nDebug Query {qid}: '{q['text']}'")
-            print(f"  Gold IDs: {list(qrels[qid].keys())}")
-            print(f"  Top IDs:  {[r['id'] for r in res]}")
+        print(f"\nDebug Query {qid}: '{q['text']}'")
+        print(f"  Gold IDs: {list(qrels[qid].keys())}")
+        print(f"  Top IDs:  {[r['id'] for r in all_results.get(qid, [])]}")
 
     metrics = evaluate_metrics(eval_qrels, all_results, k)
+    if latency:
+        metrics.update(
+            {f"latency_{key}": value for key, value in latency.items() if key != "n"}
+        )
     return metrics
 
 
@@ -240,6 +299,19 @@ def main():
         help="Reuse an existing og index instead of forcing a clean rebuild",
     )
 
+    parser.add_argument(
+        "--server",
+        nargs="?",
+        const="",
+        default=None,
+        help="Query a running `og serve` (optional socket path) and report p50/p99",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Print per-stage p50/p95 timings from OG_TRACE=json",
+    )
+
     args = parser.parse_args()
     work_dir = Path(args.work_dir)
     og_bin = args.og_bin
@@ -257,6 +329,8 @@ def main():
             args.limit_queries,
             args.limit_corpus,
             force_build=not args.reuse_index,
+            server=args.server,
+            trace=args.trace,
         )
 
         print("\n" + "=" * 40)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""Index size benchmark: on-disk size of `.og/` per corpus, optionally for two builds.
+
+Builds a fresh index of each corpus directory into a scratch copy and reports
+the size of the vector store, manifest and other index files, plus bytes per
+source byte. Pass --baseline to build with a second binary (e.g. one built from
+an older commit) and print the before/after delta.
+
+Usage:
+    uv run bench/index_size.py bench/golden bench/corpus
+    uv run bench/index_size.py --baseline /tmp/og-old bench/golden bench/corpus
+
+    CORPUS ...        Directories to index (default: bench/golden)
+    --og PATH         og binary (default: target/release/og, else og on PATH)
+    --baseline PATH   Second og binary to compare against
+    --json            Print results as JSON
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+
+def find_og(explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    release = Path(__file__).resolve().parent.parent / "target" / "release" / "og"
+    if release.exists():
+        return str(release)
+    found = shutil.which("og")
+    if not found:
+        print("og binary not found; pass --og or run cargo build --release", file=sys.stderr)
+        sys.exit(1)
+    return found
+
+
+def tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def measure(og: str, corpus: Path) -> dict:
+    with tempfile.TemporaryDirectory(prefix="og-size-") as tmp:
+        work = Path(tmp) / corpus.name
+        shutil.copytree(corpus, work, ignore=shutil.ignore_patterns(".og"))
+        source_bytes = tree_size(work)
+
+        r = subprocess.run([og, "build", "--quiet", str(work)], capture_output=True, text=True)
+        if r.returncode != 0:
+            print(f"og build failed on {corpus}:\n{r.stderr}", file=sys.stderr)
+            sys.exit(1)
+
+        index_dir = work / ".og"
+        parts: dict[str, int] = {}
+        for child in index_dir.iterdir():
+            key = "vectors" if child.name.startswith("vectors") else (
+                "manifest" if child.name.startswith("manifest") else "other"
+            )
+            parts[key] = parts.get(key, 0) + tree_size(child)
+        total = sum(parts.values())
+
+    return {
+        "corpus": str(corpus),
+        "source_bytes": source_bytes,
+        "index_bytes": total,
+        "vectors_bytes": parts.get("vectors", 0),
+        "manifest_bytes": parts.get("manifest", 0),
+        "other_bytes": parts.get("other", 0),
+        "index_per_source_byte": round(total / source_bytes, 2) if source_bytes else None,
+    }
+
+
+def mib(n: int) -> str:
+    return f"{n / (1 << 20):.2f}M"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpora", nargs="*", default=["bench/golden"])
+    parser.add_argument("--og", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    og = find_og(args.og)
+    results = []
+    for corpus in map(Path, args.corpora):
+        if not corpus.is_dir():
+            print(f"Not a directory: {corpus}", file=sys.stderr)
+            sys.exit(1)
+        row = {"current": measure(og, corpus)}
+        if args.baseline:
+            row["baseline"] = measure(args.baseline, corpus)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'corpus':<24}  {'source':>9}  {'index':>9}  {'vectors':>9}  {'manifest':>9}  {'x src':>6}  {'vs base':>8}")
+    for row in results:
+        cur = row["current"]
+        delta = "-"
+        if "baseline" in row and row["baseline"]["index_bytes"]:
+            delta = f"{(cur['index_bytes'] / row['baseline']['index_bytes'] - 1) * 100:+.1f}%"
+        print(
+            f"{Path(cur['corpus']).name:<24}  {mib(cur['source_bytes']):>9}  {mib(cur['index_bytes']):>9}  "
+            f"{mib(cur['vectors_bytes']):>9}  {mib(cur['manifest_bytes']):>9}  "
+            f"{cur['index_per_source_byte']:>6}  {delta:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
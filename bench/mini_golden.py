@@ -4,8 +4,10 @@
 # ///
 import argparse
 import json
+import os
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
 from typing import List, Dict, Tuple
 
@@ -17,26 +19,62 @@ QUERIES: List[Tuple[str, str]] = [
     ("Process background jobs from the queue", "workers.rs"),
 ]
 
-def search(og: str, query: str, corpus_dir: Path, k: int) -> List[Dict]:
-    r = subprocess.run(
-        [og, query, str(corpus_dir), "--json", "-n", str(k)],
-        capture_output=True,
-        text=True,
-    )
-    if r.returncode == 2 or not r.stdout.strip():
-        return []
+def batch_search(
+    og: str, queries: List[str], corpus_dir: Path, k: int, trace: bool = False
+) -> List[List[Dict]]:
+    """Run all queries through one `og --batch` process, in input order.
+
+    With `trace`, prints og's per-query stage timings after the run.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+        for i, query in enumerate(queries):
+            f.write(json.dumps({"id": i, "query": query}) + "\n")
+        batch_path = f.name
+
+    results: List[List[Dict]] = [[] for _ in queries]
     try:
-        return json.loads(r.stdout)
-    except json.JSONDecodeError:
-        return []
+        r = subprocess.run(
+            [og, "--batch", batch_path, str(corpus_dir), "-n", str(k), "--quiet"],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "OG_TRACE": "json"} if trace else None,
+        )
+    finally:
+        os.unlink(batch_path)
+    if r.returncode != 0:
+        print(f"og --batch failed:\n{r.stderr}")
+        sys.exit(1)
+    for line in r.stdout.splitlines():
+        record = json.loads(line)
+        results[record["id"]] = record.get("results", [])
+    if trace:
+        from og_trace import batch_report
 
-def evaluate(og: str, queries: List[Tuple[str, str]], corpus_dir: Path, k: int) -> Dict:
+        print(batch_report(r.stderr))
+    return results
+
+def evaluate(
+    og: str,
+    queries: List[Tuple[str, str]],
+    corpus_dir: Path,
+    k: int,
+    server: str | None = None,
+    trace: bool = False,
+) -> Dict:
     reciprocal_ranks: List[float] = []
     hits: Dict[int, int] = {1: 0, 3: 0, 5: 0}
 
     print(f"Running {len(queries)} queries...")
-    for query, gold_file in queries:
-        results = search(og, query, corpus_dir, k)
+    latency = None
+    if server is not None:
+        from og_client import OgClient, latency_summary
+
+        with OgClient(server or None) as client:
+            all_results = [client.search(q, corpus_dir, k) for q, _ in queries]
+            latency = latency_summary(client.latencies_ms)
+    else:
+        all_results = batch_search(og, [q for q, _ in queries], corpus_dir, k, trace)
+    for (query, gold_file), results in zip(queries, all_results):
 
         rank = None
         for i, r in enumerate(results, 1):
@@ -54,19 +92,30 @@ def evaluate(og: str, queries: List[Tuple[str, str]], corpus_dir: Path, k: int)
         print(f"Q: {query[:50]:<50} | Gold: {gold_file:<15} | Rank: {rank if rank else 'N/A'}")
 
     n = len(queries)
-    return {
+    metrics = {
         "n_queries": n,
         "mrr": round(sum(reciprocal_ranks) / n, 4),
         "recall@1": round(hits[1] / n, 4),
         "recall@3": round(hits[3] / n, 4),
         "recall@5": round(hits[5] / n, 4),
     }
+    if latency:
+        metrics["latency"] = latency
+    return metrics
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Mini-Golden Benchmark for omengrep")
     parser.add_argument("--corpus-dir", default="bench/golden")
     parser.add_argument("--og-bin", default="og")
     parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--server", nargs="?", const="", default=None,
+        help="Query a running `og serve` (optional socket path) and report latency",
+    )
+    parser.add_argument(
+        "--trace", action="store_true",
+        help="Print per-stage p50/p95 timings from OG_TRACE=json",
+    )
     args = parser.parse_args()
 
     corpus_dir = Path(args.corpus_dir)
@@ -83,7 +132,7 @@ def main() -> None:
         print(f"Build failed:\n{r.stderr}")
         sys.exit(1)
 
-    metrics = evaluate(og, QUERIES, corpus_dir, k)
+    metrics = evaluate(og, QUERIES, corpus_dir, k, args.server, args.trace)
 
     print("\n" + "=" * 44)
     print("  omengrep Mini-Golden Benchmark")
@@ -92,6 +141,9 @@ def main() -> None:
     print(f"  Recall@1 : {metrics['recall@1']:.4f}")
     print(f"  Recall@3 : {metrics['recall@3']:.4f}")
     print(f"  Recall@{k:<2}: {metrics[f'recall@{k}']:.4f}")
+    if "latency" in metrics:
+        lat = metrics["latency"]
+        print(f"  p50/p99  : {lat['p50_ms']:.1f} / {lat['p99_ms']:.1f} ms")
     print("=" * 44 + "\n")
     print(json.dumps(metrics, indent=2))
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""No-op rebuild benchmark: `og build` time on an unchanged tree vs file count.
+
+For each size, generates a synthetic tree of small source files, builds the
+index once, then times repeated `og build` runs with nothing changed. A no-op
+rebuild should cost a stat per file, not a read + hash per file.
+
+Usage:
+    uv run bench/noop_rebuild.py
+    uv run bench/noop_rebuild.py --sizes 1000,10000,50000 --repeat 5 --touch 100
+
+    --og PATH       og binary (default: target/release/og, else og on PATH)
+    --sizes LIST    Comma-separated file counts (default: 1000,5000,20000)
+    --repeat N      Timed no-op runs per size (default: 3)
+    --touch N       Also time a rebuild after bumping mtime on N files with
+                    unchanged content (re-hash path, no re-embedding)
+    --keep DIR      Generate trees under DIR and keep them (default: temp dir)
+    --json          Print results as JSON
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TEMPLATE = '''def handler_{i}(request):
+    """Handle request variant {i}."""
+    value = request.get("key_{i}")
+    if value is None:
+        raise ValueError("missing key_{i}")
+    return value * {i}
+'''
+
+
+def find_og(explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    release = Path(__file__).resolve().parent.parent / "target" / "release" / "og"
+    if release.exists():
+        return str(release)
+    found = shutil.which("og")
+    if not found:
+        print("og binary not found; pass --og or run cargo build --release", file=sys.stderr)
+        sys.exit(1)
+    return found
+
+
+def make_tree(root: Path, n_files: int) -> None:
+    """n_files small Python files, 100 per directory."""
+    root.mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        d = root / f"pkg{i // 100:04d}"
+        d.mkdir(exist_ok=True)
+        (d / f"mod_{i}.py").write_text(TEMPLATE.format(i=i), encoding="utf-8")
+
+
+def run_build(og: str, root: Path) -> tuple[float, str]:
+    t0 = time.perf_counter()
+    r = subprocess.run([og, "build", str(root)], capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if r.returncode != 0:
+        print(f"og build failed:\n{r.stderr}", file=sys.stderr)
+        sys.exit(1)
+    return elapsed, r.stderr
+
+
+def bench_size(og: str, root: Path, n_files: int, repeat: int, touch: int) -> dict:
+    make_tree(root, n_files)
+    initial, _ = run_build(og, root)
+
+    noop = []
+    for _ in range(repeat):
+        elapsed, stderr = run_build(og, root)
+        if "up to date" not in stderr:
+            print(f"  warning: no-op build did work: {stderr.strip()}", file=sys.stderr)
+        noop.append(elapsed)
+
+    result = {
+        "files": n_files,
+        "initial_build_s": round(initial, 3),
+        "noop_median_s": round(statistics.median(noop), 3),
+        "noop_min_s": round(min(noop), 3),
+        "noop_us_per_file": round(statistics.median(noop) / n_files * 1e6, 1),
+    }
+
+    if touch:
+        now = time.time() + 5
+        for path in sorted(root.rglob("*.py"))[:touch]:
+            os.utime(path, (now, now))
+        elapsed, _ = run_build(og, root)
+        result["touched_files"] = touch
+        result["touched_rebuild_s"] = round(elapsed, 3)
+
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--og", default=None)
+    parser.add_argument("--sizes", default="1000,5000,20000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--touch", type=int, default=0)
+    parser.add_argument("--keep", default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    og = find_og(args.og)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    base = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="og-noop-"))
+
+    results = []
+    try:
+        for n in sizes:
+            if not args.json:
+                print(f"Building {n} files...", file=sys.stderr)
+            results.append(bench_size(og, base / f"tree_{n}", n, args.repeat, args.touch))
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'files':>8}  {'initial':>9}  {'no-op':>9}  {'us/file':>8}  {'touched':>9}")
+    for r in results:
+        touched = f"{r['touched_rebuild_s']:.3f}s" if "touched_rebuild_s" in r else "-"
+        print(
+            f"{r['files']:>8}  {r['initial_build_s']:>8.2f}s  {r['noop_median_s']:>8.3f}s  "
+            f"{r['noop_us_per_file']:>8.1f}  {touched:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
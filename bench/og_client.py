@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""Client for `og serve` plus a query latency benchmark.
+
+The server keeps the embedding model and opened indexes warm, so per-query
+latency here is search work only (no process spawn, model load or store open).
+
+Usage:
+    og serve &
+    uv run bench/og_client.py --path bench/golden --queries queries.txt
+
+    --socket PATH   Server socket (default: same rules as og: $OG_SOCKET,
+                    $XDG_RUNTIME_DIR/og.sock, <tmp>/og-$USER.sock)
+    --path DIR      Indexed directory to search
+    --queries FILE  One query per line (.txt) or JSON lines with "query" (.jsonl)
+    --k N           Results per query (default: 10)
+    --repeat N      Run the query set N times (default: 1; first pass warms caches)
+    --no-index      Skip the server-side freshness check (pure search latency)
+
+The harnesses (quality.py, coir_eval.py, mini_golden.py) import OgClient
+for their --server mode.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def default_socket_path() -> str:
+    if os.environ.get("OG_SOCKET"):
+        return os.environ["OG_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "og.sock")
+    user = os.environ.get("USER", "default")
+    return os.path.join(tempfile.gettempdir(), f"og-{user}.sock")
+
+
+class OgClient:
+    """One persistent connection to `og serve`, speaking JSON lines."""
+
+    def __init__(self, socket_path: str | None = None):
+        self.socket_path = socket_path or default_socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+        self.reader = self.sock.makefile("r", encoding="utf-8")
+        self.latencies_ms: list[float] = []
+
+    def close(self) -> None:
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self) -> "OgClient":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    def request(self, payload: dict) -> dict:
+        t0 = time.perf_counter()
+        self.sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        line = self.reader.readline()
+        self.latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+        if not line:
+            raise ConnectionError("og serve closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "unknown server error"))
+        return response
+
+    def search(self, query: str, path: Path | str, k: int = 10, **filters) -> list[dict]:
+        payload = {"op": "search", "path": str(Path(path).resolve()), "query": query, "n": k}
+        payload.update(filters)
+        return self.request(payload)["results"]
+
+    def similar(self, file: Path | str, name: str | None = None, line: int | None = None, k: int = 10) -> list[dict]:
+        payload = {"op": "similar", "file": str(Path(file).resolve()), "n": k}
+        if name is not None:
+            payload["name"] = name
+        if line is not None:
+            payload["line"] = line
+        return self.request(payload)["results"]
+
+    def outline(self, path: Path | str, skeleton: bool = False) -> list[dict]:
+        return self.request({"op": "outline", "path": str(Path(path).resolve()), "skeleton": skeleton})["files"]
+
+    def context(self, path: Path | str, n: int = 12, symbols: int = 5) -> list[dict]:
+        return self.request({"op": "context", "path": str(Path(path).resolve()), "n": n, "symbols": symbols})["files"]
+
+
+def latency_summary(latencies_ms: list[float]) -> dict:
+    """p50/p95/p99/mean/max over client-observed request latencies."""
+    if not latencies_ms:
+        return {}
+    ordered = sorted(latencies_ms)
+
+    def pct(p: float) -> float:
+        idx = min(len(ordered) - 1, max(0, round(p / 100.0 * (len(ordered) - 1))))
+        return round(ordered[idx], 2)
+
+    return {
+        "n": len(ordered),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def print_latency(summary: dict, title: str = "og serve latency") -> None:
+    if not summary:
+        return
+    print(f"  {title}: p50 {summary['p50_ms']:.1f}ms  p95 {summary['p95_ms']:.1f}ms  "
+          f"p99 {summary['p99_ms']:.1f}ms  (n={summary['n']})")
+
+
+def load_queries(path: Path) -> list[str]:
+    queries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if path.suffix == ".jsonl":
+            record = json.loads(line)
+            queries.append(record if isinstance(record, str) else record["query"])
+        else:
+            queries.append(line)
+    return queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--path", required=True)
+    parser.add_argument("--queries", required=True)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-index", action="store_true")
+    args = parser.parse_args()
+
+    queries = load_queries(Path(args.queries))
+    if not queries:
+        print("No queries", file=sys.stderr)
+        sys.exit(1)
+
+    with OgClient(args.socket) as client:
+        client.request({"op": "ping"})
+        client.latencies_ms.clear()
+        for _ in range(args.repeat):
+            for query in queries:
+                client.search(query, args.path, args.k, no_index=args.no_index)
+        summary = latency_summary(client.latencies_ms)
+
+    print_latency(summary)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""Per-stage timing tables from `og --trace` / `OG_TRACE=json` output.
+
+og writes one `{"trace": {...}}` JSON line to stderr per command, or per query
+under `--batch`. This module parses those lines and prints p50/p95 of each
+span and counter across queries. The benchmark scripts use it for --trace;
+it also reads a saved stderr log directly.
+
+Usage:
+    OG_TRACE=json og --batch queries.jsonl bench/golden 2> trace.log
+    uv run bench/og_trace.py trace.log
+
+    LOG ...     Files holding og stderr output (default: stdin)
+    --json      Print the summary as JSON
+"""
+
+import argparse
+import json
+import sys
+
+
+def parse_traces(stderr: str) -> list[dict]:
+    """Trace records from og stderr, skipping all other lines."""
+    traces = []
+    for line in stderr.splitlines():
+        if not line.startswith('{"trace"'):
+            continue
+        try:
+            traces.append(json.loads(line)["trace"])
+        except (json.JSONDecodeError, KeyError):
+            continue
+    return traces
+
+
+def query_latencies(stderr: str) -> list[float]:
+    """Per-query total time (ms) from an `og --batch` run's traces."""
+    return [t.get("total_ms", 0.0) for t in parse_traces(stderr) if "id" in t]
+
+
+def pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(p / 100.0 * (len(ordered) - 1))))
+    return round(ordered[idx], 2)
+
+
+def summarize(traces: list[dict]) -> dict:
+    """p50/p95 of total time, each span (ms) and each counter across traces.
+
+    Traces without a span or counter count it as zero, so a stage that only
+    runs for some queries (e.g. reading file content) shows its real spread.
+    """
+    if not traces:
+        return {}
+    span_names: list[str] = []
+    count_names: list[str] = []
+    for trace in traces:
+        for span in trace.get("spans", []):
+            if span["name"] not in span_names:
+                span_names.append(span["name"])
+        for name in trace.get("counts", {}):
+            if name not in count_names:
+                count_names.append(name)
+
+    def stats(values: list[float]) -> dict:
+        return {"p50": pct(values, 50), "p95": pct(values, 95), "mean": round(sum(values) / len(values), 2)}
+
+    spans = {
+        name: stats([
+            sum(s["ms"] for s in t.get("spans", []) if s["name"] == name) for t in traces
+        ])
+        for name in span_names
+    }
+    counts = {name: stats([t.get("counts", {}).get(name, 0) for t in traces]) for name in count_names}
+    return {
+        "n": len(traces),
+        "total_ms": stats([t.get("total_ms", 0.0) for t in traces]),
+        "spans_ms": spans,
+        "counts": counts,
+    }
+
+
+def stage_table(traces: list[dict]) -> str:
+    summary = summarize(traces)
+    if not summary:
+        return "No trace records (was OG_TRACE=json set?)"
+    lines = [f"  Stage timings over {summary['n']} traces", f"  {'stage':<20} {'p50 ms':>9} {'p95 ms':>9}"]
+    total = summary["total_ms"]
+    lines.append(f"  {'total':<20} {total['p50']:>9.2f} {total['p95']:>9.2f}")
+    for name, s in summary["spans_ms"].items():
+        lines.append(f"  {name:<20} {s['p50']:>9.2f} {s['p95']:>9.2f}")
+    if summary["counts"]:
+        lines.append(f"  {'counter':<20} {'p50':>9} {'p95':>9}")
+        for name, s in summary["counts"].items():
+            lines.append(f"  {name:<20} {s['p50']:>9g} {s['p95']:>9g}")
+    return "\n".join(lines)
+
+
+def batch_report(stderr: str) -> str:
+    """Stage table for an `og --batch` run: setup once, then per query."""
+    traces = parse_traces(stderr)
+    setup = [t for t in traces if "id" not in t]
+    queries = [t for t in traces if "id" in t]
+    lines = []
+    if setup:
+        lines.append(f"  Setup: {setup[0].get('total_ms', 0.0):.1f} ms")
+    lines.append(stage_table(queries))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="*")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.logs:
+        text = "\n".join(open(path, encoding="utf-8").read() for path in args.logs)
+    else:
+        text = sys.stdin.read()
+    traces = [t for t in parse_traces(text) if "id" in t] or parse_traces(text)
+
+    if args.json:
+        print(json.dumps(summarize(traces), indent=2))
+    else:
+        print(stage_table(traces))
+
+
+if __name__ == "__main__":
+    main()
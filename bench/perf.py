@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""Scaling benchmark: the og lifecycle on synthetic repos from 1k to 1M blocks.
+
+Generates deterministic multi-language repos (Python, Rust, Go, TypeScript and
+JavaScript files in the style of bench/golden) with a given number of blocks,
+then runs against each one: a fresh `og build`, a no-op rebuild, an
+incremental rebuild after editing one file, one cold query and a warm
+`--batch` of queries. Records wall time, blocks/s, peak RSS of each og process
+and on-disk `.og/` size as JSON.
+
+Compare mode: --baseline runs a second og binary on the same repos, and
+--compare diffs two saved result files. Both flag metrics that got worse by
+more than --threshold and exit 1 if any did.
+
+Usage:
+    uv run bench/perf.py
+    uv run bench/perf.py --sizes 1000,10000,100000 --out perf.json
+    uv run bench/perf.py --baseline /tmp/og-old --sizes 10000
+    uv run bench/perf.py --compare before.json after.json
+
+    --og PATH           og binary (default: target/release/og, else og on PATH)
+    --sizes LIST        Comma-separated block counts (default: 1000,10000)
+    --blocks-per-file N Blocks per generated file (default: 10)
+    --seed N            Generator seed (default: 42)
+    --queries N         Warm queries per batch run (default: 50)
+    --work DIR          Keep generated repos under DIR and reuse them (default: temp dir)
+    --baseline PATH     Second og binary to compare against
+    --compare OLD NEW   Compare two saved --out files instead of running
+    --threshold PCT     Regression threshold in percent (default: 10)
+    --out FILE          Write results as JSON to FILE
+    --json              Print results as JSON
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from index_size import find_og, tree_size
+from og_trace import parse_traces
+
+VERBS = [
+    "parse", "load", "validate", "render", "fetch", "store", "encode", "decode",
+    "merge", "filter", "schedule", "retry", "refresh", "resolve", "compute", "export",
+]
+NOUNS = [
+    "user", "order", "invoice", "token", "session", "config", "payment", "report",
+    "message", "queue", "cache", "metric", "record", "account", "request", "schema",
+]
+
+# One block per template; {name}/{Name} are snake/Pascal case, {a}/{b} nouns, {i} a number
+TEMPLATES = {
+    ".py": '''
+def {name}({a}, {b}=None):
+    """{Verb} the {a} and {b} records for batch {i}."""
+    if {a} is None:
+        raise ValueError("missing {a}")
+    result = {{"{a}": {a}, "{b}": {b}, "batch": {i}}}
+    for key in sorted(result):
+        result[key] = str(result[key]).strip()
+    return result
+''',
+    ".rs": '''
+/// {Verb} the {a} and {b} records for batch {i}.
+pub fn {name}({a}: &str, {b}: Option<&str>) -> Result<Vec<String>, String> {{
+    if {a}.is_empty() {{
+        return Err("missing {a}".to_string());
+    }}
+    let mut out = vec![{a}.to_string()];
+    out.extend({b}.map(str::to_string));
+    out.push({i}.to_string());
+    Ok(out)
+}}
+''',
+    ".go": '''
+// {Name} will {verb} the {a} and {b} records for batch {i}.
+func {Name}({a} string, {b} string) (map[string]string, error) {{
+	if {a} == "" {{
+		return nil, fmt.Errorf("missing {a}")
+	}}
+	result := map[string]string{{"{a}": {a}, "{b}": {b}}}
+	result["batch"] = fmt.Sprint({i})
+	return result, nil
+}}
+''',
+    ".ts": '''
+/** {Verb} the {a} and {b} records for batch {i}. */
+export function {camel}({a}: string, {b}?: string): Record<string, string> {{
+    if (!{a}) {{
+        throw new Error("missing {a}");
+    }}
+    const result: Record<string, string> = {{ {a}, batch: "{i}" }};
+    if ({b}) result.{b} = {b};
+    return result;
+}}
+''',
+    ".js": '''
+/**
+ * {Verb} the {a} and {b} records for batch {i}.
+ */
+export function {camel}({a}, {b}) {{
+    if (!{a}) {{
+        throw new Error("missing {a}");
+    }}
+    return {{ {a}, {b}: {b} ?? null, batch: {i} }};
+}}
+''',
+}
+HEADERS = {".py": "", ".rs": "", ".go": "package gen\n\nimport \"fmt\"\n", ".ts": "", ".js": ""}
+EXTS = list(TEMPLATES)
+
+# Metrics compared between runs; lower is better except blocks_per_s
+METRICS = [
+    "build_s", "blocks_per_s", "build_rss_mb", "noop_s", "incremental_s",
+    "cold_query_s", "query_p50_ms", "query_p95_ms", "query_rss_mb", "index_mb",
+]
+HIGHER_IS_BETTER = {"blocks_per_s"}
+
+
+def render_block(ext: str, rng: random.Random, i: int) -> str:
+    verb, a, b = rng.choice(VERBS), rng.choice(NOUNS), rng.choice(NOUNS)
+    if b == a:
+        b = f"other_{b}"
+    name = f"{verb}_{a}_{i}"
+    pascal = "".join(part.title() for part in name.split("_"))
+    return TEMPLATES[ext].format(
+        name=name,
+        Name=pascal,
+        camel=pascal[0].lower() + pascal[1:],
+        verb=verb,
+        Verb=verb.title(),
+        a=a,
+        b=b,
+        i=i,
+    )
+
+
+def file_path(root: Path, f: int) -> Path:
+    return root / f"pkg{f // 100:04d}" / f"mod_{f}{EXTS[f % len(EXTS)]}"
+
+
+def render_file(f: int, blocks_per_file: int, seed: int) -> str:
+    """File `f` of a repo. Depends only on (f, blocks_per_file, seed), so any
+    file can be regenerated on its own."""
+    ext = EXTS[f % len(EXTS)]
+    rng = random.Random(seed * 1_000_003 + f)
+    blocks = [render_block(ext, rng, f * blocks_per_file + j) for j in range(blocks_per_file)]
+    return HEADERS[ext] + "".join(blocks)
+
+
+def make_repo(root: Path, n_blocks: int, blocks_per_file: int, seed: int) -> int:
+    """Write a repo of about n_blocks blocks, 100 files per directory. Reuses
+    a complete repo from an earlier run. Returns the file count."""
+    n_files = max(1, n_blocks // blocks_per_file)
+    marker = root / ".perf-complete"
+    spec = f"{n_blocks} {blocks_per_file} {seed}"
+    if marker.exists() and marker.read_text() == spec:
+        return n_files
+    shutil.rmtree(root, ignore_errors=True)
+    for f in range(n_files):
+        path = file_path(root, f)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(render_file(f, blocks_per_file, seed), encoding="utf-8")
+    marker.write_text(spec)
+    return n_files
+
+
+def make_queries(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(VERBS)} the {rng.choice(NOUNS)} records" for _ in range(n)]
+
+
+def run(cmd: list[str], env: dict | None = None) -> tuple[float, float, str, str]:
+    """Run og, returning (wall seconds, peak RSS MiB, stdout, stderr).
+
+    Output goes to temp files rather than pipes so a wait4() on the child
+    can't deadlock, and wait4 gives this child's own peak RSS.
+    """
+    with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=out, stderr=err, env=env, text=True)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        stdout, stderr = out.read(), err.read()
+    if proc.returncode != 0:
+        print(f"{' '.join(cmd)} failed ({proc.returncode}):\n{stderr}", file=sys.stderr)
+        sys.exit(1)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss / (1 << 20) if sys.platform == "darwin" else usage.ru_maxrss / 1024
+    return elapsed, rss, stdout, stderr
+
+
+def pct(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def lifecycle(og: str, root: Path, n_files: int, args: argparse.Namespace) -> dict:
+    env = {**os.environ, "OG_NO_SERVER": "1"}
+    shutil.rmtree(root / ".og", ignore_errors=True)
+
+    build_s, build_rss, _, _ = run([og, "build", "--quiet", str(root)], env)
+    _, _, status, _ = run([og, "status", str(root)], env)
+    blocks = next(
+        (int(w) for w, nxt in zip(status.split(), status.split()[1:]) if nxt.startswith("blocks")),
+        n_files * args.blocks_per_file,
+    )
+
+    noop_s, _, _, _ = run([og, "build", "--quiet", str(root)], env)
+
+    # Incremental: one more block in one file, then put the file back
+    edited = file_path(root, n_files // 2)
+    original = edited.read_text(encoding="utf-8")
+    rng = random.Random(args.seed)
+    edited.write_text(original + render_block(edited.suffix, rng, n_files * args.blocks_per_file), encoding="utf-8")
+    incremental_s, _, _, _ = run([og, "build", "--quiet", str(root)], env)
+    edited.write_text(original, encoding="utf-8")
+
+    queries = make_queries(args.queries, args.seed)
+    cold_s, _, _, _ = run([og, queries[0], str(root), "-n", "10", "--quiet"], env)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+        for i, query in enumerate(queries):
+            f.write(json.dumps({"id": i, "query": query}) + "\n")
+        batch_path = f.name
+    try:
+        _, query_rss, _, stderr = run(
+            [og, "--batch", batch_path, str(root), "-n", "10", "--quiet"],
+            {**env, "OG_TRACE": "json"},
+        )
+    finally:
+        os.unlink(batch_path)
+    latencies = [t["total_ms"] for t in parse_traces(stderr) if "id" in t]
+
+    result = {
+        "blocks": blocks,
+        "files": n_files,
+        "build_s": round(build_s, 3),
+        "blocks_per_s": round(blocks / build_s, 1) if build_s else None,
+        "build_rss_mb": round(build_rss, 1),
+        "noop_s": round(noop_s, 3),
+        "incremental_s": round(incremental_s, 3),
+        "cold_query_s": round(cold_s, 3),
+        "query_p50_ms": round(pct(latencies, 50), 2) if latencies else None,
+        "query_p95_ms": round(pct(latencies, 95), 2) if latencies else None,
+        "query_rss_mb": round(query_rss, 1),
+        "index_mb": round(tree_size(root / ".og") / (1 << 20), 2),
+    }
+    shutil.rmtree(root / ".og", ignore_errors=True)
+    return result
+
+
+def regressions(old: list[dict], new: list[dict], threshold: float) -> list[dict]:
+    """Metrics in `new` worse than `old` by more than threshold percent,
+    matched by requested size."""
+    old_by_size = {r["size"]: r for r in old}
+    flagged = []
+    for cur in new:
+        base = old_by_size.get(cur["size"])
+        if not base:
+            continue
+        for metric in METRICS:
+            before, after = base.get(metric), cur.get(metric)
+            if not before or after is None:
+                continue
+            change = (after / before - 1) * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > threshold:
+                flagged.append(
+                    {"size": cur["size"], "metric": metric, "before": before, "after": after,
+                     "change_pct": round(change, 1)}
+                )
+    return flagged
+
+
+def print_table(label: str, results: list[dict]) -> None:
+    print(f"{label}")
+    print(
+        f"{'blocks':>9}  {'build':>8}  {'blk/s':>8}  {'RSS MB':>7}  {'no-op':>7}  "
+        f"{'incr':>7}  {'cold q':>7}  {'p50 ms':>7}  {'p95 ms':>7}  {'index MB':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['blocks']:>9}  {r['build_s']:>7.2f}s  {r['blocks_per_s'] or 0:>8.0f}  "
+            f"{r['build_rss_mb']:>7.0f}  {r['noop_s']:>6.2f}s  {r['incremental_s']:>6.2f}s  "
+            f"{r['cold_query_s']:>6.2f}s  {r['query_p50_ms'] or 0:>7.1f}  "
+            f"{r['query_p95_ms'] or 0:>7.1f}  {r['index_mb']:>8.1f}"
+        )
+
+
+def report_regressions(flagged: list[dict], threshold: float) -> None:
+    if not flagged:
+        print(f"\nNo regressions over {threshold:g}%")
+        return
+    print(f"\nRegressions over {threshold:g}%:")
+    for f in flagged:
+        print(f"  {f['size']:>9} {f['metric']:<14} {f['before']} -> {f['after']} ({f['change_pct']:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--og", default=None)
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--blocks-per-file", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--work", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None)
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (json.loads(Path(p).read_text())["current"] for p in args.compare)
+        flagged = regressions(old, new, args.threshold)
+        if args.json:
+            print(json.dumps(flagged, indent=2))
+        else:
+            report_regressions(flagged, args.threshold)
+        sys.exit(1 if flagged else 0)
+
+    og = find_og(args.og)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    base = Path(args.work) if args.work else Path(tempfile.mkdtemp(prefix="og-perf-"))
+
+    output: dict = {"og": og, "seed": args.seed, "blocks_per_file": args.blocks_per_file, "current": []}
+    if args.baseline:
+        output["baseline_og"] = args.baseline
+        output["baseline"] = []
+    try:
+        for size in sizes:
+            root = base / f"repo_{size}_{args.blocks_per_file}_{args.seed}"
+            if not args.json:
+                print(f"Generating {size} blocks...", file=sys.stderr)
+            n_files = make_repo(root, size, args.blocks_per_file, args.seed)
+            for key, binary in [("current", og), ("baseline", args.baseline)]:
+                if binary is None:
+                    continue
+                if not args.json:
+                    print(f"  {key}: og lifecycle on {n_files} files...", file=sys.stderr)
+                output[key].append({"size": size, **lifecycle(binary, root, n_files, args)})
+    finally:
+        if not args.work:
+            shutil.rmtree(base, ignore_errors=True)
+
+    flagged = regressions(output["baseline"], output["current"], args.threshold) if args.baseline else []
+    if args.baseline:
+        output["regressions"] = flagged
+    if args.out:
+        Path(args.out).write_text(json.dumps(output, indent=2) + "\n")
+
+    if args.json:
+        print(json.dumps(output, indent=2))
+    else:
+        print_table(f"og: {og}", output["current"])
+        if args.baseline:
+            print()
+            print_table(f"baseline: {args.baseline}", output["baseline"])
+            report_regressions(flagged, args.threshold)
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,9 @@ Corpus:  Nan-Do/code-search-net-python test partition, subsampled
 Queries: docstrings as NL queries, sampled from corpus (seed=42)
 Metrics: MRR@10, Recall@1/5/10
 
-Default: 2000 corpus functions, 100 queries (~5 min).
-Full run: --corpus-size 22091 --queries 500 (~100 min, subprocess overhead).
+Default: 2000 corpus functions, 100 queries (~5 min, mostly index build).
+Full run: --corpus-size 22091 --queries 500. Queries run through a single
+`og --batch` process, so the model and index load once for the whole run.
 
 Usage:
     uv run bench/quality.py [options]
@@ -25,6 +26,11 @@ Usage:
     --k N               Recall cutoff, also MRR@k (default: 10)
     --skip-corpus       Skip writing corpus files (already written)
     --skip-build        Skip og build (index already built)
+    --server [SOCKET]   Query a running `og serve` and report p50/p95/p99 latency
+    --trace             Print per-stage p50/p95 timings from OG_TRACE=json
+    --token-pool N,...  Rebuild at each token pooling factor (e.g. 1,2,4) and
+                        compare index size, build time, query latency and
+                        quality side by side
 
 Run from the omengrep repo root.
 """
@@ -35,6 +41,8 @@ import os
 import random
 import subprocess
 import sys
+import tempfile
+import time
 from pathlib import Path
 
 from datasets import load_dataset
@@ -47,38 +55,124 @@ def write_corpus(examples: list[dict], corpus_dir: Path) -> None:
         (corpus_dir / f"{idx:06d}.py").write_text(ex["code"], encoding="utf-8")
 
 
-def build_index(og: str, corpus_dir: Path) -> None:
-    print(f"Building index: {og} build {corpus_dir}")
-    r = subprocess.run([og, "build", str(corpus_dir)], capture_output=True, text=True)
+def build_index(og: str, corpus_dir: Path, settings: list[str] | None = None) -> float:
+    """Build the index, from scratch when build `settings` flags are given.
+    Returns seconds."""
+    cmd = [og, "build", str(corpus_dir)]
+    if settings:
+        cmd += [*settings, "--force"]
+    print(f"Building index: {' '.join(cmd)}")
+    t0 = time.perf_counter()
+    r = subprocess.run(cmd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
     if r.returncode != 0:
         print(r.stderr, file=sys.stderr)
         sys.exit(1)
     if r.stdout.strip():
         print(r.stdout.strip())
+    return elapsed
 
 
-def search(og: str, query: str, corpus_dir: Path, k: int) -> list[dict]:
-    r = subprocess.run(
-        [og, query, str(corpus_dir), "--json", "-n", str(k)],
-        capture_output=True,
-        text=True,
-    )
-    # exit 0 = results, 1 = no match, 2 = error
-    if r.returncode == 2 or not r.stdout.strip():
-        return []
+def batch_search(
+    og: str,
+    queries: list[tuple[int, str]],
+    corpus_dir: Path,
+    k: int,
+    trace: bool = False,
+    latencies: list[float] | None = None,
+) -> dict[int, list[dict]]:
+    """Run all queries through one `og --batch` process, keyed by query id.
+
+    With `trace`, og's per-query stage timings are collected from stderr and
+    summarized after the run. With `latencies`, each query's traced total
+    time (ms) is appended to it.
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".jsonl", delete=False, encoding="utf-8"
+    ) as f:
+        for idx, query in queries:
+            f.write(json.dumps({"id": idx, "query": query}) + "\n")
+        batch_path = f.name
+
+    results: dict[int, list[dict]] = {}
+    # stderr goes to a file, not a pipe, so a long traced run can't block og
+    traced = trace or latencies is not None
+    stderr = tempfile.TemporaryFile("w+", encoding="utf-8") if traced else None
+    env = {**os.environ, "OG_TRACE": "json"} if traced else None
     try:
-        return json.loads(r.stdout)
-    except json.JSONDecodeError:
-        return []
+        proc = subprocess.Popen(
+            [og, "--batch", batch_path, str(corpus_dir), "-n", str(k), "--quiet"],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            env=env,
+            text=True,
+        )
+        assert proc.stdout is not None
+        for line in tqdm(proc.stdout, total=len(queries), desc="Querying"):
+            record = json.loads(line)
+            if "error" in record:
+                print(f"Query {record['id']} failed: {record['error']}", file=sys.stderr)
+            results[record["id"]] = record.get("results", [])
+        if proc.wait() != 0:
+            print(f"og --batch exited with {proc.returncode}", file=sys.stderr)
+            sys.exit(1)
+        if stderr is not None:
+            from og_trace import batch_report, query_latencies
+
+            stderr.seek(0)
+            log = stderr.read()
+            if trace:
+                print(batch_report(log))
+            if latencies is not None:
+                latencies.extend(query_latencies(log))
+    finally:
+        os.unlink(batch_path)
+        if stderr is not None:
+            stderr.close()
+    return results
+
 
+def server_search(
+    socket_path: str | None, queries: list[tuple[int, str]], corpus_dir: Path, k: int
+) -> tuple[dict[int, list[dict]], dict]:
+    """Run queries against `og serve`, returning results and latency percentiles."""
+    from og_client import OgClient, latency_summary
 
-def evaluate(og: str, queries: list[tuple[int, str]], corpus_dir: Path, k: int) -> dict:
+    results: dict[int, list[dict]] = {}
+    with OgClient(socket_path or None) as client:
+        for idx, query in tqdm(queries, desc="Querying (server)"):
+            results[idx] = client.search(query, corpus_dir, k)
+        return results, latency_summary(client.latencies_ms)
+
+
+def evaluate(
+    og: str,
+    queries: list[tuple[int, str]],
+    corpus_dir: Path,
+    k: int,
+    server: str | None = None,
+    trace: bool = False,
+    batch_latency: bool = False,
+) -> dict:
+    """MRR and recall over `queries`. Latency percentiles come from the server,
+    or with `batch_latency` from og's traced per-query time under `--batch`."""
     reciprocal_ranks: list[float] = []
     hits: dict[int, int] = {1: 0, 5: 0, k: 0}
 
-    for idx, query in tqdm(queries, desc="Querying"):
+    latency = None
+    if server is not None:
+        all_results, latency = server_search(server, queries, corpus_dir, k)
+    else:
+        latencies: list[float] | None = [] if batch_latency else None
+        all_results = batch_search(og, queries, corpus_dir, k, trace, latencies)
+        if latencies:
+            from og_client import latency_summary
+
+            latency = latency_summary(latencies)
+
+    for idx, _query in queries:
         gold = f"{idx:06d}.py"
-        results = search(og, query, corpus_dir, k)
+        results = all_results.get(idx, [])
 
         rank = None
         for i, r in enumerate(results, 1):
@@ -94,13 +188,53 @@ def evaluate(og: str, queries: list[tuple[int, str]], corpus_dir: Path, k: int)
                     hits[cutoff] += 1
 
     n = len(queries)
-    return {
+    metrics = {
         "n_queries": n,
         "mrr": round(sum(reciprocal_ranks) / n, 4),
         "recall@1": round(hits[1] / n, 4),
         "recall@5": round(hits[5] / n, 4),
         f"recall@{k}": round(hits[k] / n, 4),
     }
+    if latency:
+        metrics["latency"] = latency
+    return metrics
+
+
+def settings_sweep(
+    og: str,
+    flag: str,
+    values: list[str],
+    queries: list[tuple[int, str]],
+    corpus_dir: Path,
+    k: int,
+    server: str | None,
+) -> list[dict]:
+    """Rebuild the index with each value of the build `flag` and evaluate it."""
+    from index_size import tree_size
+
+    rows = []
+    for value in values:
+        build_s = build_index(og, corpus_dir, [flag, value])
+        metrics = evaluate(og, queries, corpus_dir, k, server, batch_latency=True)
+        metrics["setting"] = value
+        metrics["build_s"] = round(build_s, 2)
+        metrics["index_bytes"] = tree_size(corpus_dir / ".og")
+        rows.append(metrics)
+    return rows
+
+
+def print_sweep(label: str, rows: list[dict], k: int) -> None:
+    print(
+        f"  {label:<10} {'index MiB':>10} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8}"
+        f" {f'MRR@{k}':>8} {'R@1':>7} {f'R@{k}':>7}"
+    )
+    for row in rows:
+        lat = row.get("latency", {})
+        print(
+            f"  {row['setting']:<10} {row['index_bytes'] / 2**20:>10.2f} {row['build_s']:>8.1f}"
+            f" {lat.get('p50_ms', 0.0):>8.1f} {lat.get('p95_ms', 0.0):>8.1f}"
+            f" {row['mrr']:>8.4f} {row['recall@1']:>7.4f} {row[f'recall@{k}']:>7.4f}"
+        )
 
 
 def main() -> None:
@@ -112,8 +246,18 @@ def main() -> None:
     parser.add_argument("--k", type=int, default=10)
     parser.add_argument("--skip-corpus", action="store_true")
     parser.add_argument("--skip-build", action="store_true")
+    parser.add_argument("--server", nargs="?", const="", default=None)
+    parser.add_argument("--trace", action="store_true")
+    parser.add_argument("--token-pool")
     args = parser.parse_args()
 
+    sweep: tuple[str, list[str]] | None = None
+    if args.token_pool:
+        factors = args.token_pool.split(",")
+        if not all(f.isdigit() and 1 <= int(f) <= 8 for f in factors):
+            parser.error("--token-pool takes factors between 1 and 8, e.g. 1,2,4")
+        sweep = ("--token-pool", factors)
+
     corpus_dir = Path(args.corpus_dir)
     og = args.og_bin
     k = args.k
@@ -143,7 +287,9 @@ def main() -> None:
     else:
         print(f"Using existing corpus at {corpus_dir}")
 
-    if not args.skip_build:
+    if sweep:
+        print(f"Building once per {sweep[0]} value")
+    elif not args.skip_build:
         build_index(og, corpus_dir)
     else:
         print("Skipping index build")
@@ -155,7 +301,18 @@ def main() -> None:
     ]
     print(f"Sampled {len(queries)} queries (seed=42)")
 
-    metrics = evaluate(og, queries, corpus_dir, k)
+    if sweep:
+        flag, values = sweep
+        rows = settings_sweep(og, flag, values, queries, corpus_dir, k, args.server)
+        label = flag.removeprefix("--")
+        print()
+        print(f"  {label} sweep: {len(examples)} functions, {len(queries)} queries")
+        print_sweep(label, rows, k)
+        print()
+        print(json.dumps(rows, indent=2))
+        return
+
+    metrics = evaluate(og, queries, corpus_dir, k, args.server, args.trace)
     metrics["corpus_size"] = len(examples)
 
     print()
@@ -170,6 +327,9 @@ def main() -> None:
     print(f"  Recall@1 : {metrics['recall@1']:.4f}")
     print(f"  Recall@5 : {metrics['recall@5']:.4f}")
     print(f"  Recall@{k:<2}: {metrics[f'recall@{k}']:.4f}")
+    if "latency" in metrics:
+        lat = metrics["latency"]
+        print(f"  p50/p99  : {lat['p50_ms']:.1f} / {lat['p99_ms']:.1f} ms")
     print("=" * 44)
     print()
     print(json.dumps(metrics, indent=2))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# ///
+"""Startup benchmark: cold and warm wall time of every og subcommand.
+
+Copies a corpus to a scratch directory, builds its index once, then runs each
+subcommand against it. The cold run is the first run on a fresh copy of the
+index, so og's own caches (query embeddings, open stores) start empty;
+--drop-caches also drops the OS page cache before it (Linux, root). Warm is
+the median of the following runs. The `model` column shows whether the run
+loaded the embedding model, from og's trace output. Commands that never embed
+should not load it, and a cached query should not either.
+
+Usage:
+    uv run bench/startup.py
+    uv run bench/startup.py --repeat 10 --baseline /tmp/og-old --json
+
+    CORPUS          Directory to index (default: bench/golden)
+    --og PATH       og binary (default: target/release/og, else og on PATH)
+    --baseline PATH Second og binary to compare warm times against
+    --repeat N      Warm runs per subcommand (default: 5)
+    --drop-caches   Drop the OS page cache before each cold run (needs root)
+    --json          Print results as JSON
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# (name, args); {root} is the indexed copy, {n} a per-run counter
+COMMANDS = [
+    ("help", ["--help"]),
+    ("model", ["model"]),
+    ("status", ["status", "{root}"]),
+    ("list", ["list", "{root}"]),
+    ("build (no-op)", ["build", "{root}"]),
+    ("outline", ["outline", "{root}/auth.py"]),
+    ("context", ["context", "{root}"]),
+    ("similar", ["{root}/auth.py#verify_password", "{root}"]),
+    ("search (cached)", ["check a user's password", "{root}"]),
+    ("search (new)", ["password check variant {n}", "{root}"]),
+    ("clean", ["clean", "{root}"]),
+]
+
+
+def find_og(explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    release = Path(__file__).resolve().parent.parent / "target" / "release" / "og"
+    if release.exists():
+        return str(release)
+    found = shutil.which("og")
+    if not found:
+        print("og binary not found; pass --og or run cargo build --release", file=sys.stderr)
+        sys.exit(1)
+    return found
+
+
+def drop_caches() -> None:
+    os.sync()
+    try:
+        Path("/proc/sys/vm/drop_caches").write_text("3\n")
+    except OSError as e:
+        print(f"Can't drop page cache ({e}); cold runs use a warm page cache", file=sys.stderr)
+
+
+def run(og: str, args: list[str], root: Path, n: int) -> tuple[float, bool]:
+    """Wall time of one og run, and whether it loaded the model."""
+    from og_trace import parse_traces
+
+    argv = [og, *(a.format(root=root, n=n) for a in args)]
+    env = {**os.environ, "OG_NO_SERVER": "1", "OG_TRACE": "json"}
+    t0 = time.perf_counter()
+    r = subprocess.run(argv, capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - t0
+    if r.returncode not in (0, 1):
+        print(f"{' '.join(argv)} failed:\n{r.stderr}", file=sys.stderr)
+        sys.exit(1)
+    loaded = any(
+        span["name"] == "load_model"
+        for trace in parse_traces(r.stderr)
+        for span in trace.get("spans", [])
+    )
+    return elapsed, loaded
+
+
+def bench(og: str, corpus: Path, repeat: int, cold_drop: bool) -> list[dict]:
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="og-startup-") as tmp:
+        built = Path(tmp) / "built"
+        shutil.copytree(corpus, built, ignore=shutil.ignore_patterns(".og"))
+        r = subprocess.run([og, "build", "--quiet", str(built)], capture_output=True, text=True)
+        if r.returncode != 0:
+            print(f"og build failed on {corpus}:\n{r.stderr}", file=sys.stderr)
+            sys.exit(1)
+
+        for i, (name, args) in enumerate(COMMANDS):
+            # Fresh copy per command: clean deletes the index, and cold runs
+            # must not see caches an earlier command filled
+            root = Path(tmp) / f"run{i}"
+            shutil.copytree(built, root)
+            if cold_drop:
+                drop_caches()
+            cold, cold_loaded = run(og, args, root, 0)
+
+            warm = []
+            warm_loaded = False
+            for n in range(1, repeat + 1):
+                if name == "clean":
+                    shutil.rmtree(root)
+                    shutil.copytree(built, root)
+                elapsed, loaded = run(og, args, root, n)
+                warm.append(elapsed)
+                warm_loaded |= loaded
+            rows.append({
+                "command": name,
+                "cold_ms": round(cold * 1000, 1),
+                "warm_ms": round(statistics.median(warm) * 1000, 1) if warm else None,
+                "cold_loads_model": cold_loaded,
+                "warm_loads_model": warm_loaded,
+            })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default="bench/golden")
+    parser.add_argument("--og", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--drop-caches", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    corpus = Path(args.corpus)
+    if not corpus.is_dir():
+        print(f"Not a directory: {corpus}", file=sys.stderr)
+        sys.exit(1)
+
+    og = find_og(args.og)
+    rows = bench(og, corpus, args.repeat, args.drop_caches)
+    if args.baseline:
+        base = {r["command"]: r for r in bench(args.baseline, corpus, args.repeat, args.drop_caches)}
+        for row in rows:
+            row["baseline"] = base[row["command"]]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    def model(loaded: bool) -> str:
+        return "loads" if loaded else "-"
+
+    print(f"{'command':<16}  {'cold ms':>9}  {'warm ms':>9}  {'model':>6}  {'vs base':>8}")
+    for row in rows:
+        warm = row["warm_ms"]
+        delta = "-"
+        base = row.get("baseline")
+        if base and base["warm_ms"] and warm is not None:
+            delta = f"{(warm / base['warm_ms'] - 1) * 100:+.1f}%"
+        print(
+            f"{row['command']:<16}  {row['cold_ms']:>9.1f}  "
+            f"{warm if warm is not None else float('nan'):>9.1f}  "
+            f"{model(row['cold_loads_model'] or row['warm_loads_model']):>6}  {delta:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
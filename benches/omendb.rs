@@ -5,14 +5,19 @@
 //   - index_multi: inserting multi-vectors
 //   - search_multi_with_text: hybrid BM25 + semantic rerank
 //   - query_with_options: pure semantic search
+//   - retrieve_*: og's hybrid retrieval stage (both passes plus merge), the
+//     previous merge by cloned ID vs the fused stage with max / RRF fusion
 //
 // Run: cargo bench --bench omendb
 // Compare two builds: run on each, diff the output.
 
+use std::collections::HashMap;
+use std::collections::hash_map::Entry;
 use std::path::Path;
 
 use divan::{Bencher, black_box};
-use omendb::{MultiVectorConfig, SearchOptions, VectorStore};
+use omendb::{MultiVectorConfig, SearchOptions, SearchResult, VectorStore};
+use omengrep::index::fusion::{self, Fusion};
 
 fn main() {
     divan::main();
@@ -154,3 +159,78 @@ fn search_semantic(bencher: Bencher) {
         black_box(results);
     });
 }
+
+// --- Hybrid retrieval stage ---
+
+const RETRIEVE_K: usize = 30;
+
+fn both_passes(
+    store: &VectorStore,
+    token_refs: &[&[f32]],
+) -> (Vec<SearchResult>, Vec<SearchResult>) {
+    let (bm25, semantic) = rayon::join(
+        || {
+            store.search_multi_with_text(
+                "fn benchmark_function impl struct",
+                token_refs,
+                RETRIEVE_K,
+                Some(RETRIEVE_K),
+                false,
+            )
+        },
+        || store.query_with_options(token_refs, RETRIEVE_K, &SearchOptions::default()),
+    );
+    (bm25.unwrap(), semantic.unwrap())
+}
+
+/// Previous path: merge into a map keyed by cloned IDs, then sort.
+#[divan::bench]
+fn retrieve_merge_by_clone(bencher: Bencher) {
+    let dir = tempfile::tempdir().unwrap();
+    let store = make_store(dir.path());
+
+    let query_tokens = make_tokens(42);
+    let token_refs: Vec<&[f32]> = query_tokens.iter().map(|v| v.as_slice()).collect();
+
+    bencher.bench_local(|| {
+        let (bm25, semantic) = both_passes(&store, black_box(&token_refs));
+        let mut best: HashMap<String, SearchResult> = HashMap::new();
+        for r in bm25.into_iter().chain(semantic) {
+            match best.entry(r.id.clone()) {
+                Entry::Occupied(mut e) => {
+                    if r.distance > e.get().distance {
+                        *e.get_mut() = r;
+                    }
+                }
+                Entry::Vacant(e) => {
+                    e.insert(r);
+                }
+            }
+        }
+        let mut hits: Vec<SearchResult> = best.into_values().collect();
+        hits.sort_by(|a, b| b.distance.partial_cmp(&a.distance).unwrap());
+        black_box(hits);
+    });
+}
+
+/// Current path: one fusion pass over borrowed IDs.
+#[divan::bench(args = ["max", "rrf"])]
+fn retrieve_fused(bencher: Bencher, fusion_name: &str) {
+    let dir = tempfile::tempdir().unwrap();
+    let store = make_store(dir.path());
+    let fusion = Fusion::parse(fusion_name).unwrap();
+
+    let query_tokens = make_tokens(42);
+    let token_refs: Vec<&[f32]> = query_tokens.iter().map(|v| v.as_slice()).collect();
+
+    bencher.bench_local(|| {
+        let (bm25, semantic) = both_passes(&store, black_box(&token_refs));
+        let hits = fusion::fuse(
+            vec![bm25, semantic],
+            fusion,
+            |r| r.id.as_str(),
+            |r| r.distance,
+        );
+        black_box(hits);
+    });
+}
@@ -1,18 +1,46 @@
-use std::path::Path;
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
 use std::time::Instant;
 
 use anyhow::Result;
 
-use crate::index::{self, SemanticIndex, walker};
-use crate::types::EXIT_ERROR;
+use crate::embedder;
+use crate::index::shard::{self, ShardLayout};
+use crate::index::{
+    self, BuildOrder, INDEX_DIR, SemanticIndex, TreeChanges, TreeScan, checkpoint, git, manifest,
+    walker,
+};
+use crate::types::{EXIT_ERROR, IndexStats};
 
-pub fn run(path: &Path, force: bool, quiet: bool) -> Result<()> {
+/// What `og build` keeps of an existing index and how it stores new blocks.
+#[derive(Debug, Clone, Copy, Default)]
+pub struct BuildSettings {
+    /// Discard the existing index and build from scratch.
+    pub force: bool,
+    /// Token pool factor for newly embedded blocks. `None` keeps the one the
+    /// index has.
+    pub token_pool: Option<u8>,
+}
+
+pub fn run(
+    path: &Path,
+    embed_sessions: Option<usize>,
+    order: BuildOrder,
+    shard_patterns: &[String],
+    settings: BuildSettings,
+    quiet: bool,
+) -> Result<()> {
     let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
+    let sessions = embed_sessions
+        .filter(|&n| n > 0)
+        .unwrap_or_else(embedder::build_sessions);
+    let force = settings.force;
 
     // Check for parent index that already covers this path
     let build_path = if !index_exists(&path) {
         if let Some(parent) = index::find_parent_index(&path) {
-            if !force {
+            // A shard of a sharded parent is rebuilt in place, even with --force
+            if !force || shard::is_sharded(&parent.join(INDEX_DIR)) {
                 if !quiet {
                     eprintln!("Using parent index at {}", parent.display());
                 }
@@ -27,72 +55,71 @@ pub fn run(path: &Path, force: bool, quiet: bool) -> Result<()> {
         path.clone()
     };
 
+    let index_dir = build_path.join(INDEX_DIR);
+    let layout = if shard_patterns.is_empty() {
+        ShardLayout::load(&index_dir)
+    } else {
+        Some(ShardLayout::new(shard_patterns))
+    };
+    if let Some(layout) = layout {
+        super::serve::release(&build_path);
+        return build_shards(
+            &build_path,
+            &path,
+            layout,
+            sessions,
+            &order,
+            settings,
+            quiet,
+        );
+    }
+
+    if checkpoint::is_building(&index_dir) {
+        eprintln!("og build is already running for {}", build_path.display());
+        std::process::exit(EXIT_ERROR);
+    }
+    if !force && !quiet && checkpoint::interrupted(&index_dir) {
+        eprintln!("Resuming interrupted build from its last checkpoint");
+    }
+
+    // A running `og serve` may hold the store open
+    super::serve::release(&build_path);
+
     // Find subdir indexes that will be superseded
     let subdir_indexes = index::find_subdir_indexes(&build_path, false);
 
-    if force {
+    // Stored vectors can't be converted between pool factors: start over
+    let existing_pool = manifest::exists(&index_dir).then(|| manifest::token_pool(&index_dir));
+    let rebuild = existing_pool.is_some()
+        && settings.token_pool.is_some()
+        && settings.token_pool != existing_pool;
+    if rebuild && !force && !quiet {
+        eprintln!("Token pooling changed, rebuilding index");
+    }
+    let token_pool = settings.token_pool.or(existing_pool).unwrap_or(1);
+
+    if force || rebuild {
         // Full rebuild: always clear index dir (handles corrupt/partial state)
-        let index_dir = build_path.join(crate::index::INDEX_DIR);
         if index_dir.exists() {
             std::fs::remove_dir_all(&index_dir)?;
         }
-        build_index(&build_path, quiet)?;
+        build_fresh(&build_path, sessions, &order, token_pool, quiet)?;
     } else if index_exists(&build_path) {
-        // Incremental update
+        // Incremental update: ask git what changed since the last build, or
+        // stat every file; read and hash only those whose content may differ
+        let mut index = SemanticIndex::for_build(&build_path, sessions);
+        index.set_build_order(order.clone());
+        index.set_token_pool(token_pool);
         if !quiet {
             eprint!("Scanning files...");
         }
-        let files = walker::scan(&build_path)?;
+        let scan = index.scan_tree()?;
         if !quiet {
             eprintln!("\r                 \r");
         }
-
-        let index = SemanticIndex::new(&build_path, None)?;
-        let stale_result = index.get_stale_files(&files);
-
-        match stale_result {
-            Ok((changed, deleted)) => {
-                let stale_count = changed.len() + deleted.len();
-                if stale_count == 0 {
-                    if !quiet {
-                        eprintln!("Index up to date");
-                    }
-                } else {
-                    if !quiet {
-                        eprint!("Updating {stale_count} files...");
-                    }
-                    let stats = index.update(&files)?;
-                    if !quiet {
-                        eprintln!(
-                            "\rUpdated {} blocks from {} files        ",
-                            stats.blocks, stats.files
-                        );
-                        if stats.deleted > 0 {
-                            eprintln!("  Removed {} stale blocks", stats.deleted);
-                        }
-                    }
-                }
-            }
-            Err(e) => {
-                let msg = e.to_string();
-                if msg.contains("older version") {
-                    // Model or format changed - force rebuild
-                    if !quiet {
-                        eprintln!("Rebuilding (index format changed)...");
-                    }
-                    let index_dir = build_path.join(crate::index::INDEX_DIR);
-                    if index_dir.exists() {
-                        std::fs::remove_dir_all(&index_dir)?;
-                    }
-                    build_index(&build_path, quiet)?;
-                } else {
-                    eprintln!("{e}");
-                    std::process::exit(EXIT_ERROR);
-                }
-            }
-        }
+        update_index(&index, &scan, sessions, quiet)?;
     } else {
-        build_index(&build_path, quiet)?;
+        build_fresh(&build_path, sessions, &order, token_pool, quiet)?;
     }
 
     // Clean up subdir indexes now superseded by parent
@@ -109,12 +136,208 @@ pub fn run(path: &Path, force: bool, quiet: bool) -> Result<()> {
 }
 
 fn index_exists(path: &Path) -> bool {
-    path.join(crate::index::INDEX_DIR)
-        .join("manifest.json")
-        .exists()
+    index::has_index(&path.join(INDEX_DIR))
 }
 
-pub fn build_index(path: &Path, quiet: bool) -> Result<()> {
+/// Build the shards of a sharded index that hold files under `scope`. Each
+/// shard has its own store, manifest and build marker, so one shard can be
+/// rebuilt while searches keep reading the others.
+fn build_shards(
+    root: &Path,
+    scope: &Path,
+    mut layout: ShardLayout,
+    sessions: usize,
+    order: &BuildOrder,
+    settings: BuildSettings,
+    quiet: bool,
+) -> Result<()> {
+    let force = settings.force;
+    let index_dir = root.join(INDEX_DIR);
+
+    // Shards share their settings: new shards take those of the built ones
+    let saved = ShardLayout::load(&index_dir);
+    let built = saved.iter().flat_map(|s| &s.shards).find_map(|s| {
+        let dir = shard::shard_dir(&index_dir, &s.name);
+        manifest::exists(&dir).then_some(dir)
+    });
+    let token_pool = settings
+        .token_pool
+        .or_else(|| built.as_deref().map(manifest::token_pool))
+        .unwrap_or(1);
+
+    // A new layout moves files between shards: start over
+    if index_dir.exists()
+        && saved
+            .as_ref()
+            .is_none_or(|saved| saved.patterns != layout.patterns)
+    {
+        let building = checkpoint::is_building(&index_dir)
+            || saved
+                .iter()
+                .flat_map(|s| &s.shards)
+                .any(|s| checkpoint::is_building(&shard::shard_dir(&index_dir, &s.name)));
+        if building {
+            eprintln!("og build is already running for {}", root.display());
+            std::process::exit(EXIT_ERROR);
+        }
+        if !quiet {
+            eprintln!("Shard layout changed, rebuilding index");
+        }
+        std::fs::remove_dir_all(&index_dir)?;
+    }
+
+    // Taken before the walk, so edits made during it are rechecked next time
+    let state = git::snapshot(root);
+    if !quiet {
+        eprint!("Scanning files...");
+    }
+    let metadata = walker::scan_metadata(root)?;
+    if !quiet {
+        eprintln!("\r                 \r");
+    }
+
+    let relative = |path: &Path| {
+        path.strip_prefix(root)
+            .unwrap_or(path)
+            .to_string_lossy()
+            .into_owned()
+    };
+    let rel_paths: Vec<String> = metadata.keys().map(|p| relative(p)).collect();
+    layout.resolve(rel_paths.iter().map(String::as_str));
+    layout.save(&index_dir)?;
+    shard::remove_unlisted(&index_dir, &layout);
+
+    let mut parts: Vec<HashMap<PathBuf, walker::FileMetadata>> =
+        vec![HashMap::new(); layout.shards.len()];
+    for (path, meta) in metadata {
+        parts[layout.assign(&relative(&path))].insert(path, meta);
+    }
+
+    let scope = relative(scope);
+    let scope = (!scope.is_empty()).then_some(scope.as_str());
+    // One model for all shards, loaded by the first that embeds
+    let model = embedder::LazyEmbedder::new(sessions);
+    for i in layout.covering(scope) {
+        let shard = &layout.shards[i];
+        let dir = shard::shard_dir(&index_dir, &shard.name);
+        if checkpoint::is_building(&dir) {
+            eprintln!("Shard {} is already being built; skipping", shard.name);
+            continue;
+        }
+        let rebuild = manifest::exists(&dir) && manifest::token_pool(&dir) != token_pool;
+        if rebuild && !force && !quiet {
+            eprintln!("Token pooling changed, rebuilding shard {}", shard.name);
+        }
+        if (force || rebuild) && dir.exists() {
+            std::fs::remove_dir_all(&dir)?;
+        }
+        if !force && !quiet && checkpoint::interrupted(&dir) {
+            eprintln!("Resuming interrupted build of shard {}", shard.name);
+        }
+        let files = std::mem::take(&mut parts[i]);
+        if files.is_empty() && !manifest::exists(&dir) {
+            continue;
+        }
+        if !quiet {
+            eprintln!("Shard {} ({} files)", shard.name, files.len());
+        }
+
+        let mut index = SemanticIndex::for_shard(root, &shard.name, model.clone());
+        index.set_build_order(order.clone());
+        index.set_token_pool(token_pool);
+        if manifest::exists(&dir) {
+            let scan = TreeScan {
+                changes: TreeChanges::All(files),
+                git: state.clone(),
+            };
+            update_index(&index, &scan, sessions, quiet)?;
+        } else {
+            index_files(&index, &files, sessions, quiet)?;
+            index.record_git(state.as_ref());
+        }
+    }
+
+    Ok(())
+}
+
+/// Bring an existing index up to date from `scan`, reading only files whose
+/// content may have changed. Rebuilds it if its format is stale.
+fn update_index(
+    index: &SemanticIndex,
+    scan: &TreeScan,
+    sessions: usize,
+    quiet: bool,
+) -> Result<()> {
+    let t0 = Instant::now();
+    match index.update_tree(scan) {
+        Ok((_, None)) => {
+            if !quiet {
+                eprintln!("Index up to date");
+            }
+        }
+        Ok((stale_count, Some(stats))) => {
+            if !quiet {
+                let elapsed = t0.elapsed().as_secs_f64();
+                eprintln!(
+                    "Updated {} blocks from {} files ({stale_count} stale, {elapsed:.1}s, {:.0} blocks/s)",
+                    stats.blocks,
+                    stats.files,
+                    blocks_per_sec(stats.blocks, elapsed)
+                );
+                print_padding(&stats);
+                print_stages(&stats);
+                if stats.cached > 0 {
+                    eprintln!(
+                        "  {} of {} blocks reused cached embeddings",
+                        stats.cached, stats.blocks
+                    );
+                }
+                if stats.deleted > 0 {
+                    eprintln!("  Removed {} stale blocks", stats.deleted);
+                }
+            }
+        }
+        Err(e) => {
+            let msg = e.to_string();
+            if msg.contains("older version") {
+                // Model or format changed - force rebuild
+                if !quiet {
+                    eprintln!("Rebuilding (index format changed)...");
+                }
+                if index.index_dir().exists() {
+                    std::fs::remove_dir_all(index.index_dir())?;
+                }
+                match &scan.changes {
+                    TreeChanges::All(metadata) => index_files(index, metadata, sessions, quiet)?,
+                    TreeChanges::Listed { .. } => {
+                        let metadata = walker::scan_metadata(index.root())?;
+                        index_files(index, &metadata, sessions, quiet)?;
+                    }
+                }
+                index.record_git(scan.git.as_ref());
+            } else {
+                eprintln!("{e}");
+                std::process::exit(EXIT_ERROR);
+            }
+        }
+    }
+
+    Ok(())
+}
+
+pub fn build_index(path: &Path, sessions: usize, order: &BuildOrder, quiet: bool) -> Result<()> {
+    build_fresh(path, sessions, order, 1, quiet)
+}
+
+/// Scan `path` and index it from scratch with the given storage settings.
+fn build_fresh(
+    path: &Path,
+    sessions: usize,
+    order: &BuildOrder,
+    token_pool: u8,
+    quiet: bool,
+) -> Result<()> {
+    let state = git::snapshot(path);
     if !quiet {
         eprint!("Scanning files...");
     }
@@ -130,7 +353,21 @@ pub fn build_index(path: &Path, quiet: bool) -> Result<()> {
         return Ok(());
     }
 
-    let index = SemanticIndex::new(path, None)?;
+    let mut index = SemanticIndex::for_build(path, sessions);
+    index.set_build_order(order.clone());
+    index.set_token_pool(token_pool);
+    index_files(&index, &files, sessions, quiet)?;
+    index.record_git(state.as_ref());
+    Ok(())
+}
+
+/// Index `files` into `index` from scratch, with a progress spinner.
+fn index_files(
+    index: &SemanticIndex,
+    files: &HashMap<PathBuf, walker::FileMetadata>,
+    sessions: usize,
+    quiet: bool,
+) -> Result<()> {
     let t0 = Instant::now();
 
     let pb = if quiet {
@@ -163,7 +400,7 @@ pub fn build_index(path: &Path, quiet: bool) -> Result<()> {
     }
 
     let stats = index.index_paths(
-        &files,
+        files,
         progress_fn
             .as_ref()
             .map(|f| f as &dyn Fn(usize, usize, &str)),
@@ -177,11 +414,14 @@ pub fn build_index(path: &Path, quiet: bool) -> Result<()> {
 
     if !quiet {
         eprintln!(
-            "\rIndexed {} blocks from {} files ({:.1}s)        ",
+            "\rIndexed {} blocks from {} files ({:.1}s, {:.0} blocks/s, {sessions} embed sessions)        ",
             stats.blocks,
             stats.files,
-            elapsed.as_secs_f64()
+            elapsed.as_secs_f64(),
+            blocks_per_sec(stats.blocks, elapsed.as_secs_f64())
         );
+        print_padding(&stats);
+        print_stages(&stats);
         if stats.errors > 0 {
             eprintln!("{} files failed to index", stats.errors);
         }
@@ -189,3 +429,48 @@ pub fn build_index(path: &Path, quiet: bool) -> Result<()> {
 
     Ok(())
 }
+
+fn blocks_per_sec(blocks: usize, secs: f64) -> f64 {
+    if secs > 0.0 {
+        blocks as f64 / secs
+    } else {
+        0.0
+    }
+}
+
+/// Padding overhead: model FLOPs scale with padded tokens, not real ones.
+fn print_padding(stats: &IndexStats) {
+    if stats.padded_tokens == 0 {
+        return;
+    }
+    let wasted = stats.padded_tokens.saturating_sub(stats.tokens);
+    eprintln!(
+        "  {} tokens embedded, {} padded ({:.1}% padding)",
+        stats.tokens,
+        stats.padded_tokens,
+        wasted as f64 * 100.0 / stats.padded_tokens as f64
+    );
+    if stats.stored_tokens > 0 && stats.stored_tokens < stats.tokens {
+        eprintln!(
+            "  {} token vectors stored ({:.1}x fewer than embedded)",
+            stats.stored_tokens,
+            stats.tokens as f64 / stats.stored_tokens as f64
+        );
+    }
+}
+
+/// Where build time went. Extract and tokenize are summed across the worker
+/// pool, so they can exceed wall time; infer and store run on the embed loop.
+fn print_stages(stats: &IndexStats) {
+    let t = &stats.timings;
+    if t.infer.is_zero() && t.store.is_zero() {
+        return;
+    }
+    eprintln!(
+        "  Stages: extract {:.1}s, tokenize {:.1}s (worker time), infer {:.1}s, store {:.1}s",
+        t.extract.as_secs_f64(),
+        t.tokenize.as_secs_f64(),
+        t.infer.as_secs_f64(),
+        t.store.as_secs_f64()
+    );
+}
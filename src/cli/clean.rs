@@ -9,9 +9,12 @@ pub fn run(path: &Path, recursive: bool) -> Result<()> {
     let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
     let mut deleted_count = 0;
 
+    // A running `og serve` may hold the store open
+    super::serve::release(&path);
+
     // Delete root index if exists
-    if path.join(INDEX_DIR).join("manifest.json").exists() {
-        let index = SemanticIndex::new(&path, None)?;
+    if index::has_index(&path.join(INDEX_DIR)) {
+        let index = SemanticIndex::new(&path, None);
         index.clear()?;
         println!("Deleted ./.og/");
         deleted_count += 1;
@@ -23,7 +26,7 @@ pub fn run(path: &Path, recursive: bool) -> Result<()> {
             let rel_str = rel_prefix.to_string_lossy();
             if !rel_str.is_empty() && rel_str != "." {
                 {
-                    let index = SemanticIndex::new(&parent, None)?;
+                    let index = SemanticIndex::new(&parent, None);
                     match index.remove_prefix(&rel_str) {
                         Ok(stats) => {
                             if stats.blocks > 0 {
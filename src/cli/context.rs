@@ -1,14 +1,18 @@
 use std::collections::{HashMap, HashSet};
 use std::path::Path;
 
-use anyhow::Result;
+use anyhow::{Result, bail};
 use owo_colors::OwoColorize;
 use serde::Serialize;
 
-use crate::index::{VECTORS_DIR, find_index_root, manifest::Manifest};
+use crate::index::content::SourceReader;
+use crate::index::manifest::{FileEntry, Manifest};
+use crate::index::symbols::Symbol;
+use crate::index::xref::{self, DOC_BLOCK_TYPES};
+use crate::index::{find_index_root, load_manifest, shard};
+use crate::trace;
 use crate::types::EXIT_ERROR;
 
-const DOC_BLOCK_TYPES: &[&str] = &["text", "section"];
 const SYMBOL_REF_SCORE_CAP: usize = 12;
 const SYMBOL_FILE_SCORE_CAP: usize = 8;
 const FILE_REF_SCORE_CAP: usize = 40;
@@ -17,12 +21,7 @@ const FILE_FILE_SCORE_CAP: usize = 20;
 #[derive(Clone)]
 struct IndexedBlock {
     file: String,
-    name: String,
-    block_type: String,
-    start_line: usize,
-    end_line: usize,
-    content: String,
-    skeleton: String,
+    symbol: Symbol,
 }
 
 #[derive(Default)]
@@ -51,6 +50,9 @@ struct RankedSymbol {
     inbound_files: usize,
     #[serde(skip_serializing_if = "Option::is_none")]
     skeleton: Option<String>,
+    /// Index of the block in the ranked list, for reading its skeleton.
+    #[serde(skip)]
+    block: usize,
 }
 
 #[derive(Serialize)]
@@ -77,8 +79,20 @@ pub fn run(
         eprintln!("No index found. Run 'og build' to create.");
         std::process::exit(EXIT_ERROR);
     };
+    let scope = path
+        .strip_prefix(&index_root)
+        .ok()
+        .map(|p| p.to_string_lossy().into_owned())
+        .filter(|s| !s.is_empty());
+    let Some(index_dir) = shard::dir_for_scope(&index_dir, scope.as_deref()) else {
+        eprintln!(
+            "{} spans several shards; run on a directory inside one",
+            path.display()
+        );
+        std::process::exit(EXIT_ERROR);
+    };
 
-    let manifest = match Manifest::load(&index_dir) {
+    let manifest = match load_manifest(&index_root, &index_dir) {
         Ok(m) => m,
         Err(e) => {
             eprintln!("{e}");
@@ -86,37 +100,30 @@ pub fn run(
         }
     };
 
-    let vectors_path = index_dir.join(VECTORS_DIR).to_string_lossy().into_owned();
-    let store = match omendb::VectorStore::open(&vectors_path) {
-        Ok(s) => s,
-        Err(e) => {
-            eprintln!("Failed to open index: {e}");
-            std::process::exit(EXIT_ERROR);
-        }
-    };
-
-    let scope_prefix = path
-        .strip_prefix(&index_root)
-        .ok()
-        .map(|p| p.to_string_lossy().into_owned())
-        .filter(|s| !s.is_empty());
-
-    let mut block_ids: Vec<&String> = manifest
-        .files
-        .iter()
-        .filter(|(rel_path, _)| in_scope(rel_path, scope_prefix.as_deref()))
-        .flat_map(|(_, entry)| entry.blocks.iter())
-        .collect();
-    block_ids.sort();
+    let entries = scoped_entries(&manifest, scope.as_deref());
 
-    if block_ids.is_empty() {
+    if entries.is_empty() {
         eprintln!("No indexed files under {}", path.display());
         std::process::exit(EXIT_ERROR);
     }
 
-    let blocks = collect_blocks(&block_ids, &store);
-    let ranked = rank_context(&blocks, num_files, symbols_per_file, skeleton);
+    let blocks = trace::time("read_blocks", || collect_blocks(entries));
+    trace::count("blocks", blocks.len() as u64);
+    let mut ranked = trace::time("rank", || {
+        rank_context(
+            &blocks,
+            |key, limit| manifest.references(key, scope.as_deref(), limit),
+            num_files,
+            symbols_per_file,
+        )
+    });
+    if skeleton {
+        trace::time("read_skeletons", || {
+            add_skeletons(&mut ranked, &blocks, &index_root)
+        });
+    }
 
+    let _span = trace::span("output");
     if json {
         println!("{}", serde_json::to_string_pretty(&ranked)?);
     } else {
@@ -126,6 +133,47 @@ pub fn run(
     Ok(())
 }
 
+/// Ranked context JSON for `path` (used by `og serve`).
+pub fn context_json(
+    index_root: &Path,
+    index_dir: &Path,
+    path: &Path,
+    num_files: usize,
+    symbols_per_file: usize,
+    skeleton: bool,
+) -> Result<serde_json::Value> {
+    let manifest = load_manifest(index_root, index_dir)?;
+    let scope = path
+        .strip_prefix(index_root)
+        .ok()
+        .map(|p| p.to_string_lossy().into_owned())
+        .filter(|s| !s.is_empty());
+    let entries = scoped_entries(&manifest, scope.as_deref());
+    if entries.is_empty() {
+        bail!("No indexed files under {}", path.display());
+    }
+
+    let blocks = collect_blocks(entries);
+    let mut ranked = rank_context(
+        &blocks,
+        |key, limit| manifest.references(key, scope.as_deref(), limit),
+        num_files,
+        symbols_per_file,
+    );
+    if skeleton {
+        add_skeletons(&mut ranked, &blocks, index_root);
+    }
+    Ok(serde_json::to_value(&ranked)?)
+}
+
+/// Indexed files under `scope_prefix` that have blocks.
+fn scoped_entries(manifest: &Manifest, scope_prefix: Option<&str>) -> Vec<(String, FileEntry)> {
+    manifest
+        .iter()
+        .filter(|(rel_path, entry)| !entry.blocks.is_empty() && in_scope(rel_path, scope_prefix))
+        .collect()
+}
+
 fn in_scope(rel_path: &str, scope_prefix: Option<&str>) -> bool {
     match scope_prefix {
         Some(prefix) => rel_path == prefix || rel_path.starts_with(&format!("{prefix}/")),
@@ -133,85 +181,61 @@ fn in_scope(rel_path: &str, scope_prefix: Option<&str>) -> bool {
     }
 }
 
-fn collect_blocks(block_ids: &[&String], store: &omendb::VectorStore) -> Vec<IndexedBlock> {
-    let mut blocks: Vec<IndexedBlock> = block_ids
-        .iter()
-        .filter_map(|id| {
-            let meta = store.get_metadata_by_id(id)?;
-            let block_type = meta.get("type").and_then(|v| v.as_str()).unwrap_or("");
-            if DOC_BLOCK_TYPES.contains(&block_type) {
-                return None;
-            }
-
-            Some(IndexedBlock {
-                file: meta
-                    .get("file")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-                name: meta
-                    .get("name")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-                block_type: block_type.to_string(),
-                start_line: meta.get("start_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize,
-                end_line: meta.get("end_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize,
-                content: meta
-                    .get("content")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-                skeleton: meta
-                    .get("skeleton")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-            })
+/// Code blocks of `entries` from their manifest symbols, by file and line.
+fn collect_blocks(entries: Vec<(String, FileEntry)>) -> Vec<IndexedBlock> {
+    let mut blocks: Vec<IndexedBlock> = entries
+        .into_iter()
+        .flat_map(|(file, entry)| {
+            entry
+                .symbols
+                .into_iter()
+                .filter(|symbol| !DOC_BLOCK_TYPES.contains(&symbol.block_type.as_str()))
+                .map(move |symbol| IndexedBlock {
+                    file: file.clone(),
+                    symbol,
+                })
         })
         .collect();
-    blocks.sort_by(|a, b| a.file.cmp(&b.file).then(a.start_line.cmp(&b.start_line)));
+    blocks.sort_by(|a, b| {
+        a.file
+            .cmp(&b.file)
+            .then(a.symbol.start_line.cmp(&b.symbol.start_line))
+    });
     blocks
 }
 
+/// Rank files and symbols by definitions and inbound references.
+/// `references(key, limit)` lists the files whose blocks mention `key` with
+/// their block counts, or `None` if more than `limit` blocks do.
 fn rank_context(
     blocks: &[IndexedBlock],
+    references: impl Fn(&str, usize) -> Option<Vec<(String, u32)>>,
     num_files: usize,
     symbols_per_file: usize,
-    include_skeleton: bool,
 ) -> Vec<RankedFile> {
     let mut definitions: HashMap<String, Vec<usize>> = HashMap::new();
     let mut symbol_scores: Vec<SymbolScore> =
         (0..blocks.len()).map(|_| SymbolScore::default()).collect();
 
     for (idx, block) in blocks.iter().enumerate() {
-        if let Some(name) = symbol_key(&block.name) {
+        if let Some(name) = xref::symbol_key(&block.symbol.name) {
             definitions.entry(name).or_default().push(idx);
         }
     }
 
-    let token_doc_counts = token_document_counts(blocks);
+    // Each block in another file that mentions a definition's key is one
+    // inbound reference. Keys mentioned by too many blocks are skipped.
     let max_doc_freq = (blocks.len() / 40).clamp(8, 50);
-    definitions.retain(|name, _| token_doc_counts.get(name).copied().unwrap_or(0) <= max_doc_freq);
-
-    let mut seen_edges: HashSet<(usize, usize)> = HashSet::new();
-    for (source_idx, block) in blocks.iter().enumerate() {
-        for token in identifier_tokens(&block.content) {
-            let Some(targets) = definitions.get(&token) else {
-                continue;
-            };
-
-            for &target_idx in targets {
-                if target_idx == source_idx || blocks[target_idx].file == block.file {
-                    continue;
-                }
-                if !seen_edges.insert((source_idx, target_idx)) {
-                    continue;
-                }
-
-                let target_score = &mut symbol_scores[target_idx];
-                target_score.inbound_refs += 1;
-                target_score.inbound_files.insert(block.file.clone());
+    for (name, targets) in &definitions {
+        let Some(refs) = references(name, max_doc_freq) else {
+            continue;
+        };
+        for &target_idx in targets {
+            let target_file = &blocks[target_idx].file;
+            let target_score = &mut symbol_scores[target_idx];
+            for (file, count) in refs.iter().filter(|(file, _)| file != target_file) {
+                target_score.inbound_refs += *count as usize;
+                target_score.inbound_files.insert(file.clone());
             }
         }
     }
@@ -231,14 +255,15 @@ fn rank_context(
             .inbound_files
             .extend(symbol_score.inbound_files.iter().cloned());
         file_score.symbols.push(RankedSymbol {
-            name: block.name.clone(),
-            block_type: block.block_type.clone(),
-            line: block.start_line + 1,
-            end_line: block.end_line + 1,
+            name: block.symbol.name.clone(),
+            block_type: block.symbol.block_type.clone(),
+            line: block.symbol.start_line + 1,
+            end_line: block.symbol.end_line + 1,
             score,
             inbound_refs: symbol_score.inbound_refs,
             inbound_files: symbol_score.inbound_files.len(),
-            skeleton: include_skeleton.then(|| block.skeleton.clone()),
+            skeleton: None,
+            block: idx,
         });
     }
 
@@ -278,8 +303,21 @@ fn rank_context(
     ranked
 }
 
+/// Read the skeletons of the symbols that made the ranking.
+fn add_skeletons(ranked: &mut [RankedFile], blocks: &[IndexedBlock], index_root: &Path) {
+    let mut reader = SourceReader::new(index_root);
+    for symbol in ranked.iter_mut().flat_map(|file| &mut file.symbols) {
+        let block = &blocks[symbol.block];
+        symbol.skeleton = Some(
+            reader
+                .symbol_skeleton(&block.file, &block.symbol)
+                .unwrap_or_default(),
+        );
+    }
+}
+
 fn definition_weight(block: &IndexedBlock) -> f32 {
-    let base = match block.block_type.as_str() {
+    let base = match block.symbol.block_type.as_str() {
         "class" | "struct" | "enum" | "trait" | "interface" => 3.0,
         "module" | "namespace" => 2.5,
         "impl" | "constructor" => 2.0,
@@ -287,9 +325,13 @@ fn definition_weight(block: &IndexedBlock) -> f32 {
         _ => 1.0,
     };
 
-    let public_bonus = if block.content.trim_start().starts_with("pub ")
-        || block.content.trim_start().starts_with("export ")
-        || block.name.chars().next().is_some_and(char::is_uppercase)
+    let public_bonus = if block.symbol.exported
+        || block
+            .symbol
+            .name
+            .chars()
+            .next()
+            .is_some_and(char::is_uppercase)
     {
         0.5
     } else {
@@ -299,91 +341,6 @@ fn definition_weight(block: &IndexedBlock) -> f32 {
     base + public_bonus
 }
 
-fn symbol_key(name: &str) -> Option<String> {
-    let name = name
-        .rsplit(['.', ':', '#', '/', '\\'])
-        .next()
-        .unwrap_or(name)
-        .trim();
-    let key = name.to_ascii_lowercase();
-    if is_noisy_name(&key) { None } else { Some(key) }
-}
-
-fn is_noisy_name(name: &str) -> bool {
-    matches!(
-        name,
-        "" | "clone"
-            | "debug"
-            | "default"
-            | "display"
-            | "error"
-            | "fmt"
-            | "from"
-            | "get"
-            | "append"
-            | "data"
-            | "item"
-            | "items"
-            | "init"
-            | "into"
-            | "list"
-            | "main"
-            | "method"
-            | "new"
-            | "path"
-            | "run"
-            | "set"
-            | "source"
-            | "test"
-            | "tests"
-            | "value"
-            | "values"
-    ) || name.len() < 4
-}
-
-fn token_document_counts(blocks: &[IndexedBlock]) -> HashMap<String, usize> {
-    let mut counts = HashMap::new();
-    for block in blocks {
-        for token in identifier_tokens(&block.content) {
-            *counts.entry(token).or_insert(0) += 1;
-        }
-    }
-    counts
-}
-
-fn identifier_tokens(text: &str) -> HashSet<String> {
-    let mut tokens = HashSet::new();
-    let mut current = String::new();
-
-    for ch in text.chars() {
-        if ch == '_' || ch.is_ascii_alphanumeric() {
-            current.push(ch);
-        } else {
-            push_identifier(&mut tokens, &current);
-            current.clear();
-        }
-    }
-    push_identifier(&mut tokens, &current);
-
-    tokens
-}
-
-fn push_identifier(tokens: &mut HashSet<String>, ident: &str) {
-    if ident.len() < 4
-        || !ident
-            .chars()
-            .next()
-            .is_some_and(|ch| ch.is_ascii_alphabetic())
-    {
-        return;
-    }
-
-    let token = ident.to_ascii_lowercase();
-    if !is_noisy_name(&token) {
-        tokens.insert(token);
-    }
-}
-
 fn print_default(files: &[RankedFile], include_skeleton: bool) {
     for file in files {
         println!(
@@ -416,35 +373,79 @@ fn print_default(files: &[RankedFile], include_skeleton: bool) {
 
 #[cfg(test)]
 mod tests {
+    use std::collections::HashMap;
+
     use crate::cli::context::{IndexedBlock, rank_context};
+    use crate::index::symbols::Symbol;
+    use crate::index::xref;
 
-    fn block(file: &str, name: &str, content: &str) -> IndexedBlock {
-        IndexedBlock {
+    /// A one-block file, with its cross-references.
+    fn block(file: &str, name: &str, content: &str) -> (IndexedBlock, Vec<(String, u32)>) {
+        let block = IndexedBlock {
             file: file.to_string(),
-            name: name.to_string(),
-            block_type: "function".to_string(),
-            start_line: 0,
-            end_line: 0,
-            content: content.to_string(),
-            skeleton: content.to_string(),
+            symbol: Symbol {
+                name: name.to_string(),
+                block_type: "function".to_string(),
+                ..Symbol::default()
+            },
+        };
+        (block, xref::file_refs([("function", content)]))
+    }
+
+    /// Rank `files` against an in-memory version of the manifest's token index.
+    fn rank(files: Vec<(IndexedBlock, Vec<(String, u32)>)>) -> Vec<super::RankedFile> {
+        let mut index: HashMap<String, Vec<(String, u32)>> = HashMap::new();
+        for (block, refs) in &files {
+            for (token, count) in refs {
+                index
+                    .entry(token.clone())
+                    .or_default()
+                    .push((block.file.clone(), *count));
+            }
         }
+        let references = |token: &str, limit: usize| {
+            let refs = index.get(token).cloned().unwrap_or_default();
+            let total: usize = refs.iter().map(|(_, count)| *count as usize).sum();
+            (total <= limit).then_some(refs)
+        };
+        let blocks: Vec<IndexedBlock> = files.into_iter().map(|(block, _)| block).collect();
+        rank_context(&blocks, references, 10, 3)
     }
 
     #[test]
     fn context_filters_high_frequency_definition_names() {
-        let mut blocks = vec![block("defs.rs", "sharedThing", "fn sharedThing() {}")];
+        let mut files = vec![block("defs.rs", "sharedThing", "fn sharedThing() {}")];
         for i in 0..120 {
-            blocks.push(block(
+            files.push(block(
                 &format!("file_{i}.rs"),
                 &format!("caller_{i}"),
                 "fn caller() { sharedThing(); }",
             ));
         }
 
-        let ranked = rank_context(&blocks, 1, 1, false);
+        let ranked = rank(files);
         let defs = ranked.iter().find(|file| file.file == "defs.rs").unwrap();
 
         assert_eq!(defs.inbound_refs, 0);
         assert_eq!(defs.inbound_files, 0);
     }
+
+    #[test]
+    fn context_counts_references_from_other_files() {
+        let ranked = rank(vec![
+            block(
+                "config.rs",
+                "load_config",
+                "fn load_config() { load_config_file() }",
+            ),
+            block("main.rs", "start", "fn start() { load_config(); }"),
+            block("cli.rs", "parse_args", "fn parse_args() { load_config(); }"),
+            block("util.rs", "trim_name", "fn trim_name() {}"),
+        ]);
+
+        assert_eq!(ranked[0].file, "config.rs");
+        assert_eq!(ranked[0].inbound_refs, 2);
+        assert_eq!(ranked[0].inbound_files, 2);
+        assert_eq!(ranked[0].symbols[0].inbound_files, 2);
+    }
 }
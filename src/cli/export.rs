@@ -0,0 +1,33 @@
+use std::path::Path;
+use std::time::Instant;
+
+use anyhow::Result;
+
+use crate::index::{self, archive};
+use crate::types::EXIT_ERROR;
+
+pub fn run(path: &Path, output: &Path, quiet: bool) -> Result<()> {
+    let (index_root, index_dir) = index::find_index_root(path);
+    let Some(index_dir) = index_dir else {
+        eprintln!("No index. Run 'og build' to create.");
+        std::process::exit(EXIT_ERROR);
+    };
+
+    // A running `og serve` may hold the store open
+    super::serve::release(&index_root);
+
+    let t0 = Instant::now();
+    let info = archive::export(&index_dir, output)?;
+    if !quiet {
+        let size = std::fs::metadata(output).map_or(0, |m| m.len());
+        eprintln!(
+            "Exported {} to {} ({:.1} MB, {:.1} MB uncompressed, {:.1}s)",
+            index_root.display(),
+            output.display(),
+            size as f64 / 1e6,
+            info.bytes as f64 / 1e6,
+            t0.elapsed().as_secs_f64()
+        );
+    }
+    Ok(())
+}
@@ -0,0 +1,48 @@
+use std::path::Path;
+
+use anyhow::Result;
+
+use super::build::{self, BuildSettings};
+use crate::index::{self, BuildOrder, INDEX_DIR, archive, checkpoint};
+use crate::types::EXIT_ERROR;
+
+pub fn run(snapshot: &Path, path: &Path, force: bool, quiet: bool) -> Result<()> {
+    let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
+    let index_dir = path.join(INDEX_DIR);
+
+    if checkpoint::is_building(&index_dir) {
+        eprintln!("og build is already running for {}", path.display());
+        std::process::exit(EXIT_ERROR);
+    }
+    if index::has_index(&index_dir) && !force {
+        eprintln!(
+            "{} already has an index. Use --force to replace it.",
+            path.display()
+        );
+        std::process::exit(EXIT_ERROR);
+    }
+
+    // A running `og serve` may hold the store open
+    super::serve::release(&path);
+
+    let info = archive::import(snapshot, &index_dir)?;
+    if !quiet {
+        eprintln!(
+            "Imported {} files from {} (og {})",
+            info.files,
+            snapshot.display(),
+            info.og_version
+        );
+    }
+
+    // The snapshot's mtimes mean nothing here: the incremental update hashes
+    // each file once and re-embeds only those whose content differs
+    build::run(
+        &path,
+        None,
+        BuildOrder::Path,
+        &[],
+        BuildSettings::default(),
+        quiet,
+    )
+}
@@ -25,11 +25,8 @@ pub fn run(path: &Path) -> Result<()> {
             Err(_) => idx_root.display().to_string(),
         };
 
-        match SemanticIndex::new(idx_root, None) {
-            Ok(index) => match index.count() {
-                Ok(count) => println!("  {display_path}/.og/ ({count} blocks)"),
-                Err(_) => println!("  {display_path}/.og/ (needs rebuild)"),
-            },
+        match SemanticIndex::new(idx_root, None).count() {
+            Ok(count) => println!("  {display_path}/.og/ ({count} blocks)"),
             Err(_) => println!("  {display_path}/.og/ (needs rebuild)"),
         }
     }
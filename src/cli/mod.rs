@@ -1,17 +1,25 @@
 pub mod build;
 pub mod clean;
 pub mod context;
+pub mod export;
+pub mod import;
 pub mod list;
 pub mod model;
 pub mod outline;
 pub mod output;
 pub mod search;
+pub mod serve;
 pub mod status;
+pub mod watch;
 
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
+use std::time::Duration;
 
 use clap::{Parser, Subcommand};
 
+use crate::index::BuildOrder;
+use crate::index::prune::MAX_POOL_FACTOR;
+
 #[derive(Parser)]
 #[command(name = "og", about = "Semantic code search", version)]
 pub struct Cli {
@@ -22,9 +30,9 @@ pub struct Cli {
     #[arg(value_name = "QUERY")]
     query: Option<String>,
 
-    /// Directory to search.
+    /// Directories to search. Several index roots are searched together.
     #[arg(value_name = "PATH", default_value = ".")]
-    path: PathBuf,
+    path: Vec<PathBuf>,
 
     /// Number of results.
     #[arg(short = 'n', default_value = "10")]
@@ -77,6 +85,18 @@ pub struct Cli {
     /// Highlight query-related tokens in terminal previews.
     #[arg(long = "highlight")]
     highlight: bool,
+
+    /// Search every index root listed in FILE (one path per line).
+    #[arg(long = "workspace", value_name = "FILE", conflicts_with = "batch")]
+    workspace: Option<PathBuf>,
+
+    /// Run JSON-lines queries from FILE ('-' for stdin) against one loaded index.
+    #[arg(long = "batch", value_name = "FILE")]
+    batch: Option<PathBuf>,
+
+    /// Print per-stage timings and counts as JSON on stderr (also OG_TRACE=json).
+    #[arg(long = "trace", global = true)]
+    trace: bool,
 }
 
 #[derive(Subcommand)]
@@ -89,6 +109,55 @@ enum Command {
         /// Force full rebuild.
         #[arg(short = 'f', long = "force")]
         force: bool,
+        /// Parallel embedding sessions (default: $OG_EMBED_SESSIONS, else cores/8).
+        #[arg(long = "embed-sessions", value_name = "N")]
+        embed_sessions: Option<usize>,
+        /// Index files under PATH first, so they are searchable soonest.
+        #[arg(long = "first", value_name = "PATH", conflicts_with = "recent_first")]
+        first: Option<PathBuf>,
+        /// Index the most recently modified files first.
+        #[arg(long = "recent-first")]
+        recent_first: bool,
+        /// Split the index into shards: a directory, DIR/* for one shard per
+        /// subdirectory, or `top` for one per top-level directory. Repeatable.
+        #[arg(long = "shard", value_name = "PATTERN")]
+        shard: Vec<String>,
+        /// Pool each block's token vectors to about 1/N of their count by
+        /// merging near-duplicate neighbours (1 = keep all). Changing it
+        /// rebuilds the index.
+        #[arg(
+            long = "token-pool",
+            value_name = "N",
+            value_parser = clap::value_parser!(u8).range(1..=i64::from(MAX_POOL_FACTOR))
+        )]
+        token_pool: Option<u8>,
+        /// Suppress progress.
+        #[arg(short = 'q', long = "quiet")]
+        quiet: bool,
+    },
+    /// Write the index to one compressed, relocatable snapshot file.
+    Export {
+        /// Directory whose index to export.
+        #[arg(default_value = ".")]
+        path: PathBuf,
+        /// Snapshot file to write.
+        #[arg(short = 'o', long = "output", value_name = "FILE")]
+        output: PathBuf,
+        /// Suppress progress.
+        #[arg(short = 'q', long = "quiet")]
+        quiet: bool,
+    },
+    /// Unpack an index snapshot, then update it for local changes.
+    Import {
+        /// Snapshot file written by `og export`.
+        #[arg(value_name = "FILE")]
+        snapshot: PathBuf,
+        /// Directory to install the index in.
+        #[arg(default_value = ".")]
+        path: PathBuf,
+        /// Replace an existing index.
+        #[arg(short = 'f', long = "force")]
+        force: bool,
         /// Suppress progress.
         #[arg(short = 'q', long = "quiet")]
         quiet: bool,
@@ -144,6 +213,27 @@ enum Command {
         #[arg(long = "skeleton")]
         skeleton: bool,
     },
+    /// Keep the model and indexes loaded; CLI searches forward to it.
+    Serve {
+        /// Unix socket path (default: $OG_SOCKET, $XDG_RUNTIME_DIR/og.sock).
+        #[arg(long = "socket")]
+        socket: Option<PathBuf>,
+        /// Suppress progress.
+        #[arg(short = 'q', long = "quiet")]
+        quiet: bool,
+    },
+    /// Keep an index fresh from filesystem events; searches skip the stale check.
+    Watch {
+        /// Directory to watch.
+        #[arg(default_value = ".")]
+        path: PathBuf,
+        /// Quiet period before applying a burst of changes.
+        #[arg(long = "debounce", value_name = "MS", default_value = "200")]
+        debounce_ms: u64,
+        /// Suppress progress.
+        #[arg(short = 'q', long = "quiet")]
+        quiet: bool,
+    },
     /// Show embedding model status.
     Model {
         #[command(subcommand)]
@@ -160,9 +250,67 @@ enum ModelAction {
 /// Main CLI entry point.
 pub fn run() -> anyhow::Result<()> {
     let cli = Cli::parse();
+    if cli.trace || crate::trace::env_enabled() {
+        crate::trace::enable(command_name(&cli));
+    }
+
+    let result = dispatch(cli);
+    crate::trace::emit(None);
+    result
+}
 
+/// Command label for traces.
+fn command_name(cli: &Cli) -> &'static str {
+    match &cli.command {
+        Some(Command::Build { .. }) => "build",
+        Some(Command::Export { .. }) => "export",
+        Some(Command::Import { .. }) => "import",
+        Some(Command::Status { .. }) => "status",
+        Some(Command::Clean { .. }) => "clean",
+        Some(Command::List { .. }) => "list",
+        Some(Command::Outline { .. }) => "outline",
+        Some(Command::Context { .. }) => "context",
+        Some(Command::Serve { .. }) => "serve",
+        Some(Command::Watch { .. }) => "watch",
+        Some(Command::Model { .. }) => "model",
+        None if cli.batch.is_some() => "batch",
+        None => "search",
+    }
+}
+
+fn dispatch(cli: Cli) -> anyhow::Result<()> {
     match cli.command {
-        Some(Command::Build { path, force, quiet }) => build::run(&path, force, quiet),
+        Some(Command::Build {
+            path,
+            force,
+            embed_sessions,
+            first,
+            recent_first,
+            shard,
+            token_pool,
+            quiet,
+        }) => {
+            let order = match first {
+                Some(first) => {
+                    BuildOrder::First(first.canonicalize().unwrap_or_else(|_| path.join(first)))
+                }
+                None if recent_first => BuildOrder::Recent,
+                None => BuildOrder::Path,
+            };
+            let settings = build::BuildSettings { force, token_pool };
+            build::run(&path, embed_sessions, order, &shard, settings, quiet)
+        }
+        Some(Command::Export {
+            path,
+            output,
+            quiet,
+        }) => export::run(&path, &output, quiet),
+        Some(Command::Import {
+            snapshot,
+            path,
+            force,
+            quiet,
+        }) => import::run(&snapshot, &path, force, quiet),
         Some(Command::Status { path }) => status::run(&path),
         Some(Command::Clean { path, recursive }) => clean::run(&path, recursive),
         Some(Command::List { path }) => list::run(&path),
@@ -178,34 +326,81 @@ pub fn run() -> anyhow::Result<()> {
             json,
             skeleton,
         }) => context::run(&path, num_files, symbols_per_file, json, skeleton),
+        Some(Command::Serve { socket, quiet }) => serve::run(socket.as_deref(), quiet),
+        Some(Command::Watch {
+            path,
+            debounce_ms,
+            quiet,
+        }) => watch::run(&path, Duration::from_millis(debounce_ms), quiet),
         Some(Command::Model { action }) => match action {
             Some(ModelAction::Install) => model::install(),
             None => model::status(),
         },
+        None if cli.batch.is_some() => {
+            // In batch mode queries come from the file, so the first positional is the path.
+            let path = cli.query.as_deref().map(Path::new).unwrap_or(&cli.path[0]);
+            search::run_batch(
+                &search::SearchParams {
+                    query: None,
+                    path,
+                    num_results: cli.num_results,
+                    threshold: cli.threshold,
+                    format: crate::types::OutputFormat::from_flags(
+                        !cli.no_content,
+                        false,
+                        cli.no_content,
+                    ),
+                    quiet: cli.quiet,
+                    file_types: cli.file_types.as_deref(),
+                    exclude: &cli.exclude,
+                    code_only: cli.code_only,
+                    no_index: cli.no_index,
+                    context_lines: 0,
+                    regex: cli.regex.as_deref(),
+                    highlight: false,
+                },
+                cli.batch.as_deref().unwrap_or(Path::new("-")),
+            )
+        }
         None if cli.query.is_none() => {
             use clap::CommandFactory;
             Cli::command().print_help()?;
             println!();
             Ok(())
         }
-        None => search::run(&search::SearchParams {
-            query: cli.query.as_deref(),
-            path: &cli.path,
-            num_results: cli.num_results,
-            threshold: cli.threshold,
-            format: crate::types::OutputFormat::from_flags(
-                cli.json,
-                cli.files_only,
-                cli.no_content,
-            ),
-            quiet: cli.quiet,
-            file_types: cli.file_types.as_deref(),
-            exclude: &cli.exclude,
-            code_only: cli.code_only,
-            no_index: cli.no_index,
-            context_lines: cli.context_lines,
-            regex: cli.regex.as_deref(),
-            highlight: cli.highlight,
-        }),
+        None => {
+            let roots = match &cli.workspace {
+                Some(file) => search::read_workspace(file)?,
+                None => cli
+                    .path
+                    .iter()
+                    .map(|p| (p.to_string_lossy().into_owned(), p.clone()))
+                    .collect(),
+            };
+            let params = search::SearchParams {
+                query: cli.query.as_deref(),
+                path: &roots[0].1,
+                num_results: cli.num_results,
+                threshold: cli.threshold,
+                format: crate::types::OutputFormat::from_flags(
+                    cli.json,
+                    cli.files_only,
+                    cli.no_content,
+                ),
+                quiet: cli.quiet,
+                file_types: cli.file_types.as_deref(),
+                exclude: &cli.exclude,
+                code_only: cli.code_only,
+                no_index: cli.no_index,
+                context_lines: cli.context_lines,
+                regex: cli.regex.as_deref(),
+                highlight: cli.highlight,
+            };
+            if roots.len() > 1 {
+                search::run_multi(&params, &roots)
+            } else {
+                search::run(&params)
+            }
+        }
     }
 }
@@ -1,9 +1,12 @@
 use std::path::Path;
 
-use anyhow::Result;
+use anyhow::{Result, bail};
 use owo_colors::OwoColorize;
 
-use crate::index::{VECTORS_DIR, find_index_root, manifest::Manifest};
+use crate::index::content::SourceReader;
+use crate::index::manifest::{FileEntry, Manifest};
+use crate::index::{find_index_root, load_manifest, shard};
+use crate::trace;
 use crate::types::EXIT_ERROR;
 
 /// A block entry for outline display.
@@ -23,8 +26,20 @@ pub fn run(path: &Path, json: bool, skeleton: bool) -> Result<()> {
         eprintln!("No index found. Run 'og build' to create.");
         std::process::exit(EXIT_ERROR);
     };
+    let scope = path
+        .strip_prefix(&index_root)
+        .ok()
+        .map(|p| p.to_string_lossy().into_owned())
+        .filter(|s| !s.is_empty());
+    let Some(index_dir) = shard::dir_for_scope(&index_dir, scope.as_deref()) else {
+        eprintln!(
+            "{} spans several shards; run on a directory inside one",
+            path.display()
+        );
+        std::process::exit(EXIT_ERROR);
+    };
 
-    let manifest = match Manifest::load(&index_dir) {
+    let manifest = match load_manifest(&index_root, &index_dir) {
         Ok(m) => m,
         Err(e) => {
             eprintln!("{e}");
@@ -32,25 +47,52 @@ pub fn run(path: &Path, json: bool, skeleton: bool) -> Result<()> {
         }
     };
 
-    let vectors_path = index_dir.join(VECTORS_DIR).to_string_lossy().into_owned();
-    let store = match omendb::VectorStore::open(&vectors_path) {
-        Ok(s) => s,
-        Err(e) => {
-            eprintln!("Failed to open index: {e}");
-            std::process::exit(EXIT_ERROR);
-        }
-    };
+    let file_entries = scoped_entries(&manifest, &index_root, &path);
+
+    if file_entries.is_empty() {
+        eprintln!("No indexed files under {}", path.display());
+        std::process::exit(EXIT_ERROR);
+    }
+
+    if json {
+        print_json(&file_entries, &index_root, skeleton)?;
+    } else {
+        print_default(&file_entries, &index_root, skeleton);
+    }
+
+    Ok(())
+}
+
+/// Outline JSON for `path` (used by `og serve`).
+pub fn outline_json(
+    index_root: &Path,
+    index_dir: &Path,
+    path: &Path,
+    skeleton: bool,
+) -> Result<serde_json::Value> {
+    let manifest = load_manifest(index_root, index_dir)?;
+    let file_entries = scoped_entries(&manifest, index_root, path);
+    if file_entries.is_empty() {
+        bail!("No indexed files under {}", path.display());
+    }
+    Ok(serde_json::Value::Array(outline_values(
+        &file_entries,
+        index_root,
+        skeleton,
+    )))
+}
 
+/// Indexed files under `path`, sorted by relative path.
+fn scoped_entries(manifest: &Manifest, index_root: &Path, path: &Path) -> Vec<(String, FileEntry)> {
     // Compute scope prefix for filtering (relative to index root)
     let scope_prefix = path
-        .strip_prefix(&index_root)
+        .strip_prefix(index_root)
         .ok()
         .map(|p| p.to_string_lossy().into_owned())
         .filter(|s| !s.is_empty());
 
     // Collect matching files sorted by path
-    let mut file_entries: Vec<(&str, &[String])> = manifest
-        .files
+    let mut file_entries: Vec<(String, FileEntry)> = manifest
         .iter()
         .filter(|(rel_path, _)| match &scope_prefix {
             Some(prefix) => {
@@ -58,69 +100,44 @@ pub fn run(path: &Path, json: bool, skeleton: bool) -> Result<()> {
             }
             None => true,
         })
-        .map(|(rel_path, entry)| (rel_path.as_str(), entry.blocks.as_slice()))
         .collect();
 
-    file_entries.sort_by_key(|(path, _)| *path);
-
-    if file_entries.is_empty() {
-        eprintln!("No indexed files under {}", path.display());
-        std::process::exit(EXIT_ERROR);
-    }
-
-    if json {
-        print_json(&file_entries, &store, skeleton)?;
-    } else {
-        print_default(&file_entries, &store, skeleton);
-    }
-
-    Ok(())
+    file_entries.sort_by(|(a, _), (b, _)| a.cmp(b));
+    file_entries
 }
 
 fn get_blocks(
-    block_ids: &[String],
-    store: &omendb::VectorStore,
+    rel_path: &str,
+    entry: &FileEntry,
+    index_root: &Path,
     with_skeleton: bool,
 ) -> Vec<OutlineEntry> {
-    let mut entries: Vec<OutlineEntry> = block_ids
+    let _span = trace::span("read_blocks");
+    let mut reader = SourceReader::new(index_root);
+    let mut entries: Vec<OutlineEntry> = entry
+        .symbols
         .iter()
-        .filter_map(|id| {
-            let meta = store.get_metadata_by_id(id)?;
-            Some(OutlineEntry {
-                name: meta
-                    .get("name")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-                block_type: meta
-                    .get("type")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("")
-                    .to_string(),
-                start_line: meta.get("start_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize,
-                end_line: meta.get("end_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize,
-                skeleton: if with_skeleton {
-                    meta.get("skeleton")
-                        .and_then(|v| v.as_str())
-                        .map(|s| s.to_string())
-                } else {
-                    None
-                },
-            })
+        .map(|symbol| OutlineEntry {
+            name: symbol.name.clone(),
+            block_type: symbol.block_type.clone(),
+            start_line: symbol.start_line,
+            end_line: symbol.end_line,
+            skeleton: if with_skeleton {
+                reader.symbol_skeleton(rel_path, symbol)
+            } else {
+                None
+            },
         })
         .collect();
     entries.sort_by_key(|e| e.start_line);
+    trace::count("blocks", entries.len() as u64);
     entries
 }
 
-fn print_default(
-    file_entries: &[(&str, &[String])],
-    store: &omendb::VectorStore,
-    with_skeleton: bool,
-) {
-    for (rel_path, block_ids) in file_entries {
+fn print_default(file_entries: &[(String, FileEntry)], index_root: &Path, with_skeleton: bool) {
+    for (rel_path, entry) in file_entries {
         println!("{}", rel_path.bold());
-        let blocks = get_blocks(block_ids, store, with_skeleton);
+        let blocks = get_blocks(rel_path, entry, index_root, with_skeleton);
         for entry in &blocks {
             println!(
                 "  {:>5}  {:<12}  {}",
@@ -140,40 +157,49 @@ fn print_default(
 }
 
 fn print_json(
-    file_entries: &[(&str, &[String])],
-    store: &omendb::VectorStore,
+    file_entries: &[(String, FileEntry)],
+    index_root: &Path,
     with_skeleton: bool,
 ) -> Result<()> {
-    let output: Vec<serde_json::Value> = file_entries
+    let output = outline_values(file_entries, index_root, with_skeleton);
+    println!("{}", serde_json::to_string_pretty(&output)?);
+    Ok(())
+}
+
+fn outline_values(
+    file_entries: &[(String, FileEntry)],
+    index_root: &Path,
+    with_skeleton: bool,
+) -> Vec<serde_json::Value> {
+    file_entries
         .iter()
-        .map(|(rel_path, block_ids)| {
-            let blocks: Vec<serde_json::Value> = get_blocks(block_ids, store, with_skeleton)
-                .into_iter()
-                .map(|e| {
-                    if with_skeleton {
-                        serde_json::json!({
-                            "name": e.name,
-                            "type": e.block_type,
-                            "line": e.start_line + 1,
-                            "end_line": e.end_line + 1,
-                            "skeleton": e.skeleton,
-                        })
-                    } else {
-                        serde_json::json!({
-                            "name": e.name,
-                            "type": e.block_type,
-                            "line": e.start_line + 1,
-                            "end_line": e.end_line + 1,
-                        })
-                    }
-                })
-                .collect();
+        .map(|(rel_path, entry)| {
+            let blocks: Vec<serde_json::Value> =
+                get_blocks(rel_path, entry, index_root, with_skeleton)
+                    .into_iter()
+                    .map(|e| {
+                        if with_skeleton {
+                            serde_json::json!({
+                                "name": e.name,
+                                "type": e.block_type,
+                                "line": e.start_line + 1,
+                                "end_line": e.end_line + 1,
+                                "skeleton": e.skeleton,
+                            })
+                        } else {
+                            serde_json::json!({
+                                "name": e.name,
+                                "type": e.block_type,
+                                "line": e.start_line + 1,
+                                "end_line": e.end_line + 1,
+                            })
+                        }
+                    })
+                    .collect();
             serde_json::json!({
                 "file": rel_path,
                 "blocks": blocks,
             })
         })
-        .collect();
-    println!("{}", serde_json::to_string_pretty(&output)?);
-    Ok(())
+        .collect()
 }
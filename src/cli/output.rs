@@ -11,7 +11,21 @@ pub fn print_results(
     context_lines: usize,
     highlight_query: Option<&str>,
 ) {
-    let results: Vec<SearchResult> = results
+    let results = relative_results(results, root);
+
+    match format {
+        OutputFormat::FilesOnly => print_files_only(&results),
+        OutputFormat::Json => print_json(&results, false),
+        OutputFormat::NoContent => print_json(&results, true),
+        OutputFormat::Default => {
+            print_default(&results, show_score, context_lines, highlight_query)
+        }
+    }
+}
+
+/// Rewrite result paths relative to `root` where possible.
+pub fn relative_results(results: &[SearchResult], root: Option<&Path>) -> Vec<SearchResult> {
+    results
         .iter()
         .map(|r| {
             let mut r = r.clone();
@@ -22,51 +36,47 @@ pub fn print_results(
             }
             r
         })
-        .collect();
+        .collect()
+}
 
-    match format {
-        OutputFormat::FilesOnly => print_files_only(&results),
-        OutputFormat::Json => print_json(&results, false),
-        OutputFormat::NoContent => print_json(&results, true),
-        OutputFormat::Default => {
-            print_default(&results, show_score, context_lines, highlight_query)
+/// JSON value for results, optionally without the content field.
+pub fn results_json(results: &[SearchResult], compact: bool) -> serde_json::Value {
+    let mut output = serde_json::to_value(results).unwrap_or_default();
+    if compact && let Some(items) = output.as_array_mut() {
+        for item in items {
+            if let Some(obj) = item.as_object_mut() {
+                obj.remove("content");
+            }
         }
     }
+    output
 }
 
 fn print_files_only(results: &[SearchResult]) {
     let mut seen = std::collections::HashSet::new();
     for r in results {
-        if seen.insert(&r.file) {
-            println!("{}", r.file);
+        let file = display_path(r);
+        if seen.insert(file.clone()) {
+            println!("{file}");
         }
     }
 }
 
-fn print_json(results: &[SearchResult], compact: bool) {
-    if compact {
-        let output: Vec<serde_json::Value> = results
-            .iter()
-            .map(|r| {
-                let mut v = serde_json::to_value(r).unwrap_or_default();
-                if let Some(obj) = v.as_object_mut() {
-                    obj.remove("content");
-                }
-                v
-            })
-            .collect();
-        println!(
-            "{}",
-            serde_json::to_string_pretty(&output).unwrap_or_default()
-        );
-    } else {
-        println!(
-            "{}",
-            serde_json::to_string_pretty(results).unwrap_or_default()
-        );
+/// Result path for display, under its root label in multi-root searches.
+fn display_path(r: &SearchResult) -> String {
+    match &r.root {
+        Some(root) => format!("{}/{}", root.trim_end_matches('/'), r.file),
+        None => r.file.clone(),
     }
 }
 
+fn print_json(results: &[SearchResult], compact: bool) {
+    println!(
+        "{}",
+        serde_json::to_string_pretty(&results_json(results, compact)).unwrap_or_default()
+    );
+}
+
 fn print_default(
     results: &[SearchResult],
     show_score: bool,
@@ -79,11 +89,12 @@ fn print_default(
 
     for r in results {
         let line_num = r.line.to_string();
+        let file = display_path(r);
 
         if show_score {
             println!(
                 "{}:{} {} {} (score: {:.3})",
-                r.file.cyan(),
+                file.cyan(),
                 line_num.yellow(),
                 r.block_type.dimmed(),
                 r.name.bold(),
@@ -92,7 +103,7 @@ fn print_default(
         } else {
             println!(
                 "{}:{} {} {}",
-                r.file.cyan(),
+                file.cyan(),
                 line_num.yellow(),
                 r.block_type.dimmed(),
                 r.name.bold()
@@ -1,12 +1,19 @@
-use std::path::Path;
-use std::time::Instant;
+use std::io::{BufRead, Write};
+use std::path::{Path, PathBuf};
+use std::time::{Duration, Instant};
 
-use anyhow::{Result, bail};
+use anyhow::{Context, Result, bail};
+use rayon::prelude::*;
+use serde::Deserialize;
 
 use crate::boost::boost_results;
-use crate::cli::output::print_results;
-use crate::index::{self, SemanticIndex, walker};
-use crate::types::{EXIT_ERROR, EXIT_MATCH, EXIT_NO_MATCH, FileRef, OutputFormat};
+use crate::cli::output::{print_results, relative_results, results_json};
+use crate::cli::serve;
+use crate::embedder::{self, LazyEmbedder};
+use crate::index::filter::SearchFilter;
+use crate::index::{self, BuildOrder, SemanticIndex, checkpoint};
+use crate::trace;
+use crate::types::{EXIT_ERROR, EXIT_MATCH, EXIT_NO_MATCH, FileRef, OutputFormat, SearchResult};
 
 pub struct SearchParams<'a> {
     pub query: Option<&'a str>,
@@ -24,6 +31,13 @@ pub struct SearchParams<'a> {
     pub highlight: bool,
 }
 
+impl SearchParams<'_> {
+    /// Type/exclude filter, applied inside the index search.
+    pub(crate) fn filter(&self) -> SearchFilter {
+        SearchFilter::new(self.file_types, self.exclude, self.code_only)
+    }
+}
+
 pub fn run(params: &SearchParams) -> Result<()> {
     let query = match params.query {
         Some(q) => q,
@@ -44,17 +58,291 @@ pub fn run(params: &SearchParams) -> Result<()> {
         );
     }
 
-    let path = params
-        .path
-        .canonicalize()
-        .unwrap_or_else(|_| params.path.to_path_buf());
+    // Validate the regex before paying for index load and search
+    let regex = compile_regex(params.regex);
+
+    let path = canonical_search_path(params.path);
+
+    // A running `og serve` already has the model and store loaded
+    let (results, search_time) = match forward_search(&path, query, params) {
+        Some(forwarded) => forwarded,
+        None => {
+            let mut index = open_index(&path, params.no_index, params.quiet, None)?;
+
+            // Run search
+            if !params.quiet {
+                eprint!("Searching...");
+            }
+            let t0 = Instant::now();
+            index.set_search_scope(Some(&path));
+            index.set_search_filter(params.filter());
+            let results = index.search(query, params.num_results)?;
+            let search_time = t0.elapsed();
+            if !params.quiet {
+                eprintln!("\r              \r");
+            }
+
+            (
+                postprocess_results(results, query, params, regex.as_ref()),
+                search_time,
+            )
+        }
+    };
+
+    // After the match so forwarded searches report no hits the same way
+    if results.is_empty() {
+        if !matches!(params.format, OutputFormat::Json) {
+            eprintln!("No results found");
+        }
+        trace::emit(None);
+        std::process::exit(EXIT_NO_MATCH);
+    }
+
+    trace::time("output", || {
+        print_results(
+            &results,
+            params.format,
+            false,
+            Some(&path),
+            params.context_lines,
+            params.highlight.then_some(query),
+        )
+    });
+    trace::count("results", results.len() as u64);
+
+    if !params.quiet && !matches!(params.format, OutputFormat::Json | OutputFormat::FilesOnly) {
+        let result_word = if results.len() == 1 {
+            "result"
+        } else {
+            "results"
+        };
+        eprintln!(
+            "{} {} ({:.2}s)",
+            results.len(),
+            result_word,
+            search_time.as_secs_f64()
+        );
+    }
+
+    trace::emit(None);
+    std::process::exit(EXIT_MATCH);
+}
+
+/// Search several index roots in one run. The roots share one model, loaded
+/// only if the query misses the query cache, and the query is embedded once;
+/// each root's store is then searched concurrently, and the results are
+/// merged by score. Each `(label, path)` root labels its results,
+/// whose paths are relative to it.
+pub fn run_multi(params: &SearchParams, roots: &[(String, PathBuf)]) -> Result<()> {
+    let Some(query) = params.query else {
+        bail!("No query provided. Run 'og --help' for usage.");
+    };
+    // A file reference names its own index
+    if parse_file_reference(query).is_some() {
+        return run(params);
+    }
+    let regex = compile_regex(params.regex);
+
+    let embedder = LazyEmbedder::new(1);
+    let mut indexes = Vec::with_capacity(roots.len());
+    for (label, path) in roots {
+        let path = canonical_search_path(path);
+        let mut index = open_index(&path, params.no_index, params.quiet, Some(&embedder))?;
+        index.set_search_scope(Some(&path));
+        index.set_search_filter(params.filter());
+        indexes.push((label, path, index));
+    }
+
+    if !params.quiet {
+        eprint!("Searching...");
+    }
+    let t0 = Instant::now();
+    let (_, _, first) = &indexes[0];
+    let query_tokens = first.embed_query_cached(query)?;
+    let per_root = indexes
+        .par_iter()
+        .map(|(label, path, index)| {
+            let results = index.search_embedded(query, &query_tokens, params.num_results)?;
+            let results = postprocess_results(results, query, params, regex.as_ref());
+            let mut results = relative_results(&results, Some(path));
+            for r in &mut results {
+                r.root = Some(label.to_string());
+            }
+            Ok(results)
+        })
+        .collect::<Result<Vec<_>>>()?;
+    let results = index::merge_top_k(per_root, params.num_results);
+    let search_time = t0.elapsed();
+    if !params.quiet {
+        eprintln!("\r              \r");
+    }
+    trace::count("roots", roots.len() as u64);
+
+    if results.is_empty() {
+        if !matches!(params.format, OutputFormat::Json) {
+            eprintln!("No results found");
+        }
+        trace::emit(None);
+        std::process::exit(EXIT_NO_MATCH);
+    }
+
+    trace::time("output", || {
+        print_results(
+            &results,
+            params.format,
+            false,
+            None,
+            params.context_lines,
+            params.highlight.then_some(query),
+        )
+    });
+    trace::count("results", results.len() as u64);
+
+    if !params.quiet && !matches!(params.format, OutputFormat::Json | OutputFormat::FilesOnly) {
+        eprintln!(
+            "{} results from {} roots ({:.2}s)",
+            results.len(),
+            roots.len(),
+            search_time.as_secs_f64()
+        );
+    }
+
+    trace::emit(None);
+    std::process::exit(EXIT_MATCH);
+}
+
+/// Roots listed in a workspace file: one path per line, relative to the
+/// file's directory. Blank lines and `#` comments are skipped; each root is
+/// labelled with its line.
+pub fn read_workspace(file: &Path) -> Result<Vec<(String, PathBuf)>> {
+    let text = std::fs::read_to_string(file)
+        .with_context(|| format!("Failed to read workspace file {}", file.display()))?;
+    let base = file.parent().unwrap_or(Path::new("."));
+    let roots: Vec<(String, PathBuf)> = text
+        .lines()
+        .map(str::trim)
+        .filter(|line| !line.is_empty() && !line.starts_with('#'))
+        .map(|line| (line.to_string(), base.join(line)))
+        .collect();
+    if roots.is_empty() {
+        bail!("Workspace file {} lists no roots", file.display());
+    }
+    Ok(roots)
+}
+
+/// A single line of `--batch` input: either a bare JSON string or an object.
+#[derive(Deserialize)]
+#[serde(untagged)]
+enum BatchQuery {
+    Text(String),
+    Request {
+        #[serde(default)]
+        id: Option<serde_json::Value>,
+        query: String,
+        #[serde(default)]
+        n: Option<usize>,
+    },
+}
+
+/// Run JSON-lines queries against a single loaded index.
+///
+/// The embedder, store and freshness check are paid once; each input line
+/// produces one output line `{"id", "query", "results", "elapsed_ms"}` on stdout.
+pub fn run_batch(params: &SearchParams, batch: &Path) -> Result<()> {
+    let regex = compile_regex(params.regex);
+
+    let path = canonical_search_path(params.path);
+    let mut index = open_index(&path, params.no_index, params.quiet, None)?;
+    index.set_search_scope(Some(&path));
+    index.set_search_filter(params.filter());
+    // Setup (model load, stale check) gets its own trace; each query then
+    // emits one tagged with its id
+    trace::emit(None);
+
+    let input: Box<dyn BufRead> = if batch == Path::new("-") {
+        Box::new(std::io::stdin().lock())
+    } else {
+        let file = std::fs::File::open(batch)
+            .with_context(|| format!("Failed to open batch file {}", batch.display()))?;
+        Box::new(std::io::BufReader::new(file))
+    };
+
+    let compact = matches!(params.format, OutputFormat::NoContent);
+    let mut stdout = std::io::stdout().lock();
+    let t0 = Instant::now();
+    let mut count = 0usize;
+
+    for (line_no, line) in input.lines().enumerate() {
+        let line = line?;
+        if line.trim().is_empty() {
+            continue;
+        }
+
+        let (id, query, k) = match serde_json::from_str::<BatchQuery>(&line) {
+            Ok(BatchQuery::Text(query)) => (serde_json::json!(line_no), query, None),
+            Ok(BatchQuery::Request { id, query, n }) => {
+                (id.unwrap_or(serde_json::json!(line_no)), query, n)
+            }
+            Err(e) => {
+                let record = serde_json::json!({
+                    "id": line_no,
+                    "error": format!("Invalid batch line: {e}"),
+                });
+                writeln!(stdout, "{record}")?;
+                continue;
+            }
+        };
+
+        let q0 = Instant::now();
+        let record = match index.search(&query, k.unwrap_or(params.num_results)) {
+            Ok(results) => {
+                let results = postprocess_results(results, &query, params, regex.as_ref());
+                let results = relative_results(&results, Some(&path));
+                serde_json::json!({
+                    "id": id,
+                    "query": query,
+                    "results": results_json(&results, compact),
+                    "elapsed_ms": q0.elapsed().as_secs_f64() * 1000.0,
+                })
+            }
+            Err(e) => serde_json::json!({
+                "id": id,
+                "query": query,
+                "error": format!("{e:#}"),
+            }),
+        };
+        writeln!(stdout, "{record}")?;
+        stdout.flush()?;
+        trace::emit(Some(serde_json::json!({ "id": record["id"] })));
+        count += 1;
+    }
+
+    if !params.quiet {
+        eprintln!("{count} queries ({:.2}s)", t0.elapsed().as_secs_f64());
+    }
+
+    Ok(())
+}
+
+fn canonical_search_path(path: &Path) -> PathBuf {
+    let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
     if !path.exists() {
         eprintln!("Path does not exist: {}", path.display());
         std::process::exit(EXIT_ERROR);
     }
+    path
+}
 
+/// Locate (or auto-build) the index covering `path` and bring it up to date.
+/// `embedder` is a model already loaded for another root.
+fn open_index(
+    path: &Path,
+    no_index: bool,
+    quiet: bool,
+    embedder: Option<&LazyEmbedder>,
+) -> Result<SemanticIndex> {
     // Walk up to find existing index
-    let (index_root, existing_index) = index::find_index_root(&path);
+    let (index_root, existing_index) = index::find_index_root(path);
 
     if existing_index.is_none() {
         // Check for auto-build
@@ -62,10 +350,15 @@ pub fn run(params: &SearchParams) -> Result<()> {
             .map(|v| matches!(v.to_lowercase().as_str(), "1" | "true" | "yes"))
             .unwrap_or(false)
         {
-            if !params.quiet {
+            if !quiet {
                 eprintln!("Building index (OG_AUTO_BUILD=1)...");
             }
-            super::build::build_index(&path, params.quiet)?;
+            super::build::build_index(
+                path,
+                embedder::build_sessions(),
+                &BuildOrder::default(),
+                quiet,
+            )?;
         } else {
             eprintln!("No index found. Run 'og build' first.");
             eprintln!("Tip: Set OG_AUTO_BUILD=1 for auto-indexing");
@@ -76,22 +369,46 @@ pub fn run(params: &SearchParams) -> Result<()> {
     let index_root = if existing_index.is_some() {
         index_root
     } else {
-        path.clone()
+        path.to_path_buf()
     };
 
-    let mut index = SemanticIndex::new(&index_root, None)?;
+    let mut index = match embedder {
+        Some(embedder) => SemanticIndex::with_lazy_embedder(&index_root, None, embedder.clone()),
+        None => SemanticIndex::new(&index_root, None),
+    };
+
+    if !quiet && !no_index && index_root != path {
+        eprintln!("Using index at {}", index_root.display());
+    }
+
+    if !quiet {
+        for name in index.building_shards() {
+            eprintln!("Shard {name} is being built; searching the others");
+        }
+    }
 
-    if !params.no_index {
-        // Auto-update stale files using metadata-only scan (no content reads)
-        if !params.quiet && index_root != path {
-            eprintln!("Using index at {}", index_root.display());
+    // A running build holds the store: search the snapshot of its last
+    // checkpoint, and ask for a fresh one at the next
+    if checkpoint::is_building(index.index_dir()) {
+        checkpoint::request_snapshot(index.index_dir());
+        if !index.use_build_snapshot() {
+            eprintln!("Index is being built; results are available from its next checkpoint.");
+            std::process::exit(EXIT_ERROR);
+        }
+        if !quiet {
+            eprintln!("Build in progress: searching its last checkpoint");
         }
+        return Ok(index);
+    }
 
-        let metadata = walker::scan_metadata(&index_root)?;
-        let (stale_count, stats) = index.check_and_update(&metadata)?;
+    // A running `og watch` already applies changes as they happen
+    if !no_index && !super::watch::is_watched(index.index_dir()) {
+        // Auto-update stale files: paths git lists, or a metadata-only scan
+        let scan = index.scan_tree()?;
+        let (stale_count, stats) = index.update_tree(&scan)?;
 
         if stale_count > 0
-            && !params.quiet
+            && !quiet
             && let Some(stats) = &stats
         {
             if stats.blocks > 0 {
@@ -105,28 +422,54 @@ pub fn run(params: &SearchParams) -> Result<()> {
         }
     }
 
-    // Run search
-    if !params.quiet {
-        eprint!("Searching...");
-    }
-    let t0 = Instant::now();
-    index.set_search_scope(Some(&path));
-    let mut results = index.search(query, params.num_results)?;
-    let search_time = t0.elapsed();
-    if !params.quiet {
-        eprintln!("\r              \r");
-    }
+    Ok(index)
+}
 
-    if results.is_empty() {
-        if !matches!(params.format, OutputFormat::Json) {
-            eprintln!("No results found");
+fn compile_regex(pattern: Option<&str>) -> Option<regex::Regex> {
+    let pattern = pattern?;
+    match regex::Regex::new(pattern) {
+        Ok(re) => Some(re),
+        Err(e) => {
+            eprintln!("Invalid regex: {e}");
+            std::process::exit(EXIT_ERROR);
         }
-        std::process::exit(EXIT_NO_MATCH);
     }
+}
+
+/// Search through a running `og serve`, if any. Results come back filtered and boosted.
+fn forward_search(
+    path: &Path,
+    query: &str,
+    params: &SearchParams,
+) -> Option<(Vec<SearchResult>, Duration)> {
+    let t0 = Instant::now();
+    let _span = trace::span("forward");
+    let response = serve::forward(&serde_json::json!({
+        "op": "search",
+        "path": path,
+        "query": query,
+        "n": params.num_results,
+        "file_types": params.file_types,
+        "exclude": params.exclude,
+        "code_only": params.code_only,
+        "threshold": params.threshold,
+        "regex": params.regex,
+        "no_index": params.no_index,
+    }))?;
+    let results = serde_json::from_value(response.get("results")?.clone()).ok()?;
+    Some((results, t0.elapsed()))
+}
 
-    // Filter results
-    results = filter_results(results, params.file_types, params.exclude, params.code_only);
-    boost_results(&mut results, query);
+/// Apply ranking boosts, threshold and regex filter. Type/exclude filters
+/// already ran inside the index search.
+pub(crate) fn postprocess_results(
+    mut results: Vec<SearchResult>,
+    query: &str,
+    params: &SearchParams,
+    regex: Option<&regex::Regex>,
+) -> Vec<SearchResult> {
+    let _span = trace::span("postprocess");
+    trace::time("boost", || boost_results(&mut results, query));
 
     // Filter by threshold
     if params.threshold != 0.0 {
@@ -134,48 +477,13 @@ pub fn run(params: &SearchParams) -> Result<()> {
     }
 
     // Regex filter
-    if let Some(pattern) = params.regex {
-        match regex::Regex::new(pattern) {
-            Ok(re) => {
-                results.retain(|r| {
-                    r.content.as_deref().is_some_and(|c| re.is_match(c)) || re.is_match(&r.name)
-                });
-            }
-            Err(e) => {
-                eprintln!("Invalid regex: {e}");
-                std::process::exit(EXIT_ERROR);
-            }
-        }
-    }
-
-    print_results(
-        &results,
-        params.format,
-        false,
-        Some(&path),
-        params.context_lines,
-        params.highlight.then_some(query),
-    );
-
-    if !params.quiet && !matches!(params.format, OutputFormat::Json | OutputFormat::FilesOnly) {
-        let result_word = if results.len() == 1 {
-            "result"
-        } else {
-            "results"
-        };
-        eprintln!(
-            "{} {} ({:.2}s)",
-            results.len(),
-            result_word,
-            search_time.as_secs_f64()
-        );
+    if let Some(re) = regex {
+        results.retain(|r| {
+            r.content.as_deref().is_some_and(|c| re.is_match(c)) || re.is_match(&r.name)
+        });
     }
 
-    std::process::exit(if results.is_empty() {
-        EXIT_NO_MATCH
-    } else {
-        EXIT_MATCH
-    });
+    results
 }
 
 fn run_similar_search(
@@ -236,23 +544,41 @@ fn run_similar_search(
         .unwrap_or_else(|_| file_path.into());
     let abs_str = abs_path.to_string_lossy();
 
-    let index = SemanticIndex::new(&index_root, None)?;
-    let mut results = index.find_similar(&abs_str, line, name, num_results)?;
+    let forwarded: Option<Vec<SearchResult>> = serve::forward(&serde_json::json!({
+        "op": "similar",
+        "file": abs_path,
+        "line": line,
+        "name": name,
+        "n": num_results,
+    }))
+    .and_then(|response| serde_json::from_value(response.get("results")?.clone()).ok());
+
+    let boost_query = name.unwrap_or("");
+    let results = match forwarded {
+        Some(results) => results,
+        None => {
+            let index = SemanticIndex::new(&index_root, None);
+            let mut results = trace::time("find_similar", || {
+                index.find_similar(&abs_str, line, name, num_results)
+            })?;
+
+            // Boost similar results using the reference name as query
+            if !boost_query.is_empty() {
+                trace::time("boost", || boost_results(&mut results, boost_query));
+            }
+            results
+        }
+    };
 
     if !quiet {
         eprintln!("\r                                \r");
     }
 
-    // Boost similar results using the reference name as query
-    let boost_query = name.unwrap_or("");
-    if !boost_query.is_empty() {
-        boost_results(&mut results, boost_query);
-    }
-
     if results.is_empty() {
         if !matches!(format, OutputFormat::Json) {
             eprintln!("No similar code found");
         }
+        trace::emit(None);
         std::process::exit(EXIT_NO_MATCH);
     }
 
@@ -324,79 +650,3 @@ fn parse_file_reference(query: &str) -> Option<FileRef> {
 
     None
 }
-
-/// Filter results by file type and exclude patterns.
-fn filter_results(
-    mut results: Vec<crate::types::SearchResult>,
-    file_types: Option<&str>,
-    exclude: &[String],
-    code_only: bool,
-) -> Vec<crate::types::SearchResult> {
-    // Build exclude list
-    let mut exclude_patterns: Vec<String> = exclude.to_vec();
-    if code_only {
-        exclude_patterns.extend(
-            ["*.md", "*.markdown", "*.txt", "*.rst", "*.adoc"]
-                .iter()
-                .map(|s| s.to_string()),
-        );
-    }
-
-    if file_types.is_none() && exclude_patterns.is_empty() {
-        return results;
-    }
-
-    // File type filtering
-    if let Some(types) = file_types {
-        let type_map: &[(&str, &[&str])] = &[
-            ("py", &[".py", ".pyi"]),
-            ("js", &[".js", ".jsx", ".mjs"]),
-            ("ts", &[".ts", ".tsx"]),
-            ("rust", &[".rs"]),
-            ("rs", &[".rs"]),
-            ("go", &[".go"]),
-            ("java", &[".java"]),
-            ("c", &[".c", ".h"]),
-            ("cpp", &[".cpp", ".cc", ".cxx", ".hpp", ".hh"]),
-            ("cs", &[".cs"]),
-            ("rb", &[".rb"]),
-            ("php", &[".php"]),
-            ("sh", &[".sh", ".bash", ".zsh"]),
-            ("md", &[".md", ".markdown"]),
-            ("json", &[".json"]),
-            ("yaml", &[".yaml", ".yml"]),
-            ("toml", &[".toml"]),
-        ];
-
-        let mut allowed_exts: std::collections::HashSet<String> = std::collections::HashSet::new();
-        for ft in types.split(',') {
-            let ft = ft.trim().to_lowercase();
-            let found = type_map.iter().find(|(name, _)| *name == ft);
-            if let Some((_, exts)) = found {
-                for ext in *exts {
-                    allowed_exts.insert(ext.to_string());
-                }
-            } else {
-                allowed_exts.insert(format!(".{ft}"));
-            }
-        }
-
-        results.retain(|r| allowed_exts.iter().any(|ext| r.file.ends_with(ext)));
-    }
-
-    // Exclude pattern filtering (simple glob matching)
-    if !exclude_patterns.is_empty() {
-        results.retain(|r| {
-            !exclude_patterns.iter().any(|pattern| {
-                // Simple glob: *.ext matching
-                if let Some(ext) = pattern.strip_prefix('*') {
-                    r.file.ends_with(ext)
-                } else {
-                    r.file.contains(pattern)
-                }
-            })
-        });
-    }
-
-    results
-}
@@ -0,0 +1,440 @@
+use std::path::{Path, PathBuf};
+
+/// Default socket location: `$OG_SOCKET`, else `$XDG_RUNTIME_DIR/og.sock`,
+/// else a per-user socket in the temp dir.
+pub fn socket_path() -> PathBuf {
+    if let Some(path) = std::env::var_os("OG_SOCKET") {
+        return PathBuf::from(path);
+    }
+    if let Some(dir) = std::env::var_os("XDG_RUNTIME_DIR") {
+        return PathBuf::from(dir).join("og.sock");
+    }
+    let user = std::env::var("USER").unwrap_or_else(|_| "default".to_string());
+    std::env::temp_dir().join(format!("og-{user}.sock"))
+}
+
+/// Ask a running server to drop its open store for the index covering `path`,
+/// so a local writer (`og build`, `og clean`) can take it.
+pub fn release(path: &Path) {
+    let _ = forward(&serde_json::json!({
+        "op": "release",
+        "path": path,
+    }));
+}
+
+#[cfg(unix)]
+pub use unix::{forward, run};
+
+#[cfg(not(unix))]
+pub fn forward(_request: &serde_json::Value) -> Option<serde_json::Value> {
+    None
+}
+
+#[cfg(not(unix))]
+pub fn run(_socket: Option<&Path>, _quiet: bool) -> anyhow::Result<()> {
+    anyhow::bail!("og serve requires Unix domain sockets")
+}
+
+#[cfg(unix)]
+mod unix {
+    use std::collections::HashMap;
+    use std::io::{BufRead, BufReader, Write};
+    use std::os::unix::net::{UnixListener, UnixStream};
+    use std::path::{Path, PathBuf};
+    use std::sync::{Arc, Mutex, RwLock};
+    use std::time::{Instant, SystemTime};
+
+    use anyhow::{Context, Result, anyhow, bail};
+    use serde::Deserialize;
+
+    use super::socket_path;
+    use crate::boost::boost_results;
+    use crate::cli::{context, outline, search, watch};
+    use crate::embedder::{self, Embedder};
+    use crate::index::{self, SemanticIndex, checkpoint, manifest, shard};
+    use crate::types::OutputFormat;
+
+    /// Whether CLI commands should try a running server first.
+    fn forwarding_enabled() -> bool {
+        !std::env::var("OG_NO_SERVER")
+            .map(|v| matches!(v.to_lowercase().as_str(), "1" | "true" | "yes"))
+            .unwrap_or(false)
+    }
+
+    fn default_k() -> usize {
+        10
+    }
+
+    fn default_context_files() -> usize {
+        12
+    }
+
+    fn default_symbols() -> usize {
+        5
+    }
+
+    /// One request line on the server socket, tagged by `op`.
+    #[derive(Deserialize)]
+    #[serde(tag = "op", rename_all = "snake_case")]
+    enum Request {
+        Ping,
+        Search {
+            path: PathBuf,
+            query: String,
+            #[serde(default = "default_k")]
+            n: usize,
+            #[serde(default)]
+            file_types: Option<String>,
+            #[serde(default)]
+            exclude: Vec<String>,
+            #[serde(default)]
+            code_only: bool,
+            #[serde(default)]
+            threshold: f32,
+            #[serde(default)]
+            regex: Option<String>,
+            #[serde(default)]
+            no_index: bool,
+        },
+        Similar {
+            file: PathBuf,
+            #[serde(default)]
+            line: Option<usize>,
+            #[serde(default)]
+            name: Option<String>,
+            #[serde(default = "default_k")]
+            n: usize,
+        },
+        Outline {
+            path: PathBuf,
+            #[serde(default)]
+            skeleton: bool,
+        },
+        Context {
+            path: PathBuf,
+            #[serde(default = "default_context_files")]
+            n: usize,
+            #[serde(default = "default_symbols")]
+            symbols: usize,
+            #[serde(default)]
+            skeleton: bool,
+        },
+        Release {
+            path: PathBuf,
+        },
+    }
+
+    /// The index (or shard of a sharded one) holding everything under `path`.
+    fn index_covering<'a>(index: &'a SemanticIndex, path: &Path) -> Result<&'a SemanticIndex> {
+        index.index_for(path).with_context(|| {
+            format!(
+                "{} spans several shards; run on a directory inside one",
+                path.display()
+            )
+        })
+    }
+
+    /// On-disk state an open index was read at: the manifest generation and
+    /// when the shard layout was written. Another process rebuilding the
+    /// index (`og build --force`, a new `--shard` layout) changes it.
+    type Stamp = (manifest::Generation, Option<SystemTime>);
+
+    fn stamp(index_dir: &Path) -> Stamp {
+        (
+            manifest::generation(index_dir),
+            shard::layout_modified(index_dir),
+        )
+    }
+
+    /// Shared server state: one warm embedder, one index per index root.
+    struct Server {
+        embedder: Arc<dyn Embedder>,
+        roots: Mutex<HashMap<PathBuf, (Stamp, Arc<RwLock<SemanticIndex>>)>>,
+    }
+
+    impl Server {
+        /// The open index for `path`, reopened when it changed on disk since
+        /// it was opened, so its token pool, shard layout and store match
+        /// what is there now.
+        fn index_for(&self, path: &Path) -> Result<Arc<RwLock<SemanticIndex>>> {
+            let (root, index_dir) = index::find_index_root(path);
+            let Some(index_dir) = index_dir else {
+                bail!("No index found. Run 'og build' first.");
+            };
+
+            let current = stamp(&index_dir);
+            let mut roots = self.roots.lock().map_err(|e| anyhow!("{e}"))?;
+            if let Some((opened, index)) = roots.get(&root)
+                && *opened == current
+            {
+                return Ok(Arc::clone(index));
+            }
+            let index = Arc::new(RwLock::new(SemanticIndex::with_embedder(
+                &root,
+                None,
+                Arc::clone(&self.embedder),
+            )));
+            roots.insert(root, (current, Arc::clone(&index)));
+            Ok(index)
+        }
+
+        /// Record the state `index` left on disk after this server wrote to
+        /// it, so its own updates don't make the next request reopen it.
+        fn restamp(&self, index: &Arc<RwLock<SemanticIndex>>, index_dir: &Path) -> Result<()> {
+            let mut roots = self.roots.lock().map_err(|e| anyhow!("{e}"))?;
+            if let Some((opened, _)) = roots.values_mut().find(|(_, i)| Arc::ptr_eq(i, index)) {
+                *opened = stamp(index_dir);
+            }
+            Ok(())
+        }
+
+        /// Re-index stale files and make sure the store is warm. The write lock
+        /// is only taken when something actually has to change.
+        fn refresh(&self, index: &Arc<RwLock<SemanticIndex>>, check_stale: bool) -> Result<()> {
+            let (stale, warm) = {
+                let index = index.read().map_err(|e| anyhow!("{e}"))?;
+                // `og watch` keeps watched roots fresh; it releases our store before writing
+                let stale = if check_stale
+                    && !watch::is_watched(index.index_dir())
+                    && !checkpoint::is_building(index.index_dir())
+                {
+                    let scan = index.scan_tree()?;
+                    index.is_stale(&scan)?.then_some(scan)
+                } else {
+                    None
+                };
+                (stale, index.has_warm_store())
+            };
+
+            if stale.is_none() && warm {
+                return Ok(());
+            }
+
+            let mut guard = index.write().map_err(|e| anyhow!("{e}"))?;
+            if let Some(scan) = stale {
+                guard.release_store();
+                guard.update_tree(&scan)?;
+                self.restamp(index, guard.index_dir())?;
+            }
+            guard.open_warm_store()
+        }
+
+        fn handle(&self, request: Request) -> Result<serde_json::Value> {
+            match request {
+                Request::Ping => Ok(serde_json::json!({
+                    "ok": true,
+                    "version": env!("CARGO_PKG_VERSION"),
+                })),
+                Request::Search {
+                    path,
+                    query,
+                    n,
+                    file_types,
+                    exclude,
+                    code_only,
+                    threshold,
+                    regex,
+                    no_index,
+                } => {
+                    let path = path.canonicalize().unwrap_or(path);
+                    let regex = regex
+                        .as_deref()
+                        .map(regex::Regex::new)
+                        .transpose()
+                        .context("Invalid regex")?;
+
+                    let index = self.index_for(&path)?;
+                    self.refresh(&index, !no_index)?;
+                    let index = index.read().map_err(|e| anyhow!("{e}"))?;
+
+                    let params = search::SearchParams {
+                        query: Some(query.as_str()),
+                        path: &path,
+                        num_results: n,
+                        threshold,
+                        format: OutputFormat::Json,
+                        quiet: true,
+                        file_types: file_types.as_deref(),
+                        exclude: &exclude,
+                        code_only,
+                        no_index,
+                        context_lines: 0,
+                        regex: None,
+                        highlight: false,
+                    };
+                    let results = index.search_scoped(&query, n, Some(&path), &params.filter())?;
+                    let results =
+                        search::postprocess_results(results, &query, &params, regex.as_ref());
+                    Ok(serde_json::json!({ "ok": true, "results": results }))
+                }
+                Request::Similar {
+                    file,
+                    line,
+                    name,
+                    n,
+                } => {
+                    let file = file.canonicalize().unwrap_or(file);
+                    let dir = file.parent().unwrap_or(Path::new("."));
+                    let index = self.index_for(dir)?;
+                    self.refresh(&index, false)?;
+                    let index = index.read().map_err(|e| anyhow!("{e}"))?;
+
+                    let mut results =
+                        index.find_similar(&file.to_string_lossy(), line, name.as_deref(), n)?;
+                    if let Some(name) = name.as_deref().filter(|n| !n.is_empty()) {
+                        boost_results(&mut results, name);
+                    }
+                    Ok(serde_json::json!({ "ok": true, "results": results }))
+                }
+                Request::Outline { path, skeleton } => {
+                    let path = path.canonicalize().unwrap_or(path);
+                    let index = self.index_for(&path)?;
+                    self.refresh(&index, false)?;
+                    let index = index.read().map_err(|e| anyhow!("{e}"))?;
+                    let index = index_covering(&index, &path)?;
+
+                    let files =
+                        outline::outline_json(index.root(), index.index_dir(), &path, skeleton)?;
+                    Ok(serde_json::json!({ "ok": true, "files": files }))
+                }
+                Request::Context {
+                    path,
+                    n,
+                    symbols,
+                    skeleton,
+                } => {
+                    let path = path.canonicalize().unwrap_or(path);
+                    let index = self.index_for(&path)?;
+                    self.refresh(&index, false)?;
+                    let index = index.read().map_err(|e| anyhow!("{e}"))?;
+                    let index = index_covering(&index, &path)?;
+
+                    let files = context::context_json(
+                        index.root(),
+                        index.index_dir(),
+                        &path,
+                        n,
+                        symbols,
+                        skeleton,
+                    )?;
+                    Ok(serde_json::json!({ "ok": true, "files": files }))
+                }
+                Request::Release { path } => {
+                    let path = path.canonicalize().unwrap_or(path);
+                    let (root, _) = index::find_index_root(&path);
+                    let index = self
+                        .roots
+                        .lock()
+                        .map_err(|e| anyhow!("{e}"))?
+                        .get(&root)
+                        .map(|(_, index)| Arc::clone(index));
+                    if let Some(index) = index {
+                        index.write().map_err(|e| anyhow!("{e}"))?.release_store();
+                    }
+                    Ok(serde_json::json!({ "ok": true }))
+                }
+            }
+        }
+
+        /// Answer newline-delimited JSON requests until the client disconnects.
+        fn serve_connection(&self, stream: UnixStream) -> Result<()> {
+            let reader = BufReader::new(stream.try_clone()?);
+            let mut writer = stream;
+
+            for line in reader.lines() {
+                let line = line?;
+                if line.trim().is_empty() {
+                    continue;
+                }
+
+                let t0 = Instant::now();
+                let mut response = match serde_json::from_str::<Request>(&line) {
+                    Ok(request) => self.handle(request).unwrap_or_else(
+                        |e| serde_json::json!({ "ok": false, "error": format!("{e:#}") }),
+                    ),
+                    Err(e) => serde_json::json!({
+                        "ok": false,
+                        "error": format!("Invalid request: {e}"),
+                    }),
+                };
+                if let Some(obj) = response.as_object_mut() {
+                    obj.insert(
+                        "elapsed_ms".to_string(),
+                        serde_json::json!(t0.elapsed().as_secs_f64() * 1000.0),
+                    );
+                }
+
+                writeln!(writer, "{response}")?;
+                writer.flush()?;
+            }
+
+            Ok(())
+        }
+    }
+
+    /// Run the server until killed, keeping the embedder and opened stores warm.
+    pub fn run(socket: Option<&Path>, quiet: bool) -> Result<()> {
+        let socket = socket.map(Path::to_path_buf).unwrap_or_else(socket_path);
+
+        if socket.exists() {
+            if UnixStream::connect(&socket).is_ok() {
+                bail!("og serve is already running on {}", socket.display());
+            }
+            // Left behind by a server that didn't shut down cleanly
+            std::fs::remove_file(&socket)?;
+        }
+
+        let t0 = Instant::now();
+        let embedder: Arc<dyn Embedder> = Arc::from(embedder::create_embedder()?);
+        let listener = UnixListener::bind(&socket)
+            .with_context(|| format!("Failed to bind {}", socket.display()))?;
+
+        if !quiet {
+            eprintln!(
+                "Serving on {} (model loaded in {:.1}s)",
+                socket.display(),
+                t0.elapsed().as_secs_f64()
+            );
+        }
+
+        let server = Arc::new(Server {
+            embedder,
+            roots: Mutex::new(HashMap::new()),
+        });
+
+        for stream in listener.incoming() {
+            let Ok(stream) = stream else { continue };
+            let server = Arc::clone(&server);
+            std::thread::spawn(move || {
+                if let Err(e) = server.serve_connection(stream)
+                    && !quiet
+                {
+                    eprintln!("Connection error: {e:#}");
+                }
+            });
+        }
+
+        Ok(())
+    }
+
+    /// Send one request to a running server. Returns `None` when no server is
+    /// listening or the server reports an error, so callers fall back to local work.
+    pub fn forward(request: &serde_json::Value) -> Option<serde_json::Value> {
+        if !forwarding_enabled() {
+            return None;
+        }
+
+        let stream = UnixStream::connect(socket_path()).ok()?;
+        writeln!(&stream, "{request}").ok()?;
+
+        let mut line = String::new();
+        BufReader::new(&stream).read_line(&mut line).ok()?;
+        let response: serde_json::Value = serde_json::from_str(&line).ok()?;
+
+        response
+            .get("ok")
+            .and_then(|v| v.as_bool())
+            .unwrap_or(false)
+            .then_some(response)
+    }
+}
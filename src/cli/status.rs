@@ -2,35 +2,24 @@ use std::path::Path;
 
 use anyhow::Result;
 
-use crate::index::{INDEX_DIR, SemanticIndex, walker};
+use crate::index::{self, INDEX_DIR, SemanticIndex, walker};
 use crate::types::EXIT_ERROR;
 
 pub fn run(path: &Path) -> Result<()> {
     let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
 
-    if !path.join(INDEX_DIR).join("manifest.json").exists() {
+    if !index::has_index(&path.join(INDEX_DIR)) {
         eprintln!("No index. Run 'og build' to create.");
         return Ok(());
     }
 
-    let index = match SemanticIndex::new(&path, None) {
-        Ok(i) => i,
-        Err(e) => {
-            let msg = e.to_string();
-            if msg.contains("older version") {
-                eprintln!("Index needs rebuild. Run: og build --force");
-                return Ok(());
-            }
-            eprintln!("{e}");
-            std::process::exit(EXIT_ERROR);
-        }
-    };
+    let index = SemanticIndex::new(&path, None);
 
     let block_count = index.count()?;
-    let files = walker::scan(&path)?;
-    let file_count = files.len();
+    let metadata = walker::scan_metadata(&path)?;
+    let file_count = metadata.len();
 
-    let stale_result = index.get_stale_files(&files);
+    let stale_result = index.get_stale_files_checked(&metadata);
     match stale_result {
         Ok((changed, deleted)) => {
             let stale_count = changed.len() + deleted.len();
@@ -61,5 +50,39 @@ pub fn run(path: &Path) -> Result<()> {
         }
     }
 
+    if index.token_pool() > 1 {
+        println!("Token pooling: {}x", index.token_pool());
+    }
+
+    if index.is_sharded() {
+        let building = index.building_shards();
+        if building.is_empty() {
+            println!("{} shards", index.shard_count());
+        } else {
+            println!(
+                "{} shards ({} being built)",
+                index.shard_count(),
+                building.join(", ")
+            );
+        }
+    }
+
+    let cache = index.query_cache();
+    if cache.is_enabled() {
+        let stats = cache.stats();
+        let lookups = stats.hits + stats.misses;
+        let hit_rate = if lookups > 0 {
+            stats.hits as f64 * 100.0 / lookups as f64
+        } else {
+            0.0
+        };
+        println!(
+            "Query cache: {} entries, {} hits, {} misses ({hit_rate:.0}% hit rate)",
+            cache.len(),
+            stats.hits,
+            stats.misses
+        );
+    }
+
     Ok(())
 }
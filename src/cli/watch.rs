@@ -0,0 +1,201 @@
+use std::collections::{HashMap, HashSet};
+use std::path::{Path, PathBuf};
+use std::sync::mpsc::{self, RecvTimeoutError};
+use std::time::{Duration, Instant};
+
+use anyhow::{Context, Result};
+use notify::event::{AccessKind, AccessMode};
+use notify::{Event, EventKind, RecursiveMode, Watcher};
+
+use crate::embedder;
+use crate::index::heartbeat::{self, Heartbeat};
+use crate::index::{self, INDEX_DIR, SemanticIndex, walker};
+use crate::types::{EXIT_ERROR, IndexStats};
+
+/// Marker in the index dir, refreshed while a watcher runs.
+const WATCH_MARKER: &str = "watch.pid";
+
+/// Longest a steady stream of events can hold back an update.
+const MAX_DELAY: Duration = Duration::from_secs(2);
+
+/// Whether a live `og watch` keeps the index in `index_dir` fresh, so callers
+/// can skip the metadata walk.
+pub fn is_watched(index_dir: &Path) -> bool {
+    heartbeat::is_alive(index_dir, WATCH_MARKER)
+}
+
+/// Paths touched since the last update, coalesced.
+#[derive(Default)]
+struct Pending {
+    paths: HashSet<PathBuf>,
+    /// Events were dropped or ignore rules changed: fall back to a full scan.
+    rescan: bool,
+}
+
+impl Pending {
+    fn add(&mut self, event: notify::Result<Event>, index_dir: &Path) {
+        let event = match event {
+            Ok(event) => event,
+            Err(_) => {
+                self.rescan = true;
+                return;
+            }
+        };
+        if event.need_rescan() {
+            self.rescan = true;
+        }
+        // Reads don't change anything; a close after writing does
+        if let EventKind::Access(kind) = event.kind
+            && kind != AccessKind::Close(AccessMode::Write)
+        {
+            return;
+        }
+
+        for path in event.paths {
+            if path.starts_with(index_dir) {
+                continue;
+            }
+            if path
+                .file_name()
+                .is_some_and(|name| name == ".gitignore" || name == ".ignore")
+            {
+                self.rescan = true;
+            }
+            self.paths.insert(path);
+        }
+    }
+
+    fn is_empty(&self) -> bool {
+        self.paths.is_empty() && !self.rescan
+    }
+}
+
+/// Watch `path`'s index root and re-index touched files as they change.
+pub fn run(path: &Path, debounce: Duration, quiet: bool) -> Result<()> {
+    let path = path.canonicalize().unwrap_or_else(|_| path.to_path_buf());
+    let (index_root, existing_index) = index::find_index_root(&path);
+    let root = if existing_index.is_some() {
+        index_root
+    } else {
+        path.clone()
+    };
+    let index_dir = root.join(INDEX_DIR);
+
+    if is_watched(&index_dir) {
+        eprintln!("og watch is already running for {}", root.display());
+        std::process::exit(EXIT_ERROR);
+    }
+
+    // A running `og serve` may hold the store open
+    super::serve::release(&root);
+    if existing_index.is_none() {
+        super::build::build_index(
+            &root,
+            embedder::build_sessions(),
+            &index::BuildOrder::default(),
+            quiet,
+        )?;
+    }
+
+    let index = SemanticIndex::new(&root, None);
+    let mut filter = walker::PathFilter::new(&root);
+
+    // Subscribe before catching up so nothing changed in between is missed
+    let (tx, rx) = mpsc::channel();
+    let mut watcher = notify::recommended_watcher(tx)?;
+    watcher
+        .watch(&root, RecursiveMode::Recursive)
+        .with_context(|| format!("Failed to watch {}", root.display()))?;
+
+    let t0 = Instant::now();
+    let catch_up = Pending {
+        rescan: true,
+        ..Default::default()
+    };
+    report(apply(&index, &mut filter, catch_up), t0, quiet);
+
+    let _heartbeat = Heartbeat::start(index_dir.join(WATCH_MARKER))?;
+
+    if !quiet {
+        eprintln!("Watching {} (Ctrl-C to stop)", root.display());
+    }
+
+    while let Ok(event) = rx.recv() {
+        let mut pending = Pending::default();
+        pending.add(event, &index_dir);
+
+        // Debounce: wait for a quiet gap, but not forever
+        let first = Instant::now();
+        while first.elapsed() < MAX_DELAY {
+            match rx.recv_timeout(debounce) {
+                Ok(event) => pending.add(event, &index_dir),
+                Err(RecvTimeoutError::Timeout | RecvTimeoutError::Disconnected) => break,
+            }
+        }
+        if pending.is_empty() {
+            continue;
+        }
+
+        let t0 = Instant::now();
+        super::serve::release(&root);
+        report(apply(&index, &mut filter, pending), t0, quiet);
+    }
+
+    Ok(())
+}
+
+/// Re-index pending paths: stat and filter each one, rescan directories that
+/// appeared, and let the index drop whatever no longer exists.
+///
+/// The manifest is saved under its lock (`Manifest::save`), so a search or
+/// build running meanwhile reads it as it was before or after an update,
+/// never half written, and a concurrent save keeps both sides' entries.
+/// Store writes are not under that lock: a search landing mid-update may
+/// miss the blocks of the files being re-indexed in that moment.
+fn apply(
+    index: &SemanticIndex,
+    filter: &mut walker::PathFilter,
+    pending: Pending,
+) -> Result<(usize, Option<IndexStats>)> {
+    if pending.rescan {
+        filter.reset();
+        let metadata = walker::scan_metadata(index.root())?;
+        return index.check_and_update(&metadata);
+    }
+
+    let mut present = HashMap::new();
+    let mut gone = Vec::new();
+    for path in pending.paths {
+        if path.is_dir() {
+            // A directory moved into the tree arrives as a single event
+            for file in walker::scan_metadata(&path)?.into_keys() {
+                if let Some(meta) = filter.check(&file) {
+                    present.insert(file, meta);
+                }
+            }
+            gone.push(path);
+        } else if let Some(meta) = filter.check(&path) {
+            present.insert(path, meta);
+        } else {
+            gone.push(path);
+        }
+    }
+
+    index.update_paths(&present, &gone)
+}
+
+fn report(result: Result<(usize, Option<IndexStats>)>, t0: Instant, quiet: bool) {
+    match result {
+        Ok((stale_count, Some(stats))) if !quiet => {
+            eprintln!(
+                "Updated {stale_count} files: {} blocks ({} cached), {} removed ({:.1}s)",
+                stats.blocks,
+                stats.cached,
+                stats.deleted,
+                t0.elapsed().as_secs_f64()
+            );
+        }
+        Ok(_) => {}
+        Err(e) => eprintln!("Update failed: {e:#}"),
+    }
+}
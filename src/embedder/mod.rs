@@ -1,6 +1,9 @@
 pub mod onnx;
 pub mod tokenizer;
 
+use std::ops::Range;
+use std::sync::{Arc, Mutex, OnceLock};
+
 use anyhow::{Context, Result};
 use ndarray::Array2;
 
@@ -13,7 +16,8 @@ pub struct ModelConfig {
     pub doc_max_length: usize,
     pub query_max_length: usize,
     pub version: &'static str,
-    pub batch_size: usize,
+    /// Padded tokens per forward pass (documents x longest in batch).
+    pub batch_tokens: usize,
 }
 
 /// Maximum token embeddings stored per document.
@@ -31,7 +35,7 @@ pub const MODEL: &ModelConfig = &ModelConfig {
     doc_max_length: 1024,
     query_max_length: 256,
     version: "lateon-code-edge-v1",
-    batch_size: 16,
+    batch_tokens: 8192,
 };
 
 /// Embedding output: variable-length token embeddings per document.
@@ -39,27 +43,167 @@ pub const MODEL: &ModelConfig = &ModelConfig {
 pub struct TokenEmbeddings {
     /// One entry per document: each is (num_tokens, token_dim).
     pub embeddings: Vec<Array2<f32>>,
+    /// Real input tokens across all documents.
+    pub tokens: usize,
+    /// Tokens fed to the model including padding (what the forward passes cost).
+    pub padded_tokens: usize,
+}
+
+/// A document tokenized for the model: input IDs, truncated and unpadded.
+/// Every ID is attended to, so the attention mask is implied by the length;
+/// padding is added per batch when tensors are assembled.
+#[derive(Default)]
+pub struct TokenizedDoc {
+    pub ids: Vec<i64>,
+}
+
+impl TokenizedDoc {
+    pub fn len(&self) -> usize {
+        self.ids.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.ids.is_empty()
+    }
 }
 
 /// Trait for multi-vector embedding backends.
 pub trait Embedder: Send + Sync {
+    /// Tokenize one document. Safe to call from many threads at once, so bulk
+    /// indexing tokenizes in its extraction workers instead of the embed loop.
+    fn tokenize_document(&self, text: &str) -> Result<TokenizedDoc>;
+
+    /// Embed tokenized documents, returning per-token embeddings for each.
+    fn embed_tokenized(&self, docs: &[TokenizedDoc]) -> Result<TokenEmbeddings>;
+
     /// Embed documents, returning per-token embeddings for each.
-    fn embed_documents(&self, texts: &[&str]) -> Result<TokenEmbeddings>;
+    fn embed_documents(&self, texts: &[&str]) -> Result<TokenEmbeddings> {
+        let docs = texts
+            .iter()
+            .map(|text| self.tokenize_document(text))
+            .collect::<Result<Vec<_>>>()?;
+        self.embed_tokenized(&docs)
+    }
 
     /// Embed a query, returning token embeddings.
     fn embed_query(&self, text: &str) -> Result<Array2<f32>>;
+
+    /// Number of batches `embed_tokenized` can run concurrently.
+    /// Callers size their document batches as a multiple of this.
+    fn parallelism(&self) -> usize {
+        1
+    }
 }
 
-/// Create the embedder, downloading model files if needed.
+/// Create the embedder for query-time use (one session on all cores),
+/// downloading model files if needed.
 pub fn create_embedder() -> Result<Box<dyn Embedder>> {
+    create_pooled_embedder(1)
+}
+
+/// Create an embedder with `sessions` ONNX sessions splitting the CPUs,
+/// for bulk indexing.
+pub fn create_pooled_embedder(sessions: usize) -> Result<Box<dyn Embedder>> {
+    let _span = crate::trace::span("load_model");
     let (model_path, tokenizer_path) = download_model_files(MODEL)?;
     Ok(Box::new(onnx::OnnxEmbedder::new(
         &model_path,
         &tokenizer_path,
         MODEL,
+        sessions,
     )?))
 }
 
+/// An embedder loaded on first use. Commands that never embed (`og status`,
+/// `og list`, `og clean`, file-reference search, delete-only updates) skip
+/// the model load entirely. Clones share one load.
+#[derive(Clone)]
+pub struct LazyEmbedder {
+    inner: Arc<LazyInner>,
+}
+
+struct LazyInner {
+    sessions: usize,
+    model: OnceLock<Arc<dyn Embedder>>,
+    /// Held while loading, so concurrent first uses load once.
+    loading: Mutex<()>,
+}
+
+impl LazyEmbedder {
+    /// Load with `sessions` ONNX sessions when first needed.
+    pub fn new(sessions: usize) -> Self {
+        Self {
+            inner: Arc::new(LazyInner {
+                sessions,
+                model: OnceLock::new(),
+                loading: Mutex::new(()),
+            }),
+        }
+    }
+
+    /// Wrap an embedder that is already loaded.
+    pub fn loaded(embedder: Arc<dyn Embedder>) -> Self {
+        let lazy = Self::new(embedder.parallelism());
+        let _ = lazy.inner.model.set(embedder);
+        lazy
+    }
+
+    /// The embedder, loading it on the first call.
+    pub fn get(&self) -> Result<&Arc<dyn Embedder>> {
+        if let Some(model) = self.inner.model.get() {
+            return Ok(model);
+        }
+        let _loading = self.inner.loading.lock().unwrap_or_else(|e| e.into_inner());
+        if let Some(model) = self.inner.model.get() {
+            return Ok(model);
+        }
+        let model = Arc::from(create_pooled_embedder(self.inner.sessions)?);
+        Ok(self.inner.model.get_or_init(|| model))
+    }
+
+    pub fn is_loaded(&self) -> bool {
+        self.inner.model.get().is_some()
+    }
+}
+
+/// Session count for `og build`: `OG_EMBED_SESSIONS`, else one session per
+/// 8 cores (max 8). The model is small, so a single batch stops scaling well
+/// past a handful of intra-op threads.
+pub fn build_sessions() -> usize {
+    std::env::var("OG_EMBED_SESSIONS")
+        .ok()
+        .and_then(|v| v.parse::<usize>().ok())
+        .filter(|&n| n > 0)
+        .unwrap_or_else(|| (onnx::num_cpus() / 8).clamp(1, 8))
+}
+
+/// Padded-token budget per batch: `OG_BATCH_TOKENS`, else the model default.
+pub fn batch_tokens(config: &ModelConfig) -> usize {
+    std::env::var("OG_BATCH_TOKENS")
+        .ok()
+        .and_then(|v| v.parse::<usize>().ok())
+        .filter(|&n| n > 0)
+        .unwrap_or(config.batch_tokens)
+}
+
+/// Split ascending sequence lengths into contiguous batches whose padded size
+/// (count x longest) stays within `max_tokens`. A sequence longer than the
+/// budget gets a batch of its own.
+pub fn token_budget_batches(sorted_lengths: &[usize], max_tokens: usize) -> Vec<Range<usize>> {
+    let mut batches = Vec::new();
+    let mut start = 0;
+    for (i, &len) in sorted_lengths.iter().enumerate() {
+        if i > start && (i + 1 - start) * len > max_tokens {
+            batches.push(start..i);
+            start = i;
+        }
+    }
+    if start < sorted_lengths.len() {
+        batches.push(start..sorted_lengths.len());
+    }
+    batches
+}
+
 /// Download both model and tokenizer files, returning their local paths.
 fn download_model_files(config: &ModelConfig) -> Result<(String, String)> {
     let api = hf_hub::api::sync::Api::new().context("Failed to create HF Hub API")?;
@@ -84,3 +228,55 @@ fn download_model_files(config: &ModelConfig) -> Result<(String, String)> {
         tokenizer_path.to_string_lossy().into_owned(),
     ))
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn lazy_embedder_wraps_loaded_model_without_loading() {
+        struct Fixed;
+        impl Embedder for Fixed {
+            fn tokenize_document(&self, _text: &str) -> Result<TokenizedDoc> {
+                unimplemented!()
+            }
+            fn embed_tokenized(&self, _docs: &[TokenizedDoc]) -> Result<TokenEmbeddings> {
+                unimplemented!()
+            }
+            fn embed_query(&self, _text: &str) -> Result<Array2<f32>> {
+                Ok(Array2::zeros((1, 2)))
+            }
+        }
+
+        assert!(!LazyEmbedder::new(1).is_loaded());
+        let lazy = LazyEmbedder::loaded(Arc::new(Fixed));
+        let shared = lazy.clone();
+        assert!(shared.is_loaded());
+        assert_eq!(
+            shared.get().unwrap().embed_query("q").unwrap().dim(),
+            (1, 2)
+        );
+    }
+
+    #[test]
+    fn token_budget_batches_respect_padded_budget() {
+        let lengths = [10, 10, 20, 30, 30, 100, 400];
+        let batches = token_budget_batches(&lengths, 100);
+
+        assert_eq!(batches, vec![0..3, 3..5, 5..6, 6..7]);
+        for batch in &batches {
+            let padded = batch.len() * lengths[batch.end - 1];
+            assert!(padded <= 100 || batch.len() == 1);
+        }
+    }
+
+    #[test]
+    fn token_budget_batches_cover_every_item_once() {
+        let lengths: Vec<usize> = (1..=200).collect();
+        let batches = token_budget_batches(&lengths, 1000);
+
+        let covered: Vec<usize> = batches.iter().flat_map(|b| b.clone()).collect();
+        assert_eq!(covered, (0..200).collect::<Vec<_>>());
+        assert!(token_budget_batches(&[], 1000).is_empty());
+    }
+}
@@ -1,56 +1,82 @@
-use std::sync::Mutex;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::{Mutex, MutexGuard};
 
 use anyhow::{Context, Result, anyhow};
 use ndarray::Array2;
 use ort::value::TensorRef;
 
 use super::tokenizer::TokenizerWrapper;
-use super::{Embedder, ModelConfig, TokenEmbeddings};
-use tokenizers::Encoding;
+use super::{Embedder, ModelConfig, TokenEmbeddings, TokenizedDoc, token_budget_batches};
 
 /// ONNX-based embedder for LateOn-Code models.
+///
+/// Holds a pool of sessions that split the CPUs between them. One session with
+/// every core suits single queries; bulk indexing keeps more cores busy running
+/// several batches at once, each on fewer intra-op threads.
 pub struct OnnxEmbedder {
-    session: Mutex<ort::session::Session>,
+    sessions: Vec<Mutex<ort::session::Session>>,
     tokenizer: TokenizerWrapper,
-    batch_size: usize,
+    /// Padded-token budget per forward pass (batch rows x longest sequence).
+    batch_tokens: usize,
+    /// Round-robin start for session selection, so concurrent callers spread out.
+    next_session: AtomicUsize,
 }
 
 impl OnnxEmbedder {
-    pub fn new(model_path: &str, tokenizer_path: &str, config: &ModelConfig) -> Result<Self> {
-        let session = ort::session::Session::builder()?
-            .with_optimization_level(ort::session::builder::GraphOptimizationLevel::Level3)
-            .map_err(|e| anyhow!("Failed to set ONNX optimization level: {e}"))?
-            .with_intra_threads(num_cpus())
-            .map_err(|e| anyhow!("Failed to configure ONNX thread count: {e}"))?
-            .commit_from_file(model_path)
-            .context("Failed to load ONNX model")?;
+    pub fn new(
+        model_path: &str,
+        tokenizer_path: &str,
+        config: &ModelConfig,
+        num_sessions: usize,
+    ) -> Result<Self> {
+        let num_sessions = num_sessions.clamp(1, num_cpus());
+        let intra_threads = (num_cpus() / num_sessions).max(1);
+
+        let sessions = (0..num_sessions)
+            .map(|_| {
+                let session = ort::session::Session::builder()?
+                    .with_optimization_level(ort::session::builder::GraphOptimizationLevel::Level3)
+                    .map_err(|e| anyhow!("Failed to set ONNX optimization level: {e}"))?
+                    .with_intra_threads(intra_threads)
+                    .map_err(|e| anyhow!("Failed to configure ONNX thread count: {e}"))?
+                    .commit_from_file(model_path)
+                    .context("Failed to load ONNX model")?;
+                Ok(Mutex::new(session))
+            })
+            .collect::<Result<Vec<_>>>()?;
+
         let tokenizer = TokenizerWrapper::new(tokenizer_path, config)?;
         Ok(Self {
-            session: Mutex::new(session),
+            sessions,
             tokenizer,
-            batch_size: config.batch_size,
+            batch_tokens: super::batch_tokens(config),
+            next_session: AtomicUsize::new(0),
         })
     }
 
-    fn embed_batch(&self, encodings: Vec<Encoding>) -> Result<TokenEmbeddings> {
-        let batch_size = encodings.len();
-        let seq_len = encodings
-            .iter()
-            .map(|e| e.get_ids().len())
-            .max()
-            .unwrap_or(0);
+    /// Take an idle session if there is one, otherwise wait on the next in turn.
+    fn acquire_session(&self) -> Result<MutexGuard<'_, ort::session::Session>> {
+        let start = self.next_session.fetch_add(1, Ordering::Relaxed);
+        let n = self.sessions.len();
+        for i in 0..n {
+            if let Ok(session) = self.sessions[(start + i) % n].try_lock() {
+                return Ok(session);
+            }
+        }
+        self.sessions[start % n].lock().map_err(|e| anyhow!("{e}"))
+    }
+
+    fn embed_batch(&self, docs: &[&TokenizedDoc]) -> Result<Vec<Array2<f32>>> {
+        let batch_size = docs.len();
+        let seq_len = docs.iter().map(|d| d.len()).max().unwrap_or(0);
 
-        // Build input tensors
+        // Build input tensors: one slice copy per row, zero padding after it
         let mut input_ids = vec![0i64; batch_size * seq_len];
         let mut attention_mask = vec![0i64; batch_size * seq_len];
-
-        for (i, enc) in encodings.iter().enumerate() {
-            for (j, &id) in enc.get_ids().iter().enumerate() {
-                input_ids[i * seq_len + j] = id as i64;
-            }
-            for (j, &mask) in enc.get_attention_mask().iter().enumerate() {
-                attention_mask[i * seq_len + j] = mask as i64;
-            }
+        for (i, doc) in docs.iter().enumerate() {
+            let row = i * seq_len..i * seq_len + doc.len();
+            input_ids[row.clone()].copy_from_slice(&doc.ids);
+            attention_mask[row].fill(1);
         }
 
         let input_ids = ndarray::Array2::from_shape_vec((batch_size, seq_len), input_ids)?;
@@ -60,7 +86,7 @@ impl OnnxEmbedder {
         // Run inference
         let input_ids_tensor = TensorRef::from_array_view(&input_ids)?;
         let attention_mask_tensor = TensorRef::from_array_view(&attention_mask)?;
-        let mut session = self.session.lock().map_err(|e| anyhow::anyhow!("{e}"))?;
+        let mut session = self.acquire_session()?;
         let outputs = session.run(ort::inputs![
             "input_ids" => input_ids_tensor,
             "attention_mask" => attention_mask_tensor,
@@ -70,10 +96,10 @@ impl OnnxEmbedder {
         let output = outputs.get("last_hidden_state").unwrap_or(&outputs[0]);
         let view = output.try_extract_array::<f32>()?;
 
-        // Extract per-document token embeddings, filtering by attention mask
+        // Extract per-document token embeddings, dropping the padding
         let mut result = Vec::with_capacity(batch_size);
-        for (i, enc) in encodings.iter().enumerate() {
-            let num_tokens = enc.get_attention_mask().iter().filter(|&&m| m == 1).count();
+        for (i, doc) in docs.iter().enumerate() {
+            let num_tokens = doc.len();
 
             // Slice the output view directly — avoids element-by-element copy
             let mut tokens = view.slice(ndarray::s![i, 0..num_tokens, ..]).to_owned();
@@ -88,37 +114,99 @@ impl OnnxEmbedder {
             result.push(tokens);
         }
 
-        Ok(TokenEmbeddings { embeddings: result })
+        Ok(result)
     }
 }
 
 impl Embedder for OnnxEmbedder {
-    fn embed_documents(&self, texts: &[&str]) -> Result<TokenEmbeddings> {
-        let mut all_embeddings = Vec::with_capacity(texts.len());
+    fn tokenize_document(&self, text: &str) -> Result<TokenizedDoc> {
+        self.tokenizer.encode_document(text)
+    }
 
-        for chunk in texts.chunks(self.batch_size) {
-            let encodings = self.tokenizer.encode_documents(chunk)?;
-            let batch_result = self.embed_batch(encodings)?;
-            all_embeddings.extend(batch_result.embeddings);
+    fn embed_tokenized(&self, docs: &[TokenizedDoc]) -> Result<TokenEmbeddings> {
+        // Sort the whole window by length, then cut batches by padded token
+        // count, so short blocks share a forward pass instead of padding up to
+        // whichever long block landed in their batch.
+        let mut order: Vec<usize> = (0..docs.len()).collect();
+        order.sort_by_key(|&i| docs[i].len());
+        let sorted: Vec<&TokenizedDoc> = order.iter().map(|&i| &docs[i]).collect();
+        let lengths: Vec<usize> = sorted.iter().map(|d| d.len()).collect();
+        let batches = token_budget_batches(&lengths, self.batch_tokens);
+
+        let tokens = lengths.iter().sum();
+        let padded_tokens = batches.iter().map(|b| b.len() * lengths[b.end - 1]).sum();
+
+        // One worker per session pulls batches off a shared counter. Plain
+        // threads, not Rayon: the extraction producer may saturate the global pool.
+        let workers = self.sessions.len().min(batches.len());
+        let mut slots: Vec<Option<Array2<f32>>> = (0..sorted.len()).map(|_| None).collect();
+
+        if workers <= 1 {
+            for batch in &batches {
+                let embeddings = self.embed_batch(&sorted[batch.clone()])?;
+                for (pos, emb) in batch.clone().zip(embeddings) {
+                    slots[order[pos]] = Some(emb);
+                }
+            }
+        } else {
+            let next_batch = AtomicUsize::new(0);
+            std::thread::scope(|s| {
+                let handles: Vec<_> = (0..workers)
+                    .map(|_| {
+                        s.spawn(|| {
+                            let mut done = Vec::new();
+                            loop {
+                                let idx = next_batch.fetch_add(1, Ordering::Relaxed);
+                                let Some(batch) = batches.get(idx) else {
+                                    return Ok::<_, anyhow::Error>(done);
+                                };
+                                let embeddings = self.embed_batch(&sorted[batch.clone()])?;
+                                done.push((batch.start, embeddings));
+                            }
+                        })
+                    })
+                    .collect();
+
+                for handle in handles {
+                    let done = handle
+                        .join()
+                        .map_err(|_| anyhow!("Embedding worker panicked"))??;
+                    for (start, embeddings) in done {
+                        for (offset, emb) in embeddings.into_iter().enumerate() {
+                            slots[order[start + offset]] = Some(emb);
+                        }
+                    }
+                }
+                Ok::<(), anyhow::Error>(())
+            })?;
         }
 
+        let embeddings = slots
+            .into_iter()
+            .map(|slot| slot.context("Embedding worker skipped a document"))
+            .collect::<Result<Vec<_>>>()?;
+
         Ok(TokenEmbeddings {
-            embeddings: all_embeddings,
+            embeddings,
+            tokens,
+            padded_tokens,
         })
     }
 
     fn embed_query(&self, text: &str) -> Result<Array2<f32>> {
-        let encoding = self.tokenizer.encode_query(text)?;
-        let result = self.embed_batch(vec![encoding])?;
-        result
-            .embeddings
+        let doc = self.tokenizer.encode_query(text)?;
+        self.embed_batch(&[&doc])?
             .into_iter()
             .next()
             .context("No embedding produced for query")
     }
+
+    fn parallelism(&self) -> usize {
+        self.sessions.len()
+    }
 }
 
-fn num_cpus() -> usize {
+pub(crate) fn num_cpus() -> usize {
     std::thread::available_parallelism()
         .map(|n| n.get())
         .unwrap_or(4)
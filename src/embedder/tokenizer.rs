@@ -1,10 +1,11 @@
 use anyhow::Result;
-use tokenizers::Tokenizer;
+use tokenizers::{Encoding, Tokenizer};
 
-use super::ModelConfig;
+use super::{ModelConfig, TokenizedDoc};
 
 /// Wrapper around HuggingFace tokenizer.
-/// Pre-configured with truncation/padding to avoid cloning per batch.
+/// Pre-configured with truncation to avoid cloning per call. Encodings are
+/// unpadded; batches are padded when their tensors are assembled.
 pub struct TokenizerWrapper {
     doc_tokenizer: Tokenizer,
     query_tokenizer: Tokenizer,
@@ -12,9 +13,9 @@ pub struct TokenizerWrapper {
 
 impl TokenizerWrapper {
     pub fn new(tokenizer_path: &str, config: &ModelConfig) -> Result<Self> {
-        // `og build` already uses Rayon for extraction. Tokenizers also uses the
-        // global Rayon pool for padding, which can deadlock if extractor workers
-        // fill the bounded channel while the consumer waits on tokenizer jobs.
+        // Documents are tokenized one at a time inside `og build`'s Rayon
+        // extraction workers. Tokenizers' own use of the global pool would
+        // nest inside those jobs and can deadlock against the bounded channel.
         tokenizers::parallelism::set_parallelism(false);
 
         let base = Tokenizer::from_file(tokenizer_path).map_err(|e| anyhow::anyhow!("{e}"))?;
@@ -26,7 +27,6 @@ impl TokenizerWrapper {
                 ..Default::default()
             }))
             .map_err(|e| anyhow::anyhow!("{e}"))?;
-        doc_tokenizer.with_padding(Some(tokenizers::PaddingParams::default()));
 
         let mut query_tokenizer = base;
         query_tokenizer
@@ -35,7 +35,6 @@ impl TokenizerWrapper {
                 ..Default::default()
             }))
             .map_err(|e| anyhow::anyhow!("{e}"))?;
-        query_tokenizer.with_padding(Some(tokenizers::PaddingParams::default()));
 
         Ok(Self {
             doc_tokenizer,
@@ -43,22 +42,28 @@ impl TokenizerWrapper {
         })
     }
 
-    /// Encode texts for document embedding.
-    pub fn encode_documents(&self, texts: &[&str]) -> Result<Vec<tokenizers::Encoding>> {
-        texts
-            .iter()
-            .map(|text| {
-                self.doc_tokenizer
-                    .encode(tokenizers::EncodeInput::Single((*text).into()), true)
-                    .map_err(|e| anyhow::anyhow!("{e}"))
-            })
-            .collect()
+    /// Encode one text for document embedding.
+    pub fn encode_document(&self, text: &str) -> Result<TokenizedDoc> {
+        let encoding = self
+            .doc_tokenizer
+            .encode(tokenizers::EncodeInput::Single(text.into()), true)
+            .map_err(|e| anyhow::anyhow!("{e}"))?;
+        Ok(to_doc(&encoding))
     }
 
     /// Encode a query (shorter max length).
-    pub fn encode_query(&self, text: &str) -> Result<tokenizers::Encoding> {
-        self.query_tokenizer
+    pub fn encode_query(&self, text: &str) -> Result<TokenizedDoc> {
+        let encoding = self
+            .query_tokenizer
             .encode(text, true)
-            .map_err(|e| anyhow::anyhow!("{e}"))
+            .map_err(|e| anyhow::anyhow!("{e}"))?;
+        Ok(to_doc(&encoding))
+    }
+}
+
+/// Model input IDs from an encoding, widened to the i64 the model takes.
+fn to_doc(encoding: &Encoding) -> TokenizedDoc {
+    TokenizedDoc {
+        ids: encoding.get_ids().iter().map(|&id| i64::from(id)).collect(),
     }
 }
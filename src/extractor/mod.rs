@@ -113,6 +113,7 @@ impl Extractor {
                     end_line,
                     content: node_text,
                     skeleton,
+                    span: Some(range),
                 });
             }
         }
@@ -334,6 +335,7 @@ fn fallback_head(file_path: &str, content: &str) -> Vec<Block> {
         end_line: fallback_content.lines().count().saturating_sub(1),
         content: fallback_content.to_string(),
         skeleton: fallback_content.to_string(),
+        span: Some((0, end_byte)),
     }]
 }
 
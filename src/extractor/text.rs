@@ -297,6 +297,7 @@ fn extract_markdown_blocks(file_path: &str, content: &str) -> Vec<Block> {
                 end_line: section.end_line,
                 content: content_with_context.clone(),
                 skeleton: content_with_context,
+                span: None,
             });
             continue;
         }
@@ -329,6 +330,7 @@ fn extract_markdown_blocks(file_path: &str, content: &str) -> Vec<Block> {
                 end_line: section.end_line,
                 content: content_with_context.clone(),
                 skeleton: content_with_context,
+                span: None,
             });
         }
     }
@@ -362,6 +364,7 @@ fn extract_plain_text_blocks(file_path: &str, content: &str) -> Vec<Block> {
             end_line: line_num + chunk_lines,
             content: chunk.clone(),
             skeleton: chunk.clone(),
+            span: None,
         });
 
         line_num += chunk_lines;
@@ -0,0 +1,334 @@
+use std::fs::File;
+use std::io::{BufReader, BufWriter, Read, Write};
+use std::path::{Path, PathBuf};
+
+use anyhow::{Context, Result, bail};
+use flate2::Compression;
+use flate2::read::GzDecoder;
+use flate2::write::GzEncoder;
+use serde::{Deserialize, Serialize};
+
+use super::{VECTORS_DIR, checkpoint, manifest, shard};
+use crate::embedder;
+
+const MAGIC: &[u8; 4] = b"OGX1";
+
+/// Longest header and entry path accepted on import.
+const MAX_HEADER_LEN: usize = 64 * 1024;
+const MAX_PATH_LEN: usize = 4096;
+
+/// What a snapshot holds, written ahead of its files.
+#[derive(Debug, Clone, Serialize, Deserialize)]
+pub struct SnapshotInfo {
+    /// Embedding model the stored vectors came from.
+    pub model: String,
+    /// og version that wrote the snapshot.
+    pub og_version: String,
+    pub files: usize,
+    /// Uncompressed size of the files.
+    pub bytes: u64,
+}
+
+/// Write the index in `index_dir` to `out` as one gzip-compressed file.
+///
+/// Only what a search needs is kept: the vector store, the manifest and,
+/// for a sharded index, the layout and each shard's store and manifest.
+/// Every path is relative to the index dir and the manifest keys files by
+/// root-relative path, so the snapshot unpacks under any checkout. Build
+/// checkpoints, markers and the query cache stay behind.
+pub fn export(index_dir: &Path, out: &Path) -> Result<SnapshotInfo> {
+    let files = portable_files(index_dir)?;
+    if files.is_empty() {
+        bail!("No index in {}", index_dir.display());
+    }
+    let mut bytes = 0;
+    for rel in &files {
+        bytes += std::fs::metadata(index_dir.join(rel))?.len();
+    }
+    let info = SnapshotInfo {
+        model: index_model(index_dir).unwrap_or_else(|| embedder::MODEL.version.to_string()),
+        og_version: env!("CARGO_PKG_VERSION").to_string(),
+        files: files.len(),
+        bytes,
+    };
+
+    // Write beside the target and rename, so a failed export leaves no
+    // truncated snapshot behind
+    let mut tmp_name = out.as_os_str().to_os_string();
+    tmp_name.push(".tmp");
+    let tmp = PathBuf::from(tmp_name);
+    let result = write_snapshot(index_dir, &files, &info, &tmp)
+        .and_then(|()| std::fs::rename(&tmp, out).context("Failed to write snapshot"));
+    if result.is_err() {
+        let _ = std::fs::remove_file(&tmp);
+    }
+    result.map(|()| info)
+}
+
+/// Unpack the snapshot at `archive` into `index_dir`, replacing any index
+/// there. The files are unpacked beside it and swapped in once complete,
+/// so a bad snapshot leaves the existing index untouched.
+pub fn import(archive: &Path, index_dir: &Path) -> Result<SnapshotInfo> {
+    let file = File::open(archive)
+        .with_context(|| format!("Failed to open snapshot {}", archive.display()))?;
+    let mut reader = GzDecoder::new(BufReader::new(file));
+
+    let mut magic = [0u8; 4];
+    reader
+        .read_exact(&mut magic)
+        .context("Not an og index snapshot")?;
+    if &magic != MAGIC {
+        bail!("Not an og index snapshot");
+    }
+    let header = read_bytes(&mut reader, MAX_HEADER_LEN)?;
+    let info: SnapshotInfo =
+        serde_json::from_slice(&header).context("Corrupt index snapshot header")?;
+    // Stored vectors only match queries embedded by the same model
+    if info.model != embedder::MODEL.version {
+        bail!(
+            "Snapshot was built with model {} but this og uses {}. \
+             Run 'og build' to index locally.",
+            info.model,
+            embedder::MODEL.version
+        );
+    }
+
+    let mut staging_name = index_dir.as_os_str().to_os_string();
+    staging_name.push(".import");
+    let staging = PathBuf::from(staging_name);
+    if staging.exists() {
+        std::fs::remove_dir_all(&staging)?;
+    }
+    if let Err(e) = unpack(&mut reader, &staging) {
+        let _ = std::fs::remove_dir_all(&staging);
+        return Err(e);
+    }
+
+    if index_dir.exists() {
+        std::fs::remove_dir_all(index_dir)?;
+    }
+    std::fs::rename(&staging, index_dir).context("Failed to install imported index")?;
+    Ok(info)
+}
+
+fn write_snapshot(
+    index_dir: &Path,
+    files: &[String],
+    info: &SnapshotInfo,
+    out: &Path,
+) -> Result<()> {
+    let file = File::create(out).with_context(|| format!("Failed to create {}", out.display()))?;
+    let mut writer = GzEncoder::new(BufWriter::new(file), Compression::default());
+    writer.write_all(MAGIC)?;
+    write_bytes(&mut writer, &serde_json::to_vec(info)?)?;
+    for rel in files {
+        let source = File::open(index_dir.join(rel))?;
+        let len = source.metadata()?.len();
+        write_bytes(&mut writer, rel.as_bytes())?;
+        writer.write_all(&len.to_le_bytes())?;
+        let copied = std::io::copy(&mut source.take(len), &mut writer)?;
+        if copied != len {
+            bail!("{rel} changed during export");
+        }
+    }
+    // Empty path ends the entries
+    write_bytes(&mut writer, b"")?;
+    writer.finish()?.into_inner()?.sync_all()?;
+    Ok(())
+}
+
+fn unpack(reader: &mut impl Read, dir: &Path) -> Result<()> {
+    std::fs::create_dir_all(dir)?;
+    loop {
+        let path = read_bytes(reader, MAX_PATH_LEN)?;
+        if path.is_empty() {
+            return Ok(());
+        }
+        let rel = std::str::from_utf8(&path).context("Corrupt index snapshot")?;
+        let dest = dir.join(safe_relative(rel)?);
+        if let Some(parent) = dest.parent() {
+            std::fs::create_dir_all(parent)?;
+        }
+        let mut len = [0u8; 8];
+        reader
+            .read_exact(&mut len)
+            .context("Truncated index snapshot")?;
+        let len = u64::from_le_bytes(len);
+        let mut out = BufWriter::new(File::create(&dest)?);
+        let copied = std::io::copy(&mut reader.by_ref().take(len), &mut out)?;
+        if copied != len {
+            bail!("Truncated index snapshot");
+        }
+        out.flush()?;
+    }
+}
+
+/// `rel` as a path under the unpack dir. Entries are written with `/`
+/// separators and no `.`, `..` or absolute components; anything else is
+/// refused rather than written outside the index.
+fn safe_relative(rel: &str) -> Result<PathBuf> {
+    let mut path = PathBuf::new();
+    for part in rel.split('/') {
+        if part.is_empty() || part == "." || part == ".." || part.contains(['\\', ':']) {
+            bail!("Index snapshot has an unsafe path: {rel}");
+        }
+        path.push(part);
+    }
+    Ok(path)
+}
+
+fn write_bytes(writer: &mut impl Write, bytes: &[u8]) -> Result<()> {
+    writer.write_all(&(bytes.len() as u32).to_le_bytes())?;
+    writer.write_all(bytes)?;
+    Ok(())
+}
+
+fn read_bytes(reader: &mut impl Read, max_len: usize) -> Result<Vec<u8>> {
+    let mut len = [0u8; 4];
+    reader
+        .read_exact(&mut len)
+        .context("Truncated index snapshot")?;
+    let len = u32::from_le_bytes(len) as usize;
+    if len > max_len {
+        bail!("Corrupt index snapshot");
+    }
+    let mut bytes = vec![0u8; len];
+    reader
+        .read_exact(&mut bytes)
+        .context("Truncated index snapshot")?;
+    Ok(bytes)
+}
+
+/// Index-relative paths of the files a snapshot of `index_dir` holds,
+/// sorted. Refuses an index a build is writing or left half-written.
+fn portable_files(index_dir: &Path) -> Result<Vec<String>> {
+    let mut files = Vec::new();
+    for dir in index_dirs(index_dir) {
+        if checkpoint::is_building(&dir) {
+            bail!("og build is running for this index; export once it finishes");
+        }
+        if checkpoint::interrupted(&dir) {
+            bail!("Index has an interrupted build. Run 'og build' before exporting.");
+        }
+        let Ok(entries) = std::fs::read_dir(&dir) else {
+            continue;
+        };
+        for entry in entries.flatten() {
+            let name = entry.file_name().to_string_lossy().into_owned();
+            let keep = manifest::FILES.contains(&name.as_str())
+                || name.starts_with(VECTORS_DIR)
+                || (dir == index_dir && name == shard::LAYOUT_FILE);
+            if !keep {
+                continue;
+            }
+            for file in walkdir::WalkDir::new(entry.path()) {
+                let file = file?;
+                if !file.file_type().is_file() {
+                    continue;
+                }
+                let rel = file.path().strip_prefix(index_dir)?;
+                let parts: Vec<_> = rel.iter().map(|p| p.to_string_lossy()).collect();
+                files.push(parts.join("/"));
+            }
+        }
+    }
+    files.sort();
+    Ok(files)
+}
+
+/// `index_dir` and, if it is sharded, each shard's index dir.
+fn index_dirs(index_dir: &Path) -> Vec<PathBuf> {
+    let mut dirs = vec![index_dir.to_path_buf()];
+    if let Some(layout) = shard::ShardLayout::load(index_dir) {
+        dirs.extend(
+            layout
+                .shards
+                .iter()
+                .map(|s| shard::shard_dir(index_dir, &s.name)),
+        );
+    }
+    dirs
+}
+
+/// Model of the first built index among `index_dir` and its shards.
+fn index_model(index_dir: &Path) -> Option<String> {
+    index_dirs(index_dir)
+        .iter()
+        .find_map(|dir| manifest::model(dir))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn fake_index(dir: &Path) {
+        std::fs::create_dir_all(dir.join(VECTORS_DIR)).unwrap();
+        std::fs::write(dir.join(VECTORS_DIR).join("data"), b"vectors").unwrap();
+        std::fs::write(dir.join("manifest.bin"), b"manifest").unwrap();
+        std::fs::write(dir.join("manifest.journal"), b"journal").unwrap();
+        std::fs::create_dir_all(dir.join("query_cache")).unwrap();
+        std::fs::write(dir.join("query_cache").join("stats.json"), b"{}").unwrap();
+        std::fs::write(dir.join("watch.pid"), b"1\n").unwrap();
+    }
+
+    #[test]
+    fn snapshot_round_trips_portable_files() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let index_dir = tmp.path().join("a/.og");
+        fake_index(&index_dir);
+        let out = tmp.path().join("index.ogz");
+        let info = export(&index_dir, &out).unwrap();
+        assert_eq!(info.files, 3);
+        assert_eq!(info.model, embedder::MODEL.version);
+
+        let target = tmp.path().join("b/.og");
+        std::fs::create_dir_all(&target).unwrap();
+        std::fs::write(target.join("stale"), b"old").unwrap();
+        import(&out, &target).unwrap();
+
+        let read = |p: &str| std::fs::read(target.join(p)).unwrap();
+        assert_eq!(read("manifest.bin"), b"manifest");
+        assert_eq!(read("manifest.journal"), b"journal");
+        assert_eq!(read("vectors/data"), b"vectors");
+        assert!(!target.join("stale").exists());
+        assert!(!target.join("query_cache").exists());
+        assert!(!target.join("watch.pid").exists());
+        assert!(!tmp.path().join("b/.og.import").exists());
+    }
+
+    #[test]
+    fn import_refuses_other_models_and_unsafe_paths() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let snapshot = |info: &SnapshotInfo, path: &str| {
+            let out = tmp.path().join("bad.ogz");
+            let mut writer = GzEncoder::new(File::create(&out).unwrap(), Compression::fast());
+            writer.write_all(MAGIC).unwrap();
+            write_bytes(&mut writer, &serde_json::to_vec(info).unwrap()).unwrap();
+            write_bytes(&mut writer, path.as_bytes()).unwrap();
+            writer.write_all(&1u64.to_le_bytes()).unwrap();
+            writer.write_all(b"x").unwrap();
+            write_bytes(&mut writer, b"").unwrap();
+            writer.finish().unwrap();
+            out
+        };
+        let mut info = SnapshotInfo {
+            model: "other-model".to_string(),
+            og_version: "0.0.0".to_string(),
+            files: 1,
+            bytes: 1,
+        };
+        let target = tmp.path().join(".og");
+
+        let err = import(&snapshot(&info, "manifest.bin"), &target).unwrap_err();
+        assert!(err.to_string().contains("other-model"));
+
+        info.model = embedder::MODEL.version.to_string();
+        let err = import(&snapshot(&info, "../escape"), &target).unwrap_err();
+        assert!(err.to_string().contains("unsafe path"));
+        assert!(!tmp.path().join("escape").exists());
+        assert!(!target.exists());
+
+        assert!(import(&snapshot(&info, "vectors/data"), &target).is_ok());
+        assert_eq!(std::fs::read(target.join("vectors/data")).unwrap(), b"x");
+    }
+}
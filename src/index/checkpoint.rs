@@ -0,0 +1,234 @@
+use std::fs::File;
+use std::io::{BufRead, BufReader, Seek, Write};
+use std::path::{Path, PathBuf};
+
+use anyhow::{Context, Result};
+use serde::{Deserialize, Serialize};
+
+use super::heartbeat::{self, Heartbeat};
+use super::manifest::{self, FileEntry, Manifest};
+use super::{INDEX_FLUSH_INTERVAL_BLOCKS, VECTORS_DIR};
+
+/// Files whose blocks may be in the store but not yet in the saved manifest.
+const INFLIGHT_FILE: &str = "build.inflight";
+
+/// Heartbeat marker in the index dir, refreshed while a build runs.
+const BUILD_MARKER: &str = "build.pid";
+
+/// Touched by searches that want the next checkpoint published.
+const SNAPSHOT_REQUEST: &str = "snapshot.want";
+
+/// Copy of the store and manifest at the last published checkpoint.
+pub const SNAPSHOT_DIR: &str = "snapshot";
+
+/// Whether a live build is writing the index in `index_dir`. Searches then
+/// read the last published checkpoint instead of updating the index.
+pub fn is_building(index_dir: &Path) -> bool {
+    heartbeat::is_alive(index_dir, BUILD_MARKER)
+}
+
+/// Ask a live build to publish a snapshot at its next checkpoint.
+pub fn request_snapshot(index_dir: &Path) {
+    let _ = std::fs::write(index_dir.join(SNAPSHOT_REQUEST), b"");
+}
+
+/// Journal line: a file's new manifest entry, written before its blocks are stored.
+#[derive(Serialize, Deserialize)]
+struct Inflight {
+    file: String,
+    blocks: Vec<String>,
+}
+
+/// Periodic, crash-consistent checkpoints for a build.
+///
+/// Files are journaled to `build.inflight` as they are queued for embedding.
+/// Once about `INDEX_FLUSH_INTERVAL_BLOCKS` blocks have been stored, `commit`
+/// flushes the store, writes the journaled entries into the manifest and
+/// empties the journal. A build killed between checkpoints leaves the journal
+/// behind; `recover` removes the blocks it lists so the next build redoes
+/// exactly those files.
+pub(super) struct Checkpointer {
+    index_dir: PathBuf,
+    journal: File,
+    pending: Vec<(String, FileEntry)>,
+    stored: usize,
+    /// Build marker, removed on drop.
+    _heartbeat: Heartbeat,
+}
+
+impl Checkpointer {
+    pub(super) fn start(index_dir: &Path) -> Result<Self> {
+        let journal = File::create(index_dir.join(INFLIGHT_FILE))
+            .context("Failed to create build journal")?;
+
+        let heartbeat = Heartbeat::start(index_dir.join(BUILD_MARKER))?;
+
+        Ok(Self {
+            index_dir: index_dir.to_path_buf(),
+            journal,
+            pending: Vec::new(),
+            stored: 0,
+            _heartbeat: heartbeat,
+        })
+    }
+
+    /// Journal a file's entry before any of its blocks reach the store.
+    pub(super) fn add(&mut self, rel_path: String, entry: FileEntry) -> Result<()> {
+        let line = serde_json::to_string(&Inflight {
+            file: rel_path.clone(),
+            blocks: entry.blocks.clone(),
+        })?;
+        // One write per file, so the intent is on disk if the process dies
+        self.journal.write_all(format!("{line}\n").as_bytes())?;
+        self.pending.push((rel_path, entry));
+        Ok(())
+    }
+
+    /// Count blocks written to the store since the last checkpoint.
+    pub(super) fn stored(&mut self, blocks: usize) {
+        self.stored += blocks;
+    }
+
+    pub(super) fn due(&self) -> bool {
+        self.stored >= INDEX_FLUSH_INTERVAL_BLOCKS
+    }
+
+    /// Flush the store and record every journaled file in the manifest. The
+    /// caller must have stored all blocks of the journaled files.
+    pub(super) fn commit(
+        &mut self,
+        store: &omendb::VectorStore,
+        manifest: &mut Manifest,
+    ) -> Result<()> {
+        store.flush()?;
+        for (rel_path, entry) in self.pending.drain(..) {
+            manifest.insert(rel_path, entry);
+        }
+        manifest.save(&self.index_dir)?;
+        self.journal.set_len(0)?;
+        self.journal.rewind()?;
+        self.stored = 0;
+
+        // A failed publish doesn't fail the build: the request is put back
+        // so the next checkpoint tries again
+        let request = self.index_dir.join(SNAPSHOT_REQUEST);
+        if request.exists() {
+            let _ = std::fs::remove_file(&request);
+            if let Err(e) = publish_snapshot(&self.index_dir) {
+                eprintln!("Failed to publish snapshot, retrying at the next checkpoint: {e:#}");
+                request_snapshot(&self.index_dir);
+            }
+        }
+        Ok(())
+    }
+
+    /// Final checkpoint; removes the journal, marker and any snapshot.
+    pub(super) fn finish(
+        mut self,
+        store: &omendb::VectorStore,
+        manifest: &mut Manifest,
+    ) -> Result<()> {
+        self.commit(store, manifest)?;
+        let _ = std::fs::remove_file(self.index_dir.join(INFLIGHT_FILE));
+        let _ = std::fs::remove_dir_all(self.index_dir.join(SNAPSHOT_DIR));
+        Ok(())
+    }
+}
+
+impl Drop for Checkpointer {
+    fn drop(&mut self) {
+        let _ = std::fs::remove_file(self.index_dir.join(SNAPSHOT_REQUEST));
+    }
+}
+
+/// Whether a build of `index_dir` stopped between checkpoints.
+pub fn interrupted(index_dir: &Path) -> bool {
+    index_dir.join(INFLIGHT_FILE).exists() && !is_building(index_dir)
+}
+
+/// Roll back the unfinished tail of an interrupted build: delete the blocks
+/// it stored after its last checkpoint and drop the manifest entries of those
+/// files (their old blocks may already be gone), so they are indexed again.
+/// Returns the number of files rolled back.
+pub(super) fn recover(
+    index_dir: &Path,
+    store: &omendb::VectorStore,
+    manifest: &mut Manifest,
+) -> Result<usize> {
+    let path = index_dir.join(INFLIGHT_FILE);
+    let Ok(file) = File::open(&path) else {
+        return Ok(0);
+    };
+
+    let mut files = 0;
+    // A torn last line is skipped: its blocks were never stored
+    for line in BufReader::new(file).lines() {
+        let Ok(inflight) = serde_json::from_str::<Inflight>(&line?) else {
+            continue;
+        };
+        for id in &inflight.blocks {
+            let _ = store.delete(id);
+        }
+        if let Some(entry) = manifest.remove(&inflight.file) {
+            for id in &entry.blocks {
+                let _ = store.delete(id);
+            }
+        }
+        files += 1;
+    }
+
+    store.flush()?;
+    manifest.save(index_dir)?;
+    std::fs::remove_file(&path)?;
+    let _ = std::fs::remove_dir_all(index_dir.join(SNAPSHOT_DIR));
+    Ok(files)
+}
+
+/// Copy the flushed store and saved manifest to `snapshot/` for searches to
+/// read while the build holds the store. Only done on request, since it copies
+/// the whole store.
+fn publish_snapshot(index_dir: &Path) -> Result<()> {
+    let tmp = index_dir.join(format!("{SNAPSHOT_DIR}.tmp"));
+    let _ = std::fs::remove_dir_all(&tmp);
+    if let Err(e) = copy_snapshot(index_dir, &tmp) {
+        let _ = std::fs::remove_dir_all(&tmp);
+        return Err(e);
+    }
+
+    let dest = index_dir.join(SNAPSHOT_DIR);
+    let _ = std::fs::remove_dir_all(&dest);
+    std::fs::rename(&tmp, &dest)?;
+    Ok(())
+}
+
+fn copy_snapshot(index_dir: &Path, to: &Path) -> Result<()> {
+    std::fs::create_dir_all(to)?;
+    for entry in std::fs::read_dir(index_dir)? {
+        let entry = entry?;
+        let name = entry.file_name();
+        let name = name.to_string_lossy();
+        if name.starts_with(VECTORS_DIR) || name.starts_with("manifest") {
+            copy_tree(&entry.path(), &to.join(&*name))?;
+        }
+    }
+    Ok(())
+}
+
+fn copy_tree(from: &Path, to: &Path) -> Result<()> {
+    if from.is_dir() {
+        std::fs::create_dir_all(to)?;
+        for entry in std::fs::read_dir(from)? {
+            let entry = entry?;
+            copy_tree(&entry.path(), &to.join(entry.file_name()))?;
+        }
+    } else {
+        std::fs::copy(from, to)?;
+    }
+    Ok(())
+}
+
+/// Snapshot dir to search in place of `index_dir`, if one has been published.
+pub fn snapshot_dir(index_dir: &Path) -> Option<PathBuf> {
+    let dir = index_dir.join(SNAPSHOT_DIR);
+    manifest::exists(&dir).then_some(dir)
+}
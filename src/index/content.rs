@@ -0,0 +1,210 @@
+use std::collections::HashMap;
+use std::path::{Path, PathBuf};
+
+use super::symbols::Symbol;
+use crate::types::Block;
+
+/// Per-vector metadata for a block.
+///
+/// Blocks whose content is a verbatim slice of their file store the byte span
+/// and a hash of the slice instead of the text; `SourceReader` re-reads it on
+/// demand. Markdown sections and text chunks (which carry header context) keep
+/// their content inline. The skeleton is stored only when it differs from the
+/// content.
+pub fn block_metadata(block: &Block) -> serde_json::Value {
+    let mut meta = serde_json::json!({
+        "file": block.file,
+        "type": block.block_type,
+        "name": block.name,
+        "start_line": block.start_line,
+        "end_line": block.end_line,
+    });
+    let obj = meta.as_object_mut().expect("metadata is an object");
+
+    match block.span {
+        Some((start, end)) => {
+            obj.insert("span".to_string(), serde_json::json!([start, end]));
+            obj.insert(
+                "hash".to_string(),
+                serde_json::json!(super::hash_content(&block.content)),
+            );
+        }
+        None => {
+            obj.insert("content".to_string(), serde_json::json!(block.content));
+        }
+    }
+    if block.skeleton != block.content {
+        obj.insert("skeleton".to_string(), serde_json::json!(block.skeleton));
+    }
+    meta
+}
+
+/// Resolves block content from metadata, reading each source file at most once.
+pub struct SourceReader {
+    root: PathBuf,
+    files: HashMap<String, Option<String>>,
+}
+
+impl SourceReader {
+    pub fn new(root: &Path) -> Self {
+        Self {
+            root: root.to_path_buf(),
+            files: HashMap::new(),
+        }
+    }
+
+    /// Block content: inline text (older indexes and text blocks), else the
+    /// stored span of the source file. If the file changed since indexing and
+    /// the span no longer hashes the same, the block's line range is used.
+    pub fn content(&mut self, meta: &serde_json::Value) -> Option<String> {
+        if let Some(content) = meta.get("content").and_then(|v| v.as_str()) {
+            return Some(content.to_string());
+        }
+
+        let file = meta.get("file")?.as_str()?;
+        let span = meta.get("span").and_then(|v| v.as_array()).and_then(|a| {
+            let start = a.first()?.as_u64()? as usize;
+            let end = a.get(1)?.as_u64()? as usize;
+            Some((start, end))
+        });
+        let hash = meta.get("hash").and_then(|v| v.as_str());
+        let start = meta.get("start_line").and_then(|v| v.as_u64())? as usize;
+        let end = meta.get("end_line").and_then(|v| v.as_u64())? as usize;
+        self.read(file, span, hash, (start, end))
+    }
+
+    /// Block skeleton: stored when it differs from the content, else the content.
+    pub fn skeleton(&mut self, meta: &serde_json::Value) -> Option<String> {
+        match meta.get("skeleton").and_then(|v| v.as_str()) {
+            Some(skeleton) => Some(skeleton.to_string()),
+            None => self.content(meta),
+        }
+    }
+
+    /// Content of a block of `file` recorded in the manifest. Symbols keep no
+    /// inline text, so blocks without a span read their line range.
+    pub fn symbol_content(&mut self, file: &str, symbol: &Symbol) -> Option<String> {
+        self.read(
+            file,
+            symbol.span,
+            symbol.hash.as_deref(),
+            (symbol.start_line, symbol.end_line),
+        )
+    }
+
+    /// Skeleton of a block of `file` recorded in the manifest.
+    pub fn symbol_skeleton(&mut self, file: &str, symbol: &Symbol) -> Option<String> {
+        match &symbol.skeleton {
+            Some(skeleton) => Some(skeleton.clone()),
+            None => self.symbol_content(file, symbol),
+        }
+    }
+
+    /// The span of `file` if it still hashes the same, else the line range.
+    fn read(
+        &mut self,
+        file: &str,
+        span: Option<(usize, usize)>,
+        hash: Option<&str>,
+        (start, end): (usize, usize),
+    ) -> Option<String> {
+        let source = self.source(file)?;
+        let text = span.and_then(|(start, end)| source.get(start..end));
+        if let (Some(text), Some(hash)) = (text, hash)
+            && super::hash_content(text) == hash
+        {
+            return Some(text.to_string());
+        }
+
+        let lines: Vec<&str> = source
+            .lines()
+            .skip(start)
+            .take(end.saturating_sub(start) + 1)
+            .collect();
+        Some(lines.join("\n"))
+    }
+
+    fn source(&mut self, file: &str) -> Option<&str> {
+        let root = &self.root;
+        self.files
+            .entry(file.to_string())
+            .or_insert_with(|| {
+                let source = std::fs::read_to_string(root.join(file)).ok();
+                crate::trace::count("files_read", 1);
+                crate::trace::count("bytes_read", source.as_ref().map_or(0, |s| s.len() as u64));
+                source
+            })
+            .as_deref()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn block(content: &str, skeleton: &str, span: Option<(usize, usize)>) -> Block {
+        Block {
+            id: "lib.rs:1:add".to_string(),
+            file: "lib.rs".to_string(),
+            block_type: "function".to_string(),
+            name: "add".to_string(),
+            start_line: 1,
+            end_line: 3,
+            content: content.to_string(),
+            skeleton: skeleton.to_string(),
+            span,
+        }
+    }
+
+    #[test]
+    fn spans_replace_stored_content() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let source = "// math\nfn add(a: i32, b: i32) -> i32 {\n    a + b\n}\n";
+        std::fs::write(tmp.path().join("lib.rs"), source).unwrap();
+
+        let start = source.find("fn add").unwrap();
+        let end = source.len() - 1;
+        let body = &source[start..end];
+        let meta = block_metadata(&block(
+            body,
+            "fn add(a: i32, b: i32) -> i32 { ... }",
+            Some((start, end)),
+        ));
+        assert!(meta.get("content").is_none());
+
+        let mut reader = SourceReader::new(tmp.path());
+        assert_eq!(reader.content(&meta).as_deref(), Some(body));
+        assert_eq!(
+            reader.skeleton(&meta).as_deref(),
+            Some("fn add(a: i32, b: i32) -> i32 { ... }")
+        );
+
+        // Manifest symbols resolve the same way, without store metadata
+        let symbol = Symbol::from_metadata(&meta);
+        assert_eq!(
+            reader.symbol_content("lib.rs", &symbol).as_deref(),
+            Some(body)
+        );
+        assert_eq!(
+            reader.symbol_skeleton("lib.rs", &symbol).as_deref(),
+            Some("fn add(a: i32, b: i32) -> i32 { ... }")
+        );
+
+        // Inline content (text blocks, older indexes) is used as-is
+        let inline = block_metadata(&block("# Title | text", "# Title | text", None));
+        assert!(inline.get("skeleton").is_none());
+        assert_eq!(reader.content(&inline).as_deref(), Some("# Title | text"));
+    }
+
+    #[test]
+    fn edited_source_falls_back_to_line_range() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let source = "// math\nfn add() {}\n";
+        std::fs::write(tmp.path().join("lib.rs"), source).unwrap();
+        let meta = block_metadata(&block("fn add() {}", "fn add() {}", Some((8, 19))));
+
+        std::fs::write(tmp.path().join("lib.rs"), "// edited\nfn add() { 1 }\n").unwrap();
+        let mut reader = SourceReader::new(tmp.path());
+        assert_eq!(reader.content(&meta).as_deref(), Some("fn add() { 1 }"));
+    }
+}
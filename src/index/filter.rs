@@ -0,0 +1,170 @@
+/// Extensions matched by each `-t` type name. Unknown names match `.{name}`.
+const TYPE_EXTENSIONS: &[(&str, &[&str])] = &[
+    ("py", &[".py", ".pyi"]),
+    ("js", &[".js", ".jsx", ".mjs"]),
+    ("ts", &[".ts", ".tsx"]),
+    ("rust", &[".rs"]),
+    ("rs", &[".rs"]),
+    ("go", &[".go"]),
+    ("java", &[".java"]),
+    ("c", &[".c", ".h"]),
+    ("cpp", &[".cpp", ".cc", ".cxx", ".hpp", ".hh"]),
+    ("cs", &[".cs"]),
+    ("rb", &[".rb"]),
+    ("php", &[".php"]),
+    ("sh", &[".sh", ".bash", ".zsh"]),
+    ("md", &[".md", ".markdown"]),
+    ("json", &[".json"]),
+    ("yaml", &[".yaml", ".yml"]),
+    ("toml", &[".toml"]),
+];
+
+/// Exclude patterns added by `--code-only`.
+const DOC_EXCLUDES: &[&str] = &["*.md", "*.markdown", "*.txt", "*.rst", "*.adoc"];
+
+/// Headroom on the filtered fetch size, since matching blocks are not spread
+/// evenly through the ranking.
+const FETCH_MARGIN: f64 = 1.5;
+
+/// Most candidates a filtered search fetches from the store, per result.
+const MAX_FETCH_FACTOR: usize = 8;
+
+/// Filters matching at most this many blocks are searched by scoring those
+/// blocks exactly instead of querying the store.
+pub const EXACT_SCORE_MAX: usize = 2048;
+
+/// Path filter for a search: scope, `-t` types, `--exclude` and `--code-only`.
+///
+/// Evaluated against index-relative paths in the manifest before the store is
+/// queried. Narrow filters have their few matching blocks scored directly;
+/// wider ones size the store fetch by how much of the index passes, up to a
+/// small multiple of `k`.
+#[derive(Debug, Clone, Default)]
+pub struct SearchFilter {
+    /// Index-relative directory or file the results must fall under.
+    scope: Option<String>,
+    /// Allowed extensions (with dot). Empty allows any.
+    extensions: Vec<String>,
+    /// `*.ext` suffix or substring patterns that reject a path.
+    excludes: Vec<String>,
+}
+
+impl SearchFilter {
+    pub fn new(file_types: Option<&str>, exclude: &[String], code_only: bool) -> Self {
+        let mut extensions = Vec::new();
+        for ft in file_types.into_iter().flat_map(|types| types.split(',')) {
+            let ft = ft.trim().to_lowercase();
+            if ft.is_empty() {
+                continue;
+            }
+            match TYPE_EXTENSIONS.iter().find(|(name, _)| *name == ft) {
+                Some((_, exts)) => extensions.extend(exts.iter().map(|e| e.to_string())),
+                None => extensions.push(format!(".{ft}")),
+            }
+        }
+        extensions.sort();
+        extensions.dedup();
+
+        let mut excludes = exclude.to_vec();
+        if code_only {
+            excludes.extend(DOC_EXCLUDES.iter().map(|s| s.to_string()));
+        }
+
+        Self {
+            scope: None,
+            extensions,
+            excludes,
+        }
+    }
+
+    /// Restrict to an index-relative scope (`None` = whole index).
+    pub fn with_scope(mut self, scope: Option<String>) -> Self {
+        self.scope = scope;
+        self
+    }
+
+    /// Index-relative scope, if any.
+    pub fn scope(&self) -> Option<&str> {
+        self.scope.as_deref()
+    }
+
+    /// True when every path passes.
+    pub fn is_empty(&self) -> bool {
+        self.scope.is_none() && self.extensions.is_empty() && self.excludes.is_empty()
+    }
+
+    pub fn matches(&self, rel_path: &str) -> bool {
+        if let Some(scope) = &self.scope
+            && !rel_path
+                .strip_prefix(scope.as_str())
+                .is_some_and(|rest| rest.is_empty() || rest.starts_with('/'))
+        {
+            return false;
+        }
+
+        if !self.extensions.is_empty() && !self.extensions.iter().any(|e| rel_path.ends_with(e)) {
+            return false;
+        }
+
+        !self.excludes.iter().any(|pattern| {
+            // Simple glob: *.ext matching
+            match pattern.strip_prefix('*') {
+                Some(suffix) => rel_path.ends_with(suffix),
+                None => rel_path.contains(pattern.as_str()),
+            }
+        })
+    }
+}
+
+/// Store fetch size expected to yield `k` filtered results when `matching` of
+/// `total` indexed blocks pass the filter, capped by `max_fetch_k`.
+pub fn fetch_k(k: usize, matching: usize, total: usize) -> usize {
+    if matching == 0 || total == 0 {
+        return k;
+    }
+    let expected = (k as f64 * total as f64 / matching as f64 * FETCH_MARGIN).ceil();
+    (expected as usize).clamp(k, max_fetch_k(k, total))
+}
+
+/// Largest store fetch a filtered search widens to.
+pub fn max_fetch_k(k: usize, total: usize) -> usize {
+    k.saturating_mul(MAX_FETCH_FACTOR).min(total).max(k)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn filter_combines_scope_types_and_excludes() {
+        let filter = SearchFilter::new(Some("py, rs"), &["vendor".to_string()], true)
+            .with_scope(Some("src".to_string()));
+
+        assert!(filter.matches("src/auth.py"));
+        assert!(filter.matches("src/lib/errors.rs"));
+        assert!(!filter.matches("srcx/auth.py"));
+        assert!(!filter.matches("tests/auth.py"));
+        assert!(!filter.matches("src/server.go"));
+        assert!(!filter.matches("src/vendor/auth.py"));
+
+        let docs = SearchFilter::new(None, &[], true);
+        assert!(!docs.matches("README.md"));
+        assert!(docs.matches("main.go"));
+        assert!(SearchFilter::default().is_empty());
+        assert!(!docs.is_empty());
+    }
+
+    #[test]
+    fn fetch_k_is_bounded() {
+        // Everything matches: just the margin
+        assert_eq!(fetch_k(10, 1000, 1000), 15);
+        // Half matches: enough to expect 10 of them
+        assert_eq!(fetch_k(10, 5000, 10_000), 30);
+        // Selective filters never fetch more than a small multiple of k
+        assert_eq!(fetch_k(10, 100, 10_000), 80);
+        assert_eq!(fetch_k(10, 1, 10_000_000), 80);
+        // Nor more than the index, nor less than k
+        assert_eq!(fetch_k(10, 2, 40), 40);
+        assert_eq!(fetch_k(10, 5, 5), 10);
+    }
+}
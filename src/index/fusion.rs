@@ -0,0 +1,146 @@
+use std::collections::HashMap;
+
+/// Rank offset for reciprocal rank fusion. 60 is the usual choice: it keeps
+/// the head of one list from drowning out agreement between lists.
+const RRF_K: f32 = 60.0;
+
+/// How the lexical (BM25 + MaxSim) and semantic candidate lists are combined.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub enum Fusion {
+    /// Keep each block's best MaxSim score.
+    #[default]
+    Max,
+    /// Reciprocal rank fusion: each list a block appears in adds
+    /// `1 / (60 + rank)`. Scores become RRF sums instead of MaxSim values.
+    Rrf,
+}
+
+impl Fusion {
+    pub fn parse(name: &str) -> Option<Self> {
+        match name.trim().to_ascii_lowercase().as_str() {
+            "max" => Some(Self::Max),
+            "rrf" => Some(Self::Rrf),
+            _ => None,
+        }
+    }
+
+    /// `OG_FUSION` (`max` or `rrf`), else `max`.
+    pub fn from_env() -> Self {
+        std::env::var("OG_FUSION")
+            .ok()
+            .and_then(|v| Self::parse(&v))
+            .unwrap_or_default()
+    }
+}
+
+/// Fuse ranked candidate lists (each best first) into one ranking, best
+/// first, with every block once and its fused score. IDs are compared by
+/// reference into the lists, never cloned.
+pub fn fuse<T>(
+    lists: Vec<Vec<T>>,
+    fusion: Fusion,
+    id: impl Fn(&T) -> &str,
+    score: impl Fn(&T) -> f32,
+) -> Vec<(T, f32)> {
+    let capacity = lists.iter().map(Vec::len).sum();
+
+    // Block ID -> (list, position) of the copy kept, and its fused score
+    let mut best: HashMap<&str, ((usize, usize), f32)> = HashMap::with_capacity(capacity);
+    for (l, list) in lists.iter().enumerate() {
+        for (rank, item) in list.iter().enumerate() {
+            let s = score(item);
+            let contribution = match fusion {
+                Fusion::Max => s,
+                Fusion::Rrf => 1.0 / (RRF_K + rank as f32 + 1.0),
+            };
+            best.entry(id(item))
+                .and_modify(|(at, fused)| match fusion {
+                    Fusion::Max => {
+                        if s > *fused {
+                            *at = (l, rank);
+                            *fused = s;
+                        }
+                    }
+                    Fusion::Rrf => *fused += contribution,
+                })
+                .or_insert(((l, rank), contribution));
+        }
+    }
+
+    // Ties go to the earlier list and rank, so the order is deterministic
+    let mut keep: Vec<((usize, usize), f32)> = best.into_values().collect();
+    keep.sort_by(|a, b| {
+        b.1.partial_cmp(&a.1)
+            .unwrap_or(std::cmp::Ordering::Equal)
+            .then(a.0.cmp(&b.0))
+    });
+
+    // Move the kept items out of their lists
+    let mut slots: Vec<Vec<Option<T>>> = lists
+        .into_iter()
+        .map(|list| list.into_iter().map(Some).collect())
+        .collect();
+    keep.into_iter()
+        .filter_map(|((l, rank), fused)| Some((slots[l][rank].take()?, fused)))
+        .collect()
+}
+
+/// MaxSim of a query against one block's token vectors: for each query token,
+/// its best dot product with any block token, summed. Matches the store's
+/// score, for candidates scored outside it.
+pub fn maxsim(query: &[&[f32]], doc: &[Vec<f32>]) -> f32 {
+    query
+        .iter()
+        .map(|q| {
+            doc.iter()
+                .map(|d| q.iter().zip(d).map(|(a, b)| a * b).sum::<f32>())
+                .fold(f32::NEG_INFINITY, f32::max)
+        })
+        .filter(|s| s.is_finite())
+        .sum()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn ranked(items: &[(&'static str, f32)]) -> Vec<(&'static str, f32)> {
+        items.to_vec()
+    }
+
+    fn ids(fused: &[((&'static str, f32), f32)]) -> Vec<&'static str> {
+        fused.iter().map(|((id, _), _)| *id).collect()
+    }
+
+    #[test]
+    fn max_keeps_best_score_per_block() {
+        let lexical = ranked(&[("a", 0.9), ("b", 0.5)]);
+        let semantic = ranked(&[("b", 0.8), ("c", 0.7)]);
+        let fused = fuse(vec![lexical, semantic], Fusion::Max, |r| r.0, |r| r.1);
+
+        assert_eq!(ids(&fused), ["a", "b", "c"]);
+        assert_eq!(fused[1].1, 0.8);
+        assert_eq!(fused[1].0, ("b", 0.8));
+    }
+
+    #[test]
+    fn rrf_rewards_agreement_between_lists() {
+        let lexical = ranked(&[("a", 0.9), ("b", 0.5), ("c", 0.4)]);
+        let semantic = ranked(&[("d", 0.95), ("b", 0.8), ("c", 0.7)]);
+        let fused = fuse(vec![lexical, semantic], Fusion::Rrf, |r| r.0, |r| r.1);
+
+        // b and c appear in both lists; b ranks higher in both
+        assert_eq!(ids(&fused), ["b", "c", "a", "d"]);
+        assert!((fused[0].1 - (1.0 / 62.0 + 1.0 / 62.0)).abs() < 1e-6);
+        assert_eq!(Fusion::parse("RRF"), Some(Fusion::Rrf));
+        assert_eq!(Fusion::parse("sum"), None);
+    }
+
+    #[test]
+    fn maxsim_sums_best_token_matches() {
+        let (q1, q2) = ([1.0, 0.0], [0.0, 1.0]);
+        let doc = vec![vec![0.5, 0.1], vec![0.2, 0.8]];
+        assert!((maxsim(&[&q1, &q2], &doc) - 1.3).abs() < 1e-6);
+        assert_eq!(maxsim(&[&q1], &[]), 0.0);
+    }
+}
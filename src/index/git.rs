@@ -0,0 +1,220 @@
+use std::collections::BTreeSet;
+use std::path::Path;
+use std::process::{Command, Stdio};
+
+use crate::trace;
+
+/// Git state an index was last brought up to date with: the HEAD commit, and
+/// the paths (relative to the index root) whose work-tree content differed
+/// from it at the time. Every other indexed file holds its content at
+/// `commit`.
+#[derive(Debug, Clone, Default, PartialEq, Eq)]
+pub struct GitState {
+    pub commit: String,
+    pub dirty: Vec<String>,
+}
+
+/// Paths under an index root that may differ from what the index holds,
+/// relative to the root.
+#[derive(Debug, Default)]
+pub struct Changes {
+    /// Changed between the recorded commit and HEAD. A checkout rewrites
+    /// these, so their mtimes say nothing: their content is always hashed.
+    pub committed: Vec<String>,
+    /// Dirty in the work tree now or when the state was recorded.
+    pub dirty: Vec<String>,
+}
+
+/// Whether git-based change detection is turned off (`OG_NO_GIT=1`).
+fn disabled() -> bool {
+    std::env::var("OG_NO_GIT")
+        .map(|v| matches!(v.to_lowercase().as_str(), "1" | "true" | "yes"))
+        .unwrap_or(false)
+}
+
+/// HEAD and the dirty paths under `root`, from the repository's index and
+/// object database rather than a walk of the tree. `None` outside a git
+/// work tree, before the first commit, when git can't be run, or with
+/// `OG_NO_GIT=1`.
+pub fn snapshot(root: &Path) -> Option<GitState> {
+    if disabled() || !root.ancestors().any(|dir| dir.join(".git").exists()) {
+        return None;
+    }
+    let _span = trace::span("git_status");
+
+    // `root`'s path inside the work tree, then the commit
+    let out = git(root, &["rev-parse", "--show-prefix", "HEAD"])?;
+    let out = String::from_utf8(out).ok()?;
+    let mut lines = out.lines();
+    let prefix = lines.next()?.to_string();
+    let commit = lines.next()?.trim().to_string();
+    if commit.is_empty() {
+        return None;
+    }
+
+    // Porcelain paths are relative to the top of the work tree whatever the
+    // directory; `.` limits them to the root
+    let status = git(
+        root,
+        &[
+            "status",
+            "--porcelain=v1",
+            "-z",
+            "--untracked-files=all",
+            "--no-renames",
+            "--",
+            ".",
+        ],
+    )?;
+    let mut dirty = BTreeSet::new();
+    for record in split_paths(&status)? {
+        // "XY path"
+        let path = record.get(3..)?;
+        let rel = path.strip_prefix(prefix.as_str())?;
+        // An untracked nested repository is listed as its directory
+        dirty.insert(rel.trim_end_matches('/').to_string());
+    }
+    trace::count("git_dirty", dirty.len() as u64);
+
+    Some(GitState {
+        commit,
+        dirty: dirty.into_iter().collect(),
+    })
+}
+
+/// What may have changed under `root` since the index recorded `since`,
+/// given the current state `now`. `None` if git can't compare the two
+/// commits, for example because the recorded one was garbage-collected.
+pub fn changes(root: &Path, since: &GitState, now: &GitState) -> Option<Changes> {
+    let committed = if since.commit == now.commit {
+        Vec::new()
+    } else {
+        let _span = trace::span("git_diff");
+        let out = git(
+            root,
+            &[
+                "diff",
+                "--name-only",
+                "-z",
+                "--no-renames",
+                "--relative",
+                &since.commit,
+                &now.commit,
+                "--",
+            ],
+        )?;
+        split_paths(&out)?
+    };
+
+    let mut dirty: BTreeSet<&str> = since.dirty.iter().map(String::as_str).collect();
+    dirty.extend(now.dirty.iter().map(String::as_str));
+    Some(Changes {
+        committed,
+        dirty: dirty.into_iter().map(str::to_string).collect(),
+    })
+}
+
+/// Run git in `root`, returning its stdout if it succeeded. Optional locks
+/// are off so a status never rewrites the repository's index under a
+/// concurrent git command.
+fn git(root: &Path, args: &[&str]) -> Option<Vec<u8>> {
+    let out = Command::new("git")
+        .arg("-C")
+        .arg(root)
+        .args(args)
+        .env("GIT_OPTIONAL_LOCKS", "0")
+        .stdin(Stdio::null())
+        .stderr(Stdio::null())
+        .output()
+        .ok()?;
+    out.status.success().then_some(out.stdout)
+}
+
+/// NUL-separated records. `None` if any is not UTF-8, since such a path
+/// could not be matched against the index.
+fn split_paths(out: &[u8]) -> Option<Vec<String>> {
+    out.split(|&b| b == 0)
+        .filter(|record| !record.is_empty())
+        .map(|record| String::from_utf8(record.to_vec()).ok())
+        .collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn run(dir: &Path, args: &[&str]) {
+        let status = Command::new("git")
+            .arg("-C")
+            .arg(dir)
+            .args(args)
+            .stdout(Stdio::null())
+            .status()
+            .unwrap();
+        assert!(status.success(), "git {args:?}");
+    }
+
+    #[test]
+    fn changes_cover_commits_and_work_tree() {
+        if git(Path::new("."), &["--version"]).is_none() {
+            return;
+        }
+        let tmp = tempfile::TempDir::new().unwrap();
+        let repo = tmp.path();
+        let root = repo.join("src");
+        std::fs::create_dir_all(root.join("deep")).unwrap();
+        std::fs::write(root.join("a.py"), "a = 1\n").unwrap();
+        std::fs::write(root.join("b.py"), "b = 1\n").unwrap();
+        std::fs::write(repo.join("outside.py"), "x = 1\n").unwrap();
+        run(repo, &["init", "-q"]);
+        run(repo, &["add", "."]);
+        run(
+            repo,
+            &[
+                "-c",
+                "user.name=og",
+                "-c",
+                "user.email=og@localhost",
+                "commit",
+                "-qm",
+                "init",
+            ],
+        );
+
+        let indexed = snapshot(&root).unwrap();
+        assert!(indexed.dirty.is_empty());
+
+        std::fs::write(root.join("a.py"), "a = 2\n").unwrap();
+        std::fs::write(root.join("deep/new.py"), "n = 1\n").unwrap();
+        std::fs::write(repo.join("outside.py"), "x = 2\n").unwrap();
+        let now = snapshot(&root).unwrap();
+        assert_eq!(now.commit, indexed.commit);
+        assert_eq!(now.dirty, ["a.py", "deep/new.py"]);
+
+        run(repo, &["add", "."]);
+        run(
+            repo,
+            &[
+                "-c",
+                "user.name=og",
+                "-c",
+                "user.email=og@localhost",
+                "commit",
+                "-qm",
+                "edit",
+            ],
+        );
+        std::fs::remove_file(root.join("b.py")).unwrap();
+        let later = snapshot(&root).unwrap();
+        assert_ne!(later.commit, indexed.commit);
+        let changes = changes(&root, &now, &later).unwrap();
+        assert_eq!(changes.committed, ["a.py", "deep/new.py"]);
+        assert_eq!(changes.dirty, ["a.py", "b.py", "deep/new.py"]);
+
+        let gone = GitState {
+            commit: "0".repeat(40),
+            dirty: Vec::new(),
+        };
+        assert!(super::changes(&root, &gone, &later).is_none());
+    }
+}
@@ -0,0 +1,85 @@
+//! Heartbeat markers: files in an index dir that a long-running process (a
+//! build, `og watch`) keeps fresh, so other processes can tell it is alive.
+
+use std::path::{Path, PathBuf};
+use std::sync::{Arc, Mutex};
+use std::time::Duration;
+
+use anyhow::Result;
+
+/// How often a running process refreshes its marker.
+const INTERVAL: Duration = Duration::from_secs(2);
+
+/// A marker older than this was left behind by a process that died.
+const TTL: Duration = Duration::from_secs(10);
+
+/// Whether the marker `name` in `index_dir` was refreshed within `TTL`.
+pub fn is_alive(index_dir: &Path, name: &str) -> bool {
+    std::fs::metadata(index_dir.join(name))
+        .and_then(|m| m.modified())
+        .map(|mtime| mtime.elapsed().unwrap_or_default() < TTL)
+        .unwrap_or(false)
+}
+
+/// A marker holding this process's pid, refreshed every `INTERVAL` by a
+/// background thread and removed on drop. A killed process leaves it
+/// behind; it simply goes stale after `TTL`.
+pub struct Heartbeat {
+    path: PathBuf,
+    /// Cleared on drop; held while the marker is written or removed.
+    running: Arc<Mutex<bool>>,
+}
+
+impl Heartbeat {
+    pub fn start(path: PathBuf) -> Result<Self> {
+        write(&path)?;
+        let running = Arc::new(Mutex::new(true));
+        {
+            let running = Arc::clone(&running);
+            let path = path.clone();
+            std::thread::spawn(move || {
+                loop {
+                    std::thread::sleep(INTERVAL);
+                    let running = running.lock().unwrap_or_else(|e| e.into_inner());
+                    if !*running {
+                        break;
+                    }
+                    let _ = write(&path);
+                }
+            });
+        }
+        Ok(Self { path, running })
+    }
+}
+
+impl Drop for Heartbeat {
+    fn drop(&mut self) {
+        let mut running = self.running.lock().unwrap_or_else(|e| e.into_inner());
+        *running = false;
+        let _ = std::fs::remove_file(&self.path);
+    }
+}
+
+/// Replace the marker in one rename, so readers never see it half written.
+fn write(path: &Path) -> Result<()> {
+    let tmp = path.with_extension("tmp");
+    std::fs::write(&tmp, format!("{}\n", std::process::id()))?;
+    std::fs::rename(&tmp, path)?;
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn marker_lives_until_dropped() {
+        let tmp = tempfile::tempdir().unwrap();
+        assert!(!is_alive(tmp.path(), "job.pid"));
+
+        let heartbeat = Heartbeat::start(tmp.path().join("job.pid")).unwrap();
+        assert!(is_alive(tmp.path(), "job.pid"));
+        drop(heartbeat);
+        assert!(!is_alive(tmp.path(), "job.pid"));
+    }
+}
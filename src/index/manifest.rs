@@ -1,57 +1,584 @@
-use std::collections::HashMap;
+use std::collections::{BTreeMap, BTreeSet, HashMap};
+use std::io::{Seek, SeekFrom, Write};
 use std::path::Path;
+use std::time::SystemTime;
 
-use anyhow::{Result, bail};
+use anyhow::{Context, Result, bail};
+use memmap2::Mmap;
 use serde::{Deserialize, Serialize};
 
+use super::bytes::ByteReader;
+use super::git::GitState;
+use super::symbols::Symbol;
 use crate::embedder;
 
-pub const MANIFEST_VERSION: u32 = 10;
-const MANIFEST_FILE: &str = "manifest.json";
+pub const MANIFEST_VERSION: u32 = 11;
+const MANIFEST_FILE: &str = "manifest.bin";
+const JOURNAL_FILE: &str = "manifest.journal";
+/// Advisory lock taken shared to read the manifest, exclusive to save it.
+const LOCK_FILE: &str = "manifest.lock";
 
-#[derive(Debug, Clone, Serialize, Deserialize)]
-pub struct Manifest {
-    pub version: u32,
-    pub model: String,
-    pub files: HashMap<String, FileEntry>,
+/// Pretty-printed JSON manifest used up to version 10. Migrated on load.
+const LEGACY_JSON_FILE: &str = "manifest.json";
+const LEGACY_JSON_VERSION: u32 = 10;
+
+/// Files a manifest may be stored in, current and legacy.
+pub(super) const FILES: &[&str] = &[MANIFEST_FILE, JOURNAL_FILE, LEGACY_JSON_FILE];
+
+const BASE_MAGIC: &[u8; 4] = b"OGMF";
+const JOURNAL_MAGIC: &[u8; 4] = b"OGMJ";
+const BASE_HEADER_LEN: usize = 16;
+const RECORD_LEN: usize = 64;
+/// Name index entry: name offset u64, name len u32, entry u32, symbol u32.
+const NAME_RECORD_LEN: usize = 20;
+/// Token dictionary entry: token offset u64, token len u32, first posting
+/// u32, posting count u32, total block count u32.
+const TOKEN_RECORD_LEN: usize = 24;
+/// Posting: entry u32, block count u32.
+const POSTING_LEN: usize = 8;
+
+const SYMBOL_HAS_SPAN: u8 = 1;
+const SYMBOL_HAS_HASH: u8 = 2;
+const SYMBOL_HAS_SKELETON: u8 = 4;
+const SYMBOL_EXPORTED: u8 = 8;
+
+/// Journal size that triggers a rewrite of the base file, unless the base is
+/// larger: compaction happens once the journal reaches half the base size.
+const JOURNAL_COMPACT_MIN: u64 = 256 * 1024;
+
+const OP_UPSERT: u8 = 1;
+const OP_REMOVE: u8 = 2;
+const OP_GIT: u8 = 3;
+
+/// Whether `index_dir` holds a manifest (current or legacy format).
+pub fn exists(index_dir: &Path) -> bool {
+    index_dir.join(MANIFEST_FILE).exists() || index_dir.join(LEGACY_JSON_FILE).exists()
+}
+
+/// Embedding model recorded in the manifest in `index_dir`, read from the
+/// base header alone. `None` for legacy manifests or when there is none.
+pub fn model(index_dir: &Path) -> Option<String> {
+    let base = BaseView::open(&index_dir.join(MANIFEST_FILE))
+        .ok()
+        .flatten()?;
+    base.model().ok().map(str::to_string)
+}
+
+/// Token pool factor recorded in the manifest in `index_dir`; 1 (no pooling)
+/// for legacy manifests, or when there is none.
+pub fn token_pool(index_dir: &Path) -> u8 {
+    BaseView::open(&index_dir.join(MANIFEST_FILE))
+        .ok()
+        .flatten()
+        .map_or(1, |base| base.token_pool)
+}
+
+/// On-disk state of the manifest in `index_dir`: size and modification time
+/// of the base and the journal. Any save changes it, so a loaded manifest can
+/// be reused for as long as the generation it was loaded at is current.
+#[derive(Debug, Clone, Copy, Default, PartialEq, Eq)]
+pub struct Generation {
+    base: Option<(u64, SystemTime)>,
+    journal: Option<(u64, SystemTime)>,
+}
+
+/// Current `Generation` of the manifest in `index_dir`. Two stats, no reads.
+pub fn generation(index_dir: &Path) -> Generation {
+    let stamp = |name: &str| {
+        let meta = std::fs::metadata(index_dir.join(name)).ok()?;
+        Some((meta.len(), meta.modified().ok()?))
+    };
+    Generation {
+        base: stamp(MANIFEST_FILE),
+        journal: stamp(JOURNAL_FILE),
+    }
+}
+
+/// Advisory lock on the manifest in `index_dir`, held until dropped. Saves
+/// take it exclusive and reads shared, so a reader never sees a base without
+/// the journal that goes with it, and two processes never append to or
+/// compact the same journal at once. `None` when the lock file can't be
+/// opened (read-only index, no index yet); the caller goes ahead unlocked.
+fn lock(index_dir: &Path, exclusive: bool) -> Option<std::fs::File> {
+    let file = std::fs::OpenOptions::new()
+        .create(true)
+        .write(true)
+        .truncate(false)
+        .open(index_dir.join(LOCK_FILE))
+        .ok()?;
+    let locked = if exclusive {
+        file.lock()
+    } else {
+        file.lock_shared()
+    };
+    locked.ok()?;
+    Some(file)
 }
 
-#[derive(Debug, Clone, Serialize, Deserialize)]
+#[derive(Debug, Clone, Default, PartialEq, Eq, Serialize, Deserialize)]
 pub struct FileEntry {
     pub hash: String,
     pub blocks: Vec<String>,
     #[serde(default)]
     pub mtime: u64,
+    /// File size at index time. With mtime, lets staleness checks skip reading
+    /// files whose stat is unchanged.
+    #[serde(default)]
+    pub size: u64,
+    /// Name, type and location of each block, parallel to `blocks`. Empty
+    /// for entries migrated from `manifest.json` until backfilled.
+    #[serde(default)]
+    pub symbols: Vec<Symbol>,
+    /// Identifiers the file's code blocks mention, with how many blocks
+    /// mention each, sorted (`xref::file_refs`). Recorded with the symbols.
+    #[serde(default)]
+    pub refs: Vec<(String, u32)>,
+}
+
+impl FileEntry {
+    /// Whether every block has its symbol recorded.
+    pub fn has_symbols(&self) -> bool {
+        self.symbols.len() == self.blocks.len()
+    }
+}
+
+/// File manifest: indexed path -> hash, stat and block IDs.
+///
+/// On disk this is a sorted, memory-mapped base file (`manifest.bin`) plus an
+/// append-only journal of upserts and removals (`manifest.journal`). Lookups
+/// binary-search the mapped base and only decode the entry they hit; saves
+/// append changed entries to the journal and rewrite the base only when the
+/// journal has grown large relative to it.
+pub struct Manifest {
+    pub model: String,
+    /// Token pool factor new blocks are stored with (1 = every token).
+    pub token_pool: u8,
+    /// Git state the entries were last brought up to date with.
+    git: Option<GitState>,
+    /// `git` changed since the last save.
+    git_changed: bool,
+    base: Option<BaseView>,
+    /// Journal-replayed and unsaved changes over the base. `None` = removed.
+    overlay: BTreeMap<String, Option<FileEntry>>,
+    /// Paths changed since the last save.
+    dirty: BTreeSet<String>,
+    /// Length of the valid journal prefix on disk.
+    journal_len: u64,
+    /// On-disk state `base` and the journal were read at.
+    generation: Generation,
 }
 
 impl Default for Manifest {
     fn default() -> Self {
         Self {
-            version: MANIFEST_VERSION,
             model: embedder::MODEL.version.to_string(),
-            files: HashMap::new(),
+            token_pool: 1,
+            git: None,
+            git_changed: false,
+            base: None,
+            overlay: BTreeMap::new(),
+            dirty: BTreeSet::new(),
+            journal_len: 0,
+            generation: Generation::default(),
         }
     }
 }
 
 impl Manifest {
     pub fn load(index_dir: &Path) -> Result<Self> {
-        let manifest_path = index_dir.join(MANIFEST_FILE);
+        let _span = crate::trace::span("manifest_load");
+        if index_dir.join(MANIFEST_FILE).exists() {
+            let _lock = lock(index_dir, false);
+            return Self::read(index_dir);
+        }
 
-        if !manifest_path.exists() {
-            return Ok(Self::default());
+        let json_path = index_dir.join(LEGACY_JSON_FILE);
+        if json_path.exists() {
+            return Self::migrate_json(index_dir, &json_path);
+        }
+
+        Ok(Self::default())
+    }
+
+    /// Read the base and replay the journal. The caller holds the lock.
+    fn read(index_dir: &Path) -> Result<Self> {
+        let generation = generation(index_dir);
+        let base_path = index_dir.join(MANIFEST_FILE);
+        let base = if base_path.exists() {
+            BaseView::open(&base_path)?
+        } else {
+            None
+        };
+        let Some(base) = base else {
+            return Ok(Self {
+                generation,
+                ..Self::default()
+            });
+        };
+        let mut manifest = Self {
+            model: base.model()?.to_string(),
+            token_pool: base.token_pool,
+            git: base.git.clone(),
+            base: Some(base),
+            generation,
+            ..Self::default()
+        };
+        manifest.replay_journal(index_dir);
+        Ok(manifest)
+    }
+
+    /// Persist changes: append them to the journal, or rewrite the base when
+    /// there is none yet, the model or a build setting changed, or the
+    /// journal has grown too large.
+    ///
+    /// Saves from several processes (a build, `og watch`, `og serve`, the
+    /// update before a search) are serialized by the manifest lock. When
+    /// another process saved since this manifest was read, its changes are
+    /// re-read first and this one's unsaved changes applied on top, so
+    /// neither side's updates are lost.
+    pub fn save(&mut self, index_dir: &Path) -> Result<()> {
+        std::fs::create_dir_all(index_dir)?;
+        let _lock = lock(index_dir, true);
+        if generation(index_dir) != self.generation {
+            self.rebase(index_dir)?;
+        }
+
+        let needs_compact = match &self.base {
+            None => true,
+            Some(base) => {
+                base.model()? != self.model
+                    || base.token_pool != self.token_pool
+                    || self.journal_len > JOURNAL_COMPACT_MIN.max(base.len() as u64 / 2)
+            }
+        };
+        if needs_compact {
+            return self.compact(index_dir);
+        }
+        if self.dirty.is_empty() && !self.git_changed {
+            return Ok(());
+        }
+
+        let mut buf = Vec::new();
+        if self.journal_len == 0 {
+            buf.extend_from_slice(JOURNAL_MAGIC);
+            buf.extend_from_slice(&MANIFEST_VERSION.to_le_bytes());
+        }
+        for path in &self.dirty {
+            match self.overlay.get(path) {
+                Some(Some(entry)) => encode_upsert(&mut buf, path, entry),
+                _ => encode_remove(&mut buf, path),
+            }
+        }
+        if self.git_changed {
+            buf.push(OP_GIT);
+            put_git(&mut buf, self.git.as_ref());
+        }
+
+        let mut journal = std::fs::OpenOptions::new()
+            .create(true)
+            .write(true)
+            .truncate(false)
+            .open(index_dir.join(JOURNAL_FILE))?;
+        // Drop any torn tail left by an interrupted append
+        journal.set_len(self.journal_len)?;
+        journal.seek(SeekFrom::Start(self.journal_len))?;
+        journal.write_all(&buf)?;
+        journal.flush()?;
+
+        self.journal_len += buf.len() as u64;
+        self.dirty.clear();
+        self.git_changed = false;
+        self.generation = generation(index_dir);
+        Ok(())
+    }
+
+    /// Re-read the manifest another process saved and carry this one's
+    /// unsaved changes over to it. Journal records hold whole entries, so
+    /// the later save wins for any path both changed.
+    fn rebase(&mut self, index_dir: &Path) -> Result<()> {
+        let mut fresh = Self::read(index_dir)?;
+        for path in std::mem::take(&mut self.dirty) {
+            let entry = self.overlay.remove(&path).flatten();
+            fresh.overlay.insert(path.clone(), entry);
+            fresh.dirty.insert(path);
+        }
+        if self.git_changed {
+            fresh.git = self.git.take();
+            fresh.git_changed = true;
+        }
+        fresh.model = std::mem::take(&mut self.model);
+        fresh.token_pool = self.token_pool;
+        *self = fresh;
+        Ok(())
+    }
+
+    pub fn get(&self, path: &str) -> Option<FileEntry> {
+        if let Some(entry) = self.overlay.get(path) {
+            return entry.clone();
+        }
+        let base = self.base.as_ref()?;
+        base.entry(base.find(path)?)
+    }
+
+    /// `(mtime, size)` without decoding the entry's block list.
+    pub fn stat(&self, path: &str) -> Option<(u64, u64)> {
+        if let Some(entry) = self.overlay.get(path) {
+            return entry.as_ref().map(|e| (e.mtime, e.size));
+        }
+        let base = self.base.as_ref()?;
+        base.stat(base.find(path)?)
+    }
+
+    pub fn contains(&self, path: &str) -> bool {
+        match self.overlay.get(path) {
+            Some(entry) => entry.is_some(),
+            None => self
+                .base
+                .as_ref()
+                .is_some_and(|base| base.find(path).is_some()),
+        }
+    }
+
+    pub fn insert(&mut self, path: String, entry: FileEntry) {
+        self.dirty.insert(path.clone());
+        self.overlay.insert(path, Some(entry));
+    }
+
+    pub fn remove(&mut self, path: &str) -> Option<FileEntry> {
+        let old = self.get(path)?;
+        self.dirty.insert(path.to_string());
+        self.overlay.insert(path.to_string(), None);
+        Some(old)
+    }
+
+    /// Git state the entries were last brought up to date with, if recorded.
+    pub fn git(&self) -> Option<&GitState> {
+        self.git.as_ref()
+    }
+
+    /// Record the git state the entries now match (`None` outside git).
+    pub fn set_git(&mut self, state: Option<GitState>) {
+        if self.git != state {
+            self.git = state;
+            self.git_changed = true;
+        }
+    }
+
+    /// Refresh an entry's stat after confirming its content is unchanged.
+    pub fn set_stat(&mut self, path: &str, mtime: u64, size: u64) {
+        if let Some(mut entry) = self.get(path)
+            && (entry.mtime, entry.size) != (mtime, size)
+        {
+            entry.mtime = mtime;
+            entry.size = size;
+            self.insert(path.to_string(), entry);
+        }
+    }
+
+    /// All indexed paths, without decoding entries.
+    pub fn paths(&self) -> impl Iterator<Item = &str> + '_ {
+        let base_paths = self
+            .base
+            .iter()
+            .flat_map(|base| (0..base.count).filter_map(|i| base.path(i)))
+            .filter(|path| !self.overlay.contains_key(*path));
+        let overlay_paths = self
+            .overlay
+            .iter()
+            .filter(|(_, entry)| entry.is_some())
+            .map(|(path, _)| path.as_str());
+        base_paths.chain(overlay_paths)
+    }
+
+    /// All indexed paths with their block counts, without decoding block IDs.
+    pub fn block_counts(&self) -> impl Iterator<Item = (&str, usize)> + '_ {
+        let base_counts = self
+            .base
+            .iter()
+            .flat_map(|base| {
+                (0..base.count).filter_map(|i| Some((base.path(i)?, base.block_count(i)?)))
+            })
+            .filter(|(path, _)| !self.overlay.contains_key(*path));
+        let overlay_counts = self
+            .overlay
+            .iter()
+            .filter_map(|(path, entry)| Some((path.as_str(), entry.as_ref()?.blocks.len())));
+        base_counts.chain(overlay_counts)
+    }
+
+    /// All entries, decoded. Prefer `get`/`stat` for point lookups.
+    pub fn iter(&self) -> impl Iterator<Item = (String, FileEntry)> + '_ {
+        let base_entries = self
+            .base
+            .iter()
+            .flat_map(|base| (0..base.count).filter_map(|i| Some((base.path(i)?, base.entry(i)?))))
+            .filter(|(path, _)| !self.overlay.contains_key(*path))
+            .map(|(path, entry)| (path.to_string(), entry));
+        let overlay_entries = self
+            .overlay
+            .iter()
+            .filter_map(|(path, entry)| Some((path.clone(), entry.clone()?)));
+        base_entries.chain(overlay_entries)
+    }
+
+    /// Blocks named `name` anywhere in the index, as (path, symbol). The
+    /// base is binary-searched through its name index; only unsaved and
+    /// journaled entries are scanned.
+    pub fn find_symbol(&self, name: &str) -> Vec<(String, Symbol)> {
+        let mut found: Vec<(String, Symbol)> = self
+            .base
+            .iter()
+            .flat_map(|base| base.named(name))
+            .filter(|(path, _)| !self.overlay.contains_key(path))
+            .collect();
+        for (path, entry) in &self.overlay {
+            let Some(entry) = entry else { continue };
+            found.extend(
+                entry
+                    .symbols
+                    .iter()
+                    .filter(|s| s.name == name)
+                    .map(|s| (path.clone(), s.clone())),
+            );
+        }
+        found
+    }
+
+    /// Files in `scope` (a path or directory prefix, `None` for all) whose
+    /// code blocks mention the identifier `token`, with how many blocks in
+    /// each do. The base is searched through its token index; only unsaved
+    /// and journaled entries are scanned. `None` once more than `limit`
+    /// blocks mention it, so common identifiers cost no more than rare ones.
+    pub fn references(
+        &self,
+        token: &str,
+        scope: Option<&str>,
+        limit: usize,
+    ) -> Option<Vec<(String, u32)>> {
+        let in_scope = |path: &str| {
+            scope.is_none_or(|prefix| {
+                path.strip_prefix(prefix)
+                    .is_some_and(|rest| rest.is_empty() || rest.starts_with('/'))
+            })
+        };
+
+        let mut found = Vec::new();
+        let mut total = 0;
+        let base_refs = self.base.iter().flat_map(|base| {
+            base.postings(token)
+                .filter_map(move |(entry, count)| Some((base.path(entry)?, count)))
+        });
+        let overlay_refs = self.overlay.iter().filter_map(|(path, entry)| {
+            let refs = &entry.as_ref()?.refs;
+            let i = refs.binary_search_by(|(t, _)| t.as_str().cmp(token)).ok()?;
+            Some((path.as_str(), refs[i].1))
+        });
+        for (path, count) in base_refs
+            .filter(|(path, _)| !self.overlay.contains_key(*path))
+            .chain(overlay_refs)
+        {
+            if !in_scope(path) {
+                continue;
+            }
+            total += count as usize;
+            if total > limit {
+                return None;
+            }
+            found.push((path.to_string(), count));
+        }
+        Some(found)
+    }
+
+    /// Whether some entries were migrated from `manifest.json` without
+    /// symbols or cross-references and need a backfill.
+    pub fn needs_backfill(&self) -> bool {
+        let old_base = self.base.as_ref().is_some_and(|base| {
+            (0..base.count).any(|i| {
+                !base.has_symbols(i)
+                    && base
+                        .path(i)
+                        .is_some_and(|path| !self.overlay.contains_key(path))
+            })
+        });
+        old_base || self.overlay.values().flatten().any(|e| !e.has_symbols())
+    }
+
+    pub fn len(&self) -> usize {
+        self.paths().count()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.paths().next().is_none()
+    }
+
+    /// Rewrite the base file from the merged state and drop the journal.
+    fn compact(&mut self, index_dir: &Path) -> Result<()> {
+        let mut entries: Vec<(String, FileEntry)> = self.iter().collect();
+        entries.sort_by(|a, b| a.0.cmp(&b.0));
+
+        let base_path = index_dir.join(MANIFEST_FILE);
+        let tmp_path = index_dir.join(".manifest.bin.tmp");
+        std::fs::write(
+            &tmp_path,
+            encode_base(&self.model, self.token_pool, self.git.as_ref(), &entries),
+        )?;
+        self.base = None;
+        std::fs::rename(&tmp_path, &base_path)?;
+
+        // Readers wait on the lock, so none sees the new base with the old
+        // journal. Entries are absolute states, so after a crash between these
+        // steps replaying the old journal over the new base loses no file
+        remove_if_exists(&index_dir.join(JOURNAL_FILE))?;
+        remove_if_exists(&index_dir.join(LEGACY_JSON_FILE))?;
+
+        self.base = BaseView::open(&base_path)?;
+        self.overlay.clear();
+        self.dirty.clear();
+        self.git_changed = false;
+        self.journal_len = 0;
+        self.generation = generation(index_dir);
+        Ok(())
+    }
+
+    /// Apply journal records to the overlay, stopping at the first torn or
+    /// corrupt record. An unreadable journal is ignored (next save compacts).
+    fn replay_journal(&mut self, index_dir: &Path) {
+        let Ok(raw) = std::fs::read(index_dir.join(JOURNAL_FILE)) else {
+            return;
+        };
+        let mut reader = ByteReader::new(&raw);
+        if reader.bytes(4) != Some(JOURNAL_MAGIC.as_slice())
+            || reader.u32() != Some(MANIFEST_VERSION)
+        {
+            self.journal_len = 0;
+            return;
         }
 
-        let content = std::fs::read_to_string(&manifest_path)?;
+        let mut valid = reader.pos();
+        while let Some(record) = decode_journal_record(&mut reader) {
+            match record {
+                JournalRecord::File(path, entry) => {
+                    self.overlay.insert(path, entry);
+                }
+                JournalRecord::Git(state) => self.git = state,
+            }
+            valid = reader.pos();
+        }
+        self.journal_len = valid as u64;
+    }
+
+    /// Convert a version-10 `manifest.json`. The new manifest is written
+    /// immediately when possible; a read-only index still loads.
+    fn migrate_json(index_dir: &Path, json_path: &Path) -> Result<Self> {
+        let content = std::fs::read_to_string(json_path)?;
         if content.trim().is_empty() {
             return Ok(Self::default());
         }
 
         let data: serde_json::Value = serde_json::from_str(&content)?;
-
         let version = data.get("version").and_then(|v| v.as_u64()).unwrap_or(1) as u32;
 
-        if version > MANIFEST_VERSION {
+        if version > LEGACY_JSON_VERSION {
             bail!(
                 "Index was created by a newer version of og. \
                  Please upgrade og or run 'og build --force' to rebuild."
@@ -59,7 +586,7 @@ impl Manifest {
         }
 
         // Old manifests are incompatible — different model, dims, metric
-        if version < MANIFEST_VERSION {
+        if version < LEGACY_JSON_VERSION {
             let has_files = data
                 .get("files")
                 .map(|f| f.as_object().is_some_and(|o| !o.is_empty()))
@@ -67,19 +594,999 @@ impl Manifest {
             if has_files {
                 bail!("Index was created by an older version. Run 'og build --force' to rebuild.");
             }
+            return Ok(Self::default());
+        }
+
+        #[derive(Deserialize)]
+        struct LegacyManifest {
+            model: String,
+            files: HashMap<String, FileEntry>,
         }
 
-        let manifest: Manifest = serde_json::from_value(data)?;
+        let legacy: LegacyManifest = serde_json::from_value(data)?;
+        let mut manifest = Self {
+            model: legacy.model,
+            ..Self::default()
+        };
+        for (path, entry) in legacy.files {
+            manifest.insert(path, entry);
+        }
+        let _ = manifest.save(index_dir);
         Ok(manifest)
     }
+}
 
-    pub fn save(&self, index_dir: &Path) -> Result<()> {
-        std::fs::create_dir_all(index_dir)?;
-        let manifest_path = index_dir.join(MANIFEST_FILE);
-        let tmp_path = index_dir.join(".manifest.json.tmp");
-        let content = serde_json::to_string_pretty(self)?;
-        std::fs::write(&tmp_path, &content)?;
-        std::fs::rename(&tmp_path, &manifest_path)?;
-        Ok(())
+fn remove_if_exists(path: &Path) -> Result<()> {
+    match std::fs::remove_file(path) {
+        Err(e) if e.kind() != std::io::ErrorKind::NotFound => Err(e.into()),
+        _ => Ok(()),
+    }
+}
+
+/// Read-only view of `manifest.bin`.
+///
+/// Layout (little-endian):
+/// - header: magic `OGMF`, version u32, entry count u32, model len u32, model,
+///   token pool factor u8, name index length u32, token count
+///   u32, posting count u32, git state length u32 and the state as encoded
+///   by `put_git`
+/// - entry table, sorted by path, `RECORD_LEN` bytes each: path offset u64,
+///   path len u32, hash len u32, blocks offset u64, block count u32, symbol
+///   count u32, mtime u64, size u64, symbols offset u64, refs offset u64
+/// - name index, sorted by block name, `NAME_RECORD_LEN` bytes each: name
+///   offset u64, name len u32, entry u32, symbol u32
+/// - token dictionary, sorted by identifier, `TOKEN_RECORD_LEN` bytes each,
+///   then postings grouped by token and sorted by entry, `POSTING_LEN` each
+/// - heap: per entry, path bytes then hash bytes; block IDs as (len u32,
+///   bytes); symbols as encoded by `put_symbol`; refs as count u32 then
+///   (token u32, block count u32) pairs. Then the dictionary's token text.
+struct BaseView {
+    map: Mmap,
+    count: usize,
+    model_len: usize,
+    token_pool: u8,
+    git: Option<GitState>,
+    table: usize,
+    names: usize,
+    name_count: usize,
+    tokens: usize,
+    token_count: usize,
+    postings: usize,
+}
+
+impl BaseView {
+    /// Map and validate the base file. `None` for an empty old-version file.
+    fn open(path: &Path) -> Result<Option<Self>> {
+        let file = std::fs::File::open(path)?;
+        // SAFETY: manifest.bin is only ever replaced via rename, never written
+        // in place, so the mapped bytes cannot change underneath us.
+        let map = unsafe { Mmap::map(&file) }.context("Failed to map manifest")?;
+
+        let mut reader = ByteReader::new(&map);
+        if reader.bytes(4) != Some(BASE_MAGIC.as_slice()) {
+            bail!("Corrupt index manifest. Run 'og build --force' to rebuild.");
+        }
+        let version = reader.u32().context("Truncated manifest")?;
+        let count = reader.u32().context("Truncated manifest")? as usize;
+        let model_len = reader.u32().context("Truncated manifest")? as usize;
+
+        if version > MANIFEST_VERSION {
+            bail!(
+                "Index was created by a newer version of og. \
+                 Please upgrade og or run 'og build --force' to rebuild."
+            );
+        }
+        if version < MANIFEST_VERSION {
+            if count > 0 {
+                bail!("Index was created by an older version. Run 'og build --force' to rebuild.");
+            }
+            return Ok(None);
+        }
+
+        let mut table = BASE_HEADER_LEN + model_len;
+        let token_pool = (*map.get(table).context("Truncated manifest")?).max(1);
+        table += 1;
+        let mut header = ByteReader::new(map.get(table..).unwrap_or_default());
+        let name_count = header.u32().context("Truncated manifest")? as usize;
+        let token_count = header.u32().context("Truncated manifest")? as usize;
+        let posting_count = header.u32().context("Truncated manifest")? as usize;
+        let git_len = header.u32().context("Truncated manifest")? as usize;
+        let raw_git = header.bytes(git_len).context("Truncated manifest")?;
+        let git = ByteReader::new(raw_git)
+            .git()
+            .context("Corrupt index manifest")?;
+        table += header.pos();
+        let names = table + count * RECORD_LEN;
+        let tokens = names + name_count * NAME_RECORD_LEN;
+        let postings = tokens + token_count * TOKEN_RECORD_LEN;
+        if postings + posting_count * POSTING_LEN > map.len() {
+            bail!("Corrupt index manifest. Run 'og build --force' to rebuild.");
+        }
+
+        let view = Self {
+            map,
+            count,
+            model_len,
+            token_pool,
+            git,
+            table,
+            names,
+            name_count,
+            tokens,
+            token_count,
+            postings,
+        };
+        view.model()?;
+        Ok(Some(view))
+    }
+
+    fn len(&self) -> usize {
+        self.map.len()
+    }
+
+    fn model(&self) -> Result<&str> {
+        std::str::from_utf8(&self.map[BASE_HEADER_LEN..BASE_HEADER_LEN + self.model_len])
+            .context("Corrupt index manifest")
+    }
+
+    fn record(&self, i: usize) -> ByteReader<'_> {
+        let start = self.table + i * RECORD_LEN;
+        ByteReader::new(&self.map[start..start + RECORD_LEN])
+    }
+
+    fn path(&self, i: usize) -> Option<&str> {
+        let mut rec = self.record(i);
+        let off = rec.u64()? as usize;
+        let len = rec.u32()? as usize;
+        std::str::from_utf8(self.map.get(off..off.checked_add(len)?)?).ok()
+    }
+
+    /// Binary search the sorted table.
+    fn find(&self, path: &str) -> Option<usize> {
+        let (mut lo, mut hi) = (0, self.count);
+        while lo < hi {
+            let mid = lo + (hi - lo) / 2;
+            match self.path(mid)?.cmp(path) {
+                std::cmp::Ordering::Equal => return Some(mid),
+                std::cmp::Ordering::Less => lo = mid + 1,
+                std::cmp::Ordering::Greater => hi = mid,
+            }
+        }
+        None
+    }
+
+    fn stat(&self, i: usize) -> Option<(u64, u64)> {
+        let mut rec = self.record(i);
+        rec.skip(32)?;
+        Some((rec.u64()?, rec.u64()?))
+    }
+
+    fn block_count(&self, i: usize) -> Option<usize> {
+        let mut rec = self.record(i);
+        rec.skip(24)?;
+        Some(rec.u32()? as usize)
+    }
+
+    fn entry(&self, i: usize) -> Option<FileEntry> {
+        let mut rec = self.record(i);
+        let path_off = rec.u64()? as usize;
+        let path_len = rec.u32()? as usize;
+        let hash_len = rec.u32()? as usize;
+        let blocks_off = rec.u64()? as usize;
+        let block_count = rec.u32()? as usize;
+        rec.skip(4)?;
+        let mtime = rec.u64()?;
+        let size = rec.u64()?;
+        let symbols = self.symbols(i)?;
+        let refs = self.refs(i)?;
+
+        let hash_off = path_off.checked_add(path_len)?;
+        let hash = std::str::from_utf8(self.map.get(hash_off..hash_off.checked_add(hash_len)?)?)
+            .ok()?
+            .to_string();
+
+        let mut heap = ByteReader::new(self.map.get(blocks_off..)?);
+        let blocks = (0..block_count)
+            .map(|_| heap.string())
+            .collect::<Option<Vec<_>>>()?;
+
+        Some(FileEntry {
+            hash,
+            blocks,
+            mtime,
+            size,
+            symbols,
+            refs,
+        })
+    }
+
+    fn has_symbols(&self, i: usize) -> bool {
+        let mut rec = self.record(i);
+        let counts = rec.skip(24).and_then(|_| Some((rec.u32()?, rec.u32()?)));
+        counts.is_some_and(|(blocks, symbols)| blocks == symbols)
+    }
+
+    /// The entry's symbols alone; empty for entries migrated without them.
+    fn symbols(&self, i: usize) -> Option<Vec<Symbol>> {
+        let mut rec = self.record(i);
+        rec.skip(28)?;
+        let count = rec.u32()? as usize;
+        if count == 0 {
+            return Some(Vec::new());
+        }
+        rec.skip(16)?;
+        let off = rec.u64()? as usize;
+        let mut heap = ByteReader::new(self.map.get(off..)?);
+        (0..count).map(|_| heap.symbol()).collect()
+    }
+
+    /// The entry's identifier counts.
+    fn refs(&self, i: usize) -> Option<Vec<(String, u32)>> {
+        let mut rec = self.record(i);
+        rec.skip(56)?;
+        let off = rec.u64()? as usize;
+        let mut heap = ByteReader::new(self.map.get(off..)?);
+        let count = heap.u32()? as usize;
+        (0..count)
+            .map(|_| {
+                let (token, _, _) = self.token_record(heap.u32()? as usize)?;
+                Some((token.to_string(), heap.u32()?))
+            })
+            .collect()
+    }
+
+    /// Token text and its postings range.
+    fn token_record(&self, t: usize) -> Option<(&str, usize, usize)> {
+        if t >= self.token_count {
+            return None;
+        }
+        let start = self.tokens + t * TOKEN_RECORD_LEN;
+        let mut rec = ByteReader::new(self.map.get(start..start + TOKEN_RECORD_LEN)?);
+        let off = rec.u64()? as usize;
+        let len = rec.u32()? as usize;
+        let token = std::str::from_utf8(self.map.get(off..off.checked_add(len)?)?).ok()?;
+        Some((token, rec.u32()? as usize, rec.u32()? as usize))
+    }
+
+    /// (entry, block count) of every entry mentioning `token`, in entry
+    /// order, found by binary search of the token dictionary.
+    fn postings(&self, token: &str) -> impl Iterator<Item = (usize, u32)> + '_ {
+        let (mut lo, mut hi) = (0, self.token_count);
+        while lo < hi {
+            let mid = lo + (hi - lo) / 2;
+            match self.token_record(mid) {
+                Some((found, _, _)) if found < token => lo = mid + 1,
+                _ => hi = mid,
+            }
+        }
+        let range = match self.token_record(lo) {
+            Some((found, first, count)) if found == token => first..first + count,
+            _ => 0..0,
+        };
+        range.map_while(move |p| {
+            let start = self.postings + p * POSTING_LEN;
+            let mut rec = ByteReader::new(self.map.get(start..start + POSTING_LEN)?);
+            Some((rec.u32()? as usize, rec.u32()?))
+        })
+    }
+
+    fn name_record(&self, n: usize) -> Option<(&str, usize, usize)> {
+        let start = self.names + n * NAME_RECORD_LEN;
+        let mut rec = ByteReader::new(self.map.get(start..start + NAME_RECORD_LEN)?);
+        let off = rec.u64()? as usize;
+        let len = rec.u32()? as usize;
+        let name = std::str::from_utf8(self.map.get(off..off.checked_add(len)?)?).ok()?;
+        Some((name, rec.u32()? as usize, rec.u32()? as usize))
+    }
+
+    /// Blocks named `name`, found by binary search of the name index.
+    fn named(&self, name: &str) -> Vec<(String, Symbol)> {
+        let (mut lo, mut hi) = (0, self.name_count);
+        while lo < hi {
+            let mid = lo + (hi - lo) / 2;
+            match self.name_record(mid) {
+                Some((found, _, _)) if found < name => lo = mid + 1,
+                _ => hi = mid,
+            }
+        }
+
+        let mut found = Vec::new();
+        for n in lo..self.name_count {
+            let Some((found_name, entry, symbol)) = self.name_record(n) else {
+                break;
+            };
+            if found_name != name {
+                break;
+            }
+            let symbol = self
+                .symbols(entry)
+                .and_then(|mut s| (symbol < s.len()).then(|| s.swap_remove(symbol)));
+            if let (Some(path), Some(symbol)) = (self.path(entry), symbol) {
+                found.push((path.to_string(), symbol));
+            }
+        }
+        found
+    }
+}
+
+/// Serialize sorted entries into the base file layout described on `BaseView`.
+fn encode_base(
+    model: &str,
+    token_pool: u8,
+    git: Option<&GitState>,
+    entries: &[(String, FileEntry)],
+) -> Vec<u8> {
+    let named = entries
+        .iter()
+        .flat_map(|(_, e)| &e.symbols)
+        .filter(|s| !s.name.is_empty())
+        .count();
+    // Postings per token, in entry order since entries are sorted by path
+    let mut postings: BTreeMap<&str, Vec<(u32, u32)>> = BTreeMap::new();
+    for (i, (_, entry)) in entries.iter().enumerate() {
+        for (token, count) in &entry.refs {
+            postings.entry(token).or_default().push((i as u32, *count));
+        }
+    }
+    let token_ids: HashMap<&str, u32> = postings
+        .keys()
+        .enumerate()
+        .map(|(id, token)| (*token, id as u32))
+        .collect();
+    let posting_count: usize = postings.values().map(Vec::len).sum();
+
+    let mut git_state = Vec::new();
+    put_git(&mut git_state, git);
+
+    let table = BASE_HEADER_LEN + model.len() + 1 + 16 + git_state.len();
+    let mut heap_off = table
+        + entries.len() * RECORD_LEN
+        + named * NAME_RECORD_LEN
+        + postings.len() * TOKEN_RECORD_LEN
+        + posting_count * POSTING_LEN;
+
+    let mut header = Vec::with_capacity(table);
+    header.extend_from_slice(BASE_MAGIC);
+    header.extend_from_slice(&MANIFEST_VERSION.to_le_bytes());
+    header.extend_from_slice(&(entries.len() as u32).to_le_bytes());
+    header.extend_from_slice(&(model.len() as u32).to_le_bytes());
+    header.extend_from_slice(model.as_bytes());
+    header.push(token_pool);
+    header.extend_from_slice(&(named as u32).to_le_bytes());
+    header.extend_from_slice(&(postings.len() as u32).to_le_bytes());
+    header.extend_from_slice(&(posting_count as u32).to_le_bytes());
+    header.extend_from_slice(&(git_state.len() as u32).to_le_bytes());
+    header.extend_from_slice(&git_state);
+
+    let mut records = Vec::with_capacity(entries.len() * RECORD_LEN);
+    // (name, name offset, entry, symbol)
+    let mut names: Vec<(&str, usize, u32, u32)> = Vec::with_capacity(named);
+    let mut heap = Vec::new();
+    for (i, (path, entry)) in entries.iter().enumerate() {
+        let path_off = heap_off + heap.len();
+        heap.extend_from_slice(path.as_bytes());
+        heap.extend_from_slice(entry.hash.as_bytes());
+        let blocks_off = heap_off + heap.len();
+        for block in &entry.blocks {
+            put_str(&mut heap, block);
+        }
+        let symbols_off = heap_off + heap.len();
+        for (j, symbol) in entry.symbols.iter().enumerate() {
+            if !symbol.name.is_empty() {
+                // The name is the symbol's first field, after its length
+                names.push((&symbol.name, heap_off + heap.len() + 4, i as u32, j as u32));
+            }
+            put_symbol(&mut heap, symbol);
+        }
+        let refs_off = heap_off + heap.len();
+        heap.extend_from_slice(&(entry.refs.len() as u32).to_le_bytes());
+        for (token, count) in &entry.refs {
+            heap.extend_from_slice(&token_ids[token.as_str()].to_le_bytes());
+            heap.extend_from_slice(&count.to_le_bytes());
+        }
+
+        records.extend_from_slice(&(path_off as u64).to_le_bytes());
+        records.extend_from_slice(&(path.len() as u32).to_le_bytes());
+        records.extend_from_slice(&(entry.hash.len() as u32).to_le_bytes());
+        records.extend_from_slice(&(blocks_off as u64).to_le_bytes());
+        records.extend_from_slice(&(entry.blocks.len() as u32).to_le_bytes());
+        records.extend_from_slice(&(entry.symbols.len() as u32).to_le_bytes());
+        records.extend_from_slice(&entry.mtime.to_le_bytes());
+        records.extend_from_slice(&entry.size.to_le_bytes());
+        records.extend_from_slice(&(symbols_off as u64).to_le_bytes());
+        records.extend_from_slice(&(refs_off as u64).to_le_bytes());
+    }
+
+    let mut dictionary = Vec::with_capacity(postings.len() * TOKEN_RECORD_LEN);
+    let mut posting_table = Vec::with_capacity(posting_count * POSTING_LEN);
+    for (token, list) in &postings {
+        let total: u32 = list.iter().map(|(_, count)| count).sum();
+        dictionary.extend_from_slice(&((heap_off + heap.len()) as u64).to_le_bytes());
+        dictionary.extend_from_slice(&(token.len() as u32).to_le_bytes());
+        dictionary.extend_from_slice(&((posting_table.len() / POSTING_LEN) as u32).to_le_bytes());
+        dictionary.extend_from_slice(&(list.len() as u32).to_le_bytes());
+        dictionary.extend_from_slice(&total.to_le_bytes());
+        heap.extend_from_slice(token.as_bytes());
+        for (entry, count) in list {
+            posting_table.extend_from_slice(&entry.to_le_bytes());
+            posting_table.extend_from_slice(&count.to_le_bytes());
+        }
+    }
+    heap_off += heap.len();
+
+    names.sort_unstable();
+    let mut index = Vec::with_capacity(names.len() * NAME_RECORD_LEN);
+    for (name, off, entry, symbol) in names {
+        index.extend_from_slice(&(off as u64).to_le_bytes());
+        index.extend_from_slice(&(name.len() as u32).to_le_bytes());
+        index.extend_from_slice(&entry.to_le_bytes());
+        index.extend_from_slice(&symbol.to_le_bytes());
+    }
+
+    let mut out = Vec::with_capacity(heap_off);
+    out.extend_from_slice(&header);
+    out.extend_from_slice(&records);
+    out.extend_from_slice(&index);
+    out.extend_from_slice(&dictionary);
+    out.extend_from_slice(&posting_table);
+    out.extend_from_slice(&heap);
+    out
+}
+
+fn encode_upsert(buf: &mut Vec<u8>, path: &str, entry: &FileEntry) {
+    buf.push(OP_UPSERT);
+    put_str(buf, path);
+    put_str(buf, &entry.hash);
+    buf.extend_from_slice(&entry.mtime.to_le_bytes());
+    buf.extend_from_slice(&entry.size.to_le_bytes());
+    buf.extend_from_slice(&(entry.blocks.len() as u32).to_le_bytes());
+    for block in &entry.blocks {
+        put_str(buf, block);
+    }
+    buf.extend_from_slice(&(entry.symbols.len() as u32).to_le_bytes());
+    for symbol in &entry.symbols {
+        put_symbol(buf, symbol);
+    }
+    buf.extend_from_slice(&(entry.refs.len() as u32).to_le_bytes());
+    for (token, count) in &entry.refs {
+        put_str(buf, token);
+        buf.extend_from_slice(&count.to_le_bytes());
+    }
+}
+
+fn encode_remove(buf: &mut Vec<u8>, path: &str) {
+    buf.push(OP_REMOVE);
+    put_str(buf, path);
+}
+
+/// A replayed journal record: a file's new entry (`None` = removed), or
+/// the git state the manifest was brought up to date with.
+enum JournalRecord {
+    File(String, Option<FileEntry>),
+    Git(Option<GitState>),
+}
+
+fn decode_journal_record(reader: &mut ByteReader<'_>) -> Option<JournalRecord> {
+    let op = reader.u8()?;
+    if op == OP_GIT {
+        return Some(JournalRecord::Git(reader.git()?));
+    }
+    let path = reader.string()?;
+    match op {
+        OP_UPSERT => {
+            let hash = reader.string()?;
+            let mtime = reader.u64()?;
+            let size = reader.u64()?;
+            let block_count = reader.u32()? as usize;
+            let blocks = (0..block_count)
+                .map(|_| reader.string())
+                .collect::<Option<Vec<_>>>()?;
+            let symbol_count = reader.u32()? as usize;
+            let symbols = (0..symbol_count)
+                .map(|_| reader.symbol())
+                .collect::<Option<Vec<_>>>()?;
+            let ref_count = reader.u32()? as usize;
+            let refs = (0..ref_count)
+                .map(|_| Some((reader.string()?, reader.u32()?)))
+                .collect::<Option<Vec<_>>>()?;
+            Some(JournalRecord::File(
+                path,
+                Some(FileEntry {
+                    hash,
+                    blocks,
+                    mtime,
+                    size,
+                    symbols,
+                    refs,
+                }),
+            ))
+        }
+        OP_REMOVE => Some(JournalRecord::File(path, None)),
+        _ => None,
+    }
+}
+
+/// Name, type, start and end line u32, flags u8 (presence of the optional
+/// fields, and `exported`), then the span (two u64), hash and skeleton when
+/// present.
+fn put_symbol(buf: &mut Vec<u8>, symbol: &Symbol) {
+    put_str(buf, &symbol.name);
+    put_str(buf, &symbol.block_type);
+    buf.extend_from_slice(&(symbol.start_line as u32).to_le_bytes());
+    buf.extend_from_slice(&(symbol.end_line as u32).to_le_bytes());
+    let mut flags = 0;
+    if symbol.span.is_some() {
+        flags |= SYMBOL_HAS_SPAN;
+    }
+    if symbol.hash.is_some() {
+        flags |= SYMBOL_HAS_HASH;
+    }
+    if symbol.skeleton.is_some() {
+        flags |= SYMBOL_HAS_SKELETON;
+    }
+    if symbol.exported {
+        flags |= SYMBOL_EXPORTED;
+    }
+    buf.push(flags);
+    if let Some((start, end)) = symbol.span {
+        buf.extend_from_slice(&(start as u64).to_le_bytes());
+        buf.extend_from_slice(&(end as u64).to_le_bytes());
+    }
+    if let Some(hash) = &symbol.hash {
+        put_str(buf, hash);
+    }
+    if let Some(skeleton) = &symbol.skeleton {
+        put_str(buf, skeleton);
+    }
+}
+
+/// Presence u8, then the commit and the dirty paths as a count u32 and
+/// strings.
+fn put_git(buf: &mut Vec<u8>, state: Option<&GitState>) {
+    let Some(state) = state else {
+        buf.push(0);
+        return;
+    };
+    buf.push(1);
+    put_str(buf, &state.commit);
+    buf.extend_from_slice(&(state.dirty.len() as u32).to_le_bytes());
+    for path in &state.dirty {
+        put_str(buf, path);
+    }
+}
+
+fn put_str(buf: &mut Vec<u8>, s: &str) {
+    buf.extend_from_slice(&(s.len() as u32).to_le_bytes());
+    buf.extend_from_slice(s.as_bytes());
+}
+
+/// Manifest records on top of the shared reader.
+impl ByteReader<'_> {
+    /// A state written by `put_git`: `Some(None)` when none was recorded.
+    fn git(&mut self) -> Option<Option<GitState>> {
+        if self.u8()? == 0 {
+            return Some(None);
+        }
+        let commit = self.string()?;
+        let count = self.u32()? as usize;
+        let dirty = (0..count)
+            .map(|_| self.string())
+            .collect::<Option<Vec<_>>>()?;
+        Some(Some(GitState { commit, dirty }))
+    }
+
+    fn symbol(&mut self) -> Option<Symbol> {
+        let name = self.string()?;
+        let block_type = self.string()?;
+        let start_line = self.u32()? as usize;
+        let end_line = self.u32()? as usize;
+        let flags = self.u8()?;
+        let span = match flags & SYMBOL_HAS_SPAN {
+            0 => None,
+            _ => Some((self.u64()? as usize, self.u64()? as usize)),
+        };
+        let hash = match flags & SYMBOL_HAS_HASH {
+            0 => None,
+            _ => Some(self.string()?),
+        };
+        let skeleton = match flags & SYMBOL_HAS_SKELETON {
+            0 => None,
+            _ => Some(self.string()?),
+        };
+        Some(Symbol {
+            name,
+            block_type,
+            start_line,
+            end_line,
+            span,
+            hash,
+            skeleton,
+            exported: flags & SYMBOL_EXPORTED != 0,
+        })
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn entry(hash: &str, blocks: &[&str], mtime: u64) -> FileEntry {
+        FileEntry {
+            hash: hash.to_string(),
+            blocks: blocks.iter().map(|b| b.to_string()).collect(),
+            mtime,
+            size: mtime * 10,
+            symbols: Vec::new(),
+            refs: Vec::new(),
+        }
+    }
+
+    fn with_symbols(mut entry: FileEntry, names: &[&str]) -> FileEntry {
+        entry.symbols = names
+            .iter()
+            .enumerate()
+            .map(|(i, name)| Symbol {
+                name: name.to_string(),
+                block_type: "function".to_string(),
+                start_line: i * 10,
+                end_line: i * 10 + 5,
+                span: (i % 2 == 0).then_some((i * 100, i * 100 + 50)),
+                hash: (i % 2 == 0).then(|| format!("h{i}")),
+                skeleton: (i == 1).then(|| format!("def {name}(): ...")),
+                exported: i == 0,
+            })
+            .collect();
+        entry
+    }
+
+    fn names(found: Vec<(String, Symbol)>) -> Vec<(String, String)> {
+        let mut names: Vec<(String, String)> =
+            found.into_iter().map(|(path, s)| (path, s.name)).collect();
+        names.sort();
+        names
+    }
+
+    #[test]
+    fn roundtrip_through_base_file() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("src/b.rs".into(), entry("bb", &["b1", "b2"], 2));
+        manifest.insert("src/a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.insert("empty.bin".into(), entry("", &[], 3));
+        manifest.save(tmp.path()).unwrap();
+        assert!(tmp.path().join(MANIFEST_FILE).exists());
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.len(), 3);
+        assert_eq!(loaded.get("src/b.rs"), Some(entry("bb", &["b1", "b2"], 2)));
+        assert_eq!(loaded.stat("src/a.rs"), Some((1, 10)));
+        assert_eq!(loaded.get("empty.bin"), Some(entry("", &[], 3)));
+        assert!(loaded.get("missing.rs").is_none());
+        assert_eq!(loaded.model, embedder::MODEL.version);
+
+        let mut counts: Vec<(&str, usize)> = loaded.block_counts().collect();
+        counts.sort();
+        assert_eq!(
+            counts,
+            vec![("empty.bin", 0), ("src/a.rs", 1), ("src/b.rs", 2)]
+        );
+    }
+
+    #[test]
+    fn updates_append_to_journal_and_replay() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.insert("b.rs".into(), entry("bb", &["b1"], 2));
+        manifest.save(tmp.path()).unwrap();
+        let base_before = std::fs::read(tmp.path().join(MANIFEST_FILE)).unwrap();
+
+        let mut manifest = Manifest::load(tmp.path()).unwrap();
+        manifest.insert("c.rs".into(), entry("cc", &["c1"], 3));
+        assert_eq!(manifest.remove("a.rs"), Some(entry("aa", &["a1"], 1)));
+        manifest.set_stat("b.rs", 20, 200);
+        manifest.save(tmp.path()).unwrap();
+
+        // Base untouched; changes live in the journal
+        assert_eq!(
+            std::fs::read(tmp.path().join(MANIFEST_FILE)).unwrap(),
+            base_before
+        );
+        assert!(tmp.path().join(JOURNAL_FILE).exists());
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert!(!loaded.contains("a.rs"));
+        assert_eq!(loaded.stat("b.rs"), Some((20, 200)));
+        assert_eq!(loaded.get("c.rs"), Some(entry("cc", &["c1"], 3)));
+        let mut paths: Vec<&str> = loaded.paths().collect();
+        paths.sort();
+        assert_eq!(paths, vec!["b.rs", "c.rs"]);
+    }
+
+    #[test]
+    fn git_state_persists_in_base_and_journal() {
+        let tmp = tempfile::tempdir().unwrap();
+        let first = GitState {
+            commit: "a".repeat(40),
+            dirty: vec!["src/new.rs".into()],
+        };
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.set_git(Some(first.clone()));
+        manifest.save(tmp.path()).unwrap();
+        assert!(!tmp.path().join(JOURNAL_FILE).exists());
+        assert_eq!(Manifest::load(tmp.path()).unwrap().git(), Some(&first));
+
+        // A new state alone is a journal append
+        let second = GitState {
+            commit: "b".repeat(40),
+            dirty: Vec::new(),
+        };
+        let base_before = std::fs::read(tmp.path().join(MANIFEST_FILE)).unwrap();
+        let mut manifest = Manifest::load(tmp.path()).unwrap();
+        manifest.set_git(Some(second.clone()));
+        manifest.save(tmp.path()).unwrap();
+        assert_eq!(
+            std::fs::read(tmp.path().join(MANIFEST_FILE)).unwrap(),
+            base_before
+        );
+        let mut manifest = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(manifest.git(), Some(&second));
+        assert_eq!(manifest.get("a.rs"), Some(entry("aa", &["a1"], 1)));
+
+        manifest.set_git(None);
+        manifest.save(tmp.path()).unwrap();
+        let mut manifest = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(manifest.git(), None);
+        manifest.compact(tmp.path()).unwrap();
+        assert_eq!(Manifest::load(tmp.path()).unwrap().git(), None);
+    }
+
+    #[test]
+    fn concurrent_saves_keep_both_changes() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.insert("b.rs".into(), entry("bb", &["b1"], 2));
+        manifest.save(tmp.path()).unwrap();
+
+        // Two processes load the same state, then save in turn
+        let mut first = Manifest::load(tmp.path()).unwrap();
+        let mut second = Manifest::load(tmp.path()).unwrap();
+        first.insert("c.rs".into(), entry("cc", &["c1"], 3));
+        first.remove("a.rs");
+        first.compact(tmp.path()).unwrap();
+        second.insert("d.rs".into(), entry("dd", &["d1"], 4));
+        second.save(tmp.path()).unwrap();
+        first.insert("e.rs".into(), entry("ee", &["e1"], 5));
+        first.save(tmp.path()).unwrap();
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        let mut paths: Vec<&str> = loaded.paths().collect();
+        paths.sort();
+        assert_eq!(paths, vec!["b.rs", "c.rs", "d.rs", "e.rs"]);
+        assert_eq!(loaded.get("d.rs"), Some(entry("dd", &["d1"], 4)));
+    }
+
+    #[test]
+    fn torn_journal_tail_is_ignored_and_overwritten() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.save(tmp.path()).unwrap();
+        manifest.insert("b.rs".into(), entry("bb", &["b1"], 2));
+        manifest.save(tmp.path()).unwrap();
+
+        let journal = tmp.path().join(JOURNAL_FILE);
+        let mut raw = std::fs::read(&journal).unwrap();
+        raw.extend_from_slice(&[OP_UPSERT, 9, 0]);
+        std::fs::write(&journal, &raw).unwrap();
+
+        let mut loaded = Manifest::load(tmp.path()).unwrap();
+        assert!(loaded.contains("b.rs"));
+        loaded.insert("c.rs".into(), entry("cc", &[], 3));
+        loaded.save(tmp.path()).unwrap();
+
+        let reloaded = Manifest::load(tmp.path()).unwrap();
+        assert!(reloaded.contains("b.rs"));
+        assert!(reloaded.contains("c.rs"));
+    }
+
+    #[test]
+    fn large_journal_compacts_into_base() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &[], 1));
+        manifest.save(tmp.path()).unwrap();
+
+        let long_block = "x".repeat(4096);
+        for round in 0..100 {
+            manifest.insert("a.rs".into(), entry("aa", &[&long_block], round));
+            manifest.save(tmp.path()).unwrap();
+        }
+
+        let journal_len = std::fs::metadata(tmp.path().join(JOURNAL_FILE))
+            .map(|m| m.len())
+            .unwrap_or(0);
+        assert!(journal_len <= JOURNAL_COMPACT_MIN + 8192);
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.stat("a.rs"), Some((99, 990)));
+    }
+
+    #[test]
+    fn migrates_version_10_json() {
+        let tmp = tempfile::tempdir().unwrap();
+        let json = serde_json::json!({
+            "version": 10,
+            "model": embedder::MODEL.version,
+            "files": {
+                "src/a.rs": {"hash": "aa", "blocks": ["a1"], "mtime": 5},
+            },
+        });
+        std::fs::write(tmp.path().join(LEGACY_JSON_FILE), json.to_string()).unwrap();
+        assert!(exists(tmp.path()));
+
+        let manifest = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(manifest.stat("src/a.rs"), Some((5, 0)));
+        assert!(tmp.path().join(MANIFEST_FILE).exists());
+        assert!(!tmp.path().join(LEGACY_JSON_FILE).exists());
+
+        let mut reloaded = Manifest::load(tmp.path()).unwrap();
+        let old = reloaded.get("src/a.rs").unwrap();
+        assert_eq!(old.blocks, vec!["a1"]);
+        assert!(reloaded.needs_backfill());
+
+        // Backfilled symbols go to the journal and end the backfill
+        reloaded.insert("src/a.rs".into(), with_symbols(old, &["main"]));
+        reloaded.save(tmp.path()).unwrap();
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert!(!loaded.needs_backfill());
+        assert_eq!(loaded.find_symbol("main").len(), 1);
+    }
+
+    #[test]
+    fn records_build_settings() {
+        let tmp = tempfile::tempdir().unwrap();
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), entry("aa", &["a1"], 1));
+        manifest.save(tmp.path()).unwrap();
+        assert_eq!(token_pool(tmp.path()), 1);
+
+        // A changed setting rewrites the base
+        let mut manifest = Manifest::load(tmp.path()).unwrap();
+        manifest.token_pool = 3;
+        manifest.save(tmp.path()).unwrap();
+        assert!(!tmp.path().join(JOURNAL_FILE).exists());
+
+        assert_eq!(token_pool(tmp.path()), 3);
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.token_pool, 3);
+        assert_eq!(loaded.get("a.rs"), Some(entry("aa", &["a1"], 1)));
+        assert_eq!(token_pool(&tmp.path().join("missing")), 1);
+    }
+
+    #[test]
+    fn symbols_roundtrip_and_index_names() {
+        let tmp = tempfile::tempdir().unwrap();
+        let a = with_symbols(
+            entry("aa", &["a1", "a2", "a3"], 1),
+            &["parse", "Lexer.next", ""],
+        );
+        let b = with_symbols(entry("bb", &["b1", "b2"], 2), &["run", "parse"]);
+        let mut manifest = Manifest::default();
+        manifest.insert("a.rs".into(), a.clone());
+        manifest.insert("b.rs".into(), b.clone());
+        manifest.save(tmp.path()).unwrap();
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.get("a.rs"), Some(a.clone()));
+        assert!(!loaded.needs_backfill());
+        assert_eq!(
+            names(loaded.find_symbol("parse")),
+            vec![
+                ("a.rs".to_string(), "parse".to_string()),
+                ("b.rs".to_string(), "parse".to_string())
+            ]
+        );
+        assert_eq!(loaded.find_symbol("Lexer.next")[0].1, a.symbols[1]);
+        assert!(loaded.find_symbol("missing").is_empty());
+        assert!(loaded.find_symbol("").is_empty());
+
+        // Journaled entries replace their base symbols
+        let mut manifest = loaded;
+        let c = with_symbols(entry("cc", &["c1"], 3), &["parse"]);
+        manifest.insert("c.rs".into(), c.clone());
+        manifest.insert(
+            "b.rs".into(),
+            with_symbols(entry("bb", &["b1"], 4), &["run"]),
+        );
+        manifest.save(tmp.path()).unwrap();
+        assert!(tmp.path().join(JOURNAL_FILE).exists());
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.get("c.rs"), Some(c));
+        assert_eq!(
+            names(loaded.find_symbol("parse")),
+            vec![
+                ("a.rs".to_string(), "parse".to_string()),
+                ("c.rs".to_string(), "parse".to_string())
+            ]
+        );
+    }
+
+    #[test]
+    fn references_come_from_token_index_and_journal() {
+        let tmp = tempfile::tempdir().unwrap();
+        let with_refs = |mut entry: FileEntry, refs: &[(&str, u32)]| {
+            entry.refs = refs.iter().map(|(t, c)| (t.to_string(), *c)).collect();
+            entry
+        };
+        let refs = |found: Option<Vec<(String, u32)>>| {
+            let mut found = found.unwrap();
+            found.sort();
+            found
+        };
+        let mut manifest = Manifest::default();
+        let a = with_refs(entry("aa", &["a1"], 1), &[("config", 1), ("parse", 2)]);
+        manifest.insert("src/a.rs".into(), a.clone());
+        manifest.insert(
+            "src/b.rs".into(),
+            with_refs(entry("bb", &["b1"], 2), &[("parse", 1)]),
+        );
+        manifest.insert(
+            "tests/c.rs".into(),
+            with_refs(entry("cc", &["c1"], 3), &[("parse", 1)]),
+        );
+        manifest.save(tmp.path()).unwrap();
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(loaded.get("src/a.rs"), Some(a));
+        assert_eq!(
+            refs(loaded.references("parse", None, 10)),
+            vec![
+                ("src/a.rs".to_string(), 2),
+                ("src/b.rs".to_string(), 1),
+                ("tests/c.rs".to_string(), 1)
+            ]
+        );
+        assert_eq!(refs(loaded.references("parse", Some("tests"), 10)).len(), 1);
+        assert_eq!(
+            refs(loaded.references("parse", Some("src/a.rs"), 10)).len(),
+            1
+        );
+        assert!(refs(loaded.references("parse", Some("sr"), 10)).is_empty());
+        assert!(refs(loaded.references("missing", None, 10)).is_empty());
+        assert!(loaded.references("parse", None, 3).is_none());
+
+        // Journaled entries replace their base references
+        let mut manifest = loaded;
+        manifest.insert(
+            "src/b.rs".into(),
+            with_refs(entry("bb", &["b1"], 4), &[("config", 1)]),
+        );
+        manifest.remove("tests/c.rs");
+        manifest.save(tmp.path()).unwrap();
+        assert!(tmp.path().join(JOURNAL_FILE).exists());
+
+        let loaded = Manifest::load(tmp.path()).unwrap();
+        assert_eq!(
+            refs(loaded.references("parse", None, 10)),
+            vec![("src/a.rs".to_string(), 2)]
+        );
+        assert_eq!(refs(loaded.references("config", None, 10)).len(), 2);
+    }
+
+    #[test]
+    fn rejects_older_json_with_files() {
+        let tmp = tempfile::tempdir().unwrap();
+        let json = serde_json::json!({
+            "version": 9,
+            "model": "old",
+            "files": {"a.rs": {"hash": "aa", "blocks": []}},
+        });
+        std::fs::write(tmp.path().join(LEGACY_JSON_FILE), json.to_string()).unwrap();
+
+        let err = Manifest::load(tmp.path()).err().unwrap();
+        assert!(err.to_string().contains("older version"));
     }
 }
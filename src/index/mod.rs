@@ -1,73 +1,559 @@
+pub mod archive;
+mod bytes;
+pub mod checkpoint;
+pub mod content;
+pub mod filter;
+pub mod fusion;
+pub mod git;
+pub mod heartbeat;
 pub mod manifest;
+pub mod prune;
+pub mod query_cache;
+pub mod shard;
+pub mod symbols;
 pub mod walker;
+pub mod xref;
 
-use std::collections::HashMap;
-use std::collections::hash_map::Entry;
+use std::collections::{HashMap, HashSet};
 use std::path::{Path, PathBuf};
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
 
 use anyhow::{Context, Result, bail};
 use rayon::prelude::*;
 
-use crate::embedder::{self, Embedder};
+use crate::embedder::{self, Embedder, LazyEmbedder, TokenizedDoc};
 use crate::extractor::Extractor;
 use crate::tokenize::split_identifiers;
+use crate::trace;
 use crate::types::{Block, IndexStats, SearchResult};
 use omendb::SearchOptions;
 
+use checkpoint::Checkpointer;
+use content::SourceReader;
+use filter::SearchFilter;
+use fusion::Fusion;
+use git::GitState;
 use manifest::{FileEntry, Manifest};
+use query_cache::QueryCache;
+use shard::ShardLayout;
+use symbols::Symbol;
+use xref::DOC_BLOCK_TYPES;
 
 pub const INDEX_DIR: &str = ".og";
 pub const VECTORS_DIR: &str = "vectors";
 
-/// Block types that are documentation, not code.
-const DOC_BLOCK_TYPES: &[&str] = &["text", "section"];
-
-/// When search scope filters results, over-fetch by this factor to compensate.
-const SCOPE_OVERFETCH: usize = 5;
-
-/// Bound WAL growth during bulk indexing without forcing tiny checkpoint batches.
+/// Blocks stored between build checkpoints. Bounds WAL growth and the work an
+/// interrupted build redoes, without forcing tiny checkpoint batches.
 const INDEX_FLUSH_INTERVAL_BLOCKS: usize = 20_000;
 
 /// Bound extracted blocks waiting for the embedder. Embedding is the slow stage,
 /// so a large queue mostly increases memory without improving throughput.
 const EXTRACTION_QUEUE_BOUND: usize = 64;
 
+/// Blocks buffered per embedder call (per session). The embedder sorts the
+/// window by token count before batching, so a wide window groups blocks of
+/// similar length and keeps padding low.
+const EMBED_WINDOW_BLOCKS: usize = 1024;
+
+/// Extraction output sent to the embedding consumer.
+struct ExtractedFile {
+    /// Tokenized blocks, or the tokenizer error that stops the build.
+    blocks: Result<Vec<PreparedBlock>>,
+    rel_path: String,
+    file_hash: String,
+    mtime: u64,
+    size: u64,
+    /// Worker time spent extracting and tokenizing this file.
+    extract_time: Duration,
+    tokenize_time: Duration,
+}
+
+impl ExtractedFile {
+    /// Extract `content`'s blocks and tokenize them. Runs on the extraction
+    /// workers, so the embed loop only assembles batches and runs the model.
+    fn prepare(
+        extractor: &mut Extractor,
+        embedder: &dyn Embedder,
+        rel_path: String,
+        content: &str,
+        file_hash: String,
+        mtime: u64,
+        size: u64,
+    ) -> Self {
+        let t0 = Instant::now();
+        let blocks = extractor.extract(&rel_path, content).unwrap_or_default();
+        let extract_time = t0.elapsed();
+
+        let t0 = Instant::now();
+        let blocks = blocks
+            .into_iter()
+            .map(|block| PreparedBlock::new(block, embedder))
+            .collect();
+        Self {
+            blocks,
+            rel_path,
+            file_hash,
+            mtime,
+            size,
+            extract_time,
+            tokenize_time: t0.elapsed(),
+        }
+    }
+
+    /// A file that could not be read as text.
+    fn unreadable(rel_path: String, mtime: u64, size: u64) -> Self {
+        Self {
+            blocks: Ok(Vec::new()),
+            rel_path,
+            file_hash: String::new(),
+            mtime,
+            size,
+            extract_time: Duration::ZERO,
+            tokenize_time: Duration::ZERO,
+        }
+    }
+}
+
 type ProgressFn = dyn Fn(usize, usize, &str);
 
+/// Order in which a build indexes files. An interrupted build keeps what it
+/// checkpointed, so files that go first are searchable first.
+#[derive(Debug, Clone, Default, PartialEq, Eq)]
+pub enum BuildOrder {
+    /// Path order.
+    #[default]
+    Path,
+    /// Most recently modified first.
+    Recent,
+    /// Files under this path first, then path order.
+    First(PathBuf),
+}
+
+impl BuildOrder {
+    /// Sort `items`; `key` gives each item's absolute path and mtime.
+    fn sort<T>(&self, items: &mut [T], key: impl Fn(&T) -> (&Path, u64)) {
+        match self {
+            Self::Path => items.sort_by(|a, b| key(a).0.cmp(key(b).0)),
+            Self::Recent => items.sort_by(|a, b| {
+                let ((path_a, mtime_a), (path_b, mtime_b)) = (key(a), key(b));
+                mtime_b.cmp(&mtime_a).then(path_a.cmp(path_b))
+            }),
+            Self::First(first) => items.sort_by(|a, b| {
+                let (path_a, path_b) = (key(a).0, key(b).0);
+                let (later_a, later_b) = (!path_a.starts_with(first), !path_b.starts_with(first));
+                later_a.cmp(&later_b).then(path_a.cmp(path_b))
+            }),
+        }
+    }
+}
+
 /// Manages semantic search index using omendb.
 pub struct SemanticIndex {
     root: PathBuf,
     index_dir: PathBuf,
     vectors_path: String,
     search_scope: Option<String>,
-    embedder: Box<dyn Embedder>,
+    search_filter: SearchFilter,
+    fusion: Fusion,
+    build_order: BuildOrder,
+    /// Token pool factor builds store new blocks with (1 = every token).
+    token_pool: u8,
+    /// Loaded on first embed, shared with the shards.
+    embedder: LazyEmbedder,
+    /// Store kept open across calls by long-lived callers (`og serve`).
+    warm_store: Option<omendb::VectorStore>,
+    /// Manifest read by searches, reloaded when its generation changes.
+    manifest: Mutex<Option<(manifest::Generation, Arc<Manifest>)>>,
+    /// Kept for the index's lifetime so its counters are batched.
+    query_cache: QueryCache,
+    /// Layout of a sharded root; `shards` holds one index per layout shard.
+    shard_layout: Option<ShardLayout>,
+    shards: Vec<SemanticIndex>,
+}
+
+/// How much of the index a search filter lets through.
+struct FilterMatch {
+    /// Blocks in files passing the filter.
+    blocks: usize,
+    /// Blocks in the index.
+    total: usize,
+    /// IDs of the passing blocks, when there are at most
+    /// `filter::EXACT_SCORE_MAX` of them.
+    ids: Option<Vec<String>>,
+}
+
+/// Result of re-checking files whose metadata changed.
+#[derive(Default)]
+struct StaleCheck {
+    /// Content differs from the manifest: path -> (content, mtime).
+    changed: HashMap<PathBuf, (String, u64)>,
+    /// Indexed files no longer on disk (rel paths).
+    deleted: Vec<String>,
+    /// Same content, new metadata: (rel_path, mtime, size).
+    touched: Vec<(String, u64, u64)>,
+    /// Binary or unreadable now: (rel_path, mtime, size).
+    unreadable: Vec<(String, u64, u64)>,
+}
+
+impl StaleCheck {
+    fn is_empty(&self) -> bool {
+        self.changed.is_empty()
+            && self.deleted.is_empty()
+            && self.touched.is_empty()
+            && self.unreadable.is_empty()
+    }
+}
+
+/// What may have changed under an index root since its last update.
+pub enum TreeChanges {
+    /// Every eligible file under the root, from a full walk.
+    All(HashMap<PathBuf, walker::FileMetadata>),
+    /// Only the paths git lists as changed since the recorded state.
+    Listed {
+        /// Eligible files among them that exist now.
+        present: HashMap<PathBuf, walker::FileMetadata>,
+        /// Paths whose indexed files are dropped unless in `present`.
+        gone: Vec<PathBuf>,
+        /// Files changed by commits, hashed whatever their stat says.
+        committed: HashSet<PathBuf>,
+    },
+}
+
+/// A freshness check of an index root (`SemanticIndex::scan_tree`): what
+/// changed, and the git state to record once the index is up to date.
+pub struct TreeScan {
+    pub changes: TreeChanges,
+    pub git: Option<GitState>,
+}
+
+enum FileCheck {
+    Changed(PathBuf, String, u64),
+    Touched(String, u64, u64),
+    Unreadable(String, u64, u64),
 }
 
 struct PreparedBlock {
-    text: String,
+    /// Content address of the embedding: model version + embedding text.
+    key: String,
+    /// Embedding text split for the BM25 index.
+    bm25_text: String,
+    /// Model input, tokenized on the extraction workers.
+    input: TokenizedDoc,
     block: Block,
+    /// Token embeddings reused from a previous version of the block.
+    cached: Option<Vec<Vec<f32>>>,
+}
+
+impl PreparedBlock {
+    fn new(block: Block, embedder: &dyn Embedder) -> Result<Self> {
+        let text = block.embedding_text();
+        Ok(Self {
+            key: embed_key(&text),
+            bm25_text: split_identifiers(&text),
+            input: embedder.tokenize_document(&text)?,
+            block,
+            cached: None,
+        })
+    }
+}
+
+/// Embeddings of blocks about to be replaced, by content address, so blocks
+/// that only moved (new line numbers, same text) skip the model.
+#[derive(Default)]
+struct EmbedCache {
+    /// Embed key -> block ID still in the store.
+    by_key: HashMap<String, String>,
+    /// Rel path -> block IDs to delete once the new blocks are extracted.
+    old_blocks: HashMap<String, Vec<String>>,
+}
+
+impl EmbedCache {
+    fn add_file(&mut self, store: &omendb::VectorStore, rel_path: &str, block_ids: &[String]) {
+        for id in block_ids {
+            let key = store
+                .get_metadata_by_id(id)
+                .and_then(|meta| meta.get("embed")?.as_str().map(str::to_string));
+            if let Some(key) = key {
+                self.by_key.entry(key).or_insert_with(|| id.clone());
+            }
+        }
+        self.old_blocks
+            .insert(rel_path.to_string(), block_ids.to_vec());
+    }
+
+    /// Fill in cached embeddings for `prepared`, then delete the file's old
+    /// blocks. Returns how many were deleted.
+    fn take_file(
+        &mut self,
+        store: &omendb::VectorStore,
+        rel_path: &str,
+        prepared: &mut [PreparedBlock],
+    ) -> usize {
+        if !self.by_key.is_empty() {
+            for p in prepared.iter_mut() {
+                let Some(id) = self.by_key.get(&p.key) else {
+                    continue;
+                };
+                // A block that can't be read back is embedded again
+                p.cached = store.get_tokens(id).ok().map(|(tokens, _)| tokens);
+            }
+        }
+        self.delete(store, rel_path)
+    }
+
+    /// Delete a file's old blocks and forget them as cache entries: a new
+    /// block may reuse one of their IDs.
+    fn delete(&mut self, store: &omendb::VectorStore, rel_path: &str) -> usize {
+        let Some(ids) = self.old_blocks.remove(rel_path) else {
+            return 0;
+        };
+        for id in &ids {
+            let _ = store.delete(id);
+        }
+        if !self.by_key.is_empty() {
+            let gone: HashSet<&str> = ids.iter().map(String::as_str).collect();
+            self.by_key.retain(|_, id| !gone.contains(id.as_str()));
+        }
+        ids.len()
+    }
 }
 
 impl SemanticIndex {
-    pub fn new(root: &Path, search_scope: Option<&Path>) -> Result<Self> {
+    /// The model is not loaded until something needs an embedding.
+    pub fn new(root: &Path, search_scope: Option<&Path>) -> Self {
+        Self::with_lazy_embedder(root, search_scope, LazyEmbedder::new(1))
+    }
+
+    /// Construct for bulk indexing, with `sessions` embedder sessions running
+    /// batches in parallel.
+    pub fn for_build(root: &Path, sessions: usize) -> Self {
+        Self::with_lazy_embedder(root, None, LazyEmbedder::new(sessions))
+    }
+
+    /// Construct with an already-loaded embedder, shared across index roots.
+    pub fn with_embedder(
+        root: &Path,
+        search_scope: Option<&Path>,
+        embedder: Arc<dyn Embedder>,
+    ) -> Self {
+        Self::with_lazy_embedder(root, search_scope, LazyEmbedder::loaded(embedder))
+    }
+
+    /// Construct with an embedder loaded on first use, which clones share.
+    /// Lets several index roots load the model once, and only if a query
+    /// misses the query cache.
+    pub fn with_lazy_embedder(
+        root: &Path,
+        search_scope: Option<&Path>,
+        embedder: LazyEmbedder,
+    ) -> Self {
         let root = root.canonicalize().unwrap_or_else(|_| root.to_path_buf());
         let index_dir = root.join(INDEX_DIR);
-        let vectors_path = index_dir.join(VECTORS_DIR).to_string_lossy().into_owned();
-        let scope = Self::compute_scope(&root, search_scope);
-        let embedder = embedder::create_embedder()?;
+        let mut index = Self::in_dir(root, index_dir, embedder);
+        index.set_search_scope(search_scope);
 
-        Ok(Self {
+        if let Some(layout) = ShardLayout::load(&index.index_dir) {
+            let shards = layout
+                .shards
+                .iter()
+                .map(|shard| {
+                    let dir = shard::shard_dir(&index.index_dir, &shard.name);
+                    let mut shard = Self::in_dir(index.root.clone(), dir, index.embedder.clone());
+                    shard.search_scope = index.search_scope.clone();
+                    shard
+                })
+                .collect();
+            index.shards = shards;
+            index.shard_layout = Some(layout);
+        }
+        index
+    }
+
+    /// Construct for building one shard of the sharded index at `root`.
+    /// Paths stay relative to `root`; the shard has its own index dir.
+    pub fn for_shard(root: &Path, name: &str, embedder: LazyEmbedder) -> Self {
+        let root = root.canonicalize().unwrap_or_else(|_| root.to_path_buf());
+        let dir = shard::shard_dir(&root.join(INDEX_DIR), name);
+        Self::in_dir(root, dir, embedder)
+    }
+
+    fn in_dir(root: PathBuf, index_dir: PathBuf, embedder: LazyEmbedder) -> Self {
+        let vectors_path = index_dir.join(VECTORS_DIR).to_string_lossy().into_owned();
+        let token_pool = manifest::token_pool(&index_dir);
+        let query_cache = QueryCache::new(&index_dir);
+        Self {
             root,
             index_dir,
             vectors_path,
-            search_scope: scope,
+            search_scope: None,
+            search_filter: SearchFilter::default(),
+            fusion: Fusion::from_env(),
+            build_order: BuildOrder::default(),
+            token_pool,
             embedder,
-        })
+            warm_store: None,
+            manifest: Mutex::new(None),
+            query_cache,
+            shard_layout: None,
+            shards: Vec::new(),
+        }
+    }
+
+    pub fn root(&self) -> &Path {
+        &self.root
+    }
+
+    pub fn index_dir(&self) -> &Path {
+        &self.index_dir
+    }
+
+    /// Keep the vector store open for subsequent reads.
+    /// Must be released before any write path (`check_and_update`, `index`, ...).
+    pub fn open_warm_store(&mut self) -> Result<()> {
+        if self.is_sharded() {
+            for shard in self.shards.iter_mut().filter(|s| s.is_live()) {
+                shard.open_warm_store()?;
+            }
+            return Ok(());
+        }
+        if self.warm_store.is_none() {
+            self.warm_store = Some(self.open_store()?);
+        }
+        Ok(())
+    }
+
+    /// Drop the warm store so writers (or another process) can open it.
+    pub fn release_store(&mut self) {
+        self.warm_store = None;
+        for shard in &mut self.shards {
+            shard.release_store();
+        }
+    }
+
+    pub fn has_warm_store(&self) -> bool {
+        if self.is_sharded() {
+            return self
+                .shards
+                .iter()
+                .filter(|s| s.is_live())
+                .all(|s| s.has_warm_store());
+        }
+        self.warm_store.is_some()
+    }
+
+    pub fn is_sharded(&self) -> bool {
+        self.shard_layout.is_some()
+    }
+
+    pub fn shard_count(&self) -> usize {
+        self.shards.len()
+    }
+
+    /// Shards a running `og build` is writing. Searches and updates skip them
+    /// until it finishes.
+    pub fn building_shards(&self) -> Vec<&str> {
+        let Some(layout) = &self.shard_layout else {
+            return Vec::new();
+        };
+        layout
+            .shards
+            .iter()
+            .zip(&self.shards)
+            .filter(|(_, index)| checkpoint::is_building(&index.index_dir))
+            .map(|(shard, _)| shard.name.as_str())
+            .collect()
+    }
+
+    /// The index holding files under `path`: this one, or for a sharded index
+    /// the one shard covering it. `None` if `path` spans several shards.
+    pub fn index_for(&self, path: &Path) -> Option<&SemanticIndex> {
+        let Some(layout) = &self.shard_layout else {
+            return Some(self);
+        };
+        let scope = Self::compute_scope(&self.root, Some(path));
+        match layout.covering(scope.as_deref()).as_slice() {
+            [i] => Some(&self.shards[*i]),
+            _ => None,
+        }
+    }
+
+    /// An indexed shard not being rebuilt.
+    fn is_live(&self) -> bool {
+        self.is_indexed() && !checkpoint::is_building(&self.index_dir)
+    }
+
+    /// Split `files` by owning shard. Shards being rebuilt are left out.
+    fn partition<V: Clone>(
+        &self,
+        files: &HashMap<PathBuf, V>,
+    ) -> Vec<(&SemanticIndex, HashMap<PathBuf, V>)> {
+        let Some(layout) = &self.shard_layout else {
+            return Vec::new();
+        };
+        let mut parts = vec![HashMap::new(); self.shards.len()];
+        for (path, value) in files {
+            parts[layout.assign(&self.to_relative(path))].insert(path.clone(), value.clone());
+        }
+        self.shards
+            .iter()
+            .zip(parts)
+            .filter(|(shard, _)| !checkpoint::is_building(&shard.index_dir))
+            .collect()
+    }
+
+    /// Run `f` against the warm store, or a freshly opened one.
+    pub fn with_store<T>(&self, f: impl FnOnce(&omendb::VectorStore) -> Result<T>) -> Result<T> {
+        match &self.warm_store {
+            Some(store) => f(store),
+            None => f(&self.open_store()?),
+        }
     }
 
     /// Set search scope after construction (for reusing a single instance).
     pub fn set_search_scope(&mut self, search_scope: Option<&Path>) {
         self.search_scope = Self::compute_scope(&self.root, search_scope);
+        for shard in &mut self.shards {
+            shard.search_scope = self.search_scope.clone();
+        }
+    }
+
+    /// Set the type/exclude filter applied by `search`.
+    pub fn set_search_filter(&mut self, filter: SearchFilter) {
+        self.search_filter = filter;
+    }
+
+    /// Set the order in which builds index files.
+    pub fn set_build_order(&mut self, order: BuildOrder) {
+        self.build_order = order;
+    }
+
+    /// Token pool factor new blocks are stored with.
+    pub fn token_pool(&self) -> u8 {
+        self.token_pool
+    }
+
+    /// Pool each new block's token embeddings to about `1 / factor` of their
+    /// count before storing them (see `prune::pool`). Stored blocks can't be
+    /// re-pooled, so changing it for an existing index needs a full rebuild;
+    /// the caller clears the index first.
+    pub fn set_token_pool(&mut self, factor: u8) {
+        self.token_pool = factor.clamp(1, prune::MAX_POOL_FACTOR);
+    }
+
+    /// Read the snapshot a running build published at its last checkpoint
+    /// instead of the index it is writing. False if there is none yet.
+    pub fn use_build_snapshot(&mut self) -> bool {
+        let Some(dir) = checkpoint::snapshot_dir(&self.index_dir) else {
+            return false;
+        };
+        self.vectors_path = dir.join(VECTORS_DIR).to_string_lossy().into_owned();
+        self.token_pool = manifest::token_pool(&dir);
+        self.query_cache = QueryCache::new(&dir);
+        self.index_dir = dir;
+        self.warm_store = None;
+        self.manifest = Mutex::new(None);
+        true
     }
 
     fn compute_scope(root: &Path, search_scope: Option<&Path>) -> Option<String> {
@@ -88,48 +574,60 @@ impl SemanticIndex {
         batch: &mut Vec<PreparedBlock>,
         store: &mut omendb::VectorStore,
         stats: &mut IndexStats,
-        pending_store_ops: &mut usize,
+        checkpoint: &mut Checkpointer,
     ) -> Result<()> {
         if batch.is_empty() {
             return Ok(());
         }
 
-        // Sort by text length for better padding efficiency in ONNX
-        batch.sort_by_key(|p| p.text.len());
-
-        let texts: Vec<&str> = batch.iter().map(|p| p.text.as_str()).collect();
-        let token_embeddings = self.embedder.embed_documents(&texts)?;
-
-        for (idx, token_emb) in token_embeddings.embeddings.iter().enumerate() {
-            let p = &batch[idx];
+        // The embedder sorts the window by token count and batches by padded
+        // tokens; results come back in window order, so store writes stay in
+        // extraction order.
+        let inputs: Vec<TokenizedDoc> = batch
+            .iter_mut()
+            .filter(|p| p.cached.is_none())
+            .map(|p| std::mem::take(&mut p.input))
+            .collect();
+        let mut embedded = if inputs.is_empty() {
+            Vec::new().into_iter()
+        } else {
+            let t0 = Instant::now();
+            let token_embeddings = self.embedder.get()?.embed_tokenized(&inputs)?;
+            stats.timings.infer += t0.elapsed();
+            stats.tokens += token_embeddings.tokens;
+            stats.padded_tokens += token_embeddings.padded_tokens;
+            token_embeddings.embeddings.into_iter()
+        };
 
-            let tokens: Vec<Vec<f32>> = token_emb
-                .rows()
-                .into_iter()
-                .take(embedder::MAX_STORED_TOKENS)
-                .map(|r| r.to_vec())
-                .collect();
+        let t0 = Instant::now();
 
-            let metadata = serde_json::json!({
-                "file": p.block.file,
-                "type": p.block.block_type,
-                "name": p.block.name,
-                "start_line": p.block.start_line,
-                "end_line": p.block.end_line,
-                "content": p.block.content,
-                "skeleton": p.block.skeleton,
-            });
+        for p in batch.iter_mut() {
+            let tokens: Vec<Vec<f32>> = match p.cached.take() {
+                Some(tokens) => {
+                    stats.cached += 1;
+                    tokens
+                }
+                None => {
+                    let rows = embedded
+                        .next()
+                        .context("Embedder returned fewer embeddings than texts")?
+                        .rows()
+                        .into_iter()
+                        .map(|r| r.to_vec())
+                        .collect();
+                    let tokens = prune::pool(rows, self.token_pool, embedder::MAX_STORED_TOKENS);
+                    stats.stored_tokens += tokens.len();
+                    tokens
+                }
+            };
 
-            let bm25_text = split_identifiers(&p.text);
-            store.store_with_text(&p.block.id, tokens, &bm25_text, metadata)?;
+            let mut metadata = content::block_metadata(&p.block);
+            metadata["embed"] = serde_json::json!(p.key);
+            store.store_with_text(&p.block.id, tokens, &p.bm25_text, metadata)?;
             stats.blocks += 1;
-            *pending_store_ops += 1;
-
-            if *pending_store_ops >= INDEX_FLUSH_INTERVAL_BLOCKS {
-                store.flush()?;
-                *pending_store_ops = 0;
-            }
         }
+        checkpoint.stored(batch.len());
+        stats.timings.store += t0.elapsed();
 
         batch.clear();
         Ok(())
@@ -152,28 +650,31 @@ impl SemanticIndex {
         std::fs::create_dir_all(&self.index_dir)?;
         let mut manifest = Manifest::load(&self.index_dir)?;
         manifest.model = embedder::MODEL.version.to_string();
+        manifest.token_pool = self.token_pool;
         let mut stats = IndexStats::default();
 
         // Open omendb multi-vector store
         let mut store = self.open_or_create_store()?;
         store.enable_text_search()?;
+        if checkpoint::interrupted(&self.index_dir) {
+            checkpoint::recover(&self.index_dir, &store, &mut manifest)?;
+        }
 
         // Identify files needing processing (borrow content, don't clone)
-        let mut to_process: Vec<(&Path, &str, String, String, u64)> = Vec::new();
+        let mut cache = EmbedCache::default();
+        let mut to_process: Vec<(&Path, &str, String, String, u64, u64)> = Vec::new();
         for (path, (content, mtime)) in files {
             let rel_path = self.to_relative(path);
             let file_hash = hash_content(content);
 
-            if let Some(entry) = manifest.files.get(&rel_path) {
+            if let Some(entry) = manifest.get(&rel_path) {
                 if entry.hash == file_hash {
                     stats.skipped += 1;
                     continue;
                 }
-                // Delete old blocks
-                for block_id in &entry.blocks {
-                    let _ = store.delete(block_id);
-                }
-                stats.deleted += entry.blocks.len();
+                // Old blocks stay in the store until the new ones are
+                // extracted, so unchanged blocks can reuse their embeddings
+                cache.add_file(&store, &rel_path, &entry.blocks);
             }
 
             to_process.push((
@@ -182,43 +683,56 @@ impl SemanticIndex {
                 rel_path,
                 file_hash,
                 *mtime,
+                content.len() as u64,
             ));
         }
 
         if to_process.is_empty() {
-            if stats.deleted > 0 {
-                store.flush()?;
-            }
             return Ok(stats);
         }
+        self.build_order
+            .sort(&mut to_process, |(path, _, _, _, mtime, _)| (*path, *mtime));
 
         store.flush()?;
 
         // Extract blocks in parallel, streaming via mpsc to the embedder thread
-        let (tx, rx) = std::sync::mpsc::sync_channel::<(Vec<Block>, String, String, u64)>(
-            EXTRACTION_QUEUE_BOUND,
-        );
+        let (tx, rx) = std::sync::mpsc::sync_channel::<ExtractedFile>(EXTRACTION_QUEUE_BOUND);
 
         let to_process_len = to_process.len();
 
         let mut batch_buffer: Vec<PreparedBlock> = Vec::new();
-        let batch_size = embedder::MODEL.batch_size;
+        let embedder = &**self.embedder.get()?;
+        let window = EMBED_WINDOW_BLOCKS * embedder.parallelism();
         let mut processed_files = 0;
-        let mut pending_store_ops = 0usize;
+        let mut checkpoint = Checkpointer::start(&self.index_dir)?;
 
         std::thread::scope(|s| {
-            // Spawn producer thread for parallel extraction
+            // Spawn producer thread for parallel extraction and tokenization
+            // Bridged so workers take files in build order
             s.spawn(move || {
-                to_process.into_par_iter().for_each_init(
+                to_process.into_iter().par_bridge().for_each_init(
                     Extractor::new,
-                    |extractor, (_path, content, rel_path, file_hash, mtime)| {
-                        let blocks = extractor.extract(&rel_path, content).unwrap_or_default();
-                        let _ = tx.send((blocks, rel_path, file_hash, mtime));
+                    |extractor, (_path, content, rel_path, file_hash, mtime, size)| {
+                        let _ = tx.send(ExtractedFile::prepare(
+                            extractor, embedder, rel_path, content, file_hash, mtime, size,
+                        ));
                     },
                 );
             });
 
-            for (blocks, rel_path, file_hash, mtime) in rx {
+            for file in rx {
+                let ExtractedFile {
+                    blocks,
+                    rel_path,
+                    file_hash,
+                    mtime,
+                    size,
+                    extract_time,
+                    tokenize_time,
+                } = file;
+                let mut blocks = blocks?;
+                stats.timings.extract += extract_time;
+                stats.timings.tokenize += tokenize_time;
                 processed_files += 1;
 
                 if let Some(progress) = on_progress {
@@ -232,52 +746,65 @@ impl SemanticIndex {
                 if blocks.is_empty() {
                     stats.errors += 1;
                     // Even if empty, record it so we don't re-process
-                    manifest.files.insert(
+                    checkpoint.add(
                         rel_path.clone(),
                         FileEntry {
                             hash: file_hash.clone(),
-                            blocks: Vec::new(),
                             mtime,
+                            size,
+                            ..FileEntry::default()
                         },
-                    );
+                    )?;
+                    stats.deleted += cache.delete(&store, &rel_path);
                     continue;
                 }
 
                 stats.files += 1;
 
-                manifest.files.insert(
+                checkpoint.add(
                     rel_path.clone(),
                     FileEntry {
                         hash: file_hash.clone(),
-                        blocks: blocks.iter().map(|b| b.id.clone()).collect(),
+                        blocks: blocks.iter().map(|p| p.block.id.clone()).collect(),
                         mtime,
+                        size,
+                        symbols: blocks
+                            .iter()
+                            .map(|p| Symbol::from_block(&p.block))
+                            .collect(),
+                        refs: xref::file_refs(
+                            blocks
+                                .iter()
+                                .map(|p| (p.block.block_type.as_str(), p.block.content.as_str())),
+                        ),
                     },
-                );
+                )?;
+
+                stats.deleted += cache.take_file(&store, &rel_path, &mut blocks);
 
-                for block in blocks {
-                    let text = block.embedding_text();
-                    batch_buffer.push(PreparedBlock { text, block });
+                for p in blocks {
+                    batch_buffer.push(p);
 
-                    if batch_buffer.len() >= batch_size {
+                    if batch_buffer.len() >= window {
                         self.embed_batch(
                             &mut batch_buffer,
                             &mut store,
                             &mut stats,
-                            &mut pending_store_ops,
+                            &mut checkpoint,
                         )?;
                     }
                 }
+
+                // Checkpoint between files, once everything journaled is stored
+                if checkpoint.due() {
+                    self.embed_batch(&mut batch_buffer, &mut store, &mut stats, &mut checkpoint)?;
+                    checkpoint.commit(&store, &mut manifest)?;
+                }
             }
 
             // Flush remaining items
-            self.embed_batch(
-                &mut batch_buffer,
-                &mut store,
-                &mut stats,
-                &mut pending_store_ops,
-            )?;
-            store.flush()?;
-            manifest.save(&self.index_dir)?;
+            self.embed_batch(&mut batch_buffer, &mut store, &mut stats, &mut checkpoint)?;
+            checkpoint.finish(&store, &mut manifest)?;
 
             if let Some(progress) = on_progress {
                 progress(to_process_len, to_process_len, "Done");
@@ -286,6 +813,7 @@ impl SemanticIndex {
             Ok::<(), anyhow::Error>(())
         })?;
 
+        trace_stats(&stats);
         Ok(stats)
     }
 
@@ -305,51 +833,70 @@ impl SemanticIndex {
         std::fs::create_dir_all(&self.index_dir)?;
         let mut manifest = Manifest::load(&self.index_dir)?;
         manifest.model = embedder::MODEL.version.to_string();
+        manifest.token_pool = self.token_pool;
         let mut stats = IndexStats::default();
 
         let mut store = self.open_or_create_store()?;
         store.enable_text_search()?;
+        if checkpoint::interrupted(&self.index_dir) {
+            checkpoint::recover(&self.index_dir, &store, &mut manifest)?;
+        }
         store.flush()?;
 
-        let to_process: Vec<(PathBuf, u64)> = files
+        let mut to_process: Vec<(PathBuf, u64, u64)> = files
             .iter()
-            .map(|(path, &(_size, mtime))| (path.clone(), mtime))
+            .map(|(path, &(size, mtime))| (path.clone(), size, mtime))
             .collect();
 
         if to_process.is_empty() {
             return Ok(stats);
         }
+        self.build_order
+            .sort(&mut to_process, |(path, _, mtime)| (path.as_path(), *mtime));
 
         let root = self.root.clone();
         let to_process_len = to_process.len();
-        let (tx, rx) = std::sync::mpsc::sync_channel::<(Vec<Block>, String, String, u64)>(
-            EXTRACTION_QUEUE_BOUND,
-        );
+        let (tx, rx) = std::sync::mpsc::sync_channel::<ExtractedFile>(EXTRACTION_QUEUE_BOUND);
 
         let mut batch_buffer: Vec<PreparedBlock> = Vec::new();
-        let batch_size = embedder::MODEL.batch_size;
+        let embedder = &**self.embedder.get()?;
+        let window = EMBED_WINDOW_BLOCKS * embedder.parallelism();
         let mut processed_files = 0;
-        let mut pending_store_ops = 0usize;
+        let mut checkpoint = Checkpointer::start(&self.index_dir)?;
 
         std::thread::scope(|s| {
+            // Bridged so workers take files in build order
             s.spawn(move || {
-                to_process.into_par_iter().for_each_init(
+                to_process.into_iter().par_bridge().for_each_init(
                     Extractor::new,
-                    |extractor, (path, mtime)| {
+                    |extractor, (path, size, mtime)| {
                         let rel_path = relative_to(&root, &path);
                         let Some((content, mtime)) = walker::read_text(&path, mtime) else {
-                            let _ = tx.send((Vec::new(), rel_path, String::new(), mtime));
+                            let _ = tx.send(ExtractedFile::unreadable(rel_path, mtime, size));
                             return;
                         };
 
                         let file_hash = hash_content(&content);
-                        let blocks = extractor.extract(&rel_path, &content).unwrap_or_default();
-                        let _ = tx.send((blocks, rel_path, file_hash, mtime));
+                        let _ = tx.send(ExtractedFile::prepare(
+                            extractor, embedder, rel_path, &content, file_hash, mtime, size,
+                        ));
                     },
                 );
             });
 
-            for (blocks, rel_path, file_hash, mtime) in rx {
+            for file in rx {
+                let ExtractedFile {
+                    blocks,
+                    rel_path,
+                    file_hash,
+                    mtime,
+                    size,
+                    extract_time,
+                    tokenize_time,
+                } = file;
+                let blocks = blocks?;
+                stats.timings.extract += extract_time;
+                stats.timings.tokenize += tokenize_time;
                 processed_files += 1;
 
                 if let Some(progress) = on_progress {
@@ -362,50 +909,60 @@ impl SemanticIndex {
 
                 if blocks.is_empty() {
                     stats.errors += 1;
-                    manifest.files.insert(
+                    checkpoint.add(
                         rel_path.clone(),
                         FileEntry {
                             hash: file_hash.clone(),
-                            blocks: Vec::new(),
                             mtime,
+                            size,
+                            ..FileEntry::default()
                         },
-                    );
+                    )?;
                     continue;
                 }
 
                 stats.files += 1;
-                manifest.files.insert(
+                checkpoint.add(
                     rel_path.clone(),
                     FileEntry {
                         hash: file_hash.clone(),
-                        blocks: blocks.iter().map(|b| b.id.clone()).collect(),
+                        blocks: blocks.iter().map(|p| p.block.id.clone()).collect(),
                         mtime,
+                        size,
+                        symbols: blocks
+                            .iter()
+                            .map(|p| Symbol::from_block(&p.block))
+                            .collect(),
+                        refs: xref::file_refs(
+                            blocks
+                                .iter()
+                                .map(|p| (p.block.block_type.as_str(), p.block.content.as_str())),
+                        ),
                     },
-                );
+                )?;
 
-                for block in blocks {
-                    let text = block.embedding_text();
-                    batch_buffer.push(PreparedBlock { text, block });
+                for p in blocks {
+                    batch_buffer.push(p);
 
-                    if batch_buffer.len() >= batch_size {
+                    if batch_buffer.len() >= window {
                         self.embed_batch(
                             &mut batch_buffer,
                             &mut store,
                             &mut stats,
-                            &mut pending_store_ops,
+                            &mut checkpoint,
                         )?;
                     }
                 }
+
+                // Checkpoint between files, once everything journaled is stored
+                if checkpoint.due() {
+                    self.embed_batch(&mut batch_buffer, &mut store, &mut stats, &mut checkpoint)?;
+                    checkpoint.commit(&store, &mut manifest)?;
+                }
             }
 
-            self.embed_batch(
-                &mut batch_buffer,
-                &mut store,
-                &mut stats,
-                &mut pending_store_ops,
-            )?;
-            store.flush()?;
-            manifest.save(&self.index_dir)?;
+            self.embed_batch(&mut batch_buffer, &mut store, &mut stats, &mut checkpoint)?;
+            checkpoint.finish(&store, &mut manifest)?;
 
             if let Some(progress) = on_progress {
                 progress(to_process_len, to_process_len, "Done");
@@ -414,91 +971,365 @@ impl SemanticIndex {
             Ok::<(), anyhow::Error>(())
         })?;
 
+        trace_stats(&stats);
         Ok(stats)
     }
 
     /// Hybrid search: semantic + BM25 with merged candidates.
     pub fn search(&self, query: &str, k: usize) -> Result<Vec<SearchResult>> {
-        let store = self.open_store()?;
+        let filter = self
+            .search_filter
+            .clone()
+            .with_scope(self.search_scope.clone());
+        if self.is_sharded() {
+            return self.search_shards(query, None, k, &filter);
+        }
+        self.with_store(|store| self.search_store(store, query, None, k, &filter))
+    }
 
-        let query_tokens = self.embedder.embed_query(query)?;
+    /// `search` with a query embedding computed by the caller, so one query
+    /// can be run against several index roots without embedding it again.
+    pub fn search_embedded(
+        &self,
+        query: &str,
+        query_tokens: &ndarray::Array2<f32>,
+        k: usize,
+    ) -> Result<Vec<SearchResult>> {
+        let filter = self
+            .search_filter
+            .clone()
+            .with_scope(self.search_scope.clone());
+        if self.is_sharded() {
+            return self.search_shards(query, Some(query_tokens), k, &filter);
+        }
+        self.with_store(|store| self.search_store(store, query, Some(query_tokens), k, &filter))
+    }
+
+    /// Hybrid search restricted to `search_scope` and `filter`, without
+    /// mutating the instance. Lets a shared index serve differently scoped
+    /// queries concurrently.
+    pub fn search_scoped(
+        &self,
+        query: &str,
+        k: usize,
+        search_scope: Option<&Path>,
+        filter: &SearchFilter,
+    ) -> Result<Vec<SearchResult>> {
+        let filter = filter
+            .clone()
+            .with_scope(Self::compute_scope(&self.root, search_scope));
+        if self.is_sharded() {
+            return self.search_shards(query, None, k, &filter);
+        }
+        self.with_store(|store| self.search_store(store, query, None, k, &filter))
+    }
+
+    /// Fan a search out to the shards the filter's scope can reach, in
+    /// parallel, and merge their top `k` by score. The query is embedded once.
+    fn search_shards(
+        &self,
+        query: &str,
+        query_tokens: Option<&ndarray::Array2<f32>>,
+        k: usize,
+        filter: &SearchFilter,
+    ) -> Result<Vec<SearchResult>> {
+        let shards = self.shards_in_scope(filter.scope());
+        trace::count("shards", shards.len() as u64);
+        if shards.is_empty() {
+            return Ok(Vec::new());
+        }
+
+        let embedded;
+        let query_tokens = match query_tokens {
+            Some(tokens) => tokens,
+            None => {
+                embedded = self.embed_query_cached(query)?;
+                &embedded
+            }
+        };
+        let per_shard = shards
+            .par_iter()
+            .map(|shard| {
+                shard.with_store(|store| {
+                    shard.search_store(store, query, Some(query_tokens), k, filter)
+                })
+            })
+            .collect::<Result<Vec<_>>>()?;
+        Ok(merge_top_k(per_shard, k))
+    }
+
+    /// Live shards that can hold files under the index-relative `scope`.
+    fn shards_in_scope(&self, scope: Option<&str>) -> Vec<&SemanticIndex> {
+        let Some(layout) = &self.shard_layout else {
+            return Vec::new();
+        };
+        layout
+            .covering(scope)
+            .into_iter()
+            .map(|i| &self.shards[i])
+            .filter(|shard| shard.is_live())
+            .collect()
+    }
+
+    /// Embed a query, reusing cached token embeddings from earlier runs.
+    /// Cache write failures (e.g. read-only index) fall back to plain inference.
+    pub fn embed_query_cached(&self, query: &str) -> Result<ndarray::Array2<f32>> {
+        let _span = trace::span("embed_query");
+        let cache = &self.query_cache;
+        if let Some(tokens) = cache.get(query) {
+            cache.record(true);
+            trace::count("query_cache_hits", 1);
+            return Ok(tokens);
+        }
+
+        let tokens = self.embedder.get()?.embed_query(query)?;
+        cache.record(false);
+        let _ = cache.put(query, &tokens);
+        Ok(tokens)
+    }
+
+    /// Query embedding cache for this index.
+    pub fn query_cache(&self) -> &QueryCache {
+        &self.query_cache
+    }
+
+    /// Search one store. `query_tokens` is the query's embedding when the
+    /// caller already has it (shard fan-out).
+    fn search_store(
+        &self,
+        store: &omendb::VectorStore,
+        query: &str,
+        query_tokens: Option<&ndarray::Array2<f32>>,
+        k: usize,
+        filter: &SearchFilter,
+    ) -> Result<Vec<SearchResult>> {
+        // Size the filter from the manifest alone, before the store is queried
+        let matched = if filter.is_empty() {
+            None
+        } else {
+            let matched = self.filter_candidates(filter)?;
+            if matched.blocks == 0 {
+                return Ok(Vec::new());
+            }
+            Some(matched)
+        };
+
+        let embedded;
+        let query_tokens = match query_tokens {
+            Some(tokens) => tokens,
+            None => {
+                embedded = self.embed_query_cached(query)?;
+                &embedded
+            }
+        };
         let tokens: Vec<Vec<f32>> = (0..query_tokens.nrows())
             .map(|r| query_tokens.row(r).to_vec())
             .collect();
         let token_refs: Vec<&[f32]> = tokens.iter().map(|v| v.as_slice()).collect();
+        let bm25_query = crate::synonyms::expand_query(&split_identifiers(query));
 
-        // Over-fetch more when scope filtering will discard results
-        let overfetch = if self.search_scope.is_some() {
-            SCOPE_OVERFETCH
-        } else {
-            1
+        // Few enough matching blocks: score exactly those, not the whole store
+        if let Some(matched) = matched.as_ref().filter(|m| m.ids.is_some()) {
+            return self.search_blocks(store, matched, &bm25_query, &token_refs, k, filter);
+        }
+
+        // Size the fetch by how much of the index passes the filter, and widen
+        // it, up to a small multiple of k, if the filtered ranking comes up short
+        let (mut search_k, max_k) = match &matched {
+            Some(m) => (
+                filter::fetch_k(k, m.blocks, m.total),
+                filter::max_fetch_k(k, m.total),
+            ),
+            None => (k, k),
         };
-        let search_k = k.saturating_mul(overfetch);
 
-        // Run both BM25+MaxSim and pure semantic search concurrently, merge by ID
-        let bm25_query = crate::synonyms::expand_query(&split_identifiers(query));
+        loop {
+            let ranked = self.hybrid_candidates(store, &bm25_query, &token_refs, search_k)?;
 
-        let (bm25_result, semantic_result) = rayon::join(
-            || {
-                store.search_multi_with_text(
-                    &bm25_query,
-                    &token_refs,
-                    search_k,
-                    Some(search_k),
-                    false,
-                )
-            },
-            || store.query_with_options(&token_refs, search_k, &SearchOptions::default()),
-        );
+            let mut hits: Vec<omendb::SearchResult> = if matched.is_some() {
+                ranked
+                    .into_iter()
+                    .filter(|r| filter.matches(result_file(&r.metadata)))
+                    .collect()
+            } else {
+                ranked
+            };
 
-        let bm25_results = bm25_result?;
-        let semantic_results = semantic_result?;
+            if hits.len() >= k || search_k >= max_k {
+                hits.truncate(k);
 
-        // Merge: keep higher score per ID
-        let mut best: HashMap<String, omendb::SearchResult> =
-            HashMap::with_capacity(bm25_results.len() + semantic_results.len());
+                // Content is read from source only for the results kept
+                let _span = trace::span("read_content");
+                let mut reader = SourceReader::new(&self.root);
+                return Ok(hits
+                    .iter()
+                    .map(|r| self.result_from_omendb(r, &mut reader))
+                    .collect());
+            }
 
-        let mut merge = |results: Vec<omendb::SearchResult>| {
-            for r in results {
-                match best.entry(r.id.clone()) {
-                    Entry::Occupied(mut e) => {
-                        if r.distance > e.get().distance {
-                            *e.get_mut() = r;
-                        }
-                    }
-                    Entry::Vacant(e) => {
-                        e.insert(r);
-                    }
-                }
+            search_k = search_k.saturating_mul(2).min(max_k);
+        }
+    }
+
+    /// Search a filter's matching blocks by exact MaxSim against their stored
+    /// tokens, fused with the lexical hits among them. Used when the filter
+    /// leaves few enough blocks that scoring them beats querying the store.
+    ///
+    /// Every matching block is scored once here, and a lexical hit carries
+    /// the same MaxSim score, so max fusion runs no BM25 query; rank fusion
+    /// still needs the lexical ranking.
+    fn search_blocks(
+        &self,
+        store: &omendb::VectorStore,
+        matched: &FilterMatch,
+        bm25_query: &str,
+        token_refs: &[&[f32]],
+        k: usize,
+        filter: &SearchFilter,
+    ) -> Result<Vec<SearchResult>> {
+        let ids = matched.ids.as_deref().unwrap_or_default();
+        let exact = || trace::time("exact_search", || score_blocks(store, ids, token_refs));
+        let (lexical, semantic) = match self.fusion {
+            Fusion::Max => (Ok(Vec::new()), exact()),
+            Fusion::Rrf => {
+                let lexical_k = filter::fetch_k(k, matched.blocks, matched.total);
+                rayon::join(
+                    || {
+                        trace::time("bm25_search", || {
+                            store.search_multi_with_text(
+                                bm25_query,
+                                token_refs,
+                                lexical_k,
+                                Some(lexical_k),
+                                false,
+                            )
+                        })
+                    },
+                    exact,
+                )
             }
         };
-        merge(bm25_results);
-        merge(semantic_results);
+        let lexical_hits = lexical?;
+        let lexical: Vec<(&str, f32)> = lexical_hits
+            .iter()
+            .filter(|r| filter.matches(result_file(&r.metadata)))
+            .map(|r| (r.id.as_str(), r.distance))
+            .collect();
+        trace::count("bm25_candidates", lexical.len() as u64);
+        trace::count("semantic_candidates", semantic.len() as u64);
+        trace::count("blocks_scored", (lexical.len() + semantic.len()) as u64);
 
-        let mut output = Vec::new();
-        for r in best.into_values() {
-            if let Some(scope) = &self.search_scope {
-                let file = r
-                    .metadata
-                    .get("file")
-                    .and_then(|v| v.as_str())
-                    .unwrap_or("");
-                let scope = scope.as_str();
-                if file != scope && !file.starts_with(&format!("{scope}/")) {
-                    continue;
+        let mut fused = trace::time("fuse", || {
+            fusion::fuse(vec![lexical, semantic], self.fusion, |r| r.0, |r| r.1)
+        });
+        trace::count("candidates", fused.len() as u64);
+        fused.truncate(k);
+
+        let _span = trace::span("read_content");
+        let mut reader = SourceReader::new(&self.root);
+        Ok(fused
+            .into_iter()
+            .filter_map(|((id, _), score)| {
+                store
+                    .get_metadata_by_id(id)
+                    .map(|meta| self.result_from_metadata(&meta, score, &mut reader))
+            })
+            .collect())
+    }
+
+    /// Retrieval stage: BM25+MaxSim and pure semantic candidates, fetched
+    /// concurrently and fused once into a single ranking, best first. The
+    /// fused score replaces `distance`. Each query scores its own candidates,
+    /// so a block both find is scored twice; omendb 0.0.37 has no query that
+    /// returns BM25 candidates unscored, for the union to be scored once.
+    fn hybrid_candidates(
+        &self,
+        store: &omendb::VectorStore,
+        bm25_query: &str,
+        token_refs: &[&[f32]],
+        search_k: usize,
+    ) -> Result<Vec<omendb::SearchResult>> {
+        let (bm25_result, semantic_result) = rayon::join(
+            || {
+                trace::time("bm25_search", || {
+                    store.search_multi_with_text(
+                        bm25_query,
+                        token_refs,
+                        search_k,
+                        Some(search_k),
+                        false,
+                    )
+                })
+            },
+            || {
+                trace::time("semantic_search", || {
+                    store.query_with_options(token_refs, search_k, &SearchOptions::default())
+                })
+            },
+        );
+        let (bm25, semantic) = (bm25_result?, semantic_result?);
+        trace::count("bm25_candidates", bm25.len() as u64);
+        trace::count("semantic_candidates", semantic.len() as u64);
+        trace::count("blocks_scored", (bm25.len() + semantic.len()) as u64);
+
+        let _span = trace::span("fuse");
+        let fused = fusion::fuse(
+            vec![bm25, semantic],
+            self.fusion,
+            |r| r.id.as_str(),
+            |r| r.distance,
+        );
+        trace::count("candidates", fused.len() as u64);
+        Ok(fused
+            .into_iter()
+            .map(|(mut r, score)| {
+                r.distance = score;
+                r
+            })
+            .collect())
+    }
+
+    /// How much of the index passes `filter`, from the manifest's block counts.
+    /// Block IDs are decoded only when few enough blocks match to score them
+    /// exactly.
+    fn filter_candidates(&self, filter: &SearchFilter) -> Result<FilterMatch> {
+        let _span = trace::span("filter");
+        let manifest = self.manifest()?;
+        let mut total = 0;
+        let mut blocks = 0;
+        let mut matching = Vec::new();
+        for (path, count) in manifest.block_counts() {
+            total += count;
+            if count > 0 && filter.matches(path) {
+                blocks += count;
+                if blocks <= filter::EXACT_SCORE_MAX {
+                    matching.push(path);
                 }
             }
-
-            output.push(self.result_from_omendb(&r));
         }
 
-        output.sort_by(|a, b| {
-            b.score
-                .partial_cmp(&a.score)
-                .unwrap_or(std::cmp::Ordering::Equal)
+        let ids = (blocks <= filter::EXACT_SCORE_MAX).then(|| {
+            matching
+                .into_iter()
+                .filter_map(|path| manifest.get(path))
+                .flat_map(|entry| entry.blocks)
+                .collect()
         });
-        output.truncate(k);
-        Ok(output)
+        Ok(FilterMatch { blocks, total, ids })
+    }
+
+    /// The manifest, reused across searches until a save changes it on disk.
+    fn manifest(&self) -> Result<Arc<Manifest>> {
+        let generation = manifest::generation(&self.index_dir);
+        let mut cached = self.manifest.lock().unwrap_or_else(|e| e.into_inner());
+        if let Some((loaded, manifest)) = cached.as_ref()
+            && *loaded == generation
+        {
+            return Ok(Arc::clone(manifest));
+        }
+        let manifest = Arc::new(Manifest::load(&self.index_dir)?);
+        *cached = Some((generation, Arc::clone(&manifest)));
+        Ok(manifest)
     }
 
     /// Find blocks similar to a given file/block.
@@ -509,12 +1340,43 @@ impl SemanticIndex {
         name: Option<&str>,
         k: usize,
     ) -> Result<Vec<SearchResult>> {
+        if let Some(layout) = &self.shard_layout {
+            // The target block comes from its file's shard; the neighbours
+            // from every shard in scope
+            let owner = &self.shards[layout.assign(&self.to_relative(Path::new(file_path)))];
+            let manifest = Manifest::load(&owner.index_dir)?;
+            let (tokens, exclude) = owner.with_store(|store| {
+                owner.similar_target(store, &manifest, file_path, line, name)
+            })?;
+            let per_shard = self
+                .shards_in_scope(self.search_scope.as_deref())
+                .par_iter()
+                .map(|shard| {
+                    shard.with_store(|store| shard.similar_in(store, &tokens, &exclude, k))
+                })
+                .collect::<Result<Vec<_>>>()?;
+            return Ok(merge_top_k(per_shard, k));
+        }
+
         let manifest = Manifest::load(&self.index_dir)?;
-        let store = self.open_store()?;
+        self.with_store(|store| {
+            let (tokens, exclude) = self.similar_target(store, &manifest, file_path, line, name)?;
+            self.similar_in(store, &tokens, &exclude, k)
+        })
+    }
 
+    /// Token embeddings of the block `find_similar` starts from, and the
+    /// block IDs of its file, which are left out of the results.
+    fn similar_target(
+        &self,
+        store: &omendb::VectorStore,
+        manifest: &Manifest,
+        file_path: &str,
+        line: Option<usize>,
+        name: Option<&str>,
+    ) -> Result<(Vec<Vec<f32>>, HashSet<String>)> {
         let rel_path = self.to_relative(&PathBuf::from(file_path));
         let entry = manifest
-            .files
             .get(&rel_path)
             .with_context(|| format!("File not in index: {rel_path}"))?;
 
@@ -522,31 +1384,46 @@ impl SemanticIndex {
             bail!("No blocks found in {rel_path}");
         }
 
-        // Find target block
-        let block_id = if let Some(name) = name {
-            find_block_by_name(&store, &entry.blocks, name)?
+        // Find target block. Manifests migrated from `manifest.json` fall
+        // back to store metadata until their next update.
+        let symbols = if entry.has_symbols() {
+            entry.symbols
+        } else {
+            symbols_from_store(store, &entry.blocks)
+        };
+        let target = if let Some(name) = name {
+            symbols::find_by_name(&symbols, name)?
         } else if let Some(line) = line {
-            find_block_by_line(&store, &entry.blocks, line)
-                .unwrap_or_else(|| entry.blocks[0].clone())
+            symbols::find_by_line(&symbols, line).unwrap_or(0)
         } else {
-            entry.blocks[0].clone()
+            0
         };
+        let block_id = &entry.blocks[target];
 
         // Get the block's token embeddings and search with MaxSim reranking
         let (query_tokens, _meta) = store
-            .get_tokens(&block_id)
+            .get_tokens(block_id)
             .with_context(|| "Could not retrieve block token embeddings")?;
+        Ok((query_tokens, entry.blocks.into_iter().collect()))
+    }
 
+    /// Blocks nearest to `query_tokens` by MaxSim, skipping `exclude`, doc
+    /// blocks and anything outside the search scope.
+    fn similar_in(
+        &self,
+        store: &omendb::VectorStore,
+        query_tokens: &[Vec<f32>],
+        exclude: &HashSet<String>,
+        k: usize,
+    ) -> Result<Vec<SearchResult>> {
         let token_refs: Vec<&[f32]> = query_tokens.iter().map(|v| v.as_slice()).collect();
-        let search_k = k.saturating_mul(3).saturating_add(entry.blocks.len());
+        let search_k = k.saturating_mul(3).saturating_add(exclude.len());
         let results = store.query_with_options(&token_refs, search_k, &SearchOptions::default())?;
 
-        let block_set: std::collections::HashSet<&str> =
-            entry.blocks.iter().map(|s| s.as_str()).collect();
-
+        let mut reader = SourceReader::new(&self.root);
         let mut output = Vec::new();
         for r in results {
-            if block_set.contains(r.id.as_str()) {
+            if exclude.contains(&r.id) {
                 continue;
             }
 
@@ -572,7 +1449,7 @@ impl SemanticIndex {
                 }
             }
 
-            output.push(self.result_from_omendb(&r));
+            output.push(self.result_from_omendb(&r, &mut reader));
 
             if output.len() >= k {
                 break;
@@ -584,13 +1461,16 @@ impl SemanticIndex {
 
     /// Check if index exists.
     pub fn is_indexed(&self) -> bool {
-        self.index_dir.join("manifest.json").exists()
+        manifest::exists(&self.index_dir) || self.shards.iter().any(|s| s.is_indexed())
     }
 
     /// Count indexed blocks.
     pub fn count(&self) -> Result<usize> {
+        if self.is_sharded() {
+            return self.shards.iter().map(|s| s.count()).sum();
+        }
         let manifest = Manifest::load(&self.index_dir)?;
-        Ok(manifest.files.values().map(|e| e.blocks.len()).sum())
+        Ok(manifest.iter().map(|(_, e)| e.blocks.len()).sum())
     }
 
     /// Get stale files by comparing content hashes against manifest.
@@ -607,129 +1487,539 @@ impl SemanticIndex {
             current_rel_files.insert(rel_path.clone());
             let file_hash = hash_content(content);
 
-            match manifest.files.get(&rel_path) {
+            match manifest.get(&rel_path) {
                 Some(entry) if entry.hash == file_hash => {}
                 _ => changed.push(path.clone()),
             }
         }
 
         let deleted: Vec<String> = manifest
-            .files
-            .keys()
+            .paths()
             .filter(|k| !current_rel_files.contains(*k))
-            .cloned()
+            .map(String::from)
             .collect();
 
         (changed, deleted)
     }
 
-    /// Compare file metadata against manifest mtimes.
+    /// Compare file metadata (mtime and size) against the manifest.
     /// Returns (maybe_changed paths, deleted rel_paths).
     fn mtime_diff(
         &self,
         metadata: &HashMap<PathBuf, walker::FileMetadata>,
         manifest: &Manifest,
     ) -> (Vec<PathBuf>, Vec<String>) {
-        let mut maybe_changed = Vec::new();
-        let mut current_rel_files = std::collections::HashSet::new();
-
-        for (path, &(_size, mtime)) in metadata {
-            let rel_path = self.to_relative(path);
-            current_rel_files.insert(rel_path.clone());
-
-            match manifest.files.get(&rel_path) {
-                Some(entry) if entry.mtime == mtime && mtime > 0 => {}
-                _ => maybe_changed.push(path.clone()),
-            }
-        }
+        let maybe_changed = self.stat_changed(metadata, manifest);
 
+        let current_rel_files: HashSet<String> =
+            metadata.keys().map(|p| self.to_relative(p)).collect();
         let deleted: Vec<String> = manifest
-            .files
-            .keys()
+            .paths()
             .filter(|k| !current_rel_files.contains(*k))
-            .cloned()
+            .map(String::from)
             .collect();
 
         (maybe_changed, deleted)
     }
 
+    /// Files that are new or whose mtime or size differ from the manifest.
+    fn stat_changed(
+        &self,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+        manifest: &Manifest,
+    ) -> Vec<PathBuf> {
+        let mut changed = Vec::new();
+        for (path, &(size, mtime)) in metadata {
+            match manifest.stat(&self.to_relative(path)) {
+                Some(stat) if stat == (mtime, size) && mtime > 0 => {}
+                _ => changed.push(path.clone()),
+            }
+        }
+        changed
+    }
+
     /// Fast staleness check using mtime only (no content reads).
     pub fn get_stale_files_fast(
         &self,
         metadata: &HashMap<PathBuf, walker::FileMetadata>,
     ) -> Result<(Vec<PathBuf>, Vec<String>)> {
+        if self.is_sharded() {
+            return self.stale_in_shards(metadata, Self::get_stale_files_fast);
+        }
         let manifest = Manifest::load(&self.index_dir)?;
         Ok(self.mtime_diff(metadata, &manifest))
     }
 
+    /// Combine a per-shard stale check over each shard's files.
+    fn stale_in_shards(
+        &self,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+        check: impl Fn(
+            &Self,
+            &HashMap<PathBuf, walker::FileMetadata>,
+        ) -> Result<(Vec<PathBuf>, Vec<String>)>,
+    ) -> Result<(Vec<PathBuf>, Vec<String>)> {
+        let (mut changed, mut deleted) = (Vec::new(), Vec::new());
+        for (shard, files) in self.partition(metadata) {
+            let (c, d) = check(shard, &files)?;
+            changed.extend(c);
+            deleted.extend(d);
+        }
+        Ok((changed, deleted))
+    }
+
+    /// Read and hash only the files whose metadata moved since the last index.
+    /// Reads run in parallel; everything else is decided from the stat alone.
+    fn stale_check(
+        &self,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+        manifest: &Manifest,
+    ) -> StaleCheck {
+        let (maybe_changed, deleted) = self.mtime_diff(metadata, manifest);
+        self.recheck(maybe_changed, deleted, metadata, manifest)
+    }
+
+    /// Read and hash `maybe_changed` in parallel, sorting them into changed,
+    /// touched (same content) and unreadable.
+    fn recheck(
+        &self,
+        maybe_changed: Vec<PathBuf>,
+        deleted: Vec<String>,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+        manifest: &Manifest,
+    ) -> StaleCheck {
+        let checked: Vec<FileCheck> = maybe_changed
+            .into_par_iter()
+            .map(|path| {
+                let (size, mtime) = metadata.get(&path).copied().unwrap_or((0, 0));
+                let rel_path = self.to_relative(&path);
+                let entry = manifest.get(&rel_path);
+
+                let Some((content, mtime)) = walker::read_text(&path, mtime) else {
+                    return match entry {
+                        Some(e) if e.hash.is_empty() && e.blocks.is_empty() => {
+                            FileCheck::Touched(rel_path, mtime, size)
+                        }
+                        _ => FileCheck::Unreadable(rel_path, mtime, size),
+                    };
+                };
+
+                match entry {
+                    Some(e) if e.hash == hash_content(&content) => {
+                        FileCheck::Touched(rel_path, mtime, size)
+                    }
+                    _ => FileCheck::Changed(path, content, mtime),
+                }
+            })
+            .collect();
+
+        let mut check = StaleCheck {
+            deleted,
+            ..Default::default()
+        };
+        for file in checked {
+            match file {
+                FileCheck::Changed(path, content, mtime) => {
+                    check.changed.insert(path, (content, mtime));
+                }
+                FileCheck::Touched(rel_path, mtime, size) => {
+                    check.touched.push((rel_path, mtime, size));
+                }
+                FileCheck::Unreadable(rel_path, mtime, size) => {
+                    check.unreadable.push((rel_path, mtime, size));
+                }
+            }
+        }
+        check
+    }
+
+    /// Stale files from a metadata scan, hashing only files whose mtime or
+    /// size changed. Read-only: does not touch the manifest or store.
+    pub fn get_stale_files_checked(
+        &self,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+    ) -> Result<(Vec<PathBuf>, Vec<String>)> {
+        if self.is_sharded() {
+            return self.stale_in_shards(metadata, Self::get_stale_files_checked);
+        }
+        let manifest = Manifest::load(&self.index_dir)?;
+        let check = self.stale_check(metadata, &manifest);
+        let mut deleted = check.deleted;
+        deleted.extend(
+            check
+                .unreadable
+                .into_iter()
+                .filter(|(rel_path, _, _)| manifest.contains(rel_path))
+                .map(|(rel_path, _, _)| rel_path),
+        );
+        Ok((check.changed.into_keys().collect(), deleted))
+    }
+
     /// Check for stale files and update if needed. Single manifest load.
     /// Uses metadata for fast pre-check, only reads content for changed files.
     pub fn check_and_update(
         &self,
         metadata: &HashMap<PathBuf, walker::FileMetadata>,
     ) -> Result<(usize, Option<IndexStats>)> {
+        if self.is_sharded() {
+            return self.update_shards(metadata, |shard, files| shard.check_and_update(files));
+        }
+        // Roll back an interrupted build first so the stale check sees its
+        // unfinished files as new
         let mut manifest = Manifest::load(&self.index_dir)?;
-        let (maybe_changed, deleted) = self.mtime_diff(metadata, &manifest);
-
-        let stale_count = maybe_changed.len() + deleted.len();
-        if stale_count == 0 {
+        if checkpoint::interrupted(&self.index_dir) {
+            let store = self.open_store()?;
+            checkpoint::recover(&self.index_dir, &store, &mut manifest)?;
+        }
+        if manifest.needs_backfill() {
+            self.backfill(&mut manifest)?;
+        }
+        let check = trace::time("stale_check", || self.stale_check(metadata, &manifest));
+        if check.is_empty() {
             return Ok((0, None));
         }
+        trace::count(
+            "stale_files",
+            (check.changed.len() + check.deleted.len()) as u64,
+        );
+        let _span = trace::span("reindex");
+        self.apply_check(manifest, check)
+    }
 
-        // Read content only for potentially changed files, then hash-check.
-        // Use mtime from scan_metadata (already captured via stat).
-        let mut changed_files: HashMap<PathBuf, (String, u64)> = HashMap::new();
-        for path in &maybe_changed {
-            let mtime = metadata.get(path).map(|&(_size, mt)| mt).unwrap_or(0);
-            let raw = match std::fs::read(path) {
-                Ok(data) => data,
-                Err(_) => continue,
-            };
-            let check_len = raw.len().min(8192);
-            if raw[..check_len].contains(&0) {
-                continue;
+    /// Record symbols and cross-references for a manifest migrated without
+    /// them (see `backfill`). The save is best-effort: on a
+    /// read-only index, readers fill them in on each load.
+    fn backfill(&self, manifest: &mut Manifest) -> Result<()> {
+        backfill(&self.root, &self.vectors_path, manifest)?;
+        let _ = manifest.save(&self.index_dir);
+        Ok(())
+    }
+
+    /// Find what changed under the root since the last update. In a git
+    /// work tree whose state the index recorded, git lists the candidates:
+    /// the diff from the recorded commit to HEAD plus the work-tree status,
+    /// read from the repository's index instead of walking the tree.
+    /// Otherwise, or when ignore rules changed, every file is stat'ed.
+    pub fn scan_tree(&self) -> Result<TreeScan> {
+        let git = git::snapshot(&self.root);
+        if let Some(now) = &git
+            && let Some(since) = self.recorded_git()
+            && let Some(changes) = git::changes(&self.root, &since, now)
+            && let Some(changes) = self.listed_changes(changes)?
+        {
+            return Ok(TreeScan { changes, git });
+        }
+        let metadata = walker::scan_metadata(&self.root)?;
+        Ok(TreeScan {
+            changes: TreeChanges::All(metadata),
+            git,
+        })
+    }
+
+    /// Bring the index up to date with a `scan_tree` result, then record the
+    /// git state it now matches.
+    pub fn update_tree(&self, scan: &TreeScan) -> Result<(usize, Option<IndexStats>)> {
+        let result = match &scan.changes {
+            TreeChanges::All(metadata) => self.check_and_update(metadata)?,
+            TreeChanges::Listed {
+                present,
+                gone,
+                committed,
+            } => self.update_listed(present, gone, committed)?,
+        };
+        self.record_git(scan.git.as_ref());
+        Ok(result)
+    }
+
+    /// Whether `update_tree` would change anything. Read-only.
+    pub fn is_stale(&self, scan: &TreeScan) -> Result<bool> {
+        if self.recorded_git() != scan.git {
+            return Ok(true);
+        }
+        match &scan.changes {
+            TreeChanges::All(metadata) => {
+                let (changed, deleted) = self.get_stale_files_fast(metadata)?;
+                Ok(!changed.is_empty() || !deleted.is_empty())
             }
-            let content = match String::from_utf8(raw) {
-                Ok(s) => s,
-                Err(_) => continue,
-            };
-            let rel_path = self.to_relative(path);
-            let file_hash = hash_content(&content);
-            match manifest.files.get(&rel_path) {
-                Some(entry) if entry.hash == file_hash => {}
-                _ => {
-                    changed_files.insert(path.clone(), (content, mtime));
+            // Same recorded state, so no commits in between
+            TreeChanges::Listed { present, gone, .. } => self.listed_stale(present, gone),
+        }
+    }
+
+    /// Record the git state the index matches (`None` outside git), in
+    /// every shard's manifest. Best-effort, like `backfill`: without it the
+    /// next check walks the tree.
+    pub fn record_git(&self, state: Option<&GitState>) {
+        if self.is_sharded() {
+            for shard in self
+                .shards
+                .iter()
+                .filter(|s| s.is_indexed() && !checkpoint::is_building(&s.index_dir))
+            {
+                shard.record_git(state);
+            }
+            return;
+        }
+        if !self.is_indexed() {
+            return;
+        }
+        if let Ok(mut manifest) = Manifest::load(&self.index_dir)
+            && manifest.git() != state
+        {
+            manifest.set_git(state.cloned());
+            let _ = manifest.save(&self.index_dir);
+        }
+    }
+
+    /// Git state the index recorded, if every shard agrees on one and no
+    /// build was interrupted (its rollback needs the full check).
+    fn recorded_git(&self) -> Option<GitState> {
+        if self.is_sharded() {
+            let mut states = self
+                .shards
+                .iter()
+                .filter(|s| s.is_indexed())
+                .map(Self::recorded_git);
+            let first = states.next()??;
+            return states.all(|s| s.as_ref() == Some(&first)).then_some(first);
+        }
+        if checkpoint::interrupted(&self.index_dir) {
+            return None;
+        }
+        Manifest::load(&self.index_dir).ok()?.git().cloned()
+    }
+
+    /// Stat the paths git listed, the way `og watch` treats event paths.
+    /// `None` if an ignore file changed, which can hide or reveal files git
+    /// does not list.
+    fn listed_changes(&self, changes: git::Changes) -> Result<Option<TreeChanges>> {
+        let mut filter = walker::PathFilter::new(&self.root);
+        let mut present = HashMap::new();
+        let mut gone = Vec::new();
+        let mut committed = HashSet::new();
+        let listed = changes
+            .committed
+            .iter()
+            .map(|rel| (rel, true))
+            .chain(changes.dirty.iter().map(|rel| (rel, false)));
+        for (rel, from_commit) in listed {
+            let path = self.root.join(rel);
+            if path
+                .file_name()
+                .is_some_and(|name| name == ".gitignore" || name == ".ignore")
+            {
+                return Ok(None);
+            }
+            if path.is_dir() {
+                // A submodule or nested repository is listed as one path
+                for file in walker::scan_metadata(&path)?.into_keys() {
+                    if let Some(meta) = filter.check(&file) {
+                        present.insert(file, meta);
+                    }
                 }
+                gone.push(path);
+            } else if let Some(meta) = filter.check(&path) {
+                if from_commit {
+                    committed.insert(path.clone());
+                }
+                present.insert(path, meta);
+            } else {
+                gone.push(path);
             }
         }
+        trace::count("git_listed", (present.len() + gone.len()) as u64);
+        Ok(Some(TreeChanges::Listed {
+            present,
+            gone,
+            committed,
+        }))
+    }
+
+    /// Bring specific paths up to date without walking the tree (`og watch`).
+    /// `present` holds the eligible files that exist now; indexed files at or
+    /// under a `gone` path that are not in `present` are removed.
+    pub fn update_paths(
+        &self,
+        present: &HashMap<PathBuf, walker::FileMetadata>,
+        gone: &[PathBuf],
+    ) -> Result<(usize, Option<IndexStats>)> {
+        self.update_listed(present, gone, &HashSet::new())
+    }
+
+    /// `update_paths`, also hashing the files in `recheck` whose stat is
+    /// unchanged.
+    fn update_listed(
+        &self,
+        present: &HashMap<PathBuf, walker::FileMetadata>,
+        gone: &[PathBuf],
+        recheck: &HashSet<PathBuf>,
+    ) -> Result<(usize, Option<IndexStats>)> {
+        if self.is_sharded() {
+            return self.update_shards(present, |shard, files| {
+                if !shard.is_indexed() {
+                    return Ok((0, None));
+                }
+                shard.update_listed(files, gone, recheck)
+            });
+        }
+        if !self.is_indexed() {
+            return Ok((0, None));
+        }
+        let manifest = Manifest::load(&self.index_dir)?;
+        let mut maybe_changed = self.stat_changed(present, &manifest);
+        let stat_changed: HashSet<&PathBuf> = maybe_changed.iter().collect();
+        let forced: Vec<PathBuf> = present
+            .keys()
+            .filter(|p| recheck.contains(*p) && !stat_changed.contains(p))
+            .cloned()
+            .collect();
+        maybe_changed.extend(forced);
 
-        if changed_files.is_empty() && deleted.is_empty() {
+        let deleted = self.gone_entries(present, gone, &manifest);
+        let check = self.recheck(maybe_changed, deleted, present, &manifest);
+        if check.is_empty() {
             return Ok((0, None));
         }
+        self.apply_check(manifest, check)
+    }
+
+    /// Whether `update_paths` would change anything, without the content
+    /// check. Read-only.
+    fn listed_stale(
+        &self,
+        present: &HashMap<PathBuf, walker::FileMetadata>,
+        gone: &[PathBuf],
+    ) -> Result<bool> {
+        if self.is_sharded() {
+            for (shard, files) in self.partition(present) {
+                if shard.is_indexed() && shard.listed_stale(&files, gone)? {
+                    return Ok(true);
+                }
+            }
+            return Ok(false);
+        }
+        if !self.is_indexed() {
+            return Ok(false);
+        }
+        let manifest = Manifest::load(&self.index_dir)?;
+        Ok(!self.stat_changed(present, &manifest).is_empty()
+            || !self.gone_entries(present, gone, &manifest).is_empty())
+    }
+
+    /// Indexed files at or under a `gone` path that are not in `present`.
+    fn gone_entries(
+        &self,
+        present: &HashMap<PathBuf, walker::FileMetadata>,
+        gone: &[PathBuf],
+        manifest: &Manifest,
+    ) -> Vec<String> {
+        if gone.is_empty() {
+            return Vec::new();
+        }
+        let present_rel: HashSet<String> = present.keys().map(|p| self.to_relative(p)).collect();
+        let prefixes: Vec<String> = gone.iter().map(|p| self.to_relative(p)).collect();
+        manifest
+            .paths()
+            .filter(|k| !present_rel.contains(*k))
+            .filter(|k| {
+                prefixes.iter().any(|prefix| {
+                    prefix.is_empty()
+                        || *k == prefix.as_str()
+                        || k.starts_with(&format!("{prefix}/"))
+                })
+            })
+            .map(String::from)
+            .collect()
+    }
 
-        let actual_stale = changed_files.len() + deleted.len();
+    /// Run an update on each shard with its files and sum the results. A
+    /// shard with no index yet is only built once it has files.
+    fn update_shards(
+        &self,
+        metadata: &HashMap<PathBuf, walker::FileMetadata>,
+        update: impl Fn(
+            &Self,
+            &HashMap<PathBuf, walker::FileMetadata>,
+        ) -> Result<(usize, Option<IndexStats>)>,
+    ) -> Result<(usize, Option<IndexStats>)> {
+        let mut stale = 0;
+        let mut total: Option<IndexStats> = None;
+        for (shard, files) in self.partition(metadata) {
+            if files.is_empty() && !shard.is_indexed() {
+                continue;
+            }
+            let (count, stats) = update(shard, &files)?;
+            stale += count;
+            if let Some(stats) = stats {
+                total.get_or_insert_default().merge(&stats);
+            }
+        }
+        Ok((stale, total))
+    }
+
+    /// Write a stale check back: refresh touched entries, drop deleted and
+    /// unreadable files, then re-index changed ones.
+    fn apply_check(
+        &self,
+        mut manifest: Manifest,
+        check: StaleCheck,
+    ) -> Result<(usize, Option<IndexStats>)> {
+        // Unchanged content with new metadata: refresh the entry so the next
+        // check skips the read
+        for (rel_path, mtime, size) in &check.touched {
+            manifest.set_stat(rel_path, *mtime, *size);
+        }
+
+        let stale_paths: Vec<&String> = check
+            .deleted
+            .iter()
+            .chain(check.unreadable.iter().map(|(rel_path, _, _)| rel_path))
+            .collect();
 
-        // Delete vectors for deleted files (reuse already-loaded manifest)
+        // Drop blocks for deleted (or no longer readable) files, reusing the
+        // already-loaded manifest
         let mut deleted_count = 0;
-        {
+        if !stale_paths.is_empty() {
             let store = self.open_store()?;
-
-            for rel_path in &deleted {
-                if let Some(entry) = manifest.files.remove(rel_path) {
+            for rel_path in &stale_paths {
+                if let Some(entry) = manifest.remove(rel_path) {
                     for block_id in &entry.blocks {
                         let _ = store.delete(block_id);
                     }
                     deleted_count += entry.blocks.len();
                 }
             }
-
             if deleted_count > 0 {
                 store.flush()?;
-                manifest.save(&self.index_dir)?;
             }
         }
 
-        let mut stats = self.index(&changed_files, None)?;
+        // Record unreadable files so they aren't re-read on every check
+        for (rel_path, mtime, size) in check.unreadable {
+            manifest.insert(
+                rel_path,
+                FileEntry {
+                    mtime,
+                    size,
+                    ..FileEntry::default()
+                },
+            );
+        }
+
+        if !check.touched.is_empty() || !stale_paths.is_empty() {
+            manifest.save(&self.index_dir)?;
+        }
+
+        let actual_stale = check.changed.len() + check.deleted.len();
+        if check.changed.is_empty() {
+            let stats = (deleted_count > 0).then(|| IndexStats {
+                deleted: deleted_count,
+                ..Default::default()
+            });
+            return Ok((actual_stale, stats));
+        }
+
+        let mut stats = self.index(&check.changed, None)?;
         stats.deleted += deleted_count;
         Ok((actual_stale, Some(stats)))
     }
@@ -769,7 +2059,7 @@ impl SemanticIndex {
             let store = self.open_store()?;
 
             for rel_path in &deleted {
-                if let Some(entry) = manifest.files.remove(rel_path) {
+                if let Some(entry) = manifest.remove(rel_path) {
                     for block_id in &entry.blocks {
                         let _ = store.delete(block_id);
                     }
@@ -808,6 +2098,13 @@ impl SemanticIndex {
         if prefix.is_empty() || prefix == "." {
             return Ok(IndexStats::default());
         }
+        if self.is_sharded() {
+            let mut stats = IndexStats::default();
+            for shard in self.shards.iter().filter(|s| s.is_indexed()) {
+                stats.merge(&shard.remove_prefix(prefix)?);
+            }
+            return Ok(stats);
+        }
 
         let store = self.open_store()?;
 
@@ -815,14 +2112,13 @@ impl SemanticIndex {
         let mut stats = IndexStats::default();
 
         let to_remove: Vec<String> = manifest
-            .files
-            .keys()
+            .paths()
             .filter(|k| *k == prefix || k.starts_with(&format!("{prefix}/")))
-            .cloned()
+            .map(String::from)
             .collect();
 
         for rel_path in &to_remove {
-            if let Some(entry) = manifest.files.remove(rel_path) {
+            if let Some(entry) = manifest.remove(rel_path) {
                 for block_id in &entry.blocks {
                     let _ = store.delete(block_id);
                 }
@@ -837,42 +2133,43 @@ impl SemanticIndex {
         Ok(stats)
     }
 
-    fn result_from_omendb(&self, r: &omendb::SearchResult) -> SearchResult {
-        let file = r
-            .metadata
-            .get("file")
-            .and_then(|v| v.as_str())
-            .unwrap_or("");
+    fn result_from_omendb(
+        &self,
+        r: &omendb::SearchResult,
+        reader: &mut SourceReader,
+    ) -> SearchResult {
+        self.result_from_metadata(&r.metadata, r.distance, reader)
+    }
+
+    fn result_from_metadata(
+        &self,
+        metadata: &serde_json::Value,
+        score: f32,
+        reader: &mut SourceReader,
+    ) -> SearchResult {
         SearchResult {
-            file: self.to_absolute(file),
-            block_type: r
-                .metadata
+            file: self.to_absolute(result_file(metadata)),
+            block_type: metadata
                 .get("type")
                 .and_then(|v| v.as_str())
                 .unwrap_or("")
                 .to_string(),
-            name: r
-                .metadata
+            name: metadata
                 .get("name")
                 .and_then(|v| v.as_str())
                 .unwrap_or("")
                 .to_string(),
-            line: r
-                .metadata
+            line: metadata
                 .get("start_line")
                 .and_then(|v| v.as_u64())
                 .unwrap_or(0) as usize,
-            end_line: r
-                .metadata
+            end_line: metadata
                 .get("end_line")
                 .and_then(|v| v.as_u64())
                 .unwrap_or(0) as usize,
-            content: r
-                .metadata
-                .get("content")
-                .and_then(|v| v.as_str())
-                .map(|s| s.to_string()),
-            score: r.distance,
+            content: reader.content(metadata),
+            score,
+            root: None,
         }
     }
 
@@ -893,6 +2190,7 @@ impl SemanticIndex {
 
     /// Open existing multi-vector store (for search/read operations).
     fn open_store(&self) -> Result<omendb::VectorStore> {
+        let _span = trace::span("store_open");
         omendb::VectorStore::open(&self.vectors_path).context("Failed to open vector store")
     }
 
@@ -916,6 +2214,11 @@ impl SemanticIndex {
     }
 }
 
+/// Whether `index_dir` holds an index, sharded or not.
+pub fn has_index(index_dir: &Path) -> bool {
+    manifest::exists(index_dir) || shard::is_sharded(index_dir)
+}
+
 /// Walk up directory tree to find existing index.
 pub fn find_index_root(search_path: &Path) -> (PathBuf, Option<PathBuf>) {
     let search_path = search_path
@@ -925,7 +2228,7 @@ pub fn find_index_root(search_path: &Path) -> (PathBuf, Option<PathBuf>) {
     let mut current = search_path.clone();
     loop {
         let index_dir = current.join(INDEX_DIR);
-        if index_dir.join("manifest.json").exists() {
+        if has_index(&index_dir) {
             return (current, Some(index_dir));
         }
         if !current.pop() {
@@ -947,7 +2250,7 @@ pub fn find_parent_index(path: &Path) -> Option<PathBuf> {
 
     loop {
         let index_dir = current.join(INDEX_DIR);
-        if index_dir.join("manifest.json").exists() {
+        if has_index(&index_dir) {
             return Some(current);
         }
         if !current.pop() {
@@ -970,9 +2273,7 @@ pub fn find_subdir_indexes(path: &Path, include_root: bool) -> Vec<PathBuf> {
         let Ok(entry) = entry else { continue };
         if entry.file_name() == INDEX_DIR && entry.file_type().is_dir() {
             let idx_path = entry.path().to_path_buf();
-            if idx_path.join("manifest.json").exists()
-                && (include_root || idx_path.parent() != Some(&path))
-            {
+            if has_index(&idx_path) && (include_root || idx_path.parent() != Some(&path)) {
                 indexes.push(idx_path);
             }
         }
@@ -981,61 +2282,94 @@ pub fn find_subdir_indexes(path: &Path, include_root: bool) -> Vec<PathBuf> {
     indexes
 }
 
-fn find_block_by_name(
-    store: &omendb::VectorStore,
-    block_ids: &[String],
-    name: &str,
-) -> Result<String> {
-    let mut matches = Vec::new();
-
-    for block_id in block_ids {
-        if let Some(meta) = store.get_metadata_by_id(block_id) {
-            let block_name = meta.get("name").and_then(|v| v.as_str()).unwrap_or("");
-            if block_name == name || block_name.ends_with(&format!(".{name}")) {
-                matches.push((
-                    block_id.clone(),
-                    block_name.to_string(),
-                    meta.get("start_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize,
-                    meta.get("type")
-                        .and_then(|v| v.as_str())
-                        .unwrap_or("")
-                        .to_string(),
-                ));
+/// Load the manifest in `index_dir` for reading block symbols and
+/// cross-references, backfilling them in memory if it was migrated without
+/// them.
+pub fn load_manifest(index_root: &Path, index_dir: &Path) -> Result<Manifest> {
+    let mut manifest = Manifest::load(index_dir)?;
+    if manifest.needs_backfill() {
+        let vectors_path = index_dir.join(VECTORS_DIR).to_string_lossy().into_owned();
+        backfill(index_root, &vectors_path, &mut manifest)?;
+    }
+    Ok(manifest)
+}
+
+/// Fill in what manifests migrated from `manifest.json` lack: block symbols from the vector store's
+/// metadata, opened only if some entry needs them, and each file's
+/// identifier references and exported flags from its source.
+fn backfill(index_root: &Path, vectors_path: &str, manifest: &mut Manifest) -> Result<()> {
+    let _span = trace::span("backfill");
+    let mut store = None;
+    let entries: Vec<(String, FileEntry)> = manifest.iter().collect();
+    for (path, mut entry) in entries {
+        if !entry.has_symbols() {
+            if store.is_none() {
+                let opened = trace::time("store_open", || omendb::VectorStore::open(vectors_path))
+                    .context("Failed to open vector store")?;
+                store = Some(opened);
+            }
+            if let Some(store) = &store {
+                entry.symbols = symbols_from_store(store, &entry.blocks);
             }
         }
-    }
 
-    match matches.len() {
-        0 => bail!("No block named '{name}' found"),
-        1 => Ok(matches[0].0.clone()),
-        _ => {
-            let details: Vec<String> = matches
+        // A reader per file: the backfill reads every source once
+        let mut reader = SourceReader::new(index_root);
+        let contents: Vec<String> = entry
+            .symbols
+            .iter_mut()
+            .map(|symbol| {
+                let content = reader.symbol_content(&path, symbol).unwrap_or_default();
+                symbol.exported = xref::is_exported(&content);
+                content
+            })
+            .collect();
+        entry.refs = xref::file_refs(
+            entry
+                .symbols
                 .iter()
-                .map(|(_, n, line, t)| format!("  - line {line}: {t} {n}"))
-                .collect();
-            bail!(
-                "Multiple blocks named '{name}' found:\n{}\nUse file:<line> to specify.",
-                details.join("\n")
-            )
-        }
+                .zip(&contents)
+                .map(|(symbol, content)| (symbol.block_type.as_str(), content.as_str())),
+        );
+        manifest.insert(path, entry);
     }
+    Ok(())
+}
+
+/// Symbols for `block_ids` rebuilt from their store metadata.
+fn symbols_from_store(store: &omendb::VectorStore, block_ids: &[String]) -> Vec<Symbol> {
+    block_ids
+        .iter()
+        .map(|id| {
+            store
+                .get_metadata_by_id(id)
+                .map(|meta| Symbol::from_metadata(&meta))
+                .unwrap_or_default()
+        })
+        .collect()
+}
+
+/// Index-relative file a stored block belongs to, from its metadata.
+fn result_file(metadata: &serde_json::Value) -> &str {
+    metadata.get("file").and_then(|v| v.as_str()).unwrap_or("")
 }
 
-fn find_block_by_line(
+/// Exact MaxSim of the query against each block's stored tokens, best first.
+/// Blocks whose tokens can't be read are left out.
+fn score_blocks<'a>(
     store: &omendb::VectorStore,
-    block_ids: &[String],
-    line: usize,
-) -> Option<String> {
-    for block_id in block_ids {
-        if let Some(meta) = store.get_metadata_by_id(block_id) {
-            let start = meta.get("start_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize;
-            let end = meta.get("end_line").and_then(|v| v.as_u64()).unwrap_or(0) as usize;
-            if start <= line && line <= end {
-                return Some(block_id.clone());
-            }
-        }
-    }
-    None
+    ids: &'a [String],
+    token_refs: &[&[f32]],
+) -> Vec<(&'a str, f32)> {
+    let mut scored: Vec<(&str, f32)> = ids
+        .par_iter()
+        .filter_map(|id| {
+            let (tokens, _) = store.get_tokens(id).ok()?;
+            Some((id.as_str(), fusion::maxsim(token_refs, &tokens)))
+        })
+        .collect();
+    scored.sort_by(|a, b| b.1.total_cmp(&a.1));
+    scored
 }
 
 fn hash_content(content: &str) -> String {
@@ -1043,6 +2377,39 @@ fn hash_content(content: &str) -> String {
     hash.to_hex()[..16].to_string()
 }
 
+/// Report build stage totals and counts to the trace.
+fn trace_stats(stats: &IndexStats) {
+    trace::record("extract", stats.timings.extract);
+    trace::record("tokenize", stats.timings.tokenize);
+    trace::record("infer", stats.timings.infer);
+    trace::record("store", stats.timings.store);
+    trace::count("files", stats.files as u64);
+    trace::count("blocks", stats.blocks as u64);
+    trace::count("cached_blocks", stats.cached as u64);
+    trace::count("tokens", stats.tokens as u64);
+    trace::count("padded_tokens", stats.padded_tokens as u64);
+    trace::count("stored_tokens", stats.stored_tokens as u64);
+}
+
+/// Content address of a block's embedding. Independent of the block's ID and
+/// position, so a block that only moved maps to the same key.
+fn embed_key(text: &str) -> String {
+    let mut hasher = blake3::Hasher::new();
+    hasher.update(embedder::MODEL.version.as_bytes());
+    hasher.update(b"\0");
+    hasher.update(text.as_bytes());
+    hasher.finalize().to_hex()[..16].to_string()
+}
+
+/// Merge rankings from several stores (shards or roots) into one top `k`,
+/// best first.
+pub fn merge_top_k(rankings: Vec<Vec<SearchResult>>, k: usize) -> Vec<SearchResult> {
+    let mut merged: Vec<SearchResult> = rankings.into_iter().flatten().collect();
+    merged.sort_by(|a, b| b.score.total_cmp(&a.score));
+    merged.truncate(k);
+    merged
+}
+
 fn relative_to(root: &Path, path: &Path) -> String {
     path.strip_prefix(root)
         .unwrap_or(path)
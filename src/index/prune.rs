@@ -0,0 +1,135 @@
+/// Largest `og build --token-pool` factor.
+pub const MAX_POOL_FACTOR: u8 = 8;
+
+/// Leading tokens never merged: the model's CLS / document marker.
+const PROTECTED_TOKENS: usize = 1;
+
+/// Index-time token pooling: shrink a block's token embeddings to about
+/// `1 / factor` of their count before they are stored, and never above
+/// `budget`.
+///
+/// The most similar pair of adjacent tokens is merged repeatedly (their sum,
+/// renormalized) until the block fits. Neighbouring tokens that point the
+/// same way are mostly subword pieces of one identifier or runs of
+/// punctuation, so they collapse first, while tokens that carry distinct
+/// meaning survive. Each pooled vector covers a contiguous span, which keeps
+/// the work quadratic in the block length at worst. MaxSim cost and storage
+/// both scale with the stored count. `factor` 1 keeps every token and only
+/// enforces the budget by truncation, as before pooling existed.
+pub fn pool(tokens: Vec<Vec<f32>>, factor: u8, budget: usize) -> Vec<Vec<f32>> {
+    if factor <= 1 {
+        let mut tokens = tokens;
+        tokens.truncate(budget);
+        return tokens;
+    }
+
+    let n = tokens.len();
+    let target = n
+        .div_ceil(factor as usize)
+        .min(budget)
+        .max(PROTECTED_TOKENS + 1);
+    if n <= target {
+        return tokens;
+    }
+
+    let mut clusters = tokens;
+    // sims[i]: cosine between cluster i and i + 1
+    let mut sims: Vec<f32> = (0..n - 1)
+        .map(|i| cosine(&clusters[i], &clusters[i + 1]))
+        .collect();
+
+    while clusters.len() > target {
+        let Some(i) = (PROTECTED_TOKENS..sims.len()).max_by(|&a, &b| {
+            sims[a]
+                .partial_cmp(&sims[b])
+                .unwrap_or(std::cmp::Ordering::Equal)
+        }) else {
+            break;
+        };
+
+        let next = clusters.remove(i + 1);
+        for (x, y) in clusters[i].iter_mut().zip(&next) {
+            *x += y;
+        }
+        sims.remove(i);
+        if i > 0 {
+            sims[i - 1] = cosine(&clusters[i - 1], &clusters[i]);
+        }
+        if i < sims.len() {
+            sims[i] = cosine(&clusters[i], &clusters[i + 1]);
+        }
+    }
+
+    for v in &mut clusters {
+        normalize(v);
+    }
+    clusters
+}
+
+fn cosine(a: &[f32], b: &[f32]) -> f32 {
+    let dot: f32 = a.iter().zip(b).map(|(x, y)| x * y).sum();
+    let norm = (a.iter().map(|x| x * x).sum::<f32>() * b.iter().map(|x| x * x).sum::<f32>()).sqrt();
+    if norm > 1e-9 { dot / norm } else { 0.0 }
+}
+
+fn normalize(v: &mut [f32]) {
+    let norm = v.iter().map(|x| x * x).sum::<f32>().sqrt();
+    if norm > 1e-9 {
+        for x in v {
+            *x /= norm;
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn unit(v: &[f32]) -> Vec<f32> {
+        let mut v = v.to_vec();
+        normalize(&mut v);
+        v
+    }
+
+    #[test]
+    fn factor_one_only_truncates() {
+        let tokens = vec![unit(&[1.0, 0.0]); 5];
+        assert_eq!(pool(tokens.clone(), 1, 512), tokens);
+        assert_eq!(pool(tokens, 1, 3).len(), 3);
+    }
+
+    #[test]
+    fn merges_most_similar_neighbours_first() {
+        let tokens = vec![
+            unit(&[0.0, 0.0, 1.0]), // protected marker
+            unit(&[1.0, 0.0, 0.0]),
+            unit(&[0.99, 0.1, 0.0]),
+            unit(&[0.0, 1.0, 0.0]),
+            unit(&[0.1, 0.99, 0.0]),
+            unit(&[0.0, 0.0, 1.0]),
+            unit(&[0.1, 0.0, 0.99]),
+        ];
+        let pooled = pool(tokens.clone(), 2, 512);
+        assert_eq!(pooled.len(), 4);
+        assert_eq!(pooled[0], tokens[0]);
+        // Each pair of near-identical neighbours collapses into one vector
+        assert!(pooled[1][0] > 0.99);
+        assert!(pooled[2][1] > 0.99);
+        assert!(pooled[3][2] > 0.99);
+        for v in &pooled {
+            let norm: f32 = v.iter().map(|x| x * x).sum::<f32>().sqrt();
+            assert!((norm - 1.0).abs() < 1e-5);
+        }
+    }
+
+    #[test]
+    fn budget_caps_pooled_length() {
+        let tokens: Vec<Vec<f32>> = (0..100)
+            .map(|i| unit(&[(i as f32).cos(), (i as f32).sin()]))
+            .collect();
+        assert_eq!(pool(tokens.clone(), 2, 512).len(), 50);
+        assert_eq!(pool(tokens.clone(), 4, 512).len(), 25);
+        assert_eq!(pool(tokens.clone(), 2, 20).len(), 20);
+        assert_eq!(pool(tokens[..1].to_vec(), 4, 512).len(), 1);
+    }
+}
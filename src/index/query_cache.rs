@@ -0,0 +1,388 @@
+use std::path::{Path, PathBuf};
+use std::sync::Mutex;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::time::SystemTime;
+
+use anyhow::Result;
+use ndarray::Array2;
+use serde::{Deserialize, Serialize};
+
+use super::bytes::ByteReader;
+use crate::embedder;
+
+/// Directory under the index dir holding cached query embeddings.
+pub const QUERY_CACHE_DIR: &str = "query_cache";
+
+/// Default cap on cached queries. Override with `OG_QUERY_CACHE_SIZE` (0 disables).
+const DEFAULT_MAX_ENTRIES: usize = 2048;
+
+const STATS_FILE: &str = "stats.json";
+
+/// Lookups counted in memory before they are added to the stats file.
+const STATS_FLUSH_EVERY: u64 = 64;
+
+/// An eviction sweep lists and stats every entry, so one runs only every
+/// `max_entries / EVICT_SWEEP_DIVISOR` misses (each followed by a put).
+/// Between sweeps the cache can grow about 1/16 past its cap.
+const EVICT_SWEEP_DIVISOR: usize = 16;
+const ENTRY_EXT: &str = "qe";
+const ENTRY_MAGIC: &[u8; 4] = b"OGQ1";
+
+/// Distinguishes temp files written concurrently by threads of one process.
+static TMP_SEQ: AtomicU64 = AtomicU64::new(0);
+
+/// On-disk LRU cache of query token embeddings, keyed by model version plus
+/// normalized query text. One file per entry, so a lookup reads only that
+/// entry; recency is tracked with file mtimes.
+///
+/// Counters are kept in memory and added to the stats file every
+/// `STATS_FLUSH_EVERY` lookups and when the cache is dropped.
+pub struct QueryCache {
+    dir: PathBuf,
+    max_entries: usize,
+    /// Counts not yet written to the stats file.
+    pending: Mutex<Pending>,
+}
+
+#[derive(Default)]
+struct Pending {
+    stats: QueryCacheStats,
+    lookups: u64,
+}
+
+/// Cumulative cache counters, persisted next to the entries.
+#[derive(Debug, Default, Clone, Serialize, Deserialize)]
+pub struct QueryCacheStats {
+    pub hits: u64,
+    pub misses: u64,
+    pub evictions: u64,
+}
+
+impl QueryCache {
+    pub fn new(index_dir: &Path) -> Self {
+        let max_entries = std::env::var("OG_QUERY_CACHE_SIZE")
+            .ok()
+            .and_then(|v| v.parse().ok())
+            .unwrap_or(DEFAULT_MAX_ENTRIES);
+        Self::with_capacity(index_dir, max_entries)
+    }
+
+    pub fn with_capacity(index_dir: &Path, max_entries: usize) -> Self {
+        Self {
+            dir: index_dir.join(QUERY_CACHE_DIR),
+            max_entries,
+            pending: Mutex::new(Pending::default()),
+        }
+    }
+
+    pub fn is_enabled(&self) -> bool {
+        self.max_entries > 0
+    }
+
+    /// Look up a query. A hit refreshes the entry's recency.
+    pub fn get(&self, query: &str) -> Option<Array2<f32>> {
+        if !self.is_enabled() {
+            return None;
+        }
+
+        let key = cache_key(query);
+        let path = self.entry_path(&key);
+        let raw = std::fs::read(&path).ok()?;
+        let tokens = decode_entry(&raw, &key)?;
+
+        // Touch for LRU ordering; failure only degrades eviction order
+        if let Ok(file) = std::fs::File::options().write(true).open(&path) {
+            let _ = file.set_modified(SystemTime::now());
+        }
+
+        Some(tokens)
+    }
+
+    /// Store a query embedding. Every so many misses, least recently used
+    /// entries over the cap are evicted.
+    pub fn put(&self, query: &str, tokens: &Array2<f32>) -> Result<()> {
+        if !self.is_enabled() {
+            return Ok(());
+        }
+
+        std::fs::create_dir_all(&self.dir)?;
+        let key = cache_key(query);
+        let path = self.entry_path(&key);
+        let tmp_path = self.dir.join(tmp_name("entry"));
+        std::fs::write(&tmp_path, encode_entry(&key, tokens))?;
+        std::fs::rename(&tmp_path, &path)?;
+
+        // Misses count puts across processes, so short-lived searches sweep too
+        let sweep_every = (self.max_entries / EVICT_SWEEP_DIVISOR).max(1) as u64;
+        if self.stats().misses % sweep_every == 0 {
+            let evicted = self.evict()?;
+            self.lock_pending().stats.evictions += evicted as u64;
+        }
+        Ok(())
+    }
+
+    /// Count a lookup outcome.
+    pub fn record(&self, hit: bool) {
+        if !self.is_enabled() {
+            return;
+        }
+        let mut pending = self.lock_pending();
+        if hit {
+            pending.stats.hits += 1;
+        } else {
+            pending.stats.misses += 1;
+        }
+        pending.lookups += 1;
+        if pending.lookups >= STATS_FLUSH_EVERY {
+            self.flush(&mut pending);
+        }
+    }
+
+    /// Counters from the stats file plus this cache's unflushed ones.
+    pub fn stats(&self) -> QueryCacheStats {
+        let mut stats = self.saved_stats();
+        let pending = self.lock_pending();
+        stats.hits += pending.stats.hits;
+        stats.misses += pending.stats.misses;
+        stats.evictions += pending.stats.evictions;
+        stats
+    }
+
+    /// Number of cached queries.
+    pub fn len(&self) -> usize {
+        self.entries().len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len() == 0
+    }
+
+    fn entry_path(&self, key: &str) -> PathBuf {
+        self.dir
+            .join(format!("{}.{ENTRY_EXT}", &blake3_hex(key)[..32]))
+    }
+
+    fn entries(&self) -> Vec<(SystemTime, PathBuf)> {
+        let Ok(read_dir) = std::fs::read_dir(&self.dir) else {
+            return Vec::new();
+        };
+        read_dir
+            .filter_map(|e| e.ok())
+            .map(|e| e.path())
+            .filter(|p| p.extension().is_some_and(|ext| ext == ENTRY_EXT))
+            .map(|p| {
+                let mtime = std::fs::metadata(&p)
+                    .and_then(|m| m.modified())
+                    .unwrap_or(SystemTime::UNIX_EPOCH);
+                (mtime, p)
+            })
+            .collect()
+    }
+
+    fn evict(&self) -> Result<usize> {
+        let mut entries = self.entries();
+        if entries.len() <= self.max_entries {
+            return Ok(0);
+        }
+
+        entries.sort_by_key(|(mtime, _)| *mtime);
+        let excess = entries.len() - self.max_entries;
+        for (_, path) in entries.iter().take(excess) {
+            let _ = std::fs::remove_file(path);
+        }
+        Ok(excess)
+    }
+
+    fn lock_pending(&self) -> std::sync::MutexGuard<'_, Pending> {
+        self.pending.lock().unwrap_or_else(|e| e.into_inner())
+    }
+
+    fn saved_stats(&self) -> QueryCacheStats {
+        std::fs::read_to_string(self.dir.join(STATS_FILE))
+            .ok()
+            .and_then(|s| serde_json::from_str(&s).ok())
+            .unwrap_or_default()
+    }
+
+    /// Add the pending counts to the stats file.
+    fn flush(&self, pending: &mut Pending) {
+        let delta = std::mem::take(pending).stats;
+        if delta.hits + delta.misses + delta.evictions == 0 {
+            return;
+        }
+        let mut stats = self.saved_stats();
+        stats.hits += delta.hits;
+        stats.misses += delta.misses;
+        stats.evictions += delta.evictions;
+        let Ok(content) = serde_json::to_string(&stats) else {
+            return;
+        };
+        // Not after the index itself was removed (`og clean`, a rebuild)
+        let index_exists = self.dir.parent().is_some_and(Path::exists);
+        if !index_exists || std::fs::create_dir_all(&self.dir).is_err() {
+            return;
+        }
+        // Concurrent writers may drop an increment; counters are advisory
+        let tmp_path = self.dir.join(tmp_name("stats"));
+        if std::fs::write(&tmp_path, content).is_ok() {
+            let _ = std::fs::rename(&tmp_path, self.dir.join(STATS_FILE));
+        }
+    }
+}
+
+impl Drop for QueryCache {
+    fn drop(&mut self) {
+        let mut pending = self.lock_pending();
+        self.flush(&mut pending);
+    }
+}
+
+/// Collapse whitespace so trivially different spellings share an entry.
+pub fn normalize_query(query: &str) -> String {
+    query.split_whitespace().collect::<Vec<_>>().join(" ")
+}
+
+/// Cache key: model version + normalized query. Stored in the entry so hash
+/// collisions and model upgrades read as misses.
+fn cache_key(query: &str) -> String {
+    format!("{}\0{}", embedder::MODEL.version, normalize_query(query))
+}
+
+fn tmp_name(kind: &str) -> String {
+    let seq = TMP_SEQ.fetch_add(1, Ordering::Relaxed);
+    format!(".{kind}.{}.{seq}.tmp", std::process::id())
+}
+
+fn blake3_hex(key: &str) -> String {
+    blake3::hash(key.as_bytes()).to_hex().to_string()
+}
+
+/// Layout: magic, key_len u32, key, rows u32, cols u32, rows*cols f32 (all LE).
+fn encode_entry(key: &str, tokens: &Array2<f32>) -> Vec<u8> {
+    let (rows, cols) = tokens.dim();
+    let mut buf = Vec::with_capacity(16 + key.len() + rows * cols * 4);
+    buf.extend_from_slice(ENTRY_MAGIC);
+    buf.extend_from_slice(&(key.len() as u32).to_le_bytes());
+    buf.extend_from_slice(key.as_bytes());
+    buf.extend_from_slice(&(rows as u32).to_le_bytes());
+    buf.extend_from_slice(&(cols as u32).to_le_bytes());
+    for &x in tokens.iter() {
+        buf.extend_from_slice(&x.to_le_bytes());
+    }
+    buf
+}
+
+/// `None` for a truncated or corrupt entry, or one written for another key.
+fn decode_entry(raw: &[u8], expected_key: &str) -> Option<Array2<f32>> {
+    let mut reader = ByteReader::new(raw);
+    if reader.bytes(4)? != ENTRY_MAGIC {
+        return None;
+    }
+    let key_len = reader.u32()? as usize;
+    if reader.bytes(key_len)? != expected_key.as_bytes() {
+        return None;
+    }
+    let rows = reader.u32()? as usize;
+    let cols = reader.u32()? as usize;
+    let data: Vec<f32> = reader
+        .bytes(rows.checked_mul(cols)?.checked_mul(4)?)?
+        .chunks_exact(4)
+        .map(|b| f32::from_le_bytes([b[0], b[1], b[2], b[3]]))
+        .collect();
+    Array2::from_shape_vec((rows, cols), data).ok()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn tokens(rows: usize, seed: f32) -> Array2<f32> {
+        Array2::from_shape_fn((rows, 4), |(r, c)| seed + (r * 4 + c) as f32)
+    }
+
+    #[test]
+    fn roundtrip_and_whitespace_normalization() {
+        let tmp = tempfile::tempdir().unwrap();
+        let cache = QueryCache::with_capacity(tmp.path(), 8);
+
+        assert!(cache.get("error handling").is_none());
+        cache.put("error handling", &tokens(3, 1.0)).unwrap();
+
+        let hit = cache.get("  error   handling ").unwrap();
+        assert_eq!(hit, tokens(3, 1.0));
+        assert!(cache.get("Error handling").is_none());
+    }
+
+    #[test]
+    fn evicts_least_recently_used() {
+        let tmp = tempfile::tempdir().unwrap();
+        let cache = QueryCache::with_capacity(tmp.path(), 2);
+
+        cache.put("first", &tokens(1, 0.0)).unwrap();
+        std::thread::sleep(std::time::Duration::from_millis(20));
+        cache.put("second", &tokens(1, 1.0)).unwrap();
+        std::thread::sleep(std::time::Duration::from_millis(20));
+        // Touch "first" so "second" becomes the oldest
+        assert!(cache.get("first").is_some());
+        std::thread::sleep(std::time::Duration::from_millis(20));
+        cache.put("third", &tokens(1, 2.0)).unwrap();
+
+        assert_eq!(cache.len(), 2);
+        assert!(cache.get("first").is_some());
+        assert!(cache.get("second").is_none());
+        assert!(cache.get("third").is_some());
+        assert_eq!(cache.stats().evictions, 1);
+    }
+
+    #[test]
+    fn counts_hits_and_misses() {
+        let tmp = tempfile::tempdir().unwrap();
+        let cache = QueryCache::with_capacity(tmp.path(), 4);
+
+        cache.record(false);
+        cache.record(true);
+        cache.record(true);
+
+        let stats = cache.stats();
+        assert_eq!((stats.hits, stats.misses), (2, 1));
+    }
+
+    #[test]
+    fn stats_flush_every_few_lookups_and_on_drop() {
+        let tmp = tempfile::tempdir().unwrap();
+        let cache = QueryCache::with_capacity(tmp.path(), 4);
+
+        cache.record(true);
+        assert_eq!(cache.saved_stats().hits, 0);
+        for _ in 1..STATS_FLUSH_EVERY {
+            cache.record(false);
+        }
+        let saved = cache.saved_stats();
+        assert_eq!((saved.hits, saved.misses), (1, STATS_FLUSH_EVERY - 1));
+
+        cache.record(true);
+        drop(cache);
+        let stats = QueryCache::with_capacity(tmp.path(), 4).stats();
+        assert_eq!((stats.hits, stats.misses), (2, STATS_FLUSH_EVERY - 1));
+    }
+
+    #[test]
+    fn eviction_sweeps_every_few_misses() {
+        let tmp = tempfile::tempdir().unwrap();
+        // Cap 32 sweeps every 2 misses
+        let cache = QueryCache::with_capacity(tmp.path(), 32);
+
+        for i in 0..33 {
+            cache.record(false);
+            cache
+                .put(&format!("query {i}"), &tokens(1, i as f32))
+                .unwrap();
+        }
+        assert_eq!(cache.len(), 33);
+
+        cache.record(false);
+        cache.put("query 33", &tokens(1, 33.0)).unwrap();
+        assert_eq!(cache.len(), 32);
+        assert_eq!(cache.stats().evictions, 2);
+    }
+}
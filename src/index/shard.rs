@@ -0,0 +1,255 @@
+use std::collections::BTreeSet;
+use std::path::{Path, PathBuf};
+use std::time::SystemTime;
+
+use anyhow::{Context, Result};
+use serde::{Deserialize, Serialize};
+
+/// Shard layout of a sharded index root, in its index dir.
+pub(super) const LAYOUT_FILE: &str = "shards.json";
+
+/// Subdirectory of the index dir holding one index per shard.
+const SHARDS_DIR: &str = "shards";
+
+/// Shard holding the files no pattern claims.
+const REST_SHARD: &str = "_rest";
+
+/// `--shard` value for one shard per top-level directory.
+pub const TOP_LEVEL: &str = "top";
+
+#[derive(Debug, Clone, PartialEq, Eq, Serialize, Deserialize)]
+pub struct Shard {
+    pub name: String,
+    /// Index-relative directory the shard holds; empty for the catch-all shard.
+    pub prefix: String,
+}
+
+/// How an index root is split into independently built shards.
+///
+/// Patterns are index-relative directories. A trailing `*` (`services/*`,
+/// or `*` alone, which `top` stands for) gives one shard per subdirectory.
+/// Each file belongs to the shard with the longest prefix containing it, and
+/// files no shard claims go to `_rest`. Shards are resolved against the
+/// scanned tree on every build, so new directories get their own shard the
+/// next time the index is built.
+#[derive(Debug, Clone, PartialEq, Eq, Serialize, Deserialize)]
+pub struct ShardLayout {
+    pub patterns: Vec<String>,
+    pub shards: Vec<Shard>,
+}
+
+impl ShardLayout {
+    pub fn new(patterns: &[String]) -> Self {
+        let patterns = patterns
+            .iter()
+            .map(|p| {
+                let p = p.trim().trim_start_matches("./").trim_matches('/');
+                if p == TOP_LEVEL { "*" } else { p }.to_string()
+            })
+            .filter(|p| !p.is_empty())
+            .collect();
+        Self {
+            patterns,
+            shards: Vec::new(),
+        }
+    }
+
+    /// Layout saved in `index_dir`, if the index is sharded.
+    pub fn load(index_dir: &Path) -> Option<Self> {
+        let data = std::fs::read(index_dir.join(LAYOUT_FILE)).ok()?;
+        serde_json::from_slice(&data).ok()
+    }
+
+    pub fn save(&self, index_dir: &Path) -> Result<()> {
+        std::fs::create_dir_all(index_dir)?;
+        let tmp = index_dir.join(format!("{LAYOUT_FILE}.tmp"));
+        std::fs::write(&tmp, serde_json::to_vec_pretty(self)?)?;
+        std::fs::rename(&tmp, index_dir.join(LAYOUT_FILE)).context("Failed to save shard layout")
+    }
+
+    /// Resolve the patterns to shards over the tree's index-relative paths.
+    pub fn resolve<'a>(&mut self, rel_paths: impl IntoIterator<Item = &'a str>) {
+        let rel_paths: Vec<&str> = rel_paths.into_iter().collect();
+        let mut prefixes = BTreeSet::new();
+        for pattern in &self.patterns {
+            let Some(parent) = pattern.strip_suffix('*') else {
+                prefixes.insert(pattern.clone());
+                continue;
+            };
+            let parent = parent.trim_end_matches('/');
+            for path in &rel_paths {
+                let rest = if parent.is_empty() {
+                    Some(*path)
+                } else {
+                    path.strip_prefix(parent).and_then(|r| r.strip_prefix('/'))
+                };
+                if let Some((dir, _)) = rest.and_then(|r| r.split_once('/')) {
+                    prefixes.insert(join(parent, dir));
+                }
+            }
+        }
+
+        self.shards = prefixes
+            .into_iter()
+            .map(|prefix| Shard {
+                name: prefix.replace('/', "--"),
+                prefix,
+            })
+            .chain(std::iter::once(Shard {
+                name: REST_SHARD.to_string(),
+                prefix: String::new(),
+            }))
+            .collect();
+    }
+
+    /// Index of the shard holding `rel_path`: the longest prefix containing it.
+    pub fn assign(&self, rel_path: &str) -> usize {
+        let mut best = None;
+        for (i, shard) in self.shards.iter().enumerate() {
+            if contains(&shard.prefix, rel_path)
+                && best.is_none_or(|b: usize| shard.prefix.len() > self.shards[b].prefix.len())
+            {
+                best = Some(i);
+            }
+        }
+        best.unwrap_or(self.shards.len().saturating_sub(1))
+    }
+
+    /// Shards that can hold files under `scope` (`None` = all of them): the
+    /// one owning the scope itself and any nested below it.
+    pub fn covering(&self, scope: Option<&str>) -> Vec<usize> {
+        let Some(scope) = scope.filter(|s| !s.is_empty()) else {
+            return (0..self.shards.len()).collect();
+        };
+        let owner = self.assign(scope);
+        (0..self.shards.len())
+            .filter(|&i| {
+                let prefix = &self.shards[i].prefix;
+                i == owner || (!prefix.is_empty() && prefix.starts_with(&format!("{scope}/")))
+            })
+            .collect()
+    }
+}
+
+/// Whether `index_dir` is the root of a sharded index.
+pub fn is_sharded(index_dir: &Path) -> bool {
+    index_dir.join(LAYOUT_FILE).exists()
+}
+
+/// When the shard layout in `index_dir` was last written; `None` if unsharded.
+pub fn layout_modified(index_dir: &Path) -> Option<SystemTime> {
+    std::fs::metadata(index_dir.join(LAYOUT_FILE))
+        .and_then(|m| m.modified())
+        .ok()
+}
+
+/// Index dir of the shard `name` of the sharded index in `index_dir`.
+pub fn shard_dir(index_dir: &Path, name: &str) -> PathBuf {
+    index_dir.join(SHARDS_DIR).join(name)
+}
+
+/// Index dir holding the files under `scope`: `index_dir` itself, or for a
+/// sharded index the one shard covering the scope. `None` if it spans several.
+pub fn dir_for_scope(index_dir: &Path, scope: Option<&str>) -> Option<PathBuf> {
+    let Some(layout) = ShardLayout::load(index_dir) else {
+        return Some(index_dir.to_path_buf());
+    };
+    match layout.covering(scope).as_slice() {
+        [i] => Some(shard_dir(index_dir, &layout.shards[*i].name)),
+        _ => None,
+    }
+}
+
+/// Remove shard indexes the layout no longer lists.
+pub fn remove_unlisted(index_dir: &Path, layout: &ShardLayout) {
+    let Ok(entries) = std::fs::read_dir(index_dir.join(SHARDS_DIR)) else {
+        return;
+    };
+    for entry in entries.flatten() {
+        let name = entry.file_name();
+        if !layout
+            .shards
+            .iter()
+            .any(|s| name.to_str() == Some(s.name.as_str()))
+        {
+            let _ = std::fs::remove_dir_all(entry.path());
+        }
+    }
+}
+
+fn contains(prefix: &str, rel_path: &str) -> bool {
+    prefix.is_empty() || rel_path == prefix || rel_path.starts_with(&format!("{prefix}/"))
+}
+
+fn join(parent: &str, dir: &str) -> String {
+    if parent.is_empty() {
+        dir.to_string()
+    } else {
+        format!("{parent}/{dir}")
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn layout(patterns: &[&str]) -> ShardLayout {
+        let patterns: Vec<String> = patterns.iter().map(|p| p.to_string()).collect();
+        let mut layout = ShardLayout::new(&patterns);
+        layout.resolve([
+            "README.md",
+            "libs/core/lib.rs",
+            "services/api/main.go",
+            "services/api/handlers/auth.go",
+            "services/web/app.ts",
+            "tools/gen.py",
+        ]);
+        layout
+    }
+
+    fn names(layout: &ShardLayout, shards: Vec<usize>) -> Vec<&str> {
+        shards
+            .into_iter()
+            .map(|i| layout.shards[i].name.as_str())
+            .collect()
+    }
+
+    #[test]
+    fn patterns_resolve_to_shards() {
+        let top = layout(&["top"]);
+        let all: Vec<&str> = top.shards.iter().map(|s| s.name.as_str()).collect();
+        assert_eq!(all, ["libs", "services", "tools", "_rest"]);
+
+        let nested = layout(&["services/*", "libs/core/"]);
+        let all: Vec<&str> = nested.shards.iter().map(|s| s.name.as_str()).collect();
+        assert_eq!(
+            all,
+            ["libs--core", "services--api", "services--web", "_rest"]
+        );
+    }
+
+    #[test]
+    fn files_go_to_longest_prefix() {
+        let layout = layout(&["top", "services/*"]);
+        let shard = |path| layout.shards[layout.assign(path)].name.as_str();
+        assert_eq!(shard("services/api/handlers/auth.go"), "services--api");
+        assert_eq!(shard("services/shared.go"), "services");
+        assert_eq!(shard("services-old/x.go"), "_rest");
+        assert_eq!(shard("README.md"), "_rest");
+    }
+
+    #[test]
+    fn scope_selects_covering_shards() {
+        let layout = layout(&["top", "services/*"]);
+        assert_eq!(names(&layout, layout.covering(None)).len(), 6);
+        assert_eq!(
+            names(&layout, layout.covering(Some("services/api/handlers"))),
+            ["services--api"]
+        );
+        assert_eq!(
+            names(&layout, layout.covering(Some("services"))),
+            ["services", "services--api", "services--web"]
+        );
+        assert_eq!(names(&layout, layout.covering(Some("docs"))), ["_rest"]);
+    }
+}
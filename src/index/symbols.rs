@@ -0,0 +1,160 @@
+use anyhow::{Result, bail};
+use serde::{Deserialize, Serialize};
+
+use crate::types::Block;
+
+/// Name, type and location of one indexed block, kept in the manifest next
+/// to its block ID so `og outline`, `og context` and `file#name` lookups
+/// never read vector-store metadata.
+///
+/// Block text is not duplicated here: `SourceReader` reads it from the
+/// source file through `span`, checked against `hash`, or through the line
+/// range. The skeleton is kept only when it differs from the content.
+#[derive(Debug, Clone, Default, PartialEq, Eq, Serialize, Deserialize)]
+pub struct Symbol {
+    pub name: String,
+    pub block_type: String,
+    pub start_line: usize,
+    pub end_line: usize,
+    #[serde(default)]
+    pub span: Option<(usize, usize)>,
+    /// Hash of the span's text at index time.
+    #[serde(default)]
+    pub hash: Option<String>,
+    #[serde(default)]
+    pub skeleton: Option<String>,
+    /// Declared public (`pub`, `export`); weighs in `og context` ranking.
+    #[serde(default)]
+    pub exported: bool,
+}
+
+impl Symbol {
+    pub fn from_block(block: &Block) -> Self {
+        Self {
+            name: block.name.clone(),
+            block_type: block.block_type.clone(),
+            start_line: block.start_line,
+            end_line: block.end_line,
+            span: block.span,
+            hash: block.span.map(|_| super::hash_content(&block.content)),
+            skeleton: (block.skeleton != block.content).then(|| block.skeleton.clone()),
+            exported: super::xref::is_exported(&block.content),
+        }
+    }
+
+    /// Rebuild from a block's vector-store metadata, for manifests migrated
+    /// from `manifest.json`. `exported` needs the block's text, so it
+    /// is only set for blocks stored with inline content.
+    pub fn from_metadata(meta: &serde_json::Value) -> Self {
+        let str_field = |key: &str| meta.get(key).and_then(|v| v.as_str()).map(String::from);
+        let line = |key: &str| meta.get(key).and_then(|v| v.as_u64()).unwrap_or(0) as usize;
+        let span = meta
+            .get("span")
+            .and_then(|v| v.as_array())
+            .and_then(|a| Some((a.first()?.as_u64()? as usize, a.get(1)?.as_u64()? as usize)));
+        // Inline content (text blocks, older indexes) is not kept: a missing
+        // skeleton falls back to the block's lines
+        Self {
+            name: str_field("name").unwrap_or_default(),
+            block_type: str_field("type").unwrap_or_default(),
+            start_line: line("start_line"),
+            end_line: line("end_line"),
+            span,
+            hash: str_field("hash"),
+            skeleton: str_field("skeleton"),
+            exported: str_field("content").is_some_and(|c| super::xref::is_exported(&c)),
+        }
+    }
+}
+
+/// Index of the block in `symbols` named `name`, or whose dotted name ends
+/// with it (`Class.method`). Ambiguous names are an error listing the
+/// candidates.
+pub fn find_by_name(symbols: &[Symbol], name: &str) -> Result<usize> {
+    let suffix = format!(".{name}");
+    let matches: Vec<usize> = symbols
+        .iter()
+        .enumerate()
+        .filter(|(_, s)| s.name == name || s.name.ends_with(&suffix))
+        .map(|(i, _)| i)
+        .collect();
+
+    match matches.as_slice() {
+        [] => bail!("No block named '{name}' found"),
+        [i] => Ok(*i),
+        _ => {
+            let details: Vec<String> = matches
+                .iter()
+                .map(|&i| {
+                    let s = &symbols[i];
+                    format!("  - line {}: {} {}", s.start_line, s.block_type, s.name)
+                })
+                .collect();
+            bail!(
+                "Multiple blocks named '{name}' found:\n{}\nUse file:<line> to specify.",
+                details.join("\n")
+            )
+        }
+    }
+}
+
+/// Index of the first block in `symbols` whose line range holds `line`.
+pub fn find_by_line(symbols: &[Symbol], line: usize) -> Option<usize> {
+    symbols
+        .iter()
+        .position(|s| s.start_line <= line && line <= s.end_line)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn symbol(name: &str, start_line: usize, end_line: usize) -> Symbol {
+        Symbol {
+            name: name.to_string(),
+            block_type: "function".to_string(),
+            start_line,
+            end_line,
+            ..Symbol::default()
+        }
+    }
+
+    #[test]
+    fn lookups_by_name_and_line() {
+        let symbols = vec![
+            symbol("Store", 0, 20),
+            symbol("Store.get", 2, 5),
+            symbol("get", 22, 25),
+            symbol("put", 27, 30),
+        ];
+        assert_eq!(find_by_name(&symbols, "put").unwrap(), 3);
+        assert_eq!(find_by_name(&symbols, "Store.get").unwrap(), 1);
+        let err = find_by_name(&symbols, "get").unwrap_err().to_string();
+        assert!(err.contains("Multiple blocks named 'get'"), "{err}");
+        assert!(find_by_name(&symbols, "delete").is_err());
+
+        assert_eq!(find_by_line(&symbols, 3), Some(0));
+        assert_eq!(find_by_line(&symbols, 28), Some(3));
+        assert_eq!(find_by_line(&symbols, 40), None);
+    }
+
+    #[test]
+    fn metadata_and_blocks_agree() {
+        let block = Block {
+            id: "lib.rs:1:add".to_string(),
+            file: "lib.rs".to_string(),
+            block_type: "function".to_string(),
+            name: "add".to_string(),
+            start_line: 1,
+            end_line: 3,
+            content: "pub fn add() {}".to_string(),
+            skeleton: "fn add()".to_string(),
+            span: Some((8, 23)),
+        };
+        let mut from_meta = Symbol::from_metadata(&crate::index::content::block_metadata(&block));
+        // Spanned blocks keep no text in metadata to tell visibility from
+        assert!(!from_meta.exported);
+        from_meta.exported = true;
+        assert_eq!(from_meta, Symbol::from_block(&block));
+    }
+}
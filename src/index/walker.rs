@@ -3,6 +3,7 @@ use std::path::{Path, PathBuf};
 use std::time::SystemTime;
 
 use anyhow::Result;
+use ignore::gitignore::{Gitignore, GitignoreBuilder};
 use ignore::{WalkBuilder, WalkState};
 
 /// Maximum file size to index (1MB).
@@ -188,6 +189,7 @@ fn build_walker(root: &Path) -> ignore::Walk {
 /// Scan directory tree for file metadata only (no content reads).
 /// Returns path -> (file_size, mtime_secs) for each eligible file.
 pub fn scan_metadata(root: &Path) -> Result<HashMap<PathBuf, FileMetadata>> {
+    let _span = crate::trace::span("scan_metadata");
     let mut results = HashMap::new();
 
     for entry in build_walker(root) {
@@ -206,20 +208,125 @@ pub fn scan_metadata(root: &Path) -> Result<HashMap<PathBuf, FileMetadata>> {
         }
 
         if let Ok(meta) = std::fs::metadata(path) {
-            let size = meta.len();
-            let mtime = meta
-                .modified()
-                .unwrap_or(SystemTime::UNIX_EPOCH)
-                .duration_since(SystemTime::UNIX_EPOCH)
-                .map(|d| d.as_secs())
-                .unwrap_or(0);
-            results.insert(path.to_path_buf(), (size, mtime));
+            results.insert(path.to_path_buf(), (meta.len(), mtime_secs(&meta)));
         }
     }
 
+    crate::trace::count("files_scanned", results.len() as u64);
     Ok(results)
 }
 
+/// Decides whether individual paths would be picked up by `scan_metadata`
+/// without walking the tree: same hidden-file, ignore-file, size and skip-list
+/// rules. Ignore files are loaded per directory on demand and cached until
+/// `reset`.
+pub struct PathFilter {
+    root: PathBuf,
+    /// Global gitignore and `.git/info/exclude`, below every ignore file.
+    base: Vec<Gitignore>,
+    /// Per-directory `.gitignore` + `.ignore` matchers.
+    dirs: HashMap<PathBuf, Gitignore>,
+    /// Git ignore rules only apply inside a repository, as in the walker.
+    in_git_repo: bool,
+}
+
+impl PathFilter {
+    pub fn new(root: &Path) -> Self {
+        let mut filter = Self {
+            root: root.to_path_buf(),
+            base: Vec::new(),
+            dirs: HashMap::new(),
+            in_git_repo: root.ancestors().any(|dir| dir.join(".git").exists()),
+        };
+        filter.reset();
+        filter
+    }
+
+    /// Drop cached matchers (after an ignore file changed).
+    pub fn reset(&mut self) {
+        self.dirs.clear();
+        if !self.in_git_repo {
+            self.base.clear();
+            return;
+        }
+        let mut exclude = GitignoreBuilder::new(&self.root);
+        exclude.add(self.root.join(".git/info/exclude"));
+        self.base = vec![
+            Gitignore::global().0,
+            exclude.build().unwrap_or_else(|_| Gitignore::empty()),
+        ];
+    }
+
+    /// Metadata for `path` if a scan of the root would include it.
+    pub fn check(&mut self, path: &Path) -> Option<FileMetadata> {
+        let rel = path.strip_prefix(&self.root).ok()?;
+        let hidden = rel
+            .components()
+            .any(|c| c.as_os_str().to_str().is_none_or(|s| s.starts_with('.')));
+        if hidden || should_skip(path) {
+            return None;
+        }
+
+        // Symlinks are not followed by the walker either
+        let meta = std::fs::symlink_metadata(path).ok()?;
+        if !meta.is_file() || meta.len() > MAX_FILE_SIZE {
+            return None;
+        }
+
+        // An ignored ancestor directory hides everything beneath it
+        let depth = rel.components().count();
+        let mut current = self.root.clone();
+        for (i, component) in rel.components().enumerate() {
+            current.push(component);
+            if self.is_ignored(&current, i + 1 < depth) {
+                return None;
+            }
+        }
+
+        Some((meta.len(), mtime_secs(&meta)))
+    }
+
+    fn is_ignored(&mut self, path: &Path, is_dir: bool) -> bool {
+        // Deepest ignore file first: nested rules override their parents
+        for dir in path.ancestors().skip(1) {
+            let matched = self.matcher(dir).matched(path, is_dir);
+            if matched.is_ignore() {
+                return true;
+            }
+            if matched.is_whitelist() {
+                return false;
+            }
+            if dir == self.root {
+                break;
+            }
+        }
+        self.base
+            .iter()
+            .any(|gi| gi.matched(path, is_dir).is_ignore())
+    }
+
+    fn matcher(&mut self, dir: &Path) -> &Gitignore {
+        let in_git_repo = self.in_git_repo;
+        self.dirs.entry(dir.to_path_buf()).or_insert_with(|| {
+            // Later files win, so `.ignore` overrides `.gitignore` as in the walker
+            let mut builder = GitignoreBuilder::new(dir);
+            if in_git_repo {
+                builder.add(dir.join(".gitignore"));
+            }
+            builder.add(dir.join(".ignore"));
+            builder.build().unwrap_or_else(|_| Gitignore::empty())
+        })
+    }
+}
+
+fn mtime_secs(meta: &std::fs::Metadata) -> u64 {
+    meta.modified()
+        .unwrap_or(SystemTime::UNIX_EPOCH)
+        .duration_since(SystemTime::UNIX_EPOCH)
+        .map(|d| d.as_secs())
+        .unwrap_or(0)
+}
+
 /// Get mtime for a single file path.
 pub fn file_mtime(path: &Path) -> u64 {
     std::fs::metadata(path)
@@ -294,3 +401,43 @@ pub fn scan(root: &Path) -> Result<HashMap<PathBuf, (String, u64)>> {
 
     Ok(results)
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn path_filter_matches_scan() {
+        let tmp = tempfile::TempDir::new().unwrap();
+        let root = tmp.path().canonicalize().unwrap();
+        let files = [
+            "src/main.rs",
+            "src/gen/out.rs",
+            "build/artifact.rs",
+            ".hidden/secret.rs",
+            "notes.txt",
+            "image.png",
+        ];
+        for rel in files {
+            let path = root.join(rel);
+            std::fs::create_dir_all(path.parent().unwrap()).unwrap();
+            std::fs::write(&path, "fn main() {}\n").unwrap();
+        }
+        std::fs::create_dir(root.join(".git")).unwrap();
+        std::fs::write(root.join(".gitignore"), "build/\n*.txt\n").unwrap();
+        std::fs::write(root.join("src/.ignore"), "gen/\n").unwrap();
+
+        let scanned = scan_metadata(&root).unwrap();
+        let mut filter = PathFilter::new(&root);
+        for rel in files {
+            let path = root.join(rel);
+            assert_eq!(
+                filter.check(&path).is_some(),
+                scanned.contains_key(&path),
+                "{rel}"
+            );
+        }
+        assert!(filter.check(&root.join("src/main.rs")).is_some());
+        assert!(filter.check(&root.join("missing.rs")).is_none());
+    }
+}
@@ -0,0 +1,144 @@
+use std::collections::{BTreeMap, HashSet};
+
+/// Block types that are documentation, not code. They neither define nor
+/// reference symbols in the cross-reference graph.
+pub const DOC_BLOCK_TYPES: &[&str] = &["text", "section"];
+
+/// Identifiers the code blocks of one file mention, with the number of
+/// blocks mentioning each, sorted by identifier. This is the file's row of
+/// the cross-reference graph: summed over files it gives an identifier's
+/// document frequency, and the files other than a definition's own give its
+/// inbound references.
+pub fn file_refs<'a>(blocks: impl IntoIterator<Item = (&'a str, &'a str)>) -> Vec<(String, u32)> {
+    let mut counts: BTreeMap<String, u32> = BTreeMap::new();
+    for (block_type, content) in blocks {
+        if DOC_BLOCK_TYPES.contains(&block_type) {
+            continue;
+        }
+        for token in identifier_tokens(content) {
+            *counts.entry(token).or_insert(0) += 1;
+        }
+    }
+    counts.into_iter().collect()
+}
+
+/// Whether a block's text declares it public (`pub ...`, `export ...`).
+pub fn is_exported(content: &str) -> bool {
+    let content = content.trim_start();
+    content.starts_with("pub ") || content.starts_with("export ")
+}
+
+/// Graph key a block named `name` defines: its last path segment,
+/// lowercased. `None` for names too generic to rank.
+pub fn symbol_key(name: &str) -> Option<String> {
+    let name = name
+        .rsplit(['.', ':', '#', '/', '\\'])
+        .next()
+        .unwrap_or(name)
+        .trim();
+    let key = name.to_ascii_lowercase();
+    if is_noisy_name(&key) { None } else { Some(key) }
+}
+
+fn is_noisy_name(name: &str) -> bool {
+    matches!(
+        name,
+        "" | "clone"
+            | "debug"
+            | "default"
+            | "display"
+            | "error"
+            | "fmt"
+            | "from"
+            | "get"
+            | "append"
+            | "data"
+            | "item"
+            | "items"
+            | "init"
+            | "into"
+            | "list"
+            | "main"
+            | "method"
+            | "new"
+            | "path"
+            | "run"
+            | "set"
+            | "source"
+            | "test"
+            | "tests"
+            | "value"
+            | "values"
+    ) || name.len() < 4
+}
+
+/// Lowercased identifiers in `text` that could name a definition.
+pub fn identifier_tokens(text: &str) -> HashSet<String> {
+    let mut tokens = HashSet::new();
+    let mut current = String::new();
+
+    for ch in text.chars() {
+        if ch == '_' || ch.is_ascii_alphanumeric() {
+            current.push(ch);
+        } else {
+            push_identifier(&mut tokens, &current);
+            current.clear();
+        }
+    }
+    push_identifier(&mut tokens, &current);
+
+    tokens
+}
+
+fn push_identifier(tokens: &mut HashSet<String>, ident: &str) {
+    if ident.len() < 4
+        || !ident
+            .chars()
+            .next()
+            .is_some_and(|ch| ch.is_ascii_alphabetic())
+    {
+        return;
+    }
+
+    let token = ident.to_ascii_lowercase();
+    if !is_noisy_name(&token) {
+        tokens.insert(token);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn file_refs_count_blocks_per_identifier() {
+        let refs = file_refs([
+            (
+                "function",
+                "fn parse_args() { Config::load(); Config::load(); }",
+            ),
+            ("function", "fn main() { parse_args(); }"),
+            ("section", "# Config\nparse_args reads the config"),
+        ]);
+        assert_eq!(
+            refs,
+            vec![
+                ("config".to_string(), 1),
+                ("load".to_string(), 1),
+                ("parse_args".to_string(), 2),
+            ]
+        );
+    }
+
+    #[test]
+    fn keys_skip_generic_names() {
+        assert_eq!(
+            symbol_key("Store.insert_batch").as_deref(),
+            Some("insert_batch")
+        );
+        assert_eq!(symbol_key("Store::new"), None);
+        assert!(is_exported("  pub fn load()"));
+        assert!(is_exported("export function load()"));
+        assert!(!is_exported("fn load()"));
+    }
+}
@@ -5,4 +5,5 @@ pub mod extractor;
 pub mod index;
 pub mod synonyms;
 pub mod tokenize;
+pub mod trace;
 pub mod types;
@@ -0,0 +1,168 @@
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::{Mutex, MutexGuard};
+use std::time::{Duration, Instant};
+
+static ENABLED: AtomicBool = AtomicBool::new(false);
+static TRACE: Mutex<Option<Trace>> = Mutex::new(None);
+
+/// Span timings and counters for one command, or one query in `--batch`.
+/// Spans are flat and summed by name. Spans on concurrent threads (the two
+/// store searches) overlap, so they can add up to more than the total.
+struct Trace {
+    command: String,
+    start: Instant,
+    /// (name, total time, calls), in first-seen order.
+    spans: Vec<(&'static str, Duration, u64)>,
+    counts: Vec<(&'static str, u64)>,
+}
+
+impl Trace {
+    fn new(command: &str) -> Self {
+        Self {
+            command: command.to_string(),
+            start: Instant::now(),
+            spans: Vec::new(),
+            counts: Vec::new(),
+        }
+    }
+}
+
+/// Whether `OG_TRACE=json` asks for tracing.
+pub fn env_enabled() -> bool {
+    std::env::var("OG_TRACE").is_ok_and(|v| v.eq_ignore_ascii_case("json") || v == "1")
+}
+
+/// Start collecting for `command`. Until this is called every span and
+/// counter is a relaxed atomic load.
+pub fn enable(command: &str) {
+    *lock() = Some(Trace::new(command));
+    ENABLED.store(true, Ordering::Relaxed);
+}
+
+pub fn enabled() -> bool {
+    ENABLED.load(Ordering::Relaxed)
+}
+
+/// Time a stage until the returned guard drops.
+pub fn span(name: &'static str) -> Span {
+    Span {
+        name,
+        start: enabled().then(Instant::now),
+    }
+}
+
+/// Time `f` as a stage.
+pub fn time<T>(name: &'static str, f: impl FnOnce() -> T) -> T {
+    let _span = span(name);
+    f()
+}
+
+/// Add a stage duration measured elsewhere (e.g. build stage totals).
+pub fn record(name: &'static str, elapsed: Duration) {
+    if !enabled() {
+        return;
+    }
+    if let Some(trace) = lock().as_mut() {
+        match trace.spans.iter_mut().find(|(n, _, _)| *n == name) {
+            Some((_, total, calls)) => {
+                *total += elapsed;
+                *calls += 1;
+            }
+            None => trace.spans.push((name, elapsed, 1)),
+        }
+    }
+}
+
+/// Add `n` to a counter (candidates fetched, blocks scored, bytes read, ...).
+pub fn count(name: &'static str, n: u64) {
+    if !enabled() {
+        return;
+    }
+    if let Some(trace) = lock().as_mut() {
+        match trace.counts.iter_mut().find(|(c, _)| *c == name) {
+            Some((_, total)) => *total += n,
+            None => trace.counts.push((name, n)),
+        }
+    }
+}
+
+/// Write the collected trace to stderr as one JSON line and start a fresh
+/// one. `extra` fields (e.g. the batch query id) are merged in. Call before
+/// `process::exit`, which skips destructors.
+///
+/// `{"trace":{"command":"search","total_ms":41.2,"spans":[{"name":"embed_query","ms":12.5,"calls":1}],"counts":{"candidates":58}}}`
+pub fn emit(extra: Option<serde_json::Value>) {
+    if !enabled() {
+        return;
+    }
+    let mut guard = lock();
+    let Some(trace) = guard.as_mut() else {
+        return;
+    };
+
+    let ms = |d: Duration| (d.as_secs_f64() * 1e6).round() / 1e3;
+    let mut record = serde_json::json!({
+        "command": trace.command,
+        "total_ms": ms(trace.start.elapsed()),
+        "spans": trace
+            .spans
+            .iter()
+            .map(|(name, total, calls)| serde_json::json!({
+                "name": name,
+                "ms": ms(*total),
+                "calls": calls,
+            }))
+            .collect::<Vec<_>>(),
+        "counts": trace
+            .counts
+            .iter()
+            .map(|(name, n)| (name.to_string(), serde_json::json!(n)))
+            .collect::<serde_json::Map<_, _>>(),
+    });
+    if let (Some(serde_json::Value::Object(extra)), Some(obj)) = (extra, record.as_object_mut()) {
+        obj.extend(extra);
+    }
+    eprintln!("{}", serde_json::json!({ "trace": record }));
+
+    *trace = Trace::new(&trace.command);
+}
+
+fn lock() -> MutexGuard<'static, Option<Trace>> {
+    TRACE.lock().unwrap_or_else(|e| e.into_inner())
+}
+
+/// Guard returned by [`span`]; records the elapsed time when dropped.
+pub struct Span {
+    name: &'static str,
+    start: Option<Instant>,
+}
+
+impl Drop for Span {
+    fn drop(&mut self) {
+        if let Some(start) = self.start {
+            record(self.name, start.elapsed());
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn spans_and_counts_accumulate_by_name() {
+        enable("test");
+        time("stage", || std::thread::sleep(Duration::from_millis(2)));
+        time("stage", || {});
+        count("candidates", 3);
+        count("candidates", 4);
+
+        // Other tests may record into the same collector; look up by name
+        let guard = lock();
+        let trace = guard.as_ref().unwrap();
+        let (_, total, calls) = trace.spans.iter().find(|(n, _, _)| *n == "stage").unwrap();
+        assert_eq!(*calls, 2);
+        assert!(*total >= Duration::from_millis(2));
+        assert!(trace.counts.contains(&("candidates", 7)));
+    }
+}
@@ -1,3 +1,5 @@
+use std::time::Duration;
+
 use serde::{Deserialize, Serialize};
 
 /// A code block extracted from a source file.
@@ -19,6 +21,10 @@ pub struct Block {
     pub content: String,
     /// Skeleton (signature) of the block.
     pub skeleton: String,
+    /// Byte range of `content` in the source file, when content is a
+    /// verbatim slice of it. Lets the index store the range instead of the text.
+    #[serde(default)]
+    pub span: Option<(usize, usize)>,
 }
 
 impl Block {
@@ -51,6 +57,10 @@ pub struct SearchResult {
     pub content: Option<String>,
     /// Similarity/relevance score.
     pub score: f32,
+    /// Search root the result came from, when several were searched. `file`
+    /// is then relative to it.
+    #[serde(default, skip_serializing_if = "Option::is_none")]
+    pub root: Option<String>,
 }
 
 /// Parsed file reference from CLI input.
@@ -99,6 +109,47 @@ pub struct IndexStats {
     pub skipped: usize,
     pub errors: usize,
     pub deleted: usize,
+    /// Real tokens embedded.
+    pub tokens: usize,
+    /// Tokens run through the model including batch padding.
+    pub padded_tokens: usize,
+    /// Token vectors stored for the embedded blocks, after pooling.
+    #[serde(default)]
+    pub stored_tokens: usize,
+    /// Blocks stored with embeddings reused from an unchanged copy of the
+    /// block, without running the model.
+    pub cached: usize,
+    /// Time spent in each build stage.
+    pub timings: StageTimings,
+}
+
+impl IndexStats {
+    /// Add another run's counts and stage times (e.g. one per shard).
+    pub fn merge(&mut self, other: &IndexStats) {
+        self.files += other.files;
+        self.blocks += other.blocks;
+        self.skipped += other.skipped;
+        self.errors += other.errors;
+        self.deleted += other.deleted;
+        self.tokens += other.tokens;
+        self.padded_tokens += other.padded_tokens;
+        self.stored_tokens += other.stored_tokens;
+        self.cached += other.cached;
+        self.timings.extract += other.timings.extract;
+        self.timings.tokenize += other.timings.tokenize;
+        self.timings.infer += other.timings.infer;
+        self.timings.store += other.timings.store;
+    }
+}
+
+/// Build time per stage. Extract and tokenize run on the worker pool and are
+/// summed across workers; infer and store are wall time on the embed loop.
+#[derive(Debug, Default, Clone, Serialize, Deserialize)]
+pub struct StageTimings {
+    pub extract: Duration,
+    pub tokenize: Duration,
+    pub infer: Duration,
+    pub store: Duration,
 }
 
 /// Exit codes matching Python implementation.
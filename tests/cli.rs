@@ -48,7 +48,7 @@ fn build_fixture_index() -> TempDir {
 #[test]
 fn build_creates_index() {
     let tmp = build_fixture_index();
-    assert!(tmp.path().join(".og/manifest.json").exists());
+    assert!(tmp.path().join(".og/manifest.bin").exists());
 }
 
 #[test]
@@ -202,7 +202,116 @@ fn build_force_rebuilds() {
     og().args(["build", "--force", tmp.path().to_str().unwrap()])
         .assert()
         .success()
-        .stderr(predicate::str::contains("Indexed"));
+        .stderr(predicate::str::contains("Indexed"))
+        .stderr(predicate::str::contains("Stages: extract"));
+}
+
+#[test]
+fn pooled_embedding_matches_single_session() {
+    let single = build_fixture_index();
+    let pooled = build_fixture_index();
+
+    og().args([
+        "build",
+        "--force",
+        "--embed-sessions",
+        "3",
+        pooled.path().to_str().unwrap(),
+    ])
+    .assert()
+    .success()
+    .stderr(predicate::str::contains("blocks/s"));
+
+    let search = |dir: &TempDir| {
+        let output = og()
+            .args([
+                "authentication",
+                dir.path().to_str().unwrap(),
+                "--json",
+                "-n",
+                "5",
+            ])
+            .output()
+            .unwrap();
+        json_files(&output.stdout)
+            .into_iter()
+            .map(|f| f.rsplit('/').next().unwrap_or_default().to_string())
+            .collect::<Vec<_>>()
+    };
+    assert_eq!(search(&single), search(&pooled));
+}
+
+#[test]
+fn incremental_build_rehashes_only_changed_metadata() {
+    let tmp = build_fixture_index();
+    let dir = tmp.path().to_str().unwrap();
+
+    og().args(["build", dir])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Index up to date"));
+
+    // Touch without changing content: re-hashed once, nothing re-embedded
+    let touched = tmp.path().join("auth.py");
+    let later = std::time::SystemTime::now() + std::time::Duration::from_secs(120);
+    std::fs::File::options()
+        .write(true)
+        .open(&touched)
+        .unwrap()
+        .set_modified(later)
+        .unwrap();
+    og().args(["build", dir])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Index up to date"));
+
+    std::fs::write(
+        tmp.path().join("auth.py"),
+        "def rotate_session_key():\n    return 'new'\n",
+    )
+    .unwrap();
+    og().args(["build", dir])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Updated"));
+}
+
+#[test]
+fn shifted_blocks_reuse_cached_embeddings() {
+    let tmp = build_fixture_index();
+    let dir = tmp.path().to_str().unwrap();
+
+    let hash_password_line = || {
+        let output = og()
+            .args(["--json", "hash password salt", dir, "-t", "py"])
+            .output()
+            .unwrap();
+        let results: Vec<serde_json::Value> = serde_json::from_slice(&output.stdout).unwrap();
+        let hit = results
+            .iter()
+            .find(|r| r["name"] == "hash_password")
+            .expect("hash_password in results");
+        assert!(
+            hit["content"]
+                .as_str()
+                .unwrap()
+                .starts_with("def hash_password")
+        );
+        hit["line"].as_u64().unwrap()
+    };
+    let before = hash_password_line();
+
+    // Moves every block down a line without changing its text
+    let path = tmp.path().join("auth.py");
+    let content = std::fs::read_to_string(&path).unwrap();
+    std::fs::write(&path, format!("import logging\n{content}")).unwrap();
+
+    og().args(["build", dir])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("reused cached embeddings"));
+
+    assert_eq!(hash_password_line(), before + 1);
 }
 
 #[test]
@@ -223,6 +332,30 @@ fn incremental_update() {
         .stderr(predicate::str::contains("Updating"));
 }
 
+#[test]
+fn interrupted_build_resumes_from_checkpoint() {
+    let tmp = build_fixture_index();
+
+    // A build killed after journaling auth.py but before checkpointing it
+    std::fs::write(
+        tmp.path().join(".og/build.inflight"),
+        "{\"file\": \"auth.py\", \"blocks\": [\"auth.py:1:stale\"]}\n{\"file\": \"torn",
+    )
+    .unwrap();
+
+    og().args(["build", tmp.path().to_str().unwrap()])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Resuming interrupted build"))
+        .stderr(predicate::str::contains("from 1 files"));
+    assert!(!tmp.path().join(".og/build.inflight").exists());
+
+    og().args(["authentication", tmp.path().to_str().unwrap()])
+        .assert()
+        .success()
+        .stdout(predicate::str::contains("auth.py"));
+}
+
 #[test]
 fn camel_case_query_matches() {
     let tmp = build_fixture_index();
@@ -293,6 +426,183 @@ fn scope_filter_excludes_sibling_directory() {
     );
 }
 
+#[test]
+fn sharded_index_fans_out_and_rebuilds_one_shard() {
+    let tmp = TempDir::new().unwrap();
+    for dir in ["api", "web"] {
+        std::fs::create_dir_all(tmp.path().join(dir)).unwrap();
+    }
+    std::fs::write(
+        tmp.path().join("api/auth.py"),
+        "def zorbtoken_verify(token):\n    return token == 'ok'\n",
+    )
+    .unwrap();
+    std::fs::write(
+        tmp.path().join("web/login.ts"),
+        "export function zorbtoken_prompt() { return 1; }\n",
+    )
+    .unwrap();
+    std::fs::write(tmp.path().join("setup.py"), "def install():\n    pass\n").unwrap();
+
+    og().args(["build", "--shard", "top", tmp.path().to_str().unwrap()])
+        .assert()
+        .success();
+    for shard in ["api", "web", "_rest"] {
+        assert!(
+            tmp.path()
+                .join(".og/shards")
+                .join(shard)
+                .join("manifest.bin")
+                .exists()
+        );
+    }
+
+    // Unscoped search merges results from both shards
+    let out = og()
+        .args(["--json", "zorbtoken", tmp.path().to_str().unwrap()])
+        .output()
+        .unwrap();
+    let files = json_files(&out.stdout);
+    assert!(files.iter().any(|f| f.contains("api/auth.py")), "{files:?}");
+    assert!(
+        files.iter().any(|f| f.contains("web/login.ts")),
+        "{files:?}"
+    );
+
+    // A scoped search only reaches its shard
+    let api = tmp.path().join("api");
+    let out = og()
+        .args(["--json", "zorbtoken", api.to_str().unwrap()])
+        .output()
+        .unwrap();
+    let files = json_files(&out.stdout);
+    assert!(!files.iter().any(|f| f.contains("web/")), "{files:?}");
+
+    // Rebuilding one shard leaves the others alone
+    std::fs::write(
+        tmp.path().join("web/logout.ts"),
+        "export function zorbtoken_clear() {}\n",
+    )
+    .unwrap();
+    std::fs::write(tmp.path().join("api/extra.py"), "def unused():\n    pass\n").unwrap();
+    og().args(["build", tmp.path().join("web").to_str().unwrap()])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Shard web"))
+        .stderr(predicate::str::contains("Shard api").not());
+    og().args(["status", tmp.path().to_str().unwrap()])
+        .assert()
+        .success()
+        .stdout(predicate::str::contains("3 shards"))
+        .stdout(predicate::str::contains("1 changed"));
+}
+
+#[test]
+fn multi_root_search_merges_and_labels_results() {
+    let tmp = TempDir::new().unwrap();
+    for (repo, file, body) in [
+        (
+            "billing",
+            "invoice.py",
+            "def quxledger_total(items):\n    return sum(items)\n",
+        ),
+        (
+            "shipping",
+            "route.go",
+            "func QuxledgerRoute() int { return 1 }\n",
+        ),
+    ] {
+        let dir = tmp.path().join(repo);
+        std::fs::create_dir_all(&dir).unwrap();
+        std::fs::write(dir.join(file), body).unwrap();
+        og().args(["build", dir.to_str().unwrap()])
+            .assert()
+            .success();
+    }
+
+    let out = og()
+        .current_dir(tmp.path())
+        .args(["--json", "quxledger", "billing", "shipping"])
+        .output()
+        .unwrap();
+    assert!(out.status.success());
+    let results: Vec<serde_json::Value> = serde_json::from_slice(&out.stdout).unwrap();
+    let labelled: Vec<(&str, &str)> = results
+        .iter()
+        .map(|r| (r["root"].as_str().unwrap(), r["file"].as_str().unwrap()))
+        .collect();
+    assert!(
+        labelled.contains(&("billing", "invoice.py")),
+        "{labelled:?}"
+    );
+    assert!(labelled.contains(&("shipping", "route.go")), "{labelled:?}");
+
+    // Same roots from a workspace file
+    std::fs::write(
+        tmp.path().join("og.workspace"),
+        "# services\nbilling\nshipping\n",
+    )
+    .unwrap();
+    og().args([
+        "-l",
+        "quxledger",
+        "--workspace",
+        tmp.path().join("og.workspace").to_str().unwrap(),
+    ])
+    .assert()
+    .success()
+    .stdout(predicate::str::contains("billing/invoice.py"))
+    .stdout(predicate::str::contains("shipping/route.go"));
+}
+
+#[test]
+fn token_pool_shrinks_stored_tokens_and_is_recorded() {
+    let tmp = TempDir::new().unwrap();
+    std::fs::write(
+        tmp.path().join("auth.py"),
+        "def verify_password(user, password):\n    \"\"\"Check a user's password against the stored hash.\"\"\"\n    return user.check(password)\n",
+    )
+    .unwrap();
+    std::fs::write(
+        tmp.path().join("math.py"),
+        "def add(a, b):\n    return a + b\n",
+    )
+    .unwrap();
+    let path = tmp.path().to_str().unwrap();
+
+    og().args(["build", "--token-pool", "2", path])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("token vectors stored"));
+    og().args(["status", path])
+        .assert()
+        .success()
+        .stdout(predicate::str::contains("Token pooling: 2x"));
+
+    let out = og()
+        .args(["--json", "check password", path])
+        .output()
+        .unwrap();
+    let files = json_files(&out.stdout);
+    assert_eq!(
+        files.first().map(String::as_str),
+        Some("auth.py"),
+        "{files:?}"
+    );
+
+    og().args(["build", path])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("up to date"));
+    og().args(["build", "--token-pool", "1", path])
+        .assert()
+        .success()
+        .stderr(predicate::str::contains("Token pooling changed"));
+    og().args(["build", "--token-pool", "9", path])
+        .assert()
+        .failure();
+}
+
 // Regression: all chunks from a long markdown section got the same ID — only the last survived.
 #[test]
 fn markdown_long_section_indexes_all_chunks() {
@@ -412,6 +722,107 @@ fn context_scope_excludes_sibling_directory() {
     );
 }
 
+#[test]
+fn outline_and_context_read_symbols_from_manifest() {
+    let tmp = build_fixture_index();
+
+    // Symbols live in the manifest, so neither command needs the vector store
+    for entry in std::fs::read_dir(tmp.path().join(".og")).unwrap() {
+        let path = entry.unwrap().path();
+        if path
+            .file_name()
+            .unwrap()
+            .to_string_lossy()
+            .starts_with("vectors")
+        {
+            if path.is_dir() {
+                std::fs::remove_dir_all(&path).unwrap();
+            } else {
+                std::fs::remove_file(&path).unwrap();
+            }
+        }
+    }
+
+    og().args([
+        "outline",
+        "--skeleton",
+        tmp.path().join("auth.py").to_str().unwrap(),
+    ])
+    .assert()
+    .success()
+    .stdout(predicate::str::contains("UserManager"))
+    .stdout(predicate::str::contains("def verify_password("));
+
+    let out = og()
+        .args(["context", "--json", tmp.path().to_str().unwrap()])
+        .output()
+        .unwrap();
+    assert!(out.status.success());
+    assert!(json_files(&out.stdout).iter().any(|f| f == "auth.py"));
+}
+
+#[test]
+fn import_updates_exported_index_for_local_changes() {
+    let tmp = build_fixture_index();
+    let snapshot = tmp.path().join("index.ogz");
+    og().args([
+        "export",
+        tmp.path().to_str().unwrap(),
+        "-o",
+        snapshot.to_str().unwrap(),
+    ])
+    .assert()
+    .success()
+    .stderr(predicate::str::contains("Exported"));
+
+    // A clone elsewhere, one file ahead of the snapshot
+    let clone = TempDir::new().unwrap();
+    for entry in std::fs::read_dir(fixtures_dir()).unwrap() {
+        let entry = entry.unwrap();
+        if entry.file_type().unwrap().is_file() {
+            std::fs::copy(entry.path(), clone.path().join(entry.file_name())).unwrap();
+        }
+    }
+    let mut auth = std::fs::read_to_string(clone.path().join("auth.py")).unwrap();
+    auth.push_str("\n\ndef rotate_session_token(session):\n    return session.renew()\n");
+    std::fs::write(clone.path().join("auth.py"), auth).unwrap();
+
+    og().args([
+        "import",
+        snapshot.to_str().unwrap(),
+        clone.path().to_str().unwrap(),
+    ])
+    .assert()
+    .success()
+    .stderr(predicate::str::contains("Imported"))
+    .stderr(predicate::str::contains("from 1 files"));
+
+    let out = og()
+        .args([
+            "rotate session token",
+            clone.path().to_str().unwrap(),
+            "--json",
+            "--no-index",
+        ])
+        .output()
+        .unwrap();
+    assert!(out.status.success());
+    assert_eq!(
+        json_files(&out.stdout).first().map(String::as_str),
+        Some("auth.py")
+    );
+
+    // An existing index is only replaced on request
+    og().args([
+        "import",
+        snapshot.to_str().unwrap(),
+        clone.path().to_str().unwrap(),
+    ])
+    .assert()
+    .failure()
+    .stderr(predicate::str::contains("--force"));
+}
+
 #[test]
 fn highlight_marks_query_terms_in_default_output() {
     let tmp = build_fixture_index();
@@ -462,3 +873,260 @@ fn highlight_does_not_change_json_output() {
         "json output must not include ANSI styling; got: {stdout}"
     );
 }
+
+#[test]
+fn trace_reports_search_stages_on_stderr() {
+    let tmp = build_fixture_index();
+
+    let output = og()
+        .args(["--trace", "error handling", tmp.path().to_str().unwrap()])
+        .assert()
+        .success()
+        .stdout(predicate::str::contains("errors.rs"));
+
+    let stderr = String::from_utf8(output.get_output().stderr.clone()).unwrap();
+    let line = stderr
+        .lines()
+        .find(|l| l.starts_with("{\"trace\""))
+        .expect("--trace writes a trace line to stderr");
+    let trace: serde_json::Value = serde_json::from_str(line).unwrap();
+    let trace = &trace["trace"];
+    assert_eq!(trace["command"], "search");
+    let spans: Vec<&str> = trace["spans"]
+        .as_array()
+        .unwrap()
+        .iter()
+        .filter_map(|s| s["name"].as_str())
+        .collect();
+    assert!(spans.contains(&"embed_query"), "spans: {spans:?}");
+    assert!(trace["counts"]["candidates"].as_u64().unwrap() > 0);
+}
+
+#[test]
+fn search_in_git_repo_checks_only_changed_paths() {
+    let git = |dir: &std::path::Path, args: &[&str]| {
+        std::process::Command::new("git")
+            .arg("-C")
+            .arg(dir)
+            .args(["-c", "user.name=og", "-c", "user.email=og@localhost"])
+            .args(args)
+            .output()
+            .is_ok_and(|o| o.status.success())
+    };
+    let tmp = TempDir::new().unwrap();
+    if !git(tmp.path(), &["init", "-q"]) {
+        return;
+    }
+    for entry in std::fs::read_dir(fixtures_dir()).unwrap() {
+        let entry = entry.unwrap();
+        if entry.file_type().unwrap().is_file() {
+            std::fs::copy(entry.path(), tmp.path().join(entry.file_name())).unwrap();
+        }
+    }
+    std::fs::write(tmp.path().join(".gitignore"), ".og/\n").unwrap();
+    assert!(git(tmp.path(), &["add", "."]));
+    assert!(git(tmp.path(), &["commit", "-qm", "init"]));
+    og().args(["build", tmp.path().to_str().unwrap()])
+        .assert()
+        .success();
+
+    // One file committed, one left untracked
+    std::fs::write(
+        tmp.path().join("billing.py"),
+        "def compute_invoice_total(line_items):\n    return sum(item.price for item in line_items)\n",
+    )
+    .unwrap();
+    assert!(git(tmp.path(), &["add", "billing.py"]));
+    assert!(git(tmp.path(), &["commit", "-qm", "billing"]));
+    std::fs::write(
+        tmp.path().join("shipping.py"),
+        "def estimate_shipping_cost(parcel_weight):\n    return parcel_weight * 4\n",
+    )
+    .unwrap();
+
+    let output = og()
+        .env("OG_NO_SERVER", "1")
+        .args([
+            "--trace",
+            "--json",
+            "invoice total",
+            tmp.path().to_str().unwrap(),
+        ])
+        .output()
+        .unwrap();
+    assert!(output.status.success());
+    assert!(json_files(&output.stdout).iter().any(|f| f == "billing.py"));
+    let stderr = String::from_utf8(output.stderr).unwrap();
+    let line = stderr
+        .lines()
+        .find(|l| l.starts_with("{\"trace\""))
+        .expect("--trace writes a trace line to stderr");
+    let trace: serde_json::Value = serde_json::from_str(line).unwrap();
+    let spans: Vec<&str> = trace["trace"]["spans"]
+        .as_array()
+        .unwrap()
+        .iter()
+        .filter_map(|s| s["name"].as_str())
+        .collect();
+    assert!(spans.contains(&"git_status"), "spans: {spans:?}");
+    assert!(!spans.contains(&"scan_metadata"), "spans: {spans:?}");
+
+    let output = og()
+        .env("OG_NO_SERVER", "1")
+        .args(["--json", "shipping cost", tmp.path().to_str().unwrap()])
+        .output()
+        .unwrap();
+    assert!(
+        json_files(&output.stdout)
+            .iter()
+            .any(|f| f == "shipping.py")
+    );
+}
+
+#[test]
+fn commands_that_never_embed_skip_the_model_load() {
+    let tmp = build_fixture_index();
+    let path = tmp.path().to_str().unwrap();
+    let file_ref = format!("{}#AppError", tmp.path().join("errors.rs").display());
+
+    for args in [
+        vec!["--trace", "status", path],
+        vec!["--trace", "list", path],
+        vec!["--trace", file_ref.as_str(), path],
+    ] {
+        let output = og().args(&args).env("OG_NO_SERVER", "1").output().unwrap();
+        assert!(output.status.success(), "{args:?}");
+        let stderr = String::from_utf8_lossy(&output.stderr);
+        assert!(stderr.contains("{\"trace\""), "{args:?}: {stderr}");
+        assert!(!stderr.contains("load_model"), "{args:?}: {stderr}");
+    }
+}
+
+#[test]
+fn batch_mode_streams_one_line_per_query() {
+    let tmp = build_fixture_index();
+    // Keep the query file outside the indexed tree so it isn't picked up as source
+    let queries_dir = TempDir::new().unwrap();
+    let batch = queries_dir.path().join("queries.jsonl");
+    std::fs::write(
+        &batch,
+        "{\"id\": \"q1\", \"query\": \"authentication\"}\n\"error handling\"\n",
+    )
+    .unwrap();
+
+    let output = og()
+        .args([
+            "--batch",
+            batch.to_str().unwrap(),
+            tmp.path().to_str().unwrap(),
+            "-n",
+            "3",
+        ])
+        .assert()
+        .success();
+
+    let stdout = String::from_utf8(output.get_output().stdout.clone()).unwrap();
+    let lines: Vec<serde_json::Value> = stdout
+        .lines()
+        .map(|l| serde_json::from_str(l).unwrap())
+        .collect();
+    assert_eq!(lines.len(), 2);
+    assert_eq!(lines[0]["id"], "q1");
+    assert_eq!(lines[1]["id"], 1);
+
+    let results = lines[0]["results"].as_array().unwrap();
+    assert!(!results.is_empty() && results.len() <= 3);
+    assert!(
+        results
+            .iter()
+            .any(|r| r["file"].as_str().is_some_and(|f| f == "auth.py")),
+        "batch results must use index-relative paths; got: {results:?}"
+    );
+}
+
+#[cfg(unix)]
+#[test]
+fn search_forwards_to_running_server() {
+    let tmp = build_fixture_index();
+    let sock_dir = TempDir::new().unwrap();
+    let socket = sock_dir.path().join("og.sock");
+
+    #[allow(deprecated)]
+    let mut server = std::process::Command::new(assert_cmd::cargo::cargo_bin("og"))
+        .args(["serve", "--quiet", "--socket", socket.to_str().unwrap()])
+        .spawn()
+        .unwrap();
+
+    // Model load happens before bind; wait for the socket to appear
+    for _ in 0..300 {
+        if socket.exists() {
+            break;
+        }
+        std::thread::sleep(std::time::Duration::from_millis(100));
+    }
+    assert!(socket.exists(), "og serve did not bind {socket:?}");
+
+    let output = og()
+        .env("OG_SOCKET", &socket)
+        .args(["--json", "authentication", tmp.path().to_str().unwrap()])
+        .output()
+        .unwrap();
+    let _ = server.kill();
+    let _ = server.wait();
+
+    assert!(output.status.success());
+    let files = json_files(&output.stdout);
+    assert!(
+        files.iter().any(|f| f == "auth.py"),
+        "forwarded search must return index-relative results; got: {files:?}"
+    );
+}
+
+#[cfg(unix)]
+#[test]
+fn watch_indexes_new_files_without_search_walk() {
+    let tmp = build_fixture_index();
+
+    #[allow(deprecated)]
+    let mut watcher = std::process::Command::new(assert_cmd::cargo::cargo_bin("og"))
+        .args(["watch", "--quiet", "--debounce", "100"])
+        .arg(tmp.path())
+        .spawn()
+        .unwrap();
+
+    let marker = tmp.path().join(".og/watch.pid");
+    for _ in 0..300 {
+        if marker.exists() {
+            break;
+        }
+        std::thread::sleep(std::time::Duration::from_millis(100));
+    }
+    assert!(marker.exists(), "og watch did not start");
+
+    std::fs::write(
+        tmp.path().join("billing.py"),
+        "def compute_invoice_total(line_items):\n    return sum(item.price for item in line_items)\n",
+    )
+    .unwrap();
+
+    let mut files = Vec::new();
+    for _ in 0..100 {
+        let output = og()
+            .env("OG_NO_SERVER", "1")
+            .args(["--json", "invoice total", tmp.path().to_str().unwrap()])
+            .output()
+            .unwrap();
+        files = json_files(&output.stdout);
+        if files.iter().any(|f| f == "billing.py") {
+            break;
+        }
+        std::thread::sleep(std::time::Duration::from_millis(200));
+    }
+    let _ = watcher.kill();
+    let _ = watcher.wait();
+
+    assert!(
+        files.iter().any(|f| f == "billing.py"),
+        "watcher should index new files; got: {files:?}"
+    );
+}